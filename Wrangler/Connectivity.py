@@ -0,0 +1,84 @@
+import collections
+
+__all__ = ['UnionFind', 'ConnectivityReport', 'findComponents']
+
+ConnectivityReport = collections.namedtuple('ConnectivityReport',
+                                            ['numNodes', 'numLinks', 'islands', 'newIslands', 'badTransitLinks'])
+ConnectivityReport.__doc__ = """
+Result of :py:meth:`HighwayNetwork.checkConnectivity`.
+
+* *numNodes* and *numLinks* describe the roadway network checked
+* *islands* is a list of the components (sorted lists of node numbers) that aren't connected to the
+  largest component, largest first
+* *newIslands* is the subset of *islands* that weren't islands the last time connectivity was checked
+* *badTransitLinks* is a list of :py:class:`BadTransitLink` for transit links that are neither roadway
+  nor off-road transit links
+"""
+
+class UnionFind(object):
+    """
+    Disjoint sets of hashable items (e.g. node numbers) with union by size and path halving,
+    so building the components of a network is near-linear in the number of links.
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.size   = {}
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self, item):
+        """
+        Adds *item* as its own set, if it's not already present.
+        """
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item]   = 1
+
+    def find(self, item):
+        """
+        Returns the representative item for the set containing *item*, adding it if needed.
+        """
+        self.add(item)
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item         = parent[item]
+        return item
+
+    def union(self, item1, item2):
+        """
+        Merges the sets containing *item1* and *item2*.  Returns the representative of the merged set.
+        """
+        root1 = self.find(item1)
+        root2 = self.find(item2)
+        if root1 == root2: return root1
+        if self.size[root1] < self.size[root2]:
+            (root1, root2) = (root2, root1)
+        self.parent[root2] = root1
+        self.size[root1]  += self.size[root2]
+        del self.size[root2]
+        return root1
+
+    def components(self):
+        """
+        Returns a list of the sets as sorted lists, largest first.
+        """
+        members = collections.defaultdict(list)
+        for item in self.parent.keys():
+            members[self.find(item)].append(item)
+        return sorted([sorted(component) for component in members.values()], key=lambda component: (-len(component), component[0]))
+
+def findComponents(links, nodes=None):
+    """
+    Returns the (weakly) connected components of the network with the given (a, b) *links*, as a
+    list of sorted lists of nodes, largest first.  If *nodes* is passed, nodes without links are
+    included as components of their own.
+    """
+    union_find = UnionFind()
+    if nodes:
+        for node in nodes: union_find.add(node)
+    for (a, b) in links:
+        union_find.union(a, b)
+    return union_find.components()
@@ -0,0 +1,403 @@
+import re
+import numpy
+from .Logger import WranglerLogger
+from .NetworkException import NetworkException
+
+__all__ = ['StopToStopFareTable', 'TransferFareMatrix']
+
+class StopToStopFareTable(object):
+    """
+    Stop-to-stop fare file (e.g. ``BART.far``) parsed once into a store keyed by the pair of stops,
+    (lower stop, higher stop), since MTC fare files are bidirectional.
+
+    Each line of the file is kept as an entry: fare records (``fromNode toNode fare [; comment]``) are
+    parsed into their parts so that the whitespace and comments are preserved when written;
+    everything else (blank lines, comments, lines we don't understand) is kept verbatim.
+
+    Fare records added by :py:meth:`extend` replace earlier records for the same pair of stops, in either
+    direction, so later projects override earlier ones rather than piling up duplicate entries.
+
+    For backwards compatibility, this behaves like the list of lines it replaces: it supports
+    iteration over the lines, ``len()``, indexing and ``extend()``.
+    """
+
+    #                              1    2    3    4    5    6    7
+    FARE_RECORD_RE = re.compile(r"^(\s*)(\d+)(\s+)(\d+)(\s+)(\d+)(\s*(?:;.*)?)$", re.DOTALL)
+    BLANK_COMMENT_RE = re.compile(r"^\s*(;.*)?$", re.DOTALL)
+
+    def __init__(self, name, lines=None):
+        self.name     = name
+        # list of entries: a str for verbatim lines, a tuple of the FARE_RECORD_RE groups for fare records,
+        # or None for records replaced by a later one
+        self.entries  = []
+        # (from stop, to stop) -> index into self.entries
+        self.index    = {}
+        self.numLines = 0
+        # indices of the entries that aren't None, for indexing the lines; None if out of date
+        self._positions = None
+        if lines: self.extend(lines)
+
+    def __repr__(self):
+        return "StopToStopFareTable(%s: %d lines, %d fares)" % (self.name, self.numLines, len(self.index))
+
+    def __len__(self):
+        return self.numLines
+
+    def __iter__(self):
+        for entry in self.entries:
+            if entry is None: continue
+            yield self._entryText(entry)
+
+    def __getitem__(self, idx):
+        if self._positions is None:
+            self._positions = [entry_idx for (entry_idx, entry) in enumerate(self.entries) if entry is not None]
+        if isinstance(idx, slice):
+            return [self._entryText(self.entries[entry_idx]) for entry_idx in self._positions[idx]]
+        return self._entryText(self.entries[self._positions[idx]])
+
+    @staticmethod
+    def _entryText(entry):
+        return entry if isinstance(entry, str) else "".join(entry)
+
+    @staticmethod
+    def _pairKey(stopA, stopB):
+        return (stopA, stopB) if stopA <= stopB else (stopB, stopA)
+
+    @staticmethod
+    def _key(record):
+        return StopToStopFareTable._pairKey(int(record[1]), int(record[3]))
+
+    def extend(self, lines):
+        """
+        Appends the given lines.  Fare records for a pair of stops already in the table (in either
+        direction) replace the existing record.
+
+        Returns (previous number of entries, list of (entry index, replaced entry)), which can be
+        passed to :py:meth:`undoExtend`.
+        """
+        old_num_entries = len(self.entries)
+        replaced        = []
+        self._positions = None
+        for line in lines:
+            match = StopToStopFareTable.FARE_RECORD_RE.match(line)
+            if match:
+                record = match.groups()
+                key    = StopToStopFareTable._key(record)
+                if key in self.index:
+                    old_idx = self.index[key]
+                    replaced.append((old_idx, self.entries[old_idx]))
+                    self.entries[old_idx] = None
+                    self.numLines -= 1
+                self.index[key] = len(self.entries)
+                self.entries.append(record)
+            else:
+                self.entries.append(line)
+            self.numLines += 1
+
+        if len(replaced) > 0:
+            WranglerLogger.debug("%s: %d fares replaced by later entries" % (self.name, len(replaced)))
+        return (old_num_entries, replaced)
+
+    def undoExtend(self, old_num_entries, replaced):
+        """
+        Reverts an :py:meth:`extend` given its return value.
+        """
+        self._positions = None
+        for entry in self.entries[old_num_entries:]:
+            if entry is None: continue
+            self.numLines -= 1
+            if not isinstance(entry, str): del self.index[StopToStopFareTable._key(entry)]
+        del self.entries[old_num_entries:]
+
+        # most recent first, skipping entries that were themselves added by the extend
+        for (idx, entry) in reversed(replaced):
+            if idx >= old_num_entries: continue
+            self.entries[idx] = entry
+            self.index[StopToStopFareTable._key(entry)] = idx
+            self.numLines += 1
+
+    def findKey(self, stopA, stopB):
+        """
+        Returns the key for the fare between *stopA* and *stopB* in either direction, as MTC fare files are
+        bidirectional, or None if it's not found.
+        """
+        key = StopToStopFareTable._pairKey(stopA, stopB)
+        return key if key in self.index else None
+
+    def getFare(self, stopA, stopB):
+        """
+        Returns the fare (an int) between the given stops (in either direction).
+        Throws a NetworkException if not found.
+        """
+        key = self.findKey(stopA, stopB)
+        if key is None:
+            raise NetworkException("stopA/stopB {}/{} not found".format(stopA, stopB))
+        return int(self.entries[self.index[key]][5])
+
+    def setFare(self, stopA, stopB, value):
+        """
+        Sets the fare between the given stops (in either direction), preserving the formatting of the line.
+        Throws a NetworkException if not found.
+
+        Returns (entry index, previous entry) for undo.
+        """
+        key = self.findKey(stopA, stopB)
+        if key is None:
+            raise NetworkException("stopA/stopB {}/{} not found".format(stopA, stopB))
+        idx    = self.index[key]
+        record = self.entries[idx]
+        self.entries[idx] = record[:5] + (str(value),) + record[6:]
+        return (idx, record)
+
+    def records(self):
+        """
+        Returns a list of ((from stop, to stop), fare) for the fare records, in file order.
+        """
+        return [((int(self.entries[idx][1]), int(self.entries[idx][3])), int(self.entries[idx][5]))
+                for idx in sorted(self.index.values())]
+
+    def commentOut(self, key, prefix="; "):
+        """
+        Comments out the fare record for the given (from stop, to stop) *key*, in either direction, keeping the text.
+        Returns (entry index, previous entry) for undo.
+        """
+        idx    = self.index.pop(StopToStopFareTable._pairKey(*key))
+        record = self.entries[idx]
+        self.entries[idx] = prefix + "".join(record)
+        return (idx, record)
+
+    def restoreEntry(self, idx, entry):
+        """
+        Restores the entry at *idx* as returned by :py:meth:`setFare` or :py:meth:`commentOut`.
+        """
+        self.entries[idx] = entry
+        if not isinstance(entry, str): self.index[StopToStopFareTable._key(entry)] = idx
+
+    def unparsedLines(self):
+        """
+        Returns the lines that are neither fare records nor blank or comment lines.
+        """
+        return [entry for entry in self.entries
+                if isinstance(entry, str) and not StopToStopFareTable.BLANK_COMMENT_RE.match(entry)]
+
+    def write(self, outfile):
+        """
+        Writes the table to the given open file in a single streaming pass.
+        """
+        outfile.writelines(self)
+
+class TransferFareMatrix(object):
+    """
+    Transfer fare file (e.g. ``xfare.far``) parsed into a dense NumPy matrix keyed by mode, where
+    ``matrix[from_mode, to_mode]`` is the value from the line ``XFARE[from_mode]=...``.
+
+    Rows keep their original text (including the ``XFARE[n]=`` prefix, separators and trailing comment)
+    until a value in the row changes, at which point the row's values are regenerated comma-separated.
+    Other lines are kept verbatim.  Each row only has as many cells as its line has values;
+    cells past the end of a row don't exist and aren't touched by row, column or block updates.
+
+    An ``XFARE[n]`` line added by :py:meth:`extend` replaces the existing row *n*, so later projects
+    override earlier ones.  Like :py:class:`StopToStopFareTable`, this behaves like the list of lines it replaces.
+    """
+
+    #                                    1                      3                     4
+    XFARE_RE = re.compile(r"^(xfare\[(\d+)\]=)(-?\d+(?:,\s*-?\d+)*)(.*)$", re.IGNORECASE | re.DOTALL)
+
+    def __init__(self, name, lines=None):
+        self.name      = name
+        # list of entries: a str for verbatim lines, an int from_mode for XFARE rows, or None for replaced rows
+        self.entries   = []
+        # from_mode -> [entry index, prefix, rest of line, original text or None if modified]
+        self.rows      = {}
+        # indexed by from_mode: number of to_mode values in the row
+        self.rowLength = numpy.zeros(1, dtype=numpy.int64)
+        self.matrix    = numpy.zeros((1,1), dtype=numpy.int64)
+        self.numLines  = 0
+        # indices of the entries that aren't None, for indexing the lines; None if out of date
+        self._positions = None
+        if lines: self.extend(lines)
+
+    def __repr__(self):
+        return "TransferFareMatrix(%s: %d lines, %d modes)" % (self.name, self.numLines, len(self.rows))
+
+    def __len__(self):
+        return self.numLines
+
+    def __iter__(self):
+        for entry in self.entries:
+            if entry is None: continue
+            yield self._entryText(entry)
+
+    def __getitem__(self, idx):
+        if self._positions is None:
+            self._positions = [entry_idx for (entry_idx, entry) in enumerate(self.entries) if entry is not None]
+        if isinstance(idx, slice):
+            return [self._entryText(self.entries[entry_idx]) for entry_idx in self._positions[idx]]
+        return self._entryText(self.entries[self._positions[idx]])
+
+    def _entryText(self, entry):
+        return entry if isinstance(entry, str) else self._rowText(entry)
+
+    def _rowText(self, from_mode):
+        row = self.rows[from_mode]
+        if row[3] is not None: return row[3]
+        values = self.matrix[from_mode, 1:self.rowLength[from_mode]+1]
+        return "{}{}{}".format(row[1], ",".join([str(value) for value in values]), row[2])
+
+    def _resize(self, num_rows, num_cols):
+        """
+        Makes sure the matrix has at least the given number of rows and columns.
+        """
+        (cur_rows, cur_cols) = self.matrix.shape
+        if num_rows <= cur_rows and num_cols <= cur_cols: return
+        self.matrix    = numpy.pad(self.matrix, ((0, max(0, num_rows-cur_rows)), (0, max(0, num_cols-cur_cols))))
+        self.rowLength = numpy.pad(self.rowLength, (0, max(0, num_rows-cur_rows)))
+
+    def _setRowValues(self, from_mode, values):
+        self._resize(from_mode+1, len(values)+1)
+        self.matrix[from_mode, :] = 0
+        self.matrix[from_mode, 1:len(values)+1] = values
+        self.rowLength[from_mode] = len(values)
+
+    def extend(self, lines):
+        """
+        Appends the given lines.  An ``XFARE[n]`` line for a mode that already has a row replaces the row.
+
+        Returns (previous number of entries, list of (from_mode, row state)), which can be passed to
+        :py:meth:`undoExtend`.
+        """
+        old_num_entries = len(self.entries)
+        replaced        = []
+        self._positions = None
+        for line in lines:
+            match = TransferFareMatrix.XFARE_RE.match(line)
+            if match:
+                from_mode = int(match.group(2))
+                if from_mode in self.rows:
+                    replaced.append((from_mode, self.snapshotRows([from_mode])[0][1]))
+                    self.entries[self.rows[from_mode][0]] = None
+                    self.numLines -= 1
+                self._setRowValues(from_mode, [int(value) for value in match.group(3).split(",")])
+                self.rows[from_mode] = [len(self.entries), match.group(1), match.group(4), line]
+                self.entries.append(from_mode)
+            else:
+                self.entries.append(line)
+            self.numLines += 1
+        return (old_num_entries, replaced)
+
+    def undoExtend(self, old_num_entries, replaced):
+        """
+        Reverts an :py:meth:`extend` given its return value.
+        """
+        self._positions = None
+        for entry in self.entries[old_num_entries:]:
+            if entry is None: continue
+            self.numLines -= 1
+            if isinstance(entry, str): continue
+            del self.rows[entry]
+            self.matrix[entry, :] = 0
+            self.rowLength[entry] = 0
+        del self.entries[old_num_entries:]
+
+        # most recent first, skipping rows that were themselves added by the extend
+        for (from_mode, row_state) in reversed(replaced):
+            if row_state[0][0] >= old_num_entries: continue
+            self.restoreRows([(from_mode, row_state)])
+            self.entries[row_state[0][0]] = from_mode
+            self.numLines += 1
+
+    def snapshotRows(self, from_modes):
+        """
+        Returns a list of (from_mode, row state) for the given rows, to be passed to :py:meth:`restoreRows`.
+        """
+        return [(from_mode, (list(self.rows[from_mode]), self.matrix[from_mode].copy(), int(self.rowLength[from_mode])))
+                for from_mode in from_modes]
+
+    def restoreRows(self, row_states):
+        """
+        Restores rows saved by :py:meth:`snapshotRows`.
+        """
+        for (from_mode, (row, values, row_length)) in row_states:
+            self.rows[from_mode] = list(row)
+            self._resize(from_mode+1, len(values))
+            self.matrix[from_mode, :] = 0
+            self.matrix[from_mode, :len(values)] = values
+            self.rowLength[from_mode] = row_length
+
+    def modes(self):
+        """
+        Returns the sorted list of from modes with rows.
+        """
+        return sorted(self.rows.keys())
+
+    def getFare(self, from_mode, to_mode):
+        """
+        Returns the transfer fare from *from_mode* to *to_mode*.  Throws a NetworkException if not found.
+        """
+        if from_mode not in self.rows:
+            raise NetworkException("from_mode {} not found".format(from_mode))
+        if to_mode < 1 or self.rowLength[from_mode] < to_mode:
+            raise NetworkException("to_mode {} not found: {}".format(to_mode,
+                                   self.matrix[from_mode, 1:self.rowLength[from_mode]+1].tolist()))
+        return int(self.matrix[from_mode, to_mode])
+
+    def setFare(self, from_mode, to_mode, value):
+        """
+        Sets the transfer fare from *from_mode* to *to_mode*.  Throws a NetworkException if not found.
+        Returns row states for :py:meth:`restoreRows`.
+        """
+        self.getFare(from_mode, to_mode)
+        return self.setBlock([from_mode], [to_mode], value)[1]
+
+    def setRow(self, from_mode, value):
+        """
+        Sets all transfer fares from *from_mode*.  See :py:meth:`setBlock`.
+        """
+        return self.setBlock([from_mode], None, value)
+
+    def setColumn(self, to_mode, value, from_modes=None):
+        """
+        Sets all transfer fares into *to_mode* (for rows long enough to have it), e.g. ``setColumn(120, 0)``.
+        See :py:meth:`setBlock`.
+        """
+        return self.setBlock(from_modes, [to_mode], value)
+
+    def setBlock(self, from_modes, to_modes, value):
+        """
+        Sets the transfer fares for every combination of *from_modes* and *to_modes* (lists of ints; None means all)
+        to *value*, which is a number or an array broadcastable to (len(from_modes), len(to_modes)).
+        Cells past the end of a row are skipped.  Throws a NetworkException for unknown from modes.
+
+        Returns (number of cells changed, row states for :py:meth:`restoreRows`).
+        """
+        if from_modes is None:
+            from_modes = self.modes()
+        missing = [from_mode for from_mode in from_modes if from_mode not in self.rows]
+        if len(missing) > 0:
+            raise NetworkException("from_modes {} not found".format(missing))
+        if to_modes is None:
+            to_modes = list(range(1, self.matrix.shape[1]))
+        if len(from_modes) == 0 or len(to_modes) == 0:
+            return (0, [])
+
+        rows     = numpy.array(from_modes, dtype=numpy.int64)
+        cols     = numpy.array(to_modes,   dtype=numpy.int64)
+        self._resize(1, int(cols.max())+1)
+        block    = numpy.ix_(rows, cols)
+        exists   = (cols[numpy.newaxis,:] >= 1) & (cols[numpy.newaxis,:] <= self.rowLength[rows][:,numpy.newaxis])
+        current  = self.matrix[block]
+        newvals  = numpy.where(exists, numpy.broadcast_to(numpy.asarray(value, dtype=numpy.int64), current.shape), current)
+        changed  = newvals != current
+
+        changed_rows = rows[changed.any(axis=1)].tolist()
+        row_states   = self.snapshotRows(changed_rows)
+        self.matrix[block] = newvals
+        for from_mode in changed_rows:
+            self.rows[from_mode][3] = None
+        return (int(changed.sum()), row_states)
+
+    def write(self, outfile):
+        """
+        Writes the file to the given open file in a single streaming pass.
+        """
+        outfile.writelines(self)
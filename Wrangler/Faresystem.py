@@ -1,4 +1,5 @@
-import collections, re
+import collections, io, re
+import numpy
 
 from .Logger import WranglerLogger
 
@@ -12,7 +13,8 @@ class Faresystem(collections.OrderedDict):
     def __init__(self):
         collections.OrderedDict.__init__(self)
 
-        self.fare_zone_mat = {} # origin fare zone (int) => dest fare zone (int) => fare (float)
+        # fare_zone_mat[origin fare zone, dest fare zone] = fare (float); NaN for pairs without a fare
+        self.fare_zone_mat = numpy.full((0,0), numpy.nan)
 
     def __repr__(self):
         s = "FARESYSTEM "
@@ -37,51 +39,103 @@ class Faresystem(collections.OrderedDict):
         """
         return int(self["NUMBER"])
 
+    def _resizeFareZoneMatrix(self, num_zones):
+        """
+        Makes sure the fare zone matrix is at least num_zones x num_zones, filling new cells with NaN.
+        """
+        cur_zones = self.fare_zone_mat.shape[0]
+        if num_zones <= cur_zones: return
+        self.fare_zone_mat = numpy.pad(self.fare_zone_mat, ((0, num_zones-cur_zones), (0, num_zones-cur_zones)),
+                                       constant_values=numpy.nan)
+
     def setFarezoneODPair(self, farezone_i, farezone_j, fare_val):
         """
         Sets the fare for the given farezone pair
         """
-        if farezone_i not in self.fare_zone_mat:
-            self.fare_zone_mat[farezone_i] = {}
-        self.fare_zone_mat[farezone_i][farezone_j] = fare_val
+        self._resizeFareZoneMatrix(max(farezone_i, farezone_j)+1)
+        self.fare_zone_mat[farezone_i, farezone_j] = fare_val
+
+    def setFarezoneODPairs(self, farezones_i, farezones_j, fare_vals):
+        """
+        Sets the fares for the given arrays of farezone pairs in one update.  Later pairs win over earlier duplicates.
+        """
+        farezones_i = numpy.asarray(farezones_i, dtype=numpy.int64)
+        farezones_j = numpy.asarray(farezones_j, dtype=numpy.int64)
+        if len(farezones_i) == 0: return
+        fare_vals   = numpy.broadcast_to(numpy.asarray(fare_vals, dtype=numpy.float64), farezones_i.shape)
+        self._resizeFareZoneMatrix(int(max(farezones_i.max(), farezones_j.max()))+1)
+        # numpy doesn't say which of duplicate indices is assigned, so keep the last of each pair
+        num_zones = self.fare_zone_mat.shape[0]
+        (_, last) = numpy.unique((farezones_i*num_zones + farezones_j)[::-1], return_index=True)
+        last      = len(farezones_i) - 1 - last
+        self.fare_zone_mat[farezones_i[last], farezones_j[last]] = fare_vals[last]
+
+    def getFarezoneODPair(self, farezone_i, farezone_j):
+        """
+        Returns the fare for the given farezone pair, or None if it's not set.
+        """
+        if max(farezone_i, farezone_j) >= self.fare_zone_mat.shape[0]: return None
+        fare_val = self.fare_zone_mat[farezone_i, farezone_j]
+        if numpy.isnan(fare_val): return None
+        return float(fare_val)
 
     def getFareZoneMatrixLines(self):
         """
         Returns farezone to farezone string for writing.
         """
-        s = ""
-        if len(self.fare_zone_mat) == 0: return s
+        (farezones_i, farezones_j) = numpy.nonzero(~numpy.isnan(self.fare_zone_mat))
+        if len(farezones_i) == 0: return ""
 
-        for farezone_i in sorted(self.fare_zone_mat.keys()):
-            for farezone_j in sorted(self.fare_zone_mat[farezone_i].keys()):
-                s += "{} {} {} {:.4f}\n".format(self.getId(), farezone_i, farezone_j, self.fare_zone_mat[farezone_i][farezone_j])
-        return s
+        # nonzero() returns the pairs in row-major order, so these are sorted by origin then destination
+        rows = numpy.column_stack((numpy.full(len(farezones_i), self.getId()), farezones_i, farezones_j,
+                                   self.fare_zone_mat[farezones_i, farezones_j]))
+        s = io.StringIO()
+        numpy.savetxt(s, rows, fmt=["%d", "%d", "%d", "%.4f"], delimiter=" ")
+        return s.getvalue()
 
     @staticmethod
     def readFareZoneMatrixFile(farezonematrix_file, faresystems_dict):
         """
         Reads the a farezone matrix file (see FAREMATI documentation in Public Transport)
         and updates the given dictionary of faresystems.
+
+        Each line is ``farematid farezone_i farezone_j fare [fare ...]``, where additional fares are for
+        consecutive destination zones.  The file is read in one pass into flat arrays, which are then
+        routed to the faresystems with the matching FAREMATRIX id.
         """
         WranglerLogger.debug("Reading {}".format(farezonematrix_file))
+        farematids  = []
+        farezones_i = []
+        farezones_j = []
+        fare_vals   = []
         f = open(farezonematrix_file, 'r')
-        while True:
-            line = f.readline().strip()
-            if not line: break
-
-            row  = re.split("[\s+\,]", line) # split on whitespace or comma
-
-            farematid     = row[0]
-            farezone_i    = int(row[1])
-            farezone_j    = int(row[2])
-            for fare_str in row[3:]:
-                fare_val = float(fare_str)
-                # not efficient but it's ok
-                for faresystem_id in faresystems_dict.keys():
-                    if faresystems_dict[faresystem_id].getFareMatrixId() == farematid:
-                        faresystems_dict[faresystem_id].setFarezoneODPair(farezone_i, farezone_j, fare_val)
-                        # print("faresystem {} farematid {} i={}  j={}  fare={}".format(
-                        #       faresystem_id, farematid, farezone_i, farezone_j, fare_val))
-
-                farezone_j += 1
-        f.close()
\ No newline at end of file
+        for line in f:
+            row = re.split(r"[\s,]+", line.strip()) # split on whitespace or comma
+            if len(row) < 4: continue
+
+            num_fares = len(row) - 3
+            farematids.extend([row[0]]*num_fares)
+            farezones_i.extend([int(row[1])]*num_fares)
+            farezone_j = int(row[2])
+            farezones_j.extend(range(farezone_j, farezone_j+num_fares))
+            fare_vals.extend(row[3:])
+        f.close()
+        if len(farematids) == 0: return
+
+        farematids  = numpy.array(farematids)
+        farezones_i = numpy.array(farezones_i, dtype=numpy.int64)
+        farezones_j = numpy.array(farezones_j, dtype=numpy.int64)
+        fare_vals   = numpy.array(fare_vals, dtype=numpy.float64)
+
+        # FAREMATRIX id -> faresystems using it
+        farematid_to_faresystems = collections.defaultdict(list)
+        for faresystem in faresystems_dict.values():
+            farematid_to_faresystems[faresystem.getFareMatrixId()].append(faresystem)
+
+        # group the values by FAREMATRIX id with a stable sort so later values still win over earlier ones
+        (unique_ids, id_index) = numpy.unique(farematids, return_inverse=True)
+        order  = numpy.argsort(id_index, kind="stable")
+        splits = numpy.cumsum(numpy.bincount(id_index))[:-1]
+        for (farematid, group) in zip(unique_ids, numpy.split(order, splits)):
+            for faresystem in farematid_to_faresystems.get(str(farematid), []):
+                faresystem.setFarezoneODPairs(farezones_i[group], farezones_j[group], fare_vals[group])
@@ -0,0 +1,111 @@
+import os
+import numpy
+
+from .NetworkException import NetworkException
+
+__all__ = ['NodeCoordinates', 'pointsFromXY', 'linesFromXY', 'pathsFromXY',
+           'VECTOR_FORMATS', 'vectorFilenames', 'writeGeoDataFrame']
+
+# vector output format -> (file suffix, suffixes of the other files written with it)
+VECTOR_FORMATS = {
+    'shp':     ('shp',     ['shx', 'cpg', 'dbf', 'prj']),
+    'parquet': ('parquet', []),
+    'fgb':     ('fgb',     []),
+}
+
+class NodeCoordinates(object):
+    """
+    Node coordinates as sorted numpy arrays, for looking up the coordinates of many nodes at once.
+
+    *nodes* is either a dictionary of node number -> [X, Y, ...] (as returned by
+    :py:func:`Cube.import_cube_nodes_links_from_csvs`) or a DataFrame indexed by node number with
+    columns X and Y (as returned by :py:func:`Cube.import_cube_nodes_links_as_dataframes`).
+    """
+    def __init__(self, nodes):
+        if isinstance(nodes, dict):
+            node_nums = numpy.fromiter(nodes.keys(), dtype=numpy.int64, count=len(nodes))
+            xy        = numpy.array([nodes[node_num][:2] for node_num in nodes.keys()], dtype=numpy.float64).reshape(-1, 2)
+        else:
+            node_nums = nodes.index.to_numpy(dtype=numpy.int64)
+            xy        = nodes[["X","Y"]].to_numpy(dtype=numpy.float64)
+        order          = numpy.argsort(node_nums, kind='stable')
+        self.nodeNums  = node_nums[order]
+        self.xy        = xy[order]
+
+    def __len__(self):
+        return len(self.nodeNums)
+
+    def lookup(self, node_nums):
+        """
+        Returns an (n, 2) array of the X, Y coordinates of the given node numbers (negative numbers
+        are looked up by their absolute value).  Raises a :py:class:`NetworkException` for unknown nodes.
+        """
+        node_nums = numpy.abs(numpy.asarray(node_nums, dtype=numpy.int64))
+        idxs      = numpy.searchsorted(self.nodeNums, node_nums)
+        idxs      = numpy.minimum(idxs, len(self.nodeNums)-1)
+        found     = (len(self.nodeNums) > 0) & (self.nodeNums[idxs] == node_nums)
+        if not numpy.all(found):
+            raise NetworkException("Coordinates not found for nodes {}".format(sorted(set(node_nums[~found].tolist()))[:20]))
+        return self.xy[idxs]
+
+def pointsFromXY(xy):
+    """
+    Returns an array of shapely Points for the given (n, 2) array of coordinates.
+
+    NOTE: this imports shapely
+    """
+    import shapely
+    return shapely.points(numpy.asarray(xy, dtype=numpy.float64))
+
+def linesFromXY(a_xy, b_xy):
+    """
+    Returns an array of two-point shapely LineStrings from the given (n, 2) arrays of start and end coordinates.
+
+    NOTE: this imports shapely
+    """
+    import shapely
+    return shapely.linestrings(numpy.stack([numpy.asarray(a_xy, dtype=numpy.float64),
+                                            numpy.asarray(b_xy, dtype=numpy.float64)], axis=1))
+
+def pathsFromXY(xy, path_ids):
+    """
+    Returns an array of shapely LineStrings, one per path, from the given (n, 2) array of coordinates
+    and the (n,) array of the path each coordinate belongs to.  Coordinates of a path must be contiguous
+    and in order; paths are returned in order of first appearance.
+
+    NOTE: this imports shapely
+    """
+    import shapely
+    path_ids = numpy.asarray(path_ids)
+    if len(path_ids) == 0: return numpy.array([], dtype=object)
+    # renumber paths 0..n-1 in order of appearance so the result is ordered that way too
+    starts   = numpy.concatenate([[True], path_ids[1:] != path_ids[:-1]])
+    indices  = numpy.cumsum(starts) - 1
+    return shapely.linestrings(numpy.asarray(xy, dtype=numpy.float64), indices=indices)
+
+def vectorFilenames(path, basename, fmt='shp'):
+    """
+    Returns the list of files written for the vector dataset *basename* in *path* in the given format
+    (one of :py:data:`VECTOR_FORMATS`), main file first.
+    """
+    if fmt not in VECTOR_FORMATS:
+        raise NetworkException("Unknown vector format {}; expected one of {}".format(fmt, sorted(VECTOR_FORMATS.keys())))
+    (suffix, other_suffixes) = VECTOR_FORMATS[fmt]
+    return [os.path.join(path, "{}.{}".format(basename, sfx)) for sfx in [suffix] + other_suffixes]
+
+def writeGeoDataFrame(gdf, path, basename, fmt='shp'):
+    """
+    Writes the given GeoDataFrame to *path* / *basename* in the given format: ``shp`` (shapefile),
+    ``parquet`` (GeoParquet) or ``fgb`` (FlatGeobuf).  The latter two are much faster to write and
+    read than shapefiles and don't truncate field names to 10 characters.  Returns the main filename.
+
+    NOTE: this requires geopandas (and pyarrow for GeoParquet)
+    """
+    filename = vectorFilenames(path, basename, fmt)[0]
+    if fmt == 'parquet':
+        gdf.to_parquet(filename, index=False)
+    elif fmt == 'fgb':
+        gdf.to_file(filename=filename, driver="FlatGeobuf")
+    else:
+        gdf.to_file(filename=filename)
+    return filename
@@ -1,10 +1,18 @@
-import collections, csv, os, pathlib, re, shutil, subprocess, time
+import collections, copy, os, pathlib, re, shutil, sys
+import numpy
 from socket         import gethostname, getfqdn
 
+from .Connectivity import ConnectivityReport, findComponents
 from .HwySpecsRTP import HwySpecsRTP
 from .Logger import WranglerLogger
 from .Network import Network
 from .NetworkException import NetworkException
+from .RoadwayChangeSet import RoadwayChangeSet
+from .RoadwayEdits import RoadwayEdits
+from .RoadwaySnapshot import RoadwaySnapshot
+from .TollTable import TollTable
+from .TransitValidation import RoadwayLinkSet, findBadLinksInLines
+from .TurnPenalties import LinkAdjacency, TurnPenalties
 
 __all__ = ['HighwayNetwork']
 
@@ -14,6 +22,33 @@ class HighwayNetwork(Network):
     """
     cube_hostnames = None
 
+    TURN_PENALTY_FILES = ["turnsam.pen", "turnspm.pen", "turnsop.pen"]
+
+    # Set to True to queue consecutive apply.s projects and run them as one Cube job; see runPendingScripts()
+    batchApplyScripts = False
+
+    # Set to True to run apply.s scripts on FREEFLOW.BLD where it is, rather than moving it into (and back out of)
+    # each project directory; see makeInPlaceScript()
+    networkInPlace = False
+
+    # Set to False if no apply.s reads the workspace tolls.csv, so the toll table is only written with the network
+    syncTollsFile = True
+
+    # Timeout for each Cube job, in seconds, or None for the runner's default; see Cube.run_cube_job()
+    cubeTimeout = None
+
+    # environment variables with the absolute paths of the network input and output, for in-place scripts
+    NETWORK_TOKEN     = "WRANGLER_NETWORK"
+    NETWORK_OUT_TOKEN = "WRANGLER_NETWORK_OUT"
+
+    # batch job stage markers, echoed before and after each stage
+    STAGE_BEGIN = "WRANGLER_STAGE_BEGIN"
+    STAGE_END   = "WRANGLER_STAGE_END"
+    STAGE_RE    = re.compile(r"^\s*(WRANGLER_STAGE_BEGIN|WRANGLER_STAGE_END) (\d+) (.*?)\s*$")
+
+    # set of frozensets of nodes that were islands at the last checkConnectivity()
+    knownIslands = None
+
     @staticmethod
     def getCubeHostnames():
         """
@@ -57,6 +92,15 @@ class HighwayNetwork(Network):
         """
         Network.__init__(self, modelType, modelVersion, tempdir, networkBaseDir, networkProjectSubdir, networkSeedSubdir,
                          networkPlanSubdir, networkName)
+        # edits from Python roadway projects that haven't been applied to FREEFLOW.BLD yet
+        self.pendingEdits   = RoadwayEdits()
+        # (name, applyDir, applyScript, env, RoadwayChangeSet or None) for stages queued when batchApplyScripts
+        self.pendingScripts = []
+        self.batchTempDirs  = []
+        # the roadway network as a RoadwaySnapshot kept up to date with the RoadwayChangeSet of each Python
+        # project, or None if it's not known without an export; see updateRoadwayTable()
+        self.roadwayTable   = None
+        self.savedRoadwayTables = {}
         
         if isTiered:
             (head,tail) = os.path.split(basenetworkpath)
@@ -91,14 +135,59 @@ class HighwayNetwork(Network):
                 # touch a blank file
                 with open(filename, 'a'): os.utime(filename, None)
 
+        self.readTurnPenalties()
+        self.readTolls()
+
         # done
         self.applyingBasenetwork = False
+        self.roadwayTable = None
+
+    def readTurnPenalties(self, path='.'):
+        """
+        Reads the turn penalty files (``turns[am,pm,op].pen``) in *path* into *self.turnPenalties*,
+        a dictionary of filename -> :py:class:`TurnPenalties`.
+        """
+        self.turnPenalties = collections.OrderedDict()
+        for filename in HighwayNetwork.TURN_PENALTY_FILES:
+            self.turnPenalties[filename] = TurnPenalties(os.path.join(path, filename))
+
+    def writeTurnPenalties(self, path='.'):
+        """
+        Writes the merged turn penalty files (``turns[am,pm,op].pen``) into *path*.
+        """
+        for (filename, turn_penalties) in self.turnPenalties.items():
+            turn_penalties.write(os.path.join(path, filename))
+            WranglerLogger.debug("Wrote {} turn penalties to {}".format(len(turn_penalties), os.path.join(path, filename)))
+
+    def readTolls(self, tollsfile="tolls.csv"):
+        """
+        Reads *tollsfile* into *self.tolls*, the :py:class:`TollTable` that project tolls are merged into.
+        """
+        self.tolls            = TollTable.read(tollsfile)
+        self.tollsFileVersion = self.tolls.getSignature()
+
+    def writeTollsFile(self):
+        """
+        Writes *self.tolls* to ``tolls.csv`` in the workspace if it has changed since it was last read or written.
+        """
+        signature = self.tolls.getSignature()
+        if signature == self.tollsFileVersion: return
+        self.tolls.write("tolls.csv")
+        self.tollsFileVersion = signature
 
     def saveNetworkFiles(self, suffix, to_suffix):
         """
         Since roadway networks are not stored in memory but in files, this is useful
         for when the network builder is doing something tricky.
         """
+        if to_suffix:
+            self.flushNetwork()
+            self.writeTurnPenalties()
+            self.writeTollsFile()
+        else:
+            # anything pending was done after the save, so it's discarded along with the rest
+            self.pendingEdits.clear()
+            self.pendingScripts = []
         for filename in ["FREEFLOW.BLD", "turnsam.pen", "turnspm.pen", "turnsop.pen", "tolls.csv"]:
             if to_suffix:
                 shutil.copy2(src=filename, dst="{}{}".format(filename, suffix))
@@ -106,6 +195,311 @@ class HighwayNetwork(Network):
             else:
                 shutil.copy2(src="{}{}".format(filename, suffix), dst=filename)
                 WranglerLogger.debug("Copying {:20} to {}".format(filename+suffix, filename))
+        if to_suffix:
+            self.savedRoadwayTables[suffix] = self.roadwayTable
+        else:
+            self.readTurnPenalties()
+            self.readTolls()
+            self.roadwayTable = self.savedRoadwayTables.get(suffix)
+
+    def edits(self):
+        """
+        Returns the :py:class:`RoadwayEdits` for Python roadway projects to add their edits to.
+        They're applied to ``FREEFLOW.BLD`` by :py:meth:`applyEdits`.
+        """
+        return self.pendingEdits
+
+    def applyEdits(self):
+        """
+        Applies the accumulated edits from Python roadway projects (see :py:meth:`edits`) to ``FREEFLOW.BLD``
+        with a single ``runtpp`` run (or queues them as a stage of the batch job, if *batchApplyScripts*).
+        This is called before ``apply.s`` projects, and before the network file is written or exported.
+        Returns the number of edits applied.
+        """
+        if len(self.pendingEdits) == 0: return 0
+
+        import tempfile
+        num_edits = len(self.pendingEdits)
+        edits_dir = tempfile.mkdtemp(prefix="roadway_edits_")
+        WranglerLogger.info("Applying {}".format(self.pendingEdits))
+        self.pendingEdits.writeScript(edits_dir)
+        stage_name = "roadway edits from " + ",".join(self.pendingEdits.projects)
+        change_set = RoadwayChangeSet.fromEdits(self.pendingEdits)
+        self.pendingEdits.clear()
+        if self.batchApplyScripts:
+            self.pendingScripts.append((stage_name, edits_dir, "apply.s", None, change_set))
+            self.batchTempDirs.append(edits_dir)
+        else:
+            self.runApplyScript(edits_dir, "apply.s", changeSets=[change_set])
+            shutil.rmtree(edits_dir, ignore_errors=True)
+        return num_edits
+
+    def flushNetwork(self):
+        """
+        Brings ``FREEFLOW.BLD`` up to date: applies pending Python project edits and runs queued ``apply.s`` stages.
+        """
+        self.applyEdits()
+        self.runPendingScripts()
+
+    # Statements whose file arguments are made absolute (relative to the project dir) in batched stages
+    BATCH_FILE_RE = re.compile(r"""(\b(?:NETI|NETO|LINKI|LINKO|NODEI|NODEO|LOOKUPI|MATI|MATO|TURNPENI|PRINTO|DBI|RECI|RECO|ZDATI|FILE)(?:\[\d+\])?\s*=\s*)("[^"]*"|'[^']*'|[^\s,"']+)""", re.IGNORECASE)
+    # The only shell commands allowed in batched stages: copying or deleting the stage networks
+    BATCH_SHELL_RE = re.compile(r"^\s*\*\s*(copy|del)(\s+/y)?(\s+\"?FREEFLOW[^\s\"]*\"?)+\s*$", re.IGNORECASE)
+
+    @staticmethod
+    def makeBatchStage(applyDir, applyScript="apply.s", env=None):
+        """
+        Returns the text of *applyScript* rewritten to run as a stage of a batch job run in another directory:
+        ``%VAR%`` tokens for *env* are substituted, and relative files other than ``FREEFLOW*`` (the network
+        passed between stages) are made absolute in *applyDir*.  Returns None if the script can't be batched
+        because it runs shell commands other than copying or deleting ``FREEFLOW*`` files.
+        """
+        with open(os.path.join(applyDir, applyScript), 'r') as f:
+            script = f.read()
+        if env:
+            for (key, value) in env.items():
+                script = re.sub("%{}%".format(re.escape(key)), lambda match: str(value), script, flags=re.IGNORECASE)
+
+        def absolutize(match):
+            filename = match.group(2).strip("\"'")
+            if os.path.isabs(filename) or os.path.basename(filename).upper().startswith("FREEFLOW") or "%" in filename:
+                return match.group(0)
+            return '{}"{}"'.format(match.group(1), os.path.abspath(os.path.join(applyDir, filename)))
+
+        lines = []
+        for line in script.splitlines():
+            code = line.split(";")[0]
+            if code.lstrip().startswith("*"):
+                if not HighwayNetwork.BATCH_SHELL_RE.match(code): return None
+                lines.append(line)
+            elif code.strip():
+                lines.append(HighwayNetwork.BATCH_FILE_RE.sub(absolutize, code) + line[len(code):])
+            else:
+                lines.append(line)
+        return "\n".join(lines)
+
+    # copy of a script's network output over its input, e.g. *copy /y FREEFLOW.BLDOUT FREEFLOW.BLD
+    NETWORK_COPY_RE = re.compile(r"^\s*\*\s*copy(?:\s+/y)?\s+\"?(FREEFLOW[^\s\"]*)\"?\s+\"?FREEFLOW\.BLD\"?\s*$", re.IGNORECASE)
+
+    @staticmethod
+    def makeInPlaceScript(applyDir, applyScript="apply.s"):
+        """
+        Returns the text of *applyScript* rewritten to read the network from ``%WRANGLER_NETWORK%`` and write it to
+        ``%WRANGLER_NETWORK_OUT%`` (see :py:meth:`runApplyScript`) instead of ``FREEFLOW.BLD`` in *applyDir*, with the
+        final copy of its output over ``FREEFLOW.BLD`` removed.  Scripts that already use those tokens are returned as is.
+
+        Returns None if the script doesn't follow the ``apply.s`` convention closely enough to be rewritten: if it
+        uses other ``FREEFLOW*`` files, or runs shell commands on them other than that final copy.
+        """
+        with open(os.path.join(applyDir, applyScript), 'r') as f:
+            script = f.read()
+        if "%{}%".format(HighwayNetwork.NETWORK_OUT_TOKEN) in script.upper(): return script
+
+        # find the output that's copied over the input
+        outputs = set()
+        for line in script.splitlines():
+            code = line.split(";")[0]
+            if not code.lstrip().startswith("*") or "FREEFLOW" not in code.upper(): continue
+            match = HighwayNetwork.NETWORK_COPY_RE.match(code)
+            if not match: return None
+            outputs.add(match.group(1).upper())
+        if len(outputs) != 1: return None
+
+        unknown_files = []
+        def tokenize(match):
+            filename = match.group(2).strip("\"'")
+            if filename.upper() == "FREEFLOW.BLD":
+                return '{}"%{}%"'.format(match.group(1), HighwayNetwork.NETWORK_TOKEN)
+            if filename.upper() in outputs:
+                return '{}"%{}%"'.format(match.group(1), HighwayNetwork.NETWORK_OUT_TOKEN)
+            if os.path.basename(filename).upper().startswith("FREEFLOW"): unknown_files.append(filename)
+            return match.group(0)
+
+        lines = []
+        for line in script.splitlines():
+            code = line.split(";")[0]
+            if HighwayNetwork.NETWORK_COPY_RE.match(code):
+                lines.append("; {} -- the output is renamed over the input by Wrangler".format(line.strip()))
+            elif code.strip() and not code.lstrip().startswith("*"):
+                lines.append(HighwayNetwork.BATCH_FILE_RE.sub(tokenize, code) + line[len(code):])
+            else:
+                lines.append(line)
+        if unknown_files: return None
+        return "\n".join(lines)
+
+    def runPendingScripts(self):
+        """
+        Runs the ``apply.s`` stages queued when *batchApplyScripts* is set as a single Voyager job: the stages
+        are run in order in one directory, passing the network along as ``FREEFLOW.BLD``, and ``*echo`` markers
+        between them attribute output (and failures) to each project.  Returns the number of stages run.
+        """
+        if len(self.pendingScripts) == 0: return 0
+
+        import tempfile
+        stages     = self.pendingScripts
+        self.pendingScripts = []
+        batch_dir  = tempfile.mkdtemp(prefix="roadway_batch_")
+        job_lines  = []
+        for (stage_num, (stage_name, applyDir, applyScript, env, change_set)) in enumerate(stages, start=1):
+            job_lines.append("*echo {} {} {}".format(HighwayNetwork.STAGE_BEGIN, stage_num, stage_name))
+            job_lines.append(HighwayNetwork.makeBatchStage(applyDir, applyScript, env))
+            job_lines.append("*echo {} {} {}".format(HighwayNetwork.STAGE_END, stage_num, stage_name))
+        with open(os.path.join(batch_dir, "batch.job"), 'w') as f:
+            f.write("\n".join(job_lines) + "\n")
+
+        WranglerLogger.info("Running {} roadway projects as one Cube job: {}".format(len(stages), [stage[0] for stage in stages]))
+        self.runApplyScript(batch_dir, "batch.job", stageNames=[stage[0] for stage in stages],
+                            changeSets=[stage[4] for stage in stages])
+
+        shutil.rmtree(batch_dir, ignore_errors=True)
+        for temp_dir in self.batchTempDirs: shutil.rmtree(temp_dir, ignore_errors=True)
+        self.batchTempDirs = []
+        return len(stages)
+
+    def runApplyScript(self, applyDir, applyScript="apply.s", env=None, stageNames=None, changeSets=None):
+        """
+        Runs the Cube script *applyScript* in *applyDir* on ``FREEFLOW.BLD``, retrying on license errors.
+        By convention, the script reads ``FREEFLOW.BLD`` and copies its output over it at the end.
+
+        If the script is a batch job (see :py:meth:`runPendingScripts`), *stageNames* are the names of its
+        stages, and output and failures are attributed to them.
+
+        *changeSets* optionally has the :py:class:`RoadwayChangeSet` (or None) of each stage, which is used to
+        update the roadway table; see :py:meth:`updateRoadwayTable`.
+
+        If *networkInPlace* and the script can be rewritten by :py:meth:`makeInPlaceScript`, the network isn't moved:
+        the script is passed the paths of ``FREEFLOW.BLD`` and of its output next to it in the ``WRANGLER_NETWORK``
+        and ``WRANGLER_NETWORK_OUT`` environment variables, and the output is renamed over ``FREEFLOW.BLD``
+        (atomically) on success.  Since the input isn't touched, retries don't need a copy of it either.
+        """
+        # in case the script reads the tolls
+        if self.syncTollsFile: self.writeTollsFile()
+
+        in_place_script = None
+        if self.networkInPlace and not stageNames:
+            in_place_script = HighwayNetwork.makeInPlaceScript(applyDir, applyScript)
+            if in_place_script is None:
+                WranglerLogger.debug("Can't run {} in place; moving FREEFLOW.BLD to it".format(os.path.join(applyDir, applyScript)))
+
+        if in_place_script is not None:
+            network     = os.path.abspath("FREEFLOW.BLD")
+            network_out = os.path.abspath("FREEFLOW.BLDOUT")
+            env         = dict(env if env else {})
+            env[HighwayNetwork.NETWORK_TOKEN]     = network
+            env[HighwayNetwork.NETWORK_OUT_TOKEN] = network_out
+            # so a stale output isn't taken for this script's
+            if os.path.exists(network_out): os.remove(network_out)
+            runScript   = "wrangler_" + applyScript
+            with open(os.path.join(applyDir, runScript), 'w') as f:
+                f.write(in_place_script + "\n")
+        else:
+            # move the FREEFLOW.BLD into place, keeping a copy in case the job needs to be retried
+            runScript   = applyScript
+            shutil.move("FREEFLOW.BLD", os.path.join(applyDir,"FREEFLOW.BLD"))
+            shutil.copyfile(os.path.join(applyDir,"FREEFLOW.BLD"), os.path.join(applyDir,"FREEFLOW.BLD.input"))
+
+        try:
+            import Cube
+            # dispatch it, cube license
+            hostname = gethostname().lower()
+            if hostname not in HighwayNetwork.getCubeHostnames():
+                print("Dispatching cube script to taraval from %s".format(hostname))
+                f = open(os.path.join(applyDir,'runtpp_dispatch.tmp'), 'w')
+                f.write("runtpp " + runScript + "\n")
+                f.close()
+                cmd = "Y:/champ/util/bin/dispatch.bat runtpp_dispatch.tmp taraval"
+            else:
+                cmd = Cube.get_runtpp_command() + [runScript]
+
+            # output is handled as it's streamed
+            current_stage = None   # (stage number, name) of the batch stage running
+            def handleLine(line):
+                nonlocal current_stage
+                line = line.rstrip()
+                if stageNames:
+                    marker = HighwayNetwork.STAGE_RE.match(line)
+                    if marker:
+                        current_stage = (int(marker.group(2)), marker.group(3)) if marker.group(1) == HighwayNetwork.STAGE_BEGIN else None
+                        return
+                WranglerLogger.debug("[{}] {}".format(current_stage[1], line) if current_stage else line)
+
+            # on a license error, the runner retries after restoring the input
+            def beforeRetry(attempt):
+                nonlocal current_stage
+                WranglerLogger.warning("Received license error; retrying {} ...".format(attempt))
+                current_stage = None
+                if in_place_script is not None:
+                    if os.path.exists(network_out): os.remove(network_out)
+                else:
+                    shutil.copyfile(os.path.join(applyDir,"FREEFLOW.BLD.input"), os.path.join(applyDir,"FREEFLOW.BLD"))
+
+            if env:
+                run_env = copy.deepcopy(os.environ)
+                run_env.update({key:str(value) for (key, value) in env.items()})
+            else:
+                run_env = None
+            result = Cube.run_cube_job(cmd, cwd=applyDir, env=run_env, timeout=self.cubeTimeout, on_line=handleLine,
+                                       on_retry=beforeRetry, log=WranglerLogger.debug)
+            cuberet = result.returncode
+
+            if result.licenseError:
+                WranglerLogger.fatal("Out of retry attempts")
+                raise NetworkException("HighwayNetwork applyProject failed from Licensing error")
+
+            if result.timedOut:
+                failed = current_stage[1] if (stageNames and current_stage) else applyScript
+                WranglerLogger.fatal("FAIL! Project: {} timed out after {} seconds".format(failed, self.cubeTimeout))
+                raise NetworkException("HighwayNetwork applyProject timed out for {}; see log file".format(failed))
+
+            if cuberet != 0 and cuberet != 1:
+                WranglerLogger.debug("cubeStdout: {}".format(result.stdout))
+                if stageNames:
+                    failed = current_stage[1] if current_stage else "unknown stage"
+                    WranglerLogger.fatal("FAIL! Project: {} in batch job {}  cuberet={}".format(failed, applyScript, cuberet))
+                    raise NetworkException("HighwayNetwork applyProject failed for {}; see log file".format(failed))
+                WranglerLogger.fatal("FAIL! Project: {}  cuberet={}".format(applyScript, cuberet))
+                raise NetworkException("HighwayNetwork applyProject failed; see log file")
+
+            if in_place_script is not None:
+                if not os.path.exists(network_out):
+                    raise NetworkException("HighwayNetwork applyProject failed: {} didn't write {}".format(
+                                           os.path.join(applyDir, applyScript), network_out))
+                os.replace(network_out, network)
+            else:
+                # move it back
+                shutil.move(os.path.join(applyDir,"FREEFLOW.BLD"), "FREEFLOW.BLD")
+                os.remove(os.path.join(applyDir,"FREEFLOW.BLD.input"))
+        finally:
+            # don't leave the rewritten script in the project's checkout, even if the run failed
+            if in_place_script is not None and os.path.exists(os.path.join(applyDir, runScript)):
+                os.remove(os.path.join(applyDir, runScript))
+
+        self.updateRoadwayTable(changeSets if changeSets else [None])
+
+    def updateRoadwayTable(self, changeSets):
+        """
+        Updates *self.roadwayTable*, the in-memory roadway network, with the given :py:class:`RoadwayChangeSet`
+        instances of the stages of a Cube run, rather than re-exporting the network.  Only Python projects
+        (see :py:meth:`applyEdits`) have a change set: a stage without one (None) is an ``apply.s`` script,
+        which may change the network in any way, so the table is unknown until the next export.
+        """
+        for change_set in changeSets:
+            if self.roadwayTable is None: break
+            if change_set is None:
+                WranglerLogger.debug("updateRoadwayTable(): a Cube script changed the network; the roadway table will be re-exported")
+                self.roadwayTable = None
+                break
+            WranglerLogger.debug("updateRoadwayTable(): {}".format(change_set))
+            self.roadwayTable = self.roadwayTable.applyChangeSet(change_set)
+
+    def getRoadwayLinks(self):
+        """
+        Returns the set of (a, b) links of the network being built from the roadway table, if it's
+        known without an export (see :py:meth:`updateRoadwayTable`), or None.
+        """
+        self.flushNetwork()
+        if self.roadwayTable is None: return None
+        return set(self.roadwayTable.links_df.index.tolist())
 
     def applyProject(self, parentdir, networkdir, gitdir, projectsubdir=None, **kwargs):
         """
@@ -113,6 +507,9 @@ class HighwayNetwork(Network):
         By convention, the input to ``apply.s`` is ``FREEFLOW.BLD`` and the output is 
         ``FREEFLOW.BLDOUT`` which is copied to ``FREEFLOW.BLD`` at the end of ``apply.s``
 
+        Projects without an ``apply.s`` but with an ``__init__.py`` are Python projects: their ``apply()``
+        is called with this network, and their :py:class:`RoadwayEdits` accumulate until :py:meth:`applyEdits`.
+
         See :py:meth:`Wrangler.Network.applyProject` for argument details.
         """
         # special case: base network
@@ -145,87 +542,48 @@ class HighwayNetwork(Network):
             desc = open(descfilename,'r').read()
         except:
             pass
-        
-        # move the FREEFLOW.BLD into place
-        shutil.move("FREEFLOW.BLD", os.path.join(applyDir,"FREEFLOW.BLD"))
-
-        # WranglerLogger.debug("HighwayNetwork.applyProject() received kwargs:{}".format(kwargs))
-
-        # retry in case of a license error
-        NUM_RETRIES = 5
-        for attempt in range(1,NUM_RETRIES+1):
-
-            # dispatch it, cube license
-            hostname = gethostname().lower()
-            if hostname not in HighwayNetwork.getCubeHostnames():
-                print("Dispatching cube script to taraval from %s".format(hostname))
-                f = open(os.path.join(applyDir,'runtpp_dispatch.tmp'), 'w')
-                f.write("runtpp " + applyScript + "\n")
-                f.close()
-                (cuberet, cubeStdout, cubeStderr) = self._runAndLog("Y:/champ/util/bin/dispatch.bat runtpp_dispatch.tmp taraval", run_dir=applyDir, logStdoutAndStderr=True, env=kwargs) 
-            else:
-                (cuberet, cubeStdout, cubeStderr) = self._runAndLog(cmd="runtpp "+applyScript, run_dir=applyDir, env=kwargs)
-            
-
-            nodemerge = re.compile("NODEMERGE: \d+")
-            linkmerge = re.compile("LINKMERGE: \d+-\d+")
-            cube_success = re.compile("\s*(VOYAGER)\s+(ReturnCode)\s*=\s*([01])\s+")
-            license_error = False
-            for line in cubeStdout:
-                line = line.rstrip()
-                if re.match(nodemerge,line): continue
-                if re.match(linkmerge,line): continue
-                if line=="RUNTPP: Licensing error": license_error = True
-                WranglerLogger.debug(line)
-            
-            # retry on license error
-            if license_error:
-                WranglerLogger.warn("Received license error")
-                if attempt == NUM_RETRIES:
-                    WranglerLogger.fatal("Out of retry attempts")
-                    raise NetworkException("HighwayNetwork applyProject failed from Licensing error")
-
-                # retry
-                WranglerLogger.debug("Retrying {} ...".format(attempt))
-                time.sleep(1)
-                continue
-
-            if cuberet != 0 and cuberet != 1 and len(cubeStdout) > 1:
-
-                # cuberet may be wrong -- check last stdout
-                WranglerLogger.debug("checking cubeStdout[-1]: {}".format(cubeStdout[-1]))
-                # WranglerLogger.debug("match: {}".format(re.match(cube_success,cubeStdout[-1])))
-                if re.match(cube_success,cubeStdout[-1]):
-                    WranglerLogger.debug("Overriding cuberet {} with 0 due to last cubeStdout line".format(cuberet))
-                    cuberet = 0
-
-            if cuberet != 0 and cuberet != 1:
-                WranglerLogger.debug("cubeStdout: {}".format(cubeStdout))
-                WranglerLogger.fatal("FAIL! Project: {}  cuberet={}".format(applyScript, cuberet))
-                raise NetworkException("HighwayNetwork applyProject failed; see log file")
 
+        if not os.path.exists(os.path.join(applyDir, applyScript)) and os.path.exists(os.path.join(applyDir, "__init__.py")):
+            # Python project: accumulate its edits
+            projectname = projectsubdir if projectsubdir else networkdir
+            self.pendingEdits.setProject(projectname)
+            evalstr = f"import {projectname}; {projectname}.apply(self"
+            for key in kwargs.keys():
+                evalstr += f", {key}={str(kwargs[key])}"
+            evalstr += ")"
+            prev_edits = copy.deepcopy(self.pendingEdits)
+            try:
+                exec(evalstr)
+            except:
+                WranglerLogger.fatal(f"Failed to exec [{evalstr}]")
+                self.pendingEdits = prev_edits
+                raise
+            WranglerLogger.debug("Accumulated roadway edits: {}".format(self.pendingEdits))
+            project_module = sys.modules.get(projectname)
+            if not desc and hasattr(project_module, 'desc'): desc = project_module.desc()
+        else:
+            # apply (or queue) any accumulated Python edits first, then run (or queue) the script
+            self.applyEdits()
+            batch_stage = HighwayNetwork.makeBatchStage(applyDir, applyScript, kwargs) if self.batchApplyScripts else None
+            if batch_stage is not None:
+                self.pendingScripts.append((projectsubdir if projectsubdir else networkdir, applyDir, applyScript, kwargs, None))
+                WranglerLogger.debug("Queued {} as stage {} of the batch job".format(applyDir, len(self.pendingScripts)))
             else:
-                # success
-                break
-
-        # move it back
-        shutil.move(os.path.join(applyDir,"FREEFLOW.BLD"), "FREEFLOW.BLD")
+                if self.batchApplyScripts: WranglerLogger.debug("Can't batch {}; running it on its own".format(applyDir))
+                self.runPendingScripts()
+                self.runApplyScript(applyDir, applyScript, env=kwargs)
 
-        # append new turn penalty file to mine
+        # merge new turn penalties into mine; these are written by writeTurnPenalties()
         if os.path.exists(turnsfilename):
-            for filename in ["turnsam.pen", "turnspm.pen", "turnsop.pen"]:
-                newturnpens = open(turnsfilename, 'r').read()
-                turnfile = open(filename, 'a')
-                turnfile.write(newturnpens)
-                turnfile.close()
-                WranglerLogger.debug("Appending turn penalties from "+turnsfilename)
-
-        # merge tolls.csv
+            with open(turnsfilename, 'r') as f:
+                newturnpens = f.readlines()
+            for (filename, turn_penalties) in self.turnPenalties.items():
+                turn_penalties.mergeLines(newturnpens, source=turnsfilename)
+                WranglerLogger.debug("Merged turn penalties from {} into {}".format(turnsfilename, filename))
+
+        # merge tolls.csv into the toll table; it's written by write()
         if os.path.exists(tollsfilename):
-            if os.path.exists(deletetollsfilename):
-                self.mergeTolls("tolls.csv", tollsfilename, deletetollsfilename)
-            else:
-                self.mergeTolls("tolls.csv", tollsfilename)
+            self.tolls.merge(tollsfilename, deletetollsfilename if os.path.exists(deletetollsfilename) else None)
 
         WranglerLogger.debug("")
         WranglerLogger.debug("")
@@ -247,164 +605,114 @@ class HighwayNetwork(Network):
 
     def mergeTolls(self, tollsfile, newtollsfile, deletetollsfile=None):
         """
-        Merge the given tolls file with the existing.
-        """
-        WranglerLogger.debug("mergeTolls({},{}) called".format(tollsfile, newtollsfile, deletetollsfile))     
-
-        # read the original file -- fac_index is the key
-        tolls_config = collections.OrderedDict()
-        tolls        = open(tollsfile, 'r')
-        tolls_reader = csv.reader(tolls, skipinitialspace=True)
-        fieldnames   = next(tolls_reader)
-        # not using csv.DictReader because in python2, it doesn't read an ordered dict :(
-        for row in tolls_reader:
-            row_dict = collections.OrderedDict(zip(fieldnames, row))
-            WranglerLogger.debug("row_dict: {}".format(row_dict))
-            tolls_config[row_dict["fac_index"]] = row_dict
-        tolls.close()
-
-        # read the new file -- replace if fac_index matches
-        newtolls       = open(newtollsfile, 'r')
-        new_reader     = csv.reader(newtolls, skipinitialspace=True)
-        new_fieldnames = next(new_reader)
-        # they need to match, or fieldnames can be longer
-        if fieldnames == new_fieldnames:
-            # excellent
-            pass
-        elif len(new_fieldnames) < len(fieldnames) and fieldnames[:len(new_fieldnames)] == new_fieldnames:
-            # ok -- some columns at end can be blank
-            pass
-        else:
-            raise NetworkException("Toll file {} has different fieldnames ({}) than expected ({})".format(newtollsfile, new_fieldnames, fieldnames))
-
-        for row in new_reader:
-            row_dict = collections.OrderedDict(zip(fieldnames, row))
-            tolls_config[row_dict["fac_index"]] = row_dict
-        newtolls.close()
-
-        delete_fac_index = []
-        if deletetollsfile != None:
-            deletetolls        = open(deletetollsfile, 'r')   
-            newtolls           = open(newtollsfile, 'r')
-            deletetolls_reader = csv.reader(deletetolls, skipinitialspace=True)
-            for row in deletetolls_reader:
-                delete_fac_index.append(row[1])
-
-        # write it out
-        # tolls_config_sorted = collections.OrderedDict(sorted(tolls_config.items()))
-        tolls = open(tollsfile, mode='w', newline='')  # newline arg passed because of https://docs.python.org/3/library/csv.html#id3
-        tolls_writer = csv.writer(tolls)
-        tolls_writer.writerow(fieldnames)
-        for fac_index, row in tolls_config.items():
-            if not fac_index in delete_fac_index:
-                tolls_writer.writerow(row.values())
-        tolls.close()
+        Merge the given tolls file with the existing, and write it.  See :py:meth:`TollTable.merge`; the
+        network being built merges project tolls into *self.tolls* instead.
+        """
+        WranglerLogger.debug("mergeTolls({},{},{}) called".format(tollsfile, newtollsfile, deletetollsfile))
+        tolls = TollTable.read(tollsfile)
+        tolls.merge(newtollsfile, deletetollsfile)
+        tolls.write(tollsfile)
 
     def validateTurnPens(self, CubeNetFile, turnPenReportFile=None, suggestCorrectLink=True):
+        """
+        Checks that the links of each prohibited turn (with a negative penalty; see *self.turnPenalties*) exist
+        in the roadway network *CubeNetFile*.  If *suggestCorrectLink*, looks for a node that may have split a missing link and
+        suggests the corresponding turn.  Invalid turns are written to the csv *turnPenReportFile*, if passed.
+
+        Returns a list of (turn penalty filename, :py:class:`InvalidTurn`).
+
+        NOTE: this exports the network with Cube via :py:func:`Cube.import_cube_nodes_links_from_csvs`, unless
+        *CubeNetFile* is the network being built and the roadway table is known (see :py:meth:`getRoadwayLinks`)
+        """
         import Cube
-        turnpens_files = ['turnsam.pen','turnsop.pen','turnspm.pen']
-        pen_regex = r'^\s*(?P<frnode>\d+)\s+(?P<thnode>\d+)\s+(?P<tonode>\d+)\s+\d+\s+(?P<pen>-[\d+])'
+        # street names are only available for CHAMP; this matches RoadwayLinkSet so the export is shared
+        if self.modelType == Network.MODEL_TYPE_CHAMP:
+            extra_link_vars = ['STREETNAME', 'LANE_AM', 'LANE_OP','LANE_PM', 'BUSLANE_AM', 'BUSLANE_OP', 'BUSLANE_PM']
+        else:
+            extra_link_vars = []
+        roadway_links = self.getRoadwayLinks() if (CubeNetFile == "FREEFLOW.BLD" and not extra_link_vars) else None
+        if roadway_links is not None:
+            links_dict = dict.fromkeys(roadway_links)
+        else:
+            (nodes_dict, links_dict) = Cube.import_cube_nodes_links_from_csvs(CubeNetFile,
+                                                                              extra_link_vars=extra_link_vars,
+                                                                              extra_node_vars=[],
+                                                                              links_csv=os.path.join(os.getcwd(),"cubenet_validate_links.csv"),
+                                                                              nodes_csv=os.path.join(os.getcwd(),"cubenet_validate_nodes.csv"),
+                                                                              exportIfExists=True)
+        adjacency = LinkAdjacency(links_dict.keys())
+
+        def streetName(a, b):
+            if (a, b) not in links_dict: return 'missing'
+            return links_dict[(a, b)][1] if extra_link_vars else ''
+
         if turnPenReportFile:
             outfile = open(turnPenReportFile,'w')
             outfile.write('file,old_from,old_through,old_to,on_street,at_street,new_from,new_through,new_to,note\n')
-            
-        (nodes_dict, links_dict) = Cube.import_cube_nodes_links_from_csvs(CubeNetFile,
-                                                                          extra_link_vars=['LANE_AM', 'LANE_OP','LANE_PM',
-                                                                                           'BUSLANE_AM', 'BUSLANE_OP', 'BUSLANE_PM'],
-                                                                          extra_node_vars=[],
-                                                                          links_csv=os.path.join(os.getcwd(),"cubenet_validate_links.csv"),
-                                                                          nodes_csv=os.path.join(os.getcwd(),"cubenet_validate_nodes.csv"),
-                                                                          exportIfExists=True)
-        found_matches = {}
-        
-        for file_name in turnpens_files:
-            f = open(file_name,'r')
-            for line in f:
-                text = line.split(';')[0]
-                m = re.match(pen_regex, text)
-                if m:
-                    new_fr = None
-                    new_th = None
-                    new_to = None
-                    from_street = 'missing'
-                    to_street = 'missing'
-                    fr_node = int(m.groupdict()['frnode'])
-                    th_node = int(m.groupdict()['thnode'])
-                    to_node = int(m.groupdict()['tonode'])
-                    pen     = int(m.groupdict()['pen'])
-                    if not (fr_node,th_node) in links_dict:
-                        WranglerLogger.debug("HighwayNetwork.validateTurnPens: (%d, %d) not in the roadway network for %s (%d, %d, %d)" % (fr_node,th_node,file_name,fr_node,th_node,to_node))
-                        
-                        if suggestCorrectLink:
-                            new_fr = -1
-                            new_th = th_node
-                            match_links_fr = []
-                            match_links_th = []
-                            # if we already found a match for this, don't keep looking.
-                            if (fr_node,th_node) in found_matches.keys():
-                                match = found_matches[(fr_node,th_node)]
-                                new_fr = match[0][1]
-                            else:
-                                #catch the links matching fr_node on the from end
-                                for (a,b) in links_dict.keys():
-                                    if a == fr_node:
-                                        match_links_fr.append((a,b))
-                                    # and links matching th_node on the to end
-                                    if b == th_node:
-                                        match_links_th.append((a,b))
-                                # now take matched links and look for match_links_fr node b to match match_links_th node a
-                                for (a1,b1) in match_links_fr:
-                                    for (a2,b2) in match_links_th:
-                                        if b1 == a2:
-                                            #WranglerLogger.info("For link1 (%d, %d) and link2 (%d, %d): %d == %d" % (a1,b1,a2,b2,b1,a2))
-                                            found_matches[(fr_node,th_node)] = [(a1,b1),(a2,b2)]
-                                            new_fr = a2
-                                            # index 1 is streetname
-                                            from_street = links_dict[(a2,b2)][1]
-                                            break
-                    else:
-                        new_fr = fr_node
-                        from_street = links_dict[(fr_node,th_node)][1]
-        
-                            
-                    if not (th_node,to_node) in links_dict:
-                        WranglerLogger.debug("HighwayNetwork.validateTurnPens: (%d, %d) not in the roadway network for %s (%d, %d, %d)" % (th_node,to_node,file_name,fr_node,th_node,to_node))
-                        #if turnPenReportFile: outfile.write("%s,%d,%d,outbound link missing from, %d, %d, %d\n" %(file_name,th_node,to_node,fr_node,th_node,to_node))
-                        if suggestCorrectLink:
-                            new_th = th_node
-                            new_to = -1
-                            match_links_th = []
-                            match_links_to = []
-                            # if we already found a match for this, don't keep looking.
-                            if (th_node,to_node) in found_matches.keys():
-                                match = found_matches[(th_node,to_node)]
-                                new_to = match[0][1]
-                            else:
-                                #catch the links matching fr_node on the from end
-                                for (a,b) in links_dict.keys():
-                                    if a == th_node:
-                                        match_links_th.append((a,b))
-                                    # and links matching th_node on the to end
-                                    if b == to_node:
-                                        match_links_to.append((a,b))
-                                # now take matched links and look for match_links_fr node b to match match_links_th node a
-                                for (a1,b1) in match_links_th:
-                                    for (a2,b2) in match_links_to:
-                                        if b1 == a2:
-                                            #WranglerLogger.info("For link1 (%d, %d) and link2 (%d, %d): %d == %d" % (a1,b1,a2,b2,b1,a2))
-                                            found_matches[(th_node,to_node)] = [(a1,b1),(a2,b2)]
-                                            new_to = a2
-                                            to_street = links_dict[(a2,b2)][1]
-                                            break
-                    else:
-                        new_to = to_node
-                        to_street = links_dict[(th_node,to_node)][1]
-                    
-                    if new_th != None:
-                        #outfile.write('file,old_from,old_through,old_to,on_street,at_street,new_from,new_through,new_to,note\n')
-                        print(file_name,fr_node,th_node,to_node,from_street,to_street,new_fr,new_th,new_to)
-                        outfile.write('%s,%d,%d,%d,%s,%s,%d,%d,%d,note\n' % (file_name,fr_node,th_node,to_node,from_street,to_street,new_fr if new_fr else -1,new_th,new_to if new_to else -1))
-                
+
+        invalid_turns = []
+        for (file_name, turn_penalties) in self.turnPenalties.items():
+            for turn in turn_penalties.findInvalidTurns(adjacency, suggestCorrectLink, prohibitedOnly=True):
+                invalid_turns.append((file_name, turn))
+                for (a, b) in turn.missingLinks:
+                    WranglerLogger.debug("HighwayNetwork.validateTurnPens: (%d, %d) not in the roadway network for %s (%d, %d, %d)" % (a,b,file_name,turn.a,turn.b,turn.c))
+                if turnPenReportFile and turn.suggestion:
+                    (new_fr, new_th, new_to) = turn.suggestion
+                    outfile.write('%s,%d,%d,%d,%s,%s,%d,%d,%d,note\n' % (file_name,turn.a,turn.b,turn.c,
+                                  streetName(new_fr,new_th),streetName(new_th,new_to),new_fr,new_th,new_to))
+
+        if turnPenReportFile: outfile.close()
+        WranglerLogger.debug("HighwayNetwork.validateTurnPens: {} invalid turn penalties".format(len(invalid_turns)))
+        return invalid_turns
+
+    def checkConnectivity(self, cubeNetFile="FREEFLOW.BLD", transitNetwork=None):
+        """
+        Checks the connectivity of the roadway network in *cubeNetFile* (by default, the network being built):
+
+        * finds islands -- groups of nodes that aren't connected to the largest component by any link,
+          using union-find so it's near-linear in the number of links.  Islands that weren't there
+          at the last check (e.g. because a project deleted or renumbered a link) are logged as warnings.
+        * if *transitNetwork* (a :py:class:`TransitNetwork`) is passed, checks that each pair of consecutive
+          nodes in each transit line is connected by a directed roadway link or an off-road transit link.
+
+        Returns a :py:class:`ConnectivityReport`.
+
+        NOTE: this exports the network with Cube via :py:class:`RoadwayLinkSet`, unless *cubeNetFile* is the
+        network being built and the roadway table is known (see :py:meth:`getRoadwayLinks`)
+        """
+        roadway_links    = self.getRoadwayLinks() if cubeNetFile == "FREEFLOW.BLD" else None
+        if roadway_links is not None:
+            roadway_link_set = RoadwayLinkSet(roadway_links, set(), set(self.roadwayTable.nodes_df.index.tolist()))
+        else:
+            roadway_link_set = RoadwayLinkSet.forCubeNet(cubeNetFile, self.modelType)
+        # nodes without links (e.g. left by a deleted link) are islands too
+        components       = findComponents(roadway_link_set.links, nodes=roadway_link_set.nodes)
+        islands          = components[1:]
+        num_nodes        = sum([len(component) for component in components])
+
+        island_sets = set([frozenset(island) for island in islands])
+        if self.knownIslands is None:
+            new_islands = []
+        else:
+            new_islands = [island for island in islands if frozenset(island) not in self.knownIslands]
+        self.knownIslands = island_sets
+
+        WranglerLogger.debug("checkConnectivity(): {} nodes, {} links, {} islands".format(
+                             num_nodes, len(roadway_link_set), len(islands)))
+        for island in new_islands:
+            WranglerLogger.warning("checkConnectivity(): new island of {} nodes not connected to the rest of the network: {}".format(
+                                   len(island), island if len(island) <= 20 else str(island[:20]) + "..."))
+
+        bad_transit_links = []
+        if transitNetwork:
+            line_nodes        = [(line.name, line.listNodeIds()) for line in transitNetwork]
+            bad_transit_links = findBadLinksInLines(line_nodes, roadway_link_set.links, set(), transitNetwork.getTransitLinkSet())
+            for bad_link in bad_transit_links:
+                WranglerLogger.warning("checkConnectivity(): line {} link {} ({}, {}) {}".format(
+                                       bad_link.line, bad_link.seq, bad_link.a, bad_link.b, bad_link.reason))
+
+        return ConnectivityReport(num_nodes, len(roadway_link_set), islands, new_islands, bad_transit_links)
+
     def write(self, path='.', name='FREEFLOW.NET', writeEmptyFiles=True, suppressQuery=False, suppressValidation=False):
         if not os.path.exists(path):
             WranglerLogger.debug("\nPath [%s] doesn't exist; creating." % path)
@@ -423,16 +731,74 @@ class HighwayNetwork(Network):
                 if response != "Y" and response != "y":
                     exit(0)
 
+        self.flushNetwork()
         shutil.copyfile("FREEFLOW.BLD",os.path.join(path,name))
         WranglerLogger.info("Writing into %s\\%s" % (path, name))
         WranglerLogger.info("")
 
-        for filename in ["turnsam.pen",         "turnspm.pen",          "turnsop.pen", "tolls.csv"]:
-            shutil.copyfile(filename, os.path.join(path, filename))
+        self.writeTurnPenalties(path)
+        self.tolls.write(os.path.join(path, "tolls.csv"))
             
-        if not suppressValidation: self.validateTurnPens(netfile,'turnPenValidations.csv')
+        # FREEFLOW.BLD was just copied to the written network
+        if not suppressValidation: self.validateTurnPens("FREEFLOW.BLD",'turnPenValidations.csv')
+
+    # the last snapshot returned by getSnapshot()
+    lastSnapshot = None
+
+    # link variables included in shapefiles and snapshots, in addition to additional_roadway_attrs
+    SNAPSHOT_LINK_VARS = ['LANES','USE','FT','TOLLCLASS','ROUTENUM','ROUTEDIR',
+                          'CITYID','CITYNAME','FFS','SIGCOR','TOS','AUX','HOT','BRT','REGFREIGHT']
+
+    def getSnapshot(self, additional_roadway_attrs:list[str]=[]):
+        """
+        Returns a :py:class:`RoadwaySnapshot` of the network being built (``FREEFLOW.BLD`` and the toll table)
+        with :py:attr:`SNAPSHOT_LINK_VARS` plus *additional_roadway_attrs*.
+
+        If the network hasn't changed since the last snapshot, that snapshot is returned again, so
+        the "after" state of one project is the "before" state of the next without another export.
+        Pending :py:class:`RoadwayEdits` are applied to the snapshot's tables, not to ``FREEFLOW.BLD``.
+        If the roadway table is known (only Python projects were applied since the last export; see
+        :py:meth:`updateRoadwayTable`), it's used instead of exporting the network.
 
-    def writeShapefile(self, path: pathlib.Path, additional_roadway_attrs:list[str], suffix:str='', skip_nodes:bool=True):
+        NOTE: this exports the network with Cube and imports pandas
+        """
+        import hashlib
+        self.runPendingScripts()
+        sha1 = hashlib.sha1()
+        with open("FREEFLOW.BLD", 'rb') as f:
+            for chunk in iter(lambda: f.read(1024*1024), b''):
+                sha1.update(chunk)
+        sha1.update(self.tolls.getSignature().encode())
+        # pending Python project edits are applied to the tables rather than with Cube
+        if len(self.pendingEdits) > 0: sha1.update(self.pendingEdits.getSignature().encode())
+        key       = sha1.hexdigest()
+        link_vars = HighwayNetwork.SNAPSHOT_LINK_VARS + list(additional_roadway_attrs)
+        if self.lastSnapshot and self.lastSnapshot.key == key and self.lastSnapshot.hasVars(link_vars):
+            WranglerLogger.debug("getSnapshot(): reusing {}".format(self.lastSnapshot))
+            return self.lastSnapshot
+
+        tolls = self.tolls.copy()
+        if self.roadwayTable and self.roadwayTable.hasVars(link_vars):
+            WranglerLogger.debug("getSnapshot(): using roadway table {}".format(self.roadwayTable))
+            (nodes_df, links_df) = (self.roadwayTable.nodes_df, self.roadwayTable.links_df)
+        else:
+            import tempfile
+            import Cube
+            tempdir = tempfile.mkdtemp()
+            (nodes_df, links_df) = Cube.import_cube_nodes_links_as_dataframes("FREEFLOW.BLD", extra_link_vars=link_vars,
+                                            links_csv=os.path.join(tempdir,"cubenet_links.csv"),
+                                            nodes_csv=os.path.join(tempdir,"cubenet_nodes.csv"),
+                                            exportIfExists=True)
+            shutil.rmtree(tempdir, ignore_errors=True)
+            self.roadwayTable = RoadwaySnapshot(key, nodes_df, links_df, tolls)
+        if len(self.pendingEdits) > 0:
+            (nodes_df, links_df) = self.pendingEdits.applyToTables(nodes_df, links_df)
+
+        self.lastSnapshot = RoadwaySnapshot(key, nodes_df, links_df, tolls)
+        WranglerLogger.debug("getSnapshot(): created {}".format(self.lastSnapshot))
+        return self.lastSnapshot
+
+    def writeShapefile(self, path: pathlib.Path, additional_roadway_attrs:list[str], suffix:str='', skip_nodes:bool=True, fmt:str='shp'):
         """ Writes the roadway network as shape files for links and nodes (if skip_nodes=False).
         Args:
             path (pathlib.Path): The directory in which to write the shapefile.
@@ -442,6 +808,8 @@ class HighwayNetwork(Network):
               Nodes file will be written as roadway_nodes{suffix}.shp
               Tolls file will be written as tolls{suffix}.csv and tolls_long{suffix}.csv (which moves timeperiod and vehicle class to columns)
             skip_nodes (bool): pass True to skip writing roadway nodes shapefile
+            fmt (str): the vector format to write: 'shp' (shapefile), 'parquet' (GeoParquet) or 'fgb' (FlatGeobuf);
+              the latter two are faster and keep field names longer than 10 characters.
 
         Returns:
             nodes_dict: nodenum -> [X,Y]
@@ -449,91 +817,51 @@ class HighwayNetwork(Network):
         NOTE: this imports pandas, geopandas and shapely
 
         """
-        # Export as csvs
-        import tempfile
-        tempdir = tempfile.mkdtemp()
-        WranglerLogger.debug(f"Writing roadway network to tempdir {tempdir}; {additional_roadway_attrs=}")
+        from .Geometry import writeGeoDataFrame
+        snapshot = Network.allNetworks['hwy'].getSnapshot(additional_roadway_attrs)
+        WranglerLogger.debug(f"Writing {snapshot} to {path}; {additional_roadway_attrs=}")
 
-        Network.allNetworks['hwy'].write(path=tempdir, name="freeflow.net", writeEmptyFiles=False, suppressQuery=True, suppressValidation=True)
-        tempnet = os.path.join(tempdir, "freeflow.net")
-
-        # read the roadway network csvs
-        import Cube
-        link_vars = ['LANES','USE','FT','TOLLCLASS','ROUTENUM','ROUTEDIR',
-                     'CITYID','CITYNAME','FFS','SIGCOR','TOS','AUX','HOT','BRT','REGFREIGHT'] + additional_roadway_attrs
-        (nodes_dict, links_dict) = Cube.import_cube_nodes_links_from_csvs(tempnet, extra_link_vars=link_vars,
-                                        links_csv=os.path.join(tempdir,"cubenet_links.csv"),
-                                        nodes_csv=os.path.join(tempdir,"cubenet_nodes.csv"),
-                                        exportIfExists=True)
-        WranglerLogger.debug(f"Have {len(nodes_dict)} nodes and {len(links_dict)} links")
-
-        ## create node GeoDataFrame and write shapefile
-        import pandas
-        import geopandas
-        import shapely
+        ## create node and link GeoDataFrames, with all geometries created at once, and write them
         if not skip_nodes:
-            node_data = []
-            for node_num in sorted(nodes_dict.keys()):
-                node_data.append([node_num, nodes_dict[node_num][0], nodes_dict[node_num][1]])
-            nodes_df = pandas.DataFrame(data=node_data, columns=["N","X","Y"])
-            nodes_gdf = geopandas.GeoDataFrame(nodes_df, geometry=geopandas.points_from_xy(nodes_df.X, nodes_df.Y),
-                                               crs="EPSG:26910") # https://epsg.io/26910
-            nodes_gdf.to_file(filename=path / f"roadway_nodes{suffix}.shp")
-            WranglerLogger.debug(f"Wrote {len(nodes_gdf)} nodes to {path / f'roadway_nodes{suffix}.shp'}")
-
-        ## create link GeoDataFrame and write shapefile
-        link_data = []
-        link_geometry = []
-        for link_a_b in links_dict.keys():
-            link_data.append([link_a_b[0], link_a_b[1]] + links_dict[link_a_b])
-            link_geometry.append(shapely.LineString([
-                shapely.Point(nodes_dict[link_a_b[0]][0],
-                              nodes_dict[link_a_b[0]][1]),
-                shapely.Point(nodes_dict[link_a_b[1]][0],
-                              nodes_dict[link_a_b[1]][1])
-            ]))
-        links_df = pandas.DataFrame(data=link_data, columns=["A","B","DISTANCE"] + link_vars)
-        links_df = links_df.astype({'LANES':'int8', 'USE':'int8', 'FT':'int8', 'TOLLCLASS':int, 'ROUTENUM':int,
-                                    'CITYID':int, 'SIGCOR':'int8','TOS':'int8','AUX':'int8','HOT':'int8','BRT':'int8','REGFREIGHT':'int8'})
-        links_gdf = geopandas.GeoDataFrame(links_df, geometry=link_geometry, crs="EPSG:26910")
-        links_gdf.to_file(filename=path / f"roadway_links{suffix}.shp")
-        WranglerLogger.debug(f"Wrote {len(links_gdf)} links to {path / f'roadway_links{suffix}.shp'}")
-
-        # copy tolls there as well
-        shutil.copy("tolls.csv", path / f"tolls{suffix}.csv")
-        
-        # make tolls.csv long (move vehicle class and time period to column) and write to tolls_long{suffix}.csv
-        tolls_df = pandas.read_csv("tolls.csv")
-        # WranglerLogger.debug(f"Read tolls.csv; tolls_df.head:\n{tolls_df.head()}")
-        # move vehicle classes first
-        tolls_df = pandas.wide_to_long(
-            tolls_df, 
-            stubnames=["tollea","tollam","tollmd","tollpm","tollev"],
-            i=["facility_name","fac_index","tollclass","tollseg","tolltype","use","toll_flat"],
-            j="vehicle_class",
-            sep="_",
-            suffix="(da|s2|s3|vsm|sml|med|lrg)"
-        ).reset_index(drop=False)
-        # WranglerLogger.debug(f"After first wide_to_long; tolls_df.head:\n{tolls_df.head()}")
-        # now time periods
-        tolls_df = pandas.wide_to_long(
-            tolls_df,
-            stubnames="toll",
-            i=["facility_name","fac_index","tollclass","tollseg","tolltype","use","toll_flat","vehicle_class"],
-            j="timeperiod",
-            sep="",
-            suffix="(ea|am|md|pm|ev)"
-        ).reset_index(drop=False)
-        # WranglerLogger.debug(f"After second wide_to_long; tolls_df.head:\n{tolls_df.head()}")
-        tolls_df.to_csv(path / f"tolls_long{suffix}.csv", index=False)
-        WranglerLogger.debug(f"Wrote {path / f'tolls_long{suffix}.csv'}")
-
-        return nodes_dict
-
-    def reportDiff(self,netmode:str, other_network:pathlib.Path, directory:pathlib.Path, network_year:int, report_description:str, project_gitdir:str, additional_roadway_attrs:dict):
+            nodes_gdf = snapshot.nodesGeoDataFrame()
+            filename  = writeGeoDataFrame(nodes_gdf, path, f"roadway_nodes{suffix}", fmt)
+            WranglerLogger.debug(f"Wrote {len(nodes_gdf)} nodes to {filename}")
+
+        links_gdf = snapshot.linksGeoDataFrame()
+        filename  = writeGeoDataFrame(links_gdf, path, f"roadway_links{suffix}", fmt)
+        WranglerLogger.debug(f"Wrote {len(links_gdf)} links to {filename}")
+
+        # write tolls there as well
+        self.writeTolls(snapshot.tolls, path, suffix)
+
+        nodes_df = snapshot.nodes_df
+        return dict(zip(nodes_df.index.tolist(), nodes_df[["X","Y"]].values.tolist()))
+
+    def writeTolls(self, tolls, path, suffix=''):
+        """
+        Writes the given :py:class:`TollTable` to *path* as tolls{suffix}.csv, and the long version
+        (which moves timeperiod and vehicle class to columns) to tolls_long{suffix}.csv
+
+        NOTE: this imports pandas
+        """
+        tolls_file = os.path.join(path, f"tolls{suffix}.csv")
+        tolls.write(tolls_file)
+        tolls.longView().to_csv(os.path.join(path, f"tolls_long{suffix}.csv"), index=False)
+        WranglerLogger.debug(f"Wrote {tolls_file} and tolls_long{suffix}.csv")
+
+    def reportDiff(self,netmode:str, other_network, directory:pathlib.Path, network_year:int, report_description:str, project_gitdir:str, additional_roadway_attrs:dict, fmt:str='shp'):
         """
         Reports the difference ebetween this network and the other_network into the given directory.
 
+        *other_network* is either:
+
+        * a :py:class:`RoadwaySnapshot` (from :py:meth:`getSnapshot`) taken before the project.  Only the links
+          and nodes that differ are written: roadway_links_prev and roadway_nodes_prev have the deleted and
+          modified ones as they were, and roadway_links and roadway_nodes have the added and modified ones,
+          each with a ``change`` column.  Nodes are only written if any changed.
+        * a directory written by :py:meth:`writeShapefile` with suffix ``_prev`` and the same *fmt*, in which
+          case the full networks are written.
+
         NOTE: this imports pandas, geopandas and shapely
 
         Returns True if diffs were reported, false otherwise.
@@ -543,15 +871,47 @@ class HighwayNetwork(Network):
         
         # call parent version to create dir and copy in tableau
         Network.reportDiff(self, netmode, other_network, directory, network_year, report_description, project_gitdir)
-        
+
+        if isinstance(other_network, RoadwaySnapshot):
+            self.writeSnapshotDiff(other_network, self.getSnapshot(additional_roadway_attrs), directory, fmt)
+            return True
+
         # here, other_network is a tempdir with shapefiles
-        for suffix in ['shp','shx','cpg','dbf','prj']:
-            shutil.move(other_network / f"roadway_links_prev.{suffix}", 
-                        pathlib.Path(directory) / f"roadway_links_prev.{suffix}")
+        from .Geometry import vectorFilenames
+        for filename in vectorFilenames(other_network, "roadway_links_prev", fmt):
+            shutil.move(filename, pathlib.Path(directory) / os.path.basename(filename))
         shutil.move(other_network / "tolls_prev.csv",
                     pathlib.Path(directory) / "tolls_prev.csv")
         shutil.move(other_network / "tolls_long_prev.csv",
                     pathlib.Path(directory) / "tolls_long_prev.csv")
         # copy the shapefiles from there into directory
-        self.writeShapefile(path=directory, additional_roadway_attrs=additional_roadway_attrs)
-        return True
\ No newline at end of file
+        self.writeShapefile(path=directory, additional_roadway_attrs=additional_roadway_attrs, fmt=fmt)
+        return True
+
+    def writeSnapshotDiff(self, before:RoadwaySnapshot, after:RoadwaySnapshot, directory:pathlib.Path, fmt:str='shp'):
+        """
+        Writes the links and nodes that differ between the two :py:class:`RoadwaySnapshot` instances into
+        *directory*, along with both versions of the tolls; see :py:meth:`reportDiff`.  Returns the :py:class:`RoadwayDiff`.
+
+        NOTE: this imports pandas, geopandas and shapely
+        """
+        from .Geometry import writeGeoDataFrame
+        diff = before.diff(after)
+        WranglerLogger.debug("writeSnapshotDiff(): links added {} deleted {} modified {}; nodes added {} deleted {} modified {}".format(
+                             len(diff.addedLinks), len(diff.deletedLinks), len(diff.modifiedLinks),
+                             len(diff.addedNodes), len(diff.deletedNodes), len(diff.modifiedNodes)))
+
+        any_node_changes = len(diff.addedNodes) + len(diff.deletedNodes) + len(diff.modifiedNodes) > 0
+        for (snapshot, suffix, links, nodes, change) in [(before, "_prev", diff.deletedLinks, diff.deletedNodes, "deleted"),
+                                                         (after,  "",      diff.addedLinks,   diff.addedNodes,   "added")]:
+            links     = links.union(diff.modifiedLinks)
+            links_gdf = snapshot.linksGeoDataFrame(links, change=numpy.where(links.isin(diff.modifiedLinks), "modified", change))
+            if len(links_gdf)>0: writeGeoDataFrame(links_gdf, directory, f"roadway_links{suffix}", fmt)
+
+            if any_node_changes:
+                nodes     = nodes.union(diff.modifiedNodes).sort_values()
+                nodes_gdf = snapshot.nodesGeoDataFrame(nodes, change=numpy.where(nodes.isin(diff.modifiedNodes), "modified", change))
+                if len(nodes_gdf)>0: writeGeoDataFrame(nodes_gdf, directory, f"roadway_nodes{suffix}", fmt)
+
+            self.writeTolls(snapshot.tolls, directory, suffix)
+        return diff
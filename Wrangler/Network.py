@@ -1,4 +1,4 @@
-import copy, os, pathlib, re, shutil, string, subprocess, sys, tempfile
+import copy, os, pathlib, re, shutil, string, sys, tempfile
 from .Logger import WranglerLogger
 from .NetworkException import NetworkException
 from .Regexes import git_commit_pattern
@@ -45,12 +45,17 @@ class Network(object):
         if networkPlanSubdir: Network.NETWORK_PLAN_SUBDIR = networkPlanSubdir
         if networkName: Network.allNetworks[networkName] = self
 
-    def _runAndLog(self, cmd, run_dir=".", logStdoutAndStderr=False, env=None):
+    def _runAndLog(self, cmd, run_dir=".", logStdoutAndStderr=False, env=None, timeout=None):
         """
         Runs the given command in the given *run_dir*.  Returns a triple:
          (return code, stdout, stderr)
         where stdout and stderr are lists of strings.
+
+        Output is read as it's produced (and logged then, if *logStdoutAndStderr*), rather than buffered
+        until the command exits.  If it runs for more than *timeout* seconds, it's killed and the return
+        code is None.
         """
+        import Cube
         myenv = None
         retcode = None
         retStdout = []
@@ -61,24 +66,13 @@ class Network(object):
             # WranglerLogger.debug("Using environment {}".format(myenv))
 
         try:
-            proc = subprocess.Popen( cmd, cwd = run_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, env=myenv )
-
-            stdout, stderr = proc.communicate()
-
-            for line in stdout.decode().splitlines():
-                if len(line) == 0: continue
-                if logStdoutAndStderr: WranglerLogger.debug("stdout: " + line)
-                retStdout.append(line)
-
-            for line in stderr.decode().splitlines():
-                if len(line) == 0: continue
-                if logStdoutAndStderr: WranglerLogger.debug("stderr: " + line)
-                retStderr.append(line)
-
-            retcode = proc.returncode
+            result = Cube.run_command(cmd, cwd=run_dir, env=myenv, timeout=timeout,
+                                      on_stdout=(lambda line: WranglerLogger.debug("stdout: " + line)) if logStdoutAndStderr else None,
+                                      on_stderr=(lambda line: WranglerLogger.debug("stderr: " + line)) if logStdoutAndStderr else None)
+            (retcode, retStdout, retStderr) = (result.returncode, result.stdout, result.stderr)
+            if result.timedOut:
+                WranglerLogger.error(f"Timed out after {timeout} seconds: [{cmd}] run in [{run_dir}]")
             WranglerLogger.debug(f"Received {retcode} from [{cmd}] run in [{run_dir}]")
-            # WranglerLogger.debug(f"retStdout: {retStdout}")
-            # WranglerLogger.debug(f"retStderr: {retStderr}")
         
         except Exception as inst:
             WranglerLogger.error('Exception caught')
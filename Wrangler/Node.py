@@ -1,5 +1,6 @@
 import os,sys
 from .Logger import WranglerLogger
+from .NodeNames import readNodeNames
 
 __all__ = ['Node']
 
@@ -112,6 +113,22 @@ class Node(object):
         s += "\n"
         return s
 
+    def isPlain(self):
+        """
+        Returns True if this node has no attributes or comment and its stop-status matches its number,
+        so it can be fully represented by its (signed) node number.
+        """
+        return (not self.attr) and (not self.comment) and (self.stop == (self.num.find('-')<0)) and \
+               (self.num == str(int(self.num)))
+
+    # Pickling: compact tuple representation
+    def __getstate__(self):
+        return (self.num, self.stop, self.attr if self.attr else None, self.comment)
+
+    def __setstate__(self, state):
+        (self.num, self.stop, attr, self.comment) = state
+        self.attr = attr if attr else {}
+
     # Dictionary methods
     def __getitem__(self,key): return self.attr[key]
     def __setitem__(self,key,value): self.attr[key]=value
@@ -134,16 +151,7 @@ class Node(object):
         if Node.descriptions_read: return
         
         try:
-            import xlrd
-            workbook = xlrd.open_workbook(filename=os.environ["CHAMP_node_names"],
-                                          encoding_override='ascii')
-            sheet    = workbook.sheet_by_name("equiv")
-            row = 0
-            while (row < sheet.nrows):
-                Node.descriptions[int(sheet.cell_value(row,0))] = \
-                    sheet.cell_value(row,1).encode('utf-8')
-                row+=1
-            
+            Node.descriptions = readNodeNames(os.environ["CHAMP_node_names"], sheet="equiv")
             # print "Read descriptions: " + str(Node.descriptions)
         except ImportError: 
             print("Could not import xlrd module, Node descriptions unknown")
@@ -0,0 +1,101 @@
+import hashlib, json, os, tempfile
+from .Logger import WranglerLogger
+
+__all__ = ['readNodeNames']
+
+# (absolute filename, sheet) -> ((size, mtime), { node number -> name })
+_node_names_cache = {}
+
+def _cacheDir():
+    """
+    Returns the local directory for the node name caches: WRANGLER_CACHE_DIR, or ``wrangler_cache`` in the
+    temp directory.
+    """
+    return os.environ.get("WRANGLER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "wrangler_cache"))
+
+def _cacheFilename(filename, sheet):
+    key = "{}|{}".format(os.path.abspath(filename), sheet)
+    return os.path.join(_cacheDir(), "nodenames_{}.json".format(hashlib.sha1(key.encode()).hexdigest()[:16]))
+
+def _fileSha1(filename):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def _readWorkbook(filename, sheet):
+    """
+    Reads the node number -> name dictionary from the first two columns of the given sheet
+    (a sheet name or index) of the given Excel workbook, skipping rows without a node number
+    (e.g. the header).
+
+    NOTE: this imports xlrd
+    """
+    import xlrd
+    workbook = xlrd.open_workbook(filename=filename, encoding_override='ascii')
+    if isinstance(sheet, int):
+        worksheet = workbook.sheet_by_index(sheet)
+    else:
+        worksheet = workbook.sheet_by_name(sheet)
+
+    node_names = {}
+    for row in range(worksheet.nrows):
+        try:
+            node_num = int(worksheet.cell_value(row,0))
+        except ValueError:
+            continue
+        node_names[node_num] = str(worksheet.cell_value(row,1))
+    return node_names
+
+def readNodeNames(filename, sheet=0):
+    """
+    Returns a dictionary of node number (int) -> name (str) from the given sheet (a sheet name or index)
+    of the given node description workbook (e.g. ``Node Description.xls``).
+
+    The workbook is only parsed once: the result is cached for the process, and as JSON in a local cache
+    directory (see :py:func:`_cacheDir`) keyed by the workbook's size, modification time and SHA1, so later
+    processes skip the Excel parsing.
+    """
+    key        = (os.path.abspath(filename), sheet)
+    stat       = os.stat(filename)
+    file_state = (stat.st_size, stat.st_mtime)
+    if key in _node_names_cache and _node_names_cache[key][0] == file_state:
+        return _node_names_cache[key][1]
+
+    cache_file = _cacheFilename(filename, sheet)
+    node_names = None
+    sha1       = None
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'r') as f:
+                cached = json.load(f)
+            # size and mtime match, or the contents do (e.g. the workbook was copied)
+            if (cached["size"], cached["mtime"]) == file_state:
+                node_names = cached["names"]
+            elif cached["size"] == stat.st_size:
+                sha1 = _fileSha1(filename)
+                if cached["sha1"] == sha1: node_names = cached["names"]
+            if node_names is not None:
+                node_names = dict([(int(node_num), str(name)) for (node_num, name) in node_names.items()])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            WranglerLogger.debug("readNodeNames(): ignoring unreadable cache {}: {}".format(cache_file, e))
+            node_names = None
+
+    if node_names is None:
+        WranglerLogger.debug("readNodeNames(): reading {} sheet {}".format(filename, sheet))
+        node_names = _readWorkbook(filename, sheet)
+        if sha1 is None: sha1 = _fileSha1(filename)
+        try:
+            os.makedirs(_cacheDir(), exist_ok=True)
+            # written to a temporary file and renamed, so other processes never see a partial cache
+            (fd, temp_file) = tempfile.mkstemp(dir=_cacheDir(), suffix=".tmp")
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"size":stat.st_size, "mtime":stat.st_mtime, "sha1":sha1,
+                           "names":dict([(str(node_num), name) for (node_num, name) in node_names.items()])}, f)
+            os.replace(temp_file, cache_file)
+        except OSError as e:
+            WranglerLogger.debug("readNodeNames(): couldn't write cache {}: {}".format(cache_file, e))
+
+    _node_names_cache[key] = (file_state, node_names)
+    return node_names
@@ -0,0 +1,359 @@
+import json, os, re
+from collections import defaultdict
+from .Logger import WranglerLogger
+from .Network import Network
+from .NetworkException import NetworkException
+from .TransitLine import TransitLine
+from .TransitLink import TransitLink
+from .Linki import Linki
+from .PNRLink import PNRLink
+
+__all__ = ['readProjectSpecFile', 'TransitProjectSpec']
+
+def readProjectSpecFile(filename):
+    """
+    Reads a declarative project specification file and returns the contents as a dictionary.
+    Files ending in ``.json`` are read as JSON; ``.yaml`` and ``.yml`` files as YAML.
+
+    NOTE: YAML files require pyyaml, which is imported here.
+    """
+    suffix = os.path.splitext(filename)[1].lower()
+    with open(filename, 'r') as infile:
+        if suffix == ".json":
+            spec = json.load(infile)
+        elif suffix in [".yaml", ".yml"]:
+            try:
+                import yaml
+            except ImportError:
+                raise NetworkException("Reading {} requires pyyaml, which isn't installed".format(filename))
+            spec = yaml.safe_load(infile)
+        else:
+            raise NetworkException("Don't know how to read project spec file {}".format(filename))
+
+    if not isinstance(spec, dict):
+        raise NetworkException("Project spec file {} should contain a mapping at the top level".format(filename))
+    return spec
+
+class TransitProjectSpec(object):
+    """
+    Declarative transit project: a list of operations read from a YAML or JSON file, e.g.::
+
+        year: 2025
+        desc: Muni frequency and routing changes
+        operations:
+          - op: add_lines
+            file: new_lines.lin
+          - op: delete_lines
+            names: [MUN5I, MUN5O]
+            pattern: "^MUN9X"
+          - op: set_frequencies
+            lines: [MUN1I, MUN1O]
+            freqs: [0, 8, 10, 8, 15]
+          - op: set_frequencies
+            pattern: "^MUN14"
+            freqs: [6, 6]
+            timepers: [AM, PM]
+            allow_downgrades: false
+          - op: replace_segment
+            nodeA: 1001
+            nodeB: 1004
+            nodes: [1001, 1002, 1003, 1004]
+          - op: insert_stop
+            nodeA: 1001
+            nodeB: 1002
+            node: 1010
+          - op: insert_stop
+            node: 1003
+          - op: delete_support_links
+            links: [[1001, 1002]]
+            access_xfer_nodes: [1003]
+            pnr_ids: ["1004"]
+
+    Operations that act on lines may be restricted with *lines* (a list of line names) and/or
+    *pattern* (a regex matched against the line name); without either they apply to every line.
+
+    Specs are applied with :py:meth:`TransitNetwork.applyProjectSpecs`, which groups consecutive operations
+    of the same kind (across projects) and applies each group in a single pass against indexed structures.
+    Later operations override earlier ones, as they would if applied one at a time.  The exception is
+    ``insert_stop`` with *nodeA* and *nodeB*: several inserts on the same link are chained in order
+    (A, X, Y, B) rather than the later one failing to find the link the earlier one split.
+    """
+
+    OP_ADD_LINES            = "add_lines"
+    OP_DELETE_LINES         = "delete_lines"
+    OP_SET_FREQUENCIES      = "set_frequencies"
+    OP_REPLACE_SEGMENT      = "replace_segment"
+    OP_INSERT_STOP          = "insert_stop"
+    OP_DELETE_SUPPORT_LINKS = "delete_support_links"
+
+    # op -> (required keys, optional keys)
+    OPERATIONS = {
+        OP_ADD_LINES            : (["file"],                   ["replace"]),
+        OP_DELETE_LINES         : ([],                         ["names", "pattern"]),
+        OP_SET_FREQUENCIES      : (["freqs"],                  ["lines", "pattern", "timepers", "allow_downgrades"]),
+        OP_REPLACE_SEGMENT      : (["nodeA", "nodeB", "nodes"],["lines", "pattern", "preserve_stops"]),
+        OP_INSERT_STOP          : (["node"],                   ["nodeA", "nodeB", "lines", "pattern", "stop"]),
+        OP_DELETE_SUPPORT_LINKS : ([],                         ["links", "include_reverse", "access_xfer_nodes", "pnr_ids"]),
+    }
+
+    # op -> model types it supports, for ops that don't support them all
+    # (:py:meth:`TransitLine.setFreqs` only knows the CHAMP and TM1 time periods)
+    OP_MODEL_TYPES = {
+        OP_SET_FREQUENCIES      : [Network.MODEL_TYPE_CHAMP, Network.MODEL_TYPE_TM1],
+    }
+
+    # filenames recognized in a project directory by :py:meth:`TransitNetwork.applyProject`
+    SPEC_FILENAMES = ["transit_project.yaml", "transit_project.yml", "transit_project.json"]
+
+    def __init__(self, operations, year=None, desc=None, name=None, basedir="."):
+        """
+        *operations* is a list of dictionaries, each with an ``op`` key; *basedir* is the directory
+        relative to which files referenced by operations are found.
+        """
+        self.operations = operations
+        self.year       = year
+        self.desc       = desc
+        self.name       = name
+        self.basedir    = basedir
+        self.validate()
+
+    def __repr__(self):
+        return "TransitProjectSpec(name=%s, year=%s, %d operations)" % (self.name, self.year, len(self.operations))
+
+    @staticmethod
+    def read(filename, name=None):
+        """
+        Reads the given YAML or JSON file and returns a :py:class:`TransitProjectSpec`.
+        """
+        spec = readProjectSpecFile(filename)
+        return TransitProjectSpec(operations=spec.get("operations", []),
+                                  year=spec.get("year"), desc=spec.get("desc"),
+                                  name=name if name else spec.get("name", filename),
+                                  basedir=os.path.dirname(os.path.abspath(filename)))
+
+    @staticmethod
+    def findSpecFile(dirname):
+        """
+        Returns the path to the transit project spec file in *dirname*, or None if there isn't one.
+        """
+        for filename in TransitProjectSpec.SPEC_FILENAMES:
+            if os.path.exists(os.path.join(dirname, filename)):
+                return os.path.join(dirname, filename)
+        return None
+
+    def validate(self):
+        """
+        Checks that each operation is known and has the required keys.  Throws a NetworkException if not.
+        """
+        if not isinstance(self.operations, list):
+            raise NetworkException("TransitProjectSpec {}: operations should be a list".format(self.name))
+        for op_num, operation in enumerate(self.operations):
+            op = operation.get("op") if isinstance(operation, dict) else None
+            if op not in TransitProjectSpec.OPERATIONS:
+                raise NetworkException("TransitProjectSpec {} operation {}: unknown op [{}]".format(self.name, op_num, op))
+            (required, optional) = TransitProjectSpec.OPERATIONS[op]
+            for key in required:
+                if key not in operation:
+                    raise NetworkException("TransitProjectSpec {} operation {} ({}): missing {}".format(self.name, op_num, op, key))
+            for key in operation.keys():
+                if key != "op" and key not in required and key not in optional:
+                    raise NetworkException("TransitProjectSpec {} operation {} ({}): unknown key {}".format(self.name, op_num, op, key))
+            if op == TransitProjectSpec.OP_INSERT_STOP and (("nodeA" in operation) != ("nodeB" in operation)):
+                raise NetworkException("TransitProjectSpec {} operation {} ({}): specify both nodeA and nodeB or neither".format(self.name, op_num, op))
+
+    def checkModelType(self, modelType):
+        """
+        Checks that each operation supports the given model type.  Throws a NetworkException if not.
+        """
+        for op_num, operation in enumerate(self.operations):
+            model_types = TransitProjectSpec.OP_MODEL_TYPES.get(operation["op"])
+            if model_types is not None and modelType not in model_types:
+                raise NetworkException("TransitProjectSpec {} operation {} ({}): not supported for model type {}".format(
+                                       self.name, op_num, operation["op"], modelType))
+
+    @staticmethod
+    def applySpecs(network, specs):
+        """
+        Applies the given list of :py:class:`TransitProjectSpec` instances to the given :py:class:`TransitNetwork`.
+        Consecutive operations of the same kind are applied together.
+        Returns the number of operations applied.
+        """
+        # flatten to (spec, operation), then group consecutive operations of the same kind
+        groups = []
+        for spec in specs:
+            for operation in spec.operations:
+                if len(groups) > 0 and groups[-1][0] == operation["op"]:
+                    groups[-1][1].append((spec, operation))
+                else:
+                    groups.append((operation["op"], [(spec, operation)]))
+
+        num_ops = 0
+        for (op, spec_ops) in groups:
+            WranglerLogger.debug("TransitProjectSpec: applying {} {} operations from {}".format(
+                                 len(spec_ops), op, sorted(set([str(spec.name) for (spec, operation) in spec_ops]))))
+            getattr(TransitProjectSpec, "_apply_%s" % op)(network, spec_ops)
+            num_ops += len(spec_ops)
+        return num_ops
+
+    @staticmethod
+    def _lineFilter(operation):
+        """
+        Returns a function taking a line name and returning True if the operation applies to it.
+        """
+        names   = set(operation.get("lines", []))
+        pattern = re.compile(operation["pattern"]) if "pattern" in operation else None
+        if len(names) == 0 and pattern is None:
+            return lambda line_name: True
+        return lambda line_name: (line_name in names) or (pattern is not None and pattern.match(line_name) is not None)
+
+    @staticmethod
+    def _nodeIndex(network):
+        """
+        Returns a dictionary of positive node number -> { id(line) -> line } for the TransitLines using that node.
+        (TransitLines aren't hashable.)
+        """
+        lines_for_node = defaultdict(dict)
+        for line in network:
+            for node in line.n:
+                lines_for_node[abs(int(node.num))][id(line)] = line
+        return lines_for_node
+
+    @staticmethod
+    def _apply_add_lines(network, spec_ops):
+        for (spec, operation) in spec_ops:
+            network.parseFile(os.path.join(spec.basedir, operation["file"]), insert_replace=operation.get("replace", True))
+
+    @staticmethod
+    def _apply_delete_lines(network, spec_ops):
+        names    = set()
+        patterns = []
+        for (spec, operation) in spec_ops:
+            names.update(operation.get("names", []))
+            if "pattern" in operation: patterns.append(re.compile(operation["pattern"]))
+
+        missing = names.difference(network.lineNames())
+        if len(missing) > 0:
+            raise NetworkException("delete_lines: lines not found: {}".format(sorted(missing)))
+
+        for idx in range(len(network.lines)-1,-1,-1): # go backwards
+            line = network.lines[idx]
+            if not isinstance(line, TransitLine): continue
+            if line.name in names or any(pattern.match(line.name) for pattern in patterns):
+                WranglerLogger.debug("Deleting line {}".format(line.name))
+                network._journalDeletes("deleteLine", line.name, network.lines, [idx], {"spec":True})
+                del network.lines[idx]
+
+    @staticmethod
+    def _apply_set_frequencies(network, spec_ops):
+        lines = network.line('all')
+        lines_by_name = dict((line.name, line) for line in lines)
+        for (spec, operation) in spec_ops:
+            names = operation.get("lines", [])
+            missing = [name for name in names if name not in lines_by_name]
+            if len(missing) > 0:
+                raise NetworkException("set_frequencies in {}: lines not found: {}".format(spec.name, missing))
+
+            if "pattern" in operation:
+                line_filter = TransitProjectSpec._lineFilter(operation)
+                target_lines = [line for line in lines if line_filter(line.name)]
+            elif len(names) > 0:
+                target_lines = [lines_by_name[name] for name in names]
+            else:
+                target_lines = lines
+
+            for line in target_lines:
+                line.setFreqs(list(operation["freqs"]) if isinstance(operation["freqs"], list) else operation["freqs"],
+                              timepers=list(operation["timepers"]) if isinstance(operation.get("timepers"), list) else operation.get("timepers"),
+                              allowDowngrades=operation.get("allow_downgrades", True), modeltype=network.modelType)
+
+    @staticmethod
+    def _apply_replace_segment(network, spec_ops):
+        lines_for_node = TransitProjectSpec._nodeIndex(network)
+        for (spec, operation) in spec_ops:
+            nodeA = abs(int(operation["nodeA"]))
+            nodeB = abs(int(operation["nodeB"]))
+            line_filter = TransitProjectSpec._lineFilter(operation)
+            lines_for_nodeB = lines_for_node[nodeB]
+            for (line_id, line) in list(lines_for_node[nodeA].items()):
+                if line_id not in lines_for_nodeB: continue
+                if not line_filter(line.name): continue
+                if not line.hasSegment(nodeA, nodeB): continue
+                line.replaceSegment(nodeA, nodeB, [int(node_num) for node_num in operation["nodes"]],
+                                    preserveStopStatus=operation.get("preserve_stops", False))
+                # keep the index current; stale entries are harmless since hasSegment is checked
+                for node in line.n:
+                    lines_for_node[abs(int(node.num))][id(line)] = line
+
+    @staticmethod
+    def _apply_insert_stop(network, spec_ops):
+        # inserting new nodes: (nodeA, nodeB) -> [(node, line filter)] in op order; several ops splitting
+        # the same link chain their nodes in order (see the class docstring)
+        splits = defaultdict(list)
+        for (spec, operation) in spec_ops:
+            if "nodeA" not in operation: continue
+            node = abs(int(operation["node"]))
+            if not operation.get("stop", True): node = -node
+            splits[(abs(int(operation["nodeA"])), abs(int(operation["nodeB"])))].append(
+                (node, TransitProjectSpec._lineFilter(operation)))
+
+        if len(splits) > 0:
+            # one pass through the lines using the split links, with the applicable link replacements
+            lines_for_node = TransitProjectSpec._nodeIndex(network)
+            mappings = {}   # id(line) -> (line, mapping)
+            for ((nodeA, nodeB), inserts) in splits.items():
+                lines_for_nodeB = lines_for_node[nodeB]
+                for (line_id, line) in lines_for_node[nodeA].items():
+                    if line_id not in lines_for_nodeB: continue
+                    nodes = [node for (node, line_filter) in inserts if line_filter(line.name)]
+                    if len(nodes) == 0: continue
+                    if line_id not in mappings: mappings[line_id] = (line, {})
+                    mappings[line_id][1][(nodeA, nodeB)] = [nodeA] + nodes + [nodeB]
+            for (line, mapping) in mappings.values():
+                line.replaceLinks(mapping)
+
+        # setting stop status on existing nodes
+        lines_for_node = TransitProjectSpec._nodeIndex(network)
+        for (spec, operation) in spec_ops:
+            if "nodeA" in operation: continue
+            node = abs(int(operation["node"]))
+            line_filter = TransitProjectSpec._lineFilter(operation)
+            for line in lines_for_node[node].values():
+                if line_filter(line.name): line.setStop(node, operation.get("stop", True))
+
+    @staticmethod
+    def _apply_delete_support_links(network, spec_ops):
+        links     = set()
+        acc_nodes = set()
+        pnr_ids   = set()
+        for (spec, operation) in spec_ops:
+            for (nodeA, nodeB) in operation.get("links", []):
+                links.add((int(nodeA), int(nodeB)))
+                if operation.get("include_reverse", True): links.add((int(nodeB), int(nodeA)))
+            acc_nodes.update([int(node) for node in operation.get("access_xfer_nodes", [])])
+            pnr_ids.update([str(pnr_id) for pnr_id in operation.get("pnr_ids", [])])
+
+        if len(links) > 0:
+            del_idxs = [idx for idx in range(len(network.links))
+                        if isinstance(network.links[idx], TransitLink) and (network.links[idx].Anode, network.links[idx].Bnode) in links]
+            TransitProjectSpec._deleteIdxs(network, "deleteLinkForNodes", "links", network.links, del_idxs)
+
+        if len(acc_nodes) > 0:
+            for (collection_name, collection) in [("accessli", network.accessli), ("xferli", network.xferli)]:
+                del_idxs = [idx for idx in range(len(collection))
+                            if isinstance(collection[idx], Linki) and
+                               (int(collection[idx].A) in acc_nodes or int(collection[idx].B) in acc_nodes)]
+                TransitProjectSpec._deleteIdxs(network, "deleteAccessXferLinkForNode", collection_name, collection, del_idxs)
+
+        if len(pnr_ids) > 0:
+            for pnr_file in network.pnrs.keys():
+                collection = network.pnrs[pnr_file]
+                del_idxs = [idx for idx in range(len(collection))
+                            if isinstance(collection[idx], PNRLink) and collection[idx].id in pnr_ids]
+                TransitProjectSpec._deleteIdxs(network, "deletePNRLinkForId", pnr_file, collection, del_idxs)
+
+    @staticmethod
+    def _deleteIdxs(network, op, target, collection, del_idxs):
+        network._journalDeletes(op, target, collection, del_idxs, {"spec":True})
+        for del_idx in sorted(del_idxs, reverse=True):
+            WranglerLogger.debug("Removing {} {}".format(target, collection[del_idx]))
+            del collection[del_idx]
@@ -0,0 +1,43 @@
+import collections
+
+__all__ = ['RoadwayChangeSet']
+
+class RoadwayChangeSet(object):
+    """
+    The nodes and links that a roadway project added, deleted and modified, for updating an in-memory
+    roadway table (see :py:meth:`RoadwaySnapshot.applyChangeSet`) rather than re-exporting the network.
+
+    Nodes are node numbers and links are (A, B) tuples.  *nodeValues* and *linkValues* have the attribute
+    values (a dictionary of var -> value) of every added and modified node and link, as for :py:class:`RoadwayEdits`.
+    """
+    def __init__(self, source, addedNodes=[], deletedNodes=[], modifiedNodes=[],
+                 addedLinks=[], deletedLinks=[], modifiedLinks=[], nodeValues=None, linkValues=None):
+        self.source        = source
+        self.addedNodes    = set(addedNodes)
+        self.deletedNodes  = set(deletedNodes)
+        self.modifiedNodes = set(modifiedNodes)
+        self.addedLinks    = set(addedLinks)
+        self.deletedLinks  = set(deletedLinks)
+        self.modifiedLinks = set(modifiedLinks)
+        self.nodeValues    = nodeValues if nodeValues else {}
+        self.linkValues    = linkValues if linkValues else {}
+
+    def __len__(self):
+        return len(self.addedNodes) + len(self.deletedNodes) + len(self.modifiedNodes) + \
+               len(self.addedLinks) + len(self.deletedLinks) + len(self.modifiedLinks)
+
+    def __repr__(self):
+        return "RoadwayChangeSet(%s: nodes +%d -%d ~%d, links +%d -%d ~%d)" % \
+            (self.source, len(self.addedNodes), len(self.deletedNodes), len(self.modifiedNodes),
+             len(self.addedLinks), len(self.deletedLinks), len(self.modifiedLinks))
+
+    @staticmethod
+    def fromEdits(edits):
+        """
+        Returns the change set for the given :py:class:`RoadwayEdits`.
+        """
+        link_values = collections.OrderedDict(list(edits.linkAdds.items()) + list(edits.linkAttrs.items()))
+        return RoadwayChangeSet(",".join(edits.projects),
+                                addedNodes=edits.nodeAdds.keys(), addedLinks=edits.linkAdds.keys(),
+                                deletedLinks=edits.linkDeletes.keys(), modifiedLinks=edits.linkAttrs.keys(),
+                                nodeValues=dict(edits.nodeAdds), linkValues=dict(link_values))
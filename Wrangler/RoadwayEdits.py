@@ -0,0 +1,204 @@
+import collections, os
+from .Logger import WranglerLogger
+from .NetworkException import NetworkException
+
+__all__ = ['RoadwayEdits']
+
+class RoadwayEdits(object):
+    """
+    Roadway edits made by Python roadway projects: link attribute changes, link additions and deletions,
+    and node additions.  Edits from consecutive projects accumulate, and are applied to the Cube network
+    in a single ``runtpp`` run by :py:meth:`HighwayNetwork.applyEdits`, which happens before the next
+    ``apply.s`` project and before the network is written.  Until then, :py:meth:`applyToTables` applies
+    them to the tabular model (see :py:class:`RoadwaySnapshot`) so the network can be examined without Cube.
+
+    Later edits override earlier ones: setting an attribute on a link added in the same batch updates the
+    added link, deleting it drops the addition, and re-adding a deleted link keeps it with the new attributes.
+    Added links and nodes must not already be in the network.
+
+    A Python roadway project is a directory with an ``__init__.py`` (and no ``apply.s``) whose apply function
+    takes the :py:class:`HighwayNetwork`, e.g.::
+
+        def apply(network, **kwargs):
+            edits = network.edits()
+            edits.setLinkAttributes(1001, 1002, LANES=3, PROJ='MyProject')
+            edits.addNode(900001, 6050000.0, 2120000.0)
+            edits.addLink(1002, 900001, DISTANCE=0.2, LANES=1, FT=7)
+            edits.deleteLink(1002, 1003)
+    """
+    def __init__(self):
+        self.nodeAdds     = collections.OrderedDict()  # N -> {var: value} including X, Y
+        self.linkAdds     = collections.OrderedDict()  # (A, B) -> {var: value}
+        self.linkDeletes  = collections.OrderedDict()  # (A, B) -> True
+        self.linkAttrs    = collections.OrderedDict()  # (A, B) -> {var: value}, for existing links
+        self.projects     = []                         # names of the projects that made these edits
+        self.project      = None
+
+    def __len__(self):
+        return len(self.nodeAdds) + len(self.linkAdds) + len(self.linkDeletes) + len(self.linkAttrs)
+
+    def __repr__(self):
+        return "RoadwayEdits(%d node adds, %d link adds, %d link deletes, %d link changes from %s)" % \
+            (len(self.nodeAdds), len(self.linkAdds), len(self.linkDeletes), len(self.linkAttrs), self.projects)
+
+    def clear(self):
+        self.__init__()
+
+    def setProject(self, projectname):
+        """
+        Notes that subsequent edits are made by *projectname*, for logging.
+        """
+        self.project = projectname
+        if projectname not in self.projects: self.projects.append(projectname)
+
+    def getSignature(self):
+        """
+        Returns a string that identifies these edits, for keying snapshots of the edited network.
+        """
+        return repr((list(self.nodeAdds.items()), list(self.linkAdds.items()),
+                     list(self.linkDeletes.keys()), list(self.linkAttrs.items())))
+
+    @staticmethod
+    def _checkValue(var, value):
+        if isinstance(value, str) and ("'" in value or "," in value):
+            raise NetworkException("RoadwayEdits: value for {} can't contain a single quote or comma: [{}]".format(var, value))
+
+    def setLinkAttributes(self, a, b, **attrs):
+        """
+        Sets the given attributes (e.g. ``LANES=3``) on link (*a*, *b*).
+        """
+        for (var, value) in attrs.items(): RoadwayEdits._checkValue(var, value)
+        ab = (int(a), int(b))
+        if ab in self.linkDeletes:
+            raise NetworkException("RoadwayEdits: can't set {} on link {} which was deleted by {}".format(attrs, ab, self.projects))
+        if ab in self.linkAdds:
+            self.linkAdds[ab].update(attrs)
+        else:
+            self.linkAttrs.setdefault(ab, collections.OrderedDict()).update(attrs)
+
+    def setLinkAttribute(self, a, b, var, value):
+        """
+        Sets attribute *var* to *value* on link (*a*, *b*).
+        """
+        self.setLinkAttributes(a, b, **{var:value})
+
+    def addLink(self, a, b, **attrs):
+        """
+        Adds link (*a*, *b*) with the given attributes (which should include DISTANCE, in miles).
+        """
+        for (var, value) in attrs.items(): RoadwayEdits._checkValue(var, value)
+        ab = (int(a), int(b))
+        if ab in self.linkAdds:
+            raise NetworkException("RoadwayEdits: link {} was already added by {}".format(ab, self.projects))
+        if ab in self.linkDeletes:
+            # deleted and re-added: keep the existing link with the new attributes
+            del self.linkDeletes[ab]
+            self.linkAttrs[ab] = collections.OrderedDict(attrs)
+            return
+        self.linkAdds[ab] = collections.OrderedDict(attrs)
+
+    def deleteLink(self, a, b):
+        """
+        Deletes link (*a*, *b*).
+        """
+        ab = (int(a), int(b))
+        if ab in self.linkAdds:
+            del self.linkAdds[ab]
+            return
+        self.linkAttrs.pop(ab, None)
+        self.linkDeletes[ab] = True
+
+    def addNode(self, n, x, y, **attrs):
+        """
+        Adds node *n* at (*x*, *y*) with the given attributes.
+        """
+        for (var, value) in attrs.items(): RoadwayEdits._checkValue(var, value)
+        n = int(n)
+        if n in self.nodeAdds:
+            raise NetworkException("RoadwayEdits: node {} was already added by {}".format(n, self.projects))
+        self.nodeAdds[n] = collections.OrderedDict([("X", float(x)), ("Y", float(y))] + list(attrs.items()))
+
+    @staticmethod
+    def _formatValue(value):
+        if isinstance(value, str): return "'{}'".format(value)
+        return str(value)
+
+    @staticmethod
+    def _varsOf(records):
+        """
+        Returns the union of the variables of the given records (dictionaries), in order of appearance,
+        and which of those have string values.
+        """
+        variables = collections.OrderedDict()
+        for record in records:
+            for (var, value) in record.items():
+                if var not in variables: variables[var] = False
+                if isinstance(value, str): variables[var] = True
+        return variables
+
+    @staticmethod
+    def _writeRecords(filename, keys, key_vars, records):
+        """
+        Writes the given records as a csv without a header.  Returns the Cube VAR list for reading it.
+        """
+        variables = RoadwayEdits._varsOf(records)
+        with open(filename, 'w') as f:
+            for (key, record) in zip(keys, records):
+                values = list(key) + [record.get(var, "" if variables[var] else 0) for var in variables.keys()]
+                f.write(",".join([str(value) for value in values]) + "\n")
+        return ",".join(key_vars + [var + ("(C)" if is_str else "") for (var, is_str) in variables.items()])
+
+    def writeScript(self, edits_dir, script="apply.s"):
+        """
+        Writes a Cube script (and the csvs of added nodes and links) into *edits_dir* that applies these edits
+        following the ``apply.s`` convention: it reads ``FREEFLOW.BLD`` and copies its output back over it.
+        Returns the script filename.
+        """
+        lines = ["; Roadway edits from Python projects: {}".format(", ".join(self.projects)),
+                 "; {} node adds, {} link adds, {} link deletes, {} link changes".format(
+                     len(self.nodeAdds), len(self.linkAdds), len(self.linkDeletes), len(self.linkAttrs)),
+                 "RUN PGM=HWYNET",
+                 "  FILEI NETI=FREEFLOW.BLD"]
+        if len(self.nodeAdds) > 0:
+            node_vars = RoadwayEdits._writeRecords(os.path.join(edits_dir, "edits_nodes.csv"),
+                                                   [(n,) for n in self.nodeAdds.keys()], ["N"], list(self.nodeAdds.values()))
+            lines.append("  FILEI NODEI[2]=edits_nodes.csv, VAR={}".format(node_vars))
+        if len(self.linkAdds) > 0:
+            link_vars = RoadwayEdits._writeRecords(os.path.join(edits_dir, "edits_links.csv"),
+                                                   list(self.linkAdds.keys()), ["A","B"], list(self.linkAdds.values()))
+            lines.append("  FILEI LINKI[2]=edits_links.csv, VAR={}".format(link_vars))
+        lines.append("  FILEO NETO=FREEFLOW_edits.BLDOUT")
+        if len(self.nodeAdds) + len(self.linkAdds) > 0:
+            lines.append("  MERGE RECORD=T")
+
+        if len(self.linkDeletes) + len(self.linkAttrs) > 0:
+            lines.append("")
+            lines.append("  PHASE=LINKMERGE")
+            for (a, b) in self.linkDeletes.keys():
+                lines.append("    IF (A={} & B={}) DELETE".format(a, b))
+            for ((a, b), attrs) in self.linkAttrs.items():
+                lines.append("    IF (A={} & B={})".format(a, b))
+                for (var, value) in attrs.items():
+                    lines.append("      {}={}".format(var, RoadwayEdits._formatValue(value)))
+                lines.append("    ENDIF")
+            lines.append("  ENDPHASE")
+        lines.append("ENDRUN")
+        lines.append("")
+        lines.append("*copy /y FREEFLOW_edits.BLDOUT FREEFLOW.BLD")
+
+        script_file = os.path.join(edits_dir, script)
+        with open(script_file, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        WranglerLogger.debug("RoadwayEdits: wrote {} for {}".format(script_file, self))
+        return script_file
+
+    def applyToTables(self, nodes_df, links_df):
+        """
+        Returns copies of the given node and link DataFrames (indexed by N and by (A, B), as in a
+        :py:class:`RoadwaySnapshot`) with these edits applied.  Variables that aren't in the tables are ignored.
+
+        NOTE: this imports pandas
+        """
+        from .RoadwayChangeSet import RoadwayChangeSet
+        from .RoadwaySnapshot import RoadwaySnapshot
+        return RoadwaySnapshot.applyChangeSetToTables(nodes_df, links_df, RoadwayChangeSet.fromEdits(self))
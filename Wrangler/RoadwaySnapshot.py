@@ -0,0 +1,158 @@
+import collections
+from .NetworkException import NetworkException
+from .TollTable import TollTable
+
+__all__ = ['RoadwaySnapshot', 'RoadwayDiff']
+
+RoadwayDiff = collections.namedtuple('RoadwayDiff', ['addedLinks', 'deletedLinks', 'modifiedLinks',
+                                                     'addedNodes', 'deletedNodes', 'modifiedNodes'])
+RoadwayDiff.__doc__ = """
+The differences between two :py:class:`RoadwaySnapshot` instances; see :py:meth:`RoadwaySnapshot.diff`.
+The links are pandas Index objects of (A, B) and the nodes are pandas Index objects of node numbers.
+Modified links include links whose attributes changed and links with an end node that moved.
+"""
+
+class RoadwaySnapshot(object):
+    """
+    The state of a roadway network at a point in the build: its nodes and links, as typed DataFrames
+    (see :py:func:`Cube.import_cube_nodes_links_as_dataframes`), and its tolls, a :py:class:`TollTable`
+    (or the contents of a ``tolls.csv``).
+
+    *key* identifies the state (a hash of the network and tolls files), so consecutive requests for a
+    snapshot of an unchanged network can reuse one; see :py:meth:`HighwayNetwork.getSnapshot`.
+    """
+    def __init__(self, key, nodes_df, links_df, tolls):
+        self.key       = key
+        self.nodes_df  = nodes_df
+        self.links_df  = links_df
+        self.tolls     = tolls if isinstance(tolls, TollTable) else TollTable.fromText(tolls)
+
+    @property
+    def tollsText(self):
+        return self.tolls.toText()
+
+    def __repr__(self):
+        return "RoadwaySnapshot(%s, %d nodes, %d links)" % (str(self.key)[:8], len(self.nodes_df), len(self.links_df))
+
+    def hasVars(self, link_vars):
+        """
+        Returns True if this snapshot includes the given link variables.
+        """
+        return all([var in self.links_df.columns for var in link_vars])
+
+    @staticmethod
+    def applyChangeSetToTables(nodes_df, links_df, changeset):
+        """
+        Returns copies of the given node and link DataFrames (indexed by N and by (A, B)) with the given
+        :py:class:`RoadwayChangeSet` applied.  Deleting a missing row is ignored, and so are variables that
+        aren't in the tables.
+
+        NOTE: this imports pandas
+        """
+        import pandas
+        deletes  = [n for n in changeset.deletedNodes if n in nodes_df.index]
+        nodes_df = nodes_df.drop(index=deletes) if deletes else nodes_df.copy()
+        deletes  = [ab for ab in changeset.deletedLinks if ab in links_df.index]
+        links_df = links_df.drop(index=deletes) if deletes else links_df.copy()
+
+        for (n, attrs) in [(n, changeset.nodeValues.get(n, {})) for n in changeset.modifiedNodes]:
+            if n not in nodes_df.index:
+                raise NetworkException("RoadwayChangeSet: can't set {} on node {}; it's not in the network".format(dict(attrs), n))
+            for (var, value) in attrs.items():
+                if var in nodes_df.columns: nodes_df.loc[n, var] = value
+        for (ab, attrs) in [(ab, changeset.linkValues.get(ab, {})) for ab in changeset.modifiedLinks]:
+            if ab not in links_df.index:
+                raise NetworkException("RoadwayChangeSet: can't set {} on link {}; it's not in the network".format(dict(attrs), ab))
+            for (var, value) in attrs.items():
+                if var in links_df.columns: links_df.loc[ab, var] = value
+
+        # in the order they were added, if known
+        added_nodes = [n for n in changeset.nodeValues.keys() if n in changeset.addedNodes] + \
+                      sorted([n for n in changeset.addedNodes if n not in changeset.nodeValues])
+        added_links = [ab for ab in changeset.linkValues.keys() if ab in changeset.addedLinks] + \
+                      sorted([ab for ab in changeset.addedLinks if ab not in changeset.linkValues])
+        if len(added_nodes) > 0:
+            values = [changeset.nodeValues.get(n, {}) for n in added_nodes]
+            added  = pandas.DataFrame([[n] + [attrs.get(var) for var in nodes_df.columns] for (n, attrs) in zip(added_nodes, values)],
+                                      columns=[nodes_df.index.name] + list(nodes_df.columns)).set_index(nodes_df.index.name)
+            nodes_df = pandas.concat([nodes_df, added.astype(nodes_df.dtypes.to_dict(), errors='ignore')])
+        if len(added_links) > 0:
+            values = [changeset.linkValues.get(ab, {}) for ab in added_links]
+            added  = pandas.DataFrame([list(ab) + [attrs.get(var) for var in links_df.columns] for (ab, attrs) in zip(added_links, values)],
+                                      columns=list(links_df.index.names) + list(links_df.columns)).set_index(list(links_df.index.names))
+            links_df = pandas.concat([links_df, added.astype(links_df.dtypes.to_dict(), errors='ignore')])
+        return (nodes_df, links_df)
+
+    def applyChangeSet(self, changeset, key=None, tolls=None):
+        """
+        Returns a new snapshot, with the given *key*, of this one updated by the given :py:class:`RoadwayChangeSet`,
+        without re-exporting the network.
+        *tolls* defaults to this snapshot's.
+
+        NOTE: this imports pandas
+        """
+        (nodes_df, links_df) = RoadwaySnapshot.applyChangeSetToTables(self.nodes_df, self.links_df, changeset)
+        return RoadwaySnapshot(key, nodes_df, links_df, self.tolls if tolls is None else tolls)
+
+    @staticmethod
+    def _changedRows(before_df, after_df):
+        """
+        Returns the index of the rows in both DataFrames whose values (in the columns they share) differ.
+        """
+        common  = before_df.index.intersection(after_df.index)
+        columns = [column for column in before_df.columns if column in after_df.columns]
+        before  = before_df.loc[common, columns]
+        after   = after_df.loc[common, columns]
+        same    = (before == after) | (before.isna() & after.isna())
+        return common[~same.all(axis=1).to_numpy()]
+
+    def diff(self, after):
+        """
+        Returns a :py:class:`RoadwayDiff` describing how the roadway snapshot *after* differs from this one.
+        """
+        added_nodes    = after.nodes_df.index.difference(self.nodes_df.index)
+        deleted_nodes  = self.nodes_df.index.difference(after.nodes_df.index)
+        modified_nodes = RoadwaySnapshot._changedRows(self.nodes_df, after.nodes_df)
+
+        added_links    = after.links_df.index.difference(self.links_df.index)
+        deleted_links  = self.links_df.index.difference(after.links_df.index)
+        modified_links = RoadwaySnapshot._changedRows(self.links_df, after.links_df)
+
+        # links whose geometry changed because an end node moved
+        moved_nodes    = RoadwaySnapshot._changedRows(self.nodes_df[["X","Y"]], after.nodes_df[["X","Y"]])
+        if len(moved_nodes) > 0:
+            common     = self.links_df.index.intersection(after.links_df.index)
+            moved      = common.get_level_values("A").isin(moved_nodes) | common.get_level_values("B").isin(moved_nodes)
+            modified_links = modified_links.union(common[moved])
+
+        return RoadwayDiff(added_links, deleted_links, modified_links, added_nodes, deleted_nodes, modified_nodes)
+
+    def linksGeoDataFrame(self, links=None, change=None):
+        """
+        Returns a GeoDataFrame of the given links (an index of (A, B); all links by default) with A and B
+        as columns, and with a *change* column if passed.  Geometries are created at once from the node coordinates.
+
+        NOTE: this imports geopandas and shapely
+        """
+        import geopandas
+        from .Geometry import NodeCoordinates, linesFromXY
+        links_df = self.links_df if links is None else self.links_df.loc[links]
+        links_df = links_df.reset_index()
+        if change is not None: links_df["change"] = change
+        node_coords = NodeCoordinates(self.nodes_df)
+        geometry    = linesFromXY(node_coords.lookup(links_df["A"].to_numpy()), node_coords.lookup(links_df["B"].to_numpy()))
+        return geopandas.GeoDataFrame(links_df, geometry=geometry, crs="EPSG:26910") # https://epsg.io/26910
+
+    def nodesGeoDataFrame(self, nodes=None, change=None):
+        """
+        Returns a GeoDataFrame of the given nodes (an index of node numbers; all nodes by default), sorted by
+        node number, with N as a column and with a *change* column if passed.
+
+        NOTE: this imports geopandas and shapely
+        """
+        import geopandas
+        from .Geometry import pointsFromXY
+        nodes_df = self.nodes_df if nodes is None else self.nodes_df.loc[nodes]
+        nodes_df = nodes_df.sort_index().reset_index()
+        if change is not None: nodes_df["change"] = change
+        return geopandas.GeoDataFrame(nodes_df, geometry=pointsFromXY(nodes_df[["X","Y"]].to_numpy()), crs="EPSG:26910")
@@ -0,0 +1,192 @@
+import csv, hashlib, io
+from .Logger import WranglerLogger
+from .NetworkException import NetworkException
+
+__all__ = ['TollTable']
+
+class TollTable(object):
+    """
+    The contents of a ``tolls.csv``, as a DataFrame indexed by ``fac_index`` (in file order), held in
+    memory for the build: each project's ``tolls.csv`` is merged into it with :py:meth:`merge`, and it's
+    written once when the network is (see :py:meth:`HighwayNetwork.write`).
+
+    Merging never modifies the DataFrame in place, so :py:meth:`copy` is cheap, and the text and long
+    views (see :py:meth:`toText` and :py:meth:`longView`) are computed once per version.  The values are
+    kept as the strings in the files (blanks are empty strings), so the tolls are written as they were read.
+
+    NOTE: this imports pandas
+    """
+    KEY = "fac_index"
+
+    def __init__(self, tolls_df=None, fieldnames=None):
+        import pandas
+        if tolls_df is None:
+            tolls_df = pandas.DataFrame(columns=[field for field in (fieldnames if fieldnames else []) if field != TollTable.KEY],
+                                        index=pandas.Index([], name=TollTable.KEY, dtype="Int64"))
+        self.tolls_df   = tolls_df
+        self.fieldnames = list(fieldnames) if fieldnames is not None else [TollTable.KEY] + list(tolls_df.columns)
+        self._text      = None
+        self._long      = None
+
+    def __len__(self):
+        return len(self.tolls_df)
+
+    def __repr__(self):
+        return "TollTable(%d facilities)" % len(self.tolls_df)
+
+    def copy(self):
+        """
+        Returns a copy of this table which isn't affected by later merges into this one.
+        """
+        tolls = TollTable(self.tolls_df, self.fieldnames)
+        tolls._text = self._text
+        tolls._long = self._long
+        return tolls
+
+    @staticmethod
+    def _readDataFrame(text, source):
+        """
+        Returns (DataFrame of strings indexed by fac_index, fieldnames) for the given csv text, or (None, [])
+        if it's empty.
+        """
+        import pandas
+        if text.strip() == "": return (None, [])
+        fieldnames = next(csv.reader(io.StringIO(text), skipinitialspace=True))
+        if TollTable.KEY not in fieldnames:
+            raise NetworkException("Toll file {} has no {} field: {}".format(source, TollTable.KEY, fieldnames))
+        tolls_df = pandas.read_csv(io.StringIO(text), skipinitialspace=True, dtype=str, keep_default_na=False)
+        tolls_df[TollTable.KEY] = pandas.to_numeric(tolls_df[TollTable.KEY], errors='coerce').astype("Int64")
+        return (tolls_df.set_index(TollTable.KEY), fieldnames)
+
+    @staticmethod
+    def fromText(text, source="tolls"):
+        """
+        Returns the TollTable for the given contents of a ``tolls.csv``.
+        """
+        (tolls_df, fieldnames) = TollTable._readDataFrame(text, source)
+        tolls = TollTable(tolls_df, fieldnames)
+        tolls._text = text if tolls_df is not None else None
+        return tolls
+
+    @staticmethod
+    def read(filename):
+        """
+        Returns the TollTable for the given ``tolls.csv``.  An empty file gives an empty table.
+        """
+        with open(filename, 'r') as f:
+            return TollTable.fromText(f.read(), filename)
+
+    def merge(self, newtollsfile, deletetollsfile=None):
+        """
+        Merges the given project ``tolls.csv`` into this table: facilities with a ``fac_index`` that's already
+        here replace the existing ones (in place), and the rest are appended.  The new file's fields must be the
+        same as these, or a prefix of them (the missing ones are blank).  Then the facilities whose ``fac_index``
+        is in the second column of *deletetollsfile*, if passed, are deleted.
+
+        Returns (number of new facilities, number replaced, number deleted).
+        """
+        import pandas
+        with open(newtollsfile, 'r') as f:
+            (new_df, new_fieldnames) = TollTable._readDataFrame(f.read(), newtollsfile)
+        if new_df is None: new_df = pandas.DataFrame(index=pandas.Index([], name=TollTable.KEY, dtype="Int64"))
+
+        if len(self.fieldnames) == 0 or self.fieldnames == new_fieldnames:
+            # excellent
+            fieldnames = new_fieldnames
+        elif len(new_fieldnames) < len(self.fieldnames) and self.fieldnames[:len(new_fieldnames)] == new_fieldnames:
+            # ok -- some columns at end can be blank
+            fieldnames = self.fieldnames
+        else:
+            raise NetworkException("Toll file {} has different fieldnames ({}) than expected ({})".format(
+                                   newtollsfile, new_fieldnames, self.fieldnames))
+        new_df = new_df.reindex(columns=[field for field in fieldnames if field != TollTable.KEY], fill_value="")
+
+        # a fac_index repeated in the new file keeps its first position and its last values
+        new_order = new_df.index.drop_duplicates(keep='first')
+        new_df    = new_df[~new_df.index.duplicated(keep='last')].loc[new_order]
+
+        tolls_df     = self.tolls_df
+        is_replaced  = new_df.index.isin(tolls_df.index)
+        num_replaced = int(is_replaced.sum())
+        order        = tolls_df.index.append(new_df.index[~is_replaced])
+        pieces       = [df for df in [tolls_df.drop(index=new_df.index[is_replaced]), new_df] if len(df) > 0]
+        if pieces:
+            tolls_df = pandas.concat(pieces).loc[order]
+        tolls_df = tolls_df.reindex(columns=[field for field in fieldnames if field != TollTable.KEY], fill_value="")
+
+        num_deleted = 0
+        if deletetollsfile != None:
+            delete_df   = pandas.read_csv(deletetollsfile, header=None, skipinitialspace=True, dtype=str)
+            delete_idx  = pandas.to_numeric(delete_df[1], errors='coerce').dropna().astype("int64")
+            is_deleted  = tolls_df.index.isin(delete_idx)
+            num_deleted = int(is_deleted.sum())
+            tolls_df    = tolls_df[~is_deleted]
+
+        self.tolls_df   = tolls_df
+        self.fieldnames = fieldnames
+        self._text      = None
+        self._long      = None
+        WranglerLogger.debug("TollTable: merged {} new, {} replaced and {} deleted facilities from {}".format(
+                             len(new_df) - num_replaced, num_replaced, num_deleted, newtollsfile))
+        return (len(new_df) - num_replaced, num_replaced, num_deleted)
+
+    def toText(self):
+        """
+        Returns the contents of the ``tolls.csv`` for this table.
+        """
+        if self._text is None:
+            if len(self.fieldnames) == 0:
+                self._text = ""
+            else:
+                self._text = self.tolls_df.reset_index()[self.fieldnames].to_csv(index=False, lineterminator="\n")
+        return self._text
+
+    def getSignature(self):
+        """
+        Returns the SHA1 of :py:meth:`toText`, which identifies the table's state.
+        """
+        return hashlib.sha1(self.toText().encode()).hexdigest()
+
+    def write(self, filename):
+        """
+        Writes this table to the csv *filename*.
+        """
+        with open(filename, 'w', newline='') as f:
+            f.write(self.toText())
+
+    @staticmethod
+    def makeLong(tolls_df):
+        """
+        Returns the given tolls DataFrame (with fac_index as a column) made long: with vehicle class
+        and time period moved to columns.
+        """
+        import pandas
+        # move vehicle classes first
+        tolls_df = pandas.wide_to_long(
+            tolls_df,
+            stubnames=["tollea","tollam","tollmd","tollpm","tollev"],
+            i=["facility_name","fac_index","tollclass","tollseg","tolltype","use","toll_flat"],
+            j="vehicle_class",
+            sep="_",
+            suffix="(da|s2|s3|vsm|sml|med|lrg)"
+        ).reset_index(drop=False)
+        # now time periods
+        tolls_df = pandas.wide_to_long(
+            tolls_df,
+            stubnames="toll",
+            i=["facility_name","fac_index","tollclass","tollseg","tolltype","use","toll_flat","vehicle_class"],
+            j="timeperiod",
+            sep="",
+            suffix="(ea|am|md|pm|ev)"
+        ).reset_index(drop=False)
+        return tolls_df
+
+    def longView(self):
+        """
+        Returns this table made long (see :py:meth:`makeLong`), with typed values as read by pandas,
+        computed once per version of the table.
+        """
+        import pandas
+        if self._long is None:
+            self._long = TollTable.makeLong(pandas.read_csv(io.StringIO(self.toText())))
+        return self._long
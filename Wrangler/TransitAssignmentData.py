@@ -2,8 +2,8 @@
 # Original revision: Lisa Zorn 2010-8-5
 # based on old "combineTransitDBFs.py"
 #
-import csv,os,logging,string,sys,traceback,xlrd
-from dataTable import DataTable, dbfTableReader, FieldType
+import csv,os,logging,numpy,string,sys,traceback,xlrd
+from dataTable import DataTable, dbfColumnReader, dbfTableReader, FieldType
 from .TransitCapacity import TransitCapacity
 from .TransitLine import TransitLine
 from .Logger import WranglerLogger
@@ -91,6 +91,9 @@ class TransitAssignmentData:
         else:
             self.capacity   = TransitCapacity()
         self.csvColnames= None # uninitialized           
+        self.lineIds    = {}   # line name -> line id, see buildLinkIndex()
+        self.lineNames  = []   # line id -> line name
+        self.linkIndex  = {}   # (A, B, line id, SEQ) -> row in trnAsgnTable
 
         if self.timeperiod not in ["AM", "MD", "PM", "EV", "EA"]:
             raise TransitAssignmentDataException("Invalid timeperiod "+str(timeperiod))
@@ -232,326 +235,321 @@ class TransitAssignmentData:
         for field in self.trnAsgnAdditiveFields:
             self.aggregateFields[field]='f4'
 
+    def getAssignmentCsvFilename(self, mode):
+        """
+        Returns the transit assignment csv for the given *mode* in *assigndir*.
+        """
+        if self.modelType == Network.MODEL_TYPE_CHAMP:
+            if mode == "WMWVIS":
+                return os.path.join(self.assigndir, "VISWMW" + self.timeperiod + ".csv")
+            elif mode[1]=="T":
+                return os.path.join(self.assigndir, "NS" + mode + self.timeperiod + ".csv")
+            return os.path.join(self.assigndir, "SF" + mode + self.timeperiod + ".csv")
+        elif self.modelType == Network.MODEL_TYPE_TM1:
+            return os.path.join(self.assigndir, "trnlink{}_{}.csv".format(self.timeperiod.lower(), mode))
+        raise TransitAssignmentDataException("Transit assignment files unknown for model type "+str(self.modelType))
+
+    def readAssignmentCsv(self, filename, initialize=False):
+        """
+        Reads the fields we use from the transit assignment csv *filename* into a DataFrame, with one row per
+        csv row.  If *initialize*, the fields are initialized from its header row (or the defaults, if it has none).
+        Numeric columns are floats, with blanks read as 0; NAME and OWNER are strings, as they are in the file.
+
+        NOTE: this imports pandas
+        """
+        import pandas
+        with open(filename, 'r') as f:
+            firstrow = next(csv.reader([f.readline()], delimiter=',', quoting=csv.QUOTE_NONE), [])
+        hasHeader = len(firstrow) > 0 and firstrow[0] == "A"
+        if initialize and hasHeader:
+            self.initializeFields(firstrow)
+        elif not self.csvColnames:
+            self.initializeFields()
+
+        textFields    = ["NAME", "OWNER"]
+        numericFields = [field for field in self.trnAsgnCopyFields + self.trnAsgnAdditiveFields if field not in textFields]
+        dtypes        = dict((field, "float64") for field in numericFields)
+        dtypes.update((field, str) for field in textFields)
+        links_df = pandas.read_csv(filename, header=0 if hasHeader else None, names=self.csvColnames,
+                                   usecols=numericFields + textFields, index_col=False, dtype=dtypes,
+                                   quoting=csv.QUOTE_NONE, keep_default_na=False,
+                                   na_values=dict((field, [""]) for field in numericFields))
+        links_df[numericFields] = links_df[numericFields].fillna(0.0)
+        for field in ["A", "B", "MODE"]:
+            links_df[field] = links_df[field].astype("int64")
+        links_df["LINENAME"] = links_df["NAME"].str.strip()
+        return links_df
+
+    def getLineAttributes(self, linenames):
+        """
+        Returns a DataFrame indexed by the given (stripped) line names with the per-line fields
+        SYSTEM, VEHTYPE, FULLNAME, VEHCAP and GROUP, looking each distinct line up once.
+
+        NOTE: this imports pandas
+        """
+        import pandas
+        rows = []
+        for linename in pandas.unique(linenames):
+            (system, vehicletype) = self.capacity.getSystemAndVehicleType(linename, self.timeperiod)
+            try:
+                (vtype, vehcap) = self.capacity.getVehicleTypeAndCapacity(linename, self.timeperiod)
+            except:
+                vehcap = 0
+            rows.append((linename, system, vehicletype, self.capacity.getFullname(linename, self.timeperiod),
+                         vehcap, self.lineToGroup[linename] if linename in self.lineToGroup else ""))
+        return pandas.DataFrame(rows, columns=["LINENAME","SYSTEM","VEHTYPE","FULLNAME","VEHCAP","GROUP"]).set_index("LINENAME")
+
+    def getKeptRows(self, links_df, mode, lineAttrs):
+        """
+        Returns a boolean array of the rows of *links_df* (read by :py:meth:`readAssignmentCsv`) to keep:
+        those touching *profileNode* (if set), not in *ignoreModes*, and in *system* (if set).
+        """
+        keep = numpy.ones(len(links_df), dtype=bool)
+        if self.profileNode:
+            keep &= ((links_df["A"] == self.profileNode) | (links_df["B"] == self.profileNode)).to_numpy()
+            for (a, b, vol) in links_df.loc[keep & (links_df["AB_VOL"] > 0).to_numpy(), ["A","B","AB_VOL"]].itertuples(index=False):
+                WranglerLogger.info("Link %d %d for mode %s has AB_VOL %s" % (a, b, mode, vol))
+        keep &= ~links_df["MODE"].isin(self.ignoreModes).to_numpy()
+        if len(self.system)>0:
+            keep &= links_df["LINENAME"].map(lineAttrs["SYSTEM"]).isin(self.system).to_numpy()
+        return keep
+
     def readTransitAssignmentCsvs(self):
         """
         Read the transit assignment dbfs, the direct output of Cube's transit assignment.
+
+        Each mode's csv is read in bulk (see :py:meth:`readAssignmentCsv`).  The first defines the rows of
+        *trnAsgnTable* and is joined by row number to its dbf for FREQ and SEQ; the rest must have the same
+        rows, and their additive fields are summed in.  Derived fields are computed a column at a time.
+
+        NOTE: this imports pandas
         """
         self.trnAsgnTable   = False
         self.aggregateTable = False
-        warnline = {}
-        ABNameSeq_List = []  # (A,B,NAME,SEQ) from the dbf/csvs
-                
-        # open the input assignment files
+        hours = TransitLine.HOURS_PER_TIMEPERIOD[self.modelType][self.timeperiod]
+
         for mode in self.MODES:
-            if self.modelType == Network.MODEL_TYPE_CHAMP:
-                if mode == "WMWVIS":
-                    filename = os.path.join(self.assigndir, "VISWMW" + self.timeperiod + ".csv")
-                elif mode[1]=="T":
-                    filename = os.path.join(self.assigndir, "NS" + mode + self.timeperiod + ".csv")
-                else:
-                    filename = os.path.join(self.assigndir, "SF" + mode + self.timeperiod + ".csv")
-            elif self.modelType == Network.MODEL_TYPE_TM1:
-                filename = os.path.join(self.assigndir, "trnlink{}_{}.csv".format(self.timeperiod.lower(), mode))
-                
-            # Read the DBF file into datatable
+            filename = self.getAssignmentCsvFilename(mode)
             WranglerLogger.info("Reading "+filename)
+            links_df  = self.readAssignmentCsv(filename, initialize=(mode == self.MODES[0]))
+            lineAttrs = self.getLineAttributes(links_df["LINENAME"])
+            keep      = self.getKeptRows(links_df, mode, lineAttrs)
+            kept_df   = links_df[keep]
+            AB        = kept_df["A"].astype(str) + " " + kept_df["B"].astype(str)
 
-            # Create our table data structure once
+            # Initial table fill: Special stuff for the first time through
             if mode == self.MODES[0]:
-                # figure out how many records
-                numrecs = 0
-                totalrows = 0
-                                
-                filereader = csv.reader(open(filename, 'r'), delimiter=',', quoting=csv.QUOTE_NONE)
-                for row in filereader:
-                    
-                    # header row?
-                    if row[0]=="A": 
-                        self.initializeFields(row)
-                        continue
-                    elif totalrows==0 and not self.csvColnames:
-                        self.initializeFields()
-
-                    
-                    totalrows += 1
-                    if self.profileNode and \
-                       (int(row[self.colnameToCsvIndex["A"]]) != self.profileNode and
-                        int(row[self.colnameToCsvIndex["B"]]) != self.profileNode): continue
-                    
-                    if int(row[self.colnameToCsvIndex["MODE"]]) in self.ignoreModes: continue
-                    
-                    linename = row[self.colnameToCsvIndex["NAME"]].strip()
-
-                    # exclude this system?
-                    (system, vehicletype) = self.capacity.getSystemAndVehicleType(linename, self.timeperiod)
-
-                    if len(self.system)>0 and system not in self.system: continue
-
-                    numrecs += 1
-                WranglerLogger.info("Keeping %d records out of %d" % (numrecs, totalrows))
-                
-                self.trnAsgnTable = DataTable(numRecords=numrecs,
+                WranglerLogger.info("Keeping %d records out of %d" % (len(kept_df), len(links_df)))
+
+                # these fields come from the dbf because they're missing in the csv (sigh) -- join by row number
+                if self.modelType == Network.MODEL_TYPE_CHAMP:
+                    dbfname = os.path.join(self.assigndir, "SFWBW" + self.timeperiod + ".dbf")
+                else:
+                    dbfname = os.path.join(self.assigndir, "trnlink{}_{}.dbf".format(self.timeperiod.lower(), mode))
+                dbf = dbfColumnReader(dbfname, ["A","B","FREQ","SEQ"])
+                if len(dbf["A"]) < len(links_df):
+                    raise NetworkException("Dbf %s has %d rows but %s has %d" % (dbfname, len(dbf["A"]), filename, len(links_df)))
+                rows = numpy.flatnonzero(keep)
+                for field in ["A","B"]:
+                    csvValues = kept_df[field].to_numpy()
+                    bad = numpy.flatnonzero((csvValues < 100000) & (dbf[field][rows] != csvValues))
+                    if len(bad) > 0:
+                        raise NetworkException("Assertion error for %s on row %d: %s != %s" %
+                                               (field, rows[bad[0]], str(dbf[field][rows[bad[0]]]), str(csvValues[bad[0]])))
+                freq = dbf["FREQ"][rows].astype(numpy.float32)
+                seq  = dbf["SEQ"][rows]
+
+                # ABNameSeq is more complicated because we want it to be unique
+                ABName   = (AB + " " + kept_df["LINENAME"]).to_numpy(dtype=object)
+                trySeqs  = seq.copy()
+                ABNameSeq = numpy.where(seq > 0, ABName + " " + seq.astype(str).astype(object), ABName)
+                if len(set(ABNameSeq)) != len(ABNameSeq):
+                    # This line seems to be a problem... A/B/NAME/SEQ are not unique
+                    ABNameSeqSet = set()
+                    for idx in range(len(ABNameSeq)):
+                        if seq[idx] > 0:
+                            if ABNameSeq[idx] in ABNameSeqSet:
+                                WranglerLogger.warning("Non-Unique A/B/Name/Seq: " + ABNameSeq[idx] + "; faking SEQ!")
+                            # Find one that works
+                            while ABNameSeq[idx] in ABNameSeqSet:
+                                trySeqs[idx] += 1
+                                ABNameSeq[idx] = ABName[idx] + " " + str(trySeqs[idx])
+                        ABNameSeqSet.add(ABNameSeq[idx])
+
+                self.trnAsgnTable = DataTable(numRecords=len(kept_df),
                                               fieldNames=self.trnAsgnFields.keys(),
                                               numpyFieldTypes=list(self.trnAsgnFields.values()))
-                ABNameSeqSet = set()
                 WranglerLogger.debug("Created dataTable")
-            
-            # Go through the records
-            newrownum = 0  # row number in the trnAsgnTable,ABNameSeq_List -- rows we're keeping
-            oldrownum = 0  # row number in the csv,dbf -- all input rows
-            
-            filereader = csv.reader(open(filename, 'r'), delimiter=',', quoting=csv.QUOTE_NONE)
-            # for the first csv only, also read the dbf for the freq and seq fields
-            if mode == self.MODES[0]:
-                if self.modelType == Network.MODEL_TYPE_CHAMP:
-                    indbf = dbfTableReader(os.path.join(self.assigndir, "SFWBW" + self.timeperiod + ".dbf"))
-                elif self.modelType == Network.MODEL_TYPE_TM1:
-                    indbf = dbfTableReader(os.path.join(self.assigndir, "trnlink{}_{}.dbf".format(self.timeperiod.lower(), mode)))
-            else:
-                indbf = None
-            
-            for row in filereader:
-                # header row?
-                if row[0]=="A": continue
-                                                       
-                if self.profileNode:
-                    if (int(row[self.colnameToCsvIndex["A"]]) != self.profileNode and
-                        int(row[self.colnameToCsvIndex["B"]]) != self.profileNode): continue
-                    elif int(row[self.colnameToCsvIndex["AB_VOL"]]) > 0:
-                        WranglerLogger.info("Link %s %s for mode %s has AB_VOL %s" % 
-                                     (row[self.colnameToCsvIndex["A"]], 
-                                      row[self.colnameToCsvIndex["B"]], mode, 
-                                      row[self.colnameToCsvIndex["AB_VOL"]]))
-            
-                if int(row[self.colnameToCsvIndex["MODE"]]) in self.ignoreModes:
-                    oldrownum += 1
-                    continue
-                     
-                linename = row[self.colnameToCsvIndex["NAME"]].strip()
-                
-                # exclude this system?
-                (system, vehicletype) = self.capacity.getSystemAndVehicleType(linename, self.timeperiod)
-                if len(self.system)>0 and system not in self.system: continue
-            
-                # Initial table fill: Special stuff for the first time through
-                if mode == self.MODES[0]:
-
-                    # ------------ these fields just get used directly
-                    for field in self.trnAsgnCopyFields:
-                        
-                        try:
-                            # integer fields
-                            if self.trnAsgnFields[field][0] in ['u','b']:
-                                if row[self.colnameToCsvIndex[field]]=="":
-                                    self.trnAsgnTable[newrownum][field] = 0
-                                elif field in ['TIME','DIST']:
-                                    # backwards compatibility - dbfs were 100ths of a mile/min
-                                    self.trnAsgnTable[newrownum][field] = float(row[self.colnameToCsvIndex[field]])*100.0
-                                else:
-                                    self.trnAsgnTable[newrownum][field] = int(row[self.colnameToCsvIndex[field]])                               
-                            # float fields
-                            elif self.trnAsgnFields[field][0] == 'f':
-                                if row[self.colnameToCsvIndex[field]]=="":
-                                    self.trnAsgnTable[newrownum][field] = 0.0
-                                else:
-                                    self.trnAsgnTable[newrownum][field] = float(row[self.colnameToCsvIndex[field]])
-                            # text fields
-                            else:
-                                self.trnAsgnTable[newrownum][field] = row[self.colnameToCsvIndex[field]]
-                        
-                        except:
-                            WranglerLogger.fatal("Error interpreting field %s: [%s]" % (field, str(self.colnameToCsvIndex[field])))
-                            WranglerLogger.fatal("row=%s" % str(row))
-                            WranglerLogger.fatal(sys.exc_info()[0])
-                            WranglerLogger.fatal(sys.exc_info()[1])
-                            WranglerLogger.fatal(traceback.format_exc())
-                            print("Error interpreting field %s: [%s]" % (field, str(self.colnameToCsvIndex[field])))
-                            sys.exit(2)  
-                    # ------------ these fields come from the dbf because they're missing in the csv (sigh)
-                    dbfRow = indbf.__getitem__(oldrownum)
-                    if int(row[self.colnameToCsvIndex["A"]])<100000:
-                        if dbfRow["A"]!=int(row[self.colnameToCsvIndex["A"]]):
-                            raise NetworkException("Assertion error for A on row %d: %s != %s" % (oldrownum, str(dbfRow["A"]), str(row[self.colnameToCsvIndex["A"]])))
-                    if int(row[self.colnameToCsvIndex["B"]])<100000:
-                        if dbfRow["B"]!=int(row[self.colnameToCsvIndex["B"]]):
-                            raise NetworkException("Assertion error for B on row %d: %s != %s" % (oldrownum, str(dbfRow["B"]), str(row[self.colnameToCsvIndex["B"]])))
-                    self.trnAsgnTable[newrownum]["FREQ"] = dbfRow["FREQ"]
-                    self.trnAsgnTable[newrownum]["SEQ"]  = dbfRow["SEQ"]
-
-                    trySeq = dbfRow["SEQ"]
-                    # ------------ special one-time computed fields
-                    
-                    # ABNameSeq is more complicated because we want it to be unique 
-                    AB = row[self.colnameToCsvIndex["A"]] + " " + row[self.colnameToCsvIndex["B"]]
-                    self.trnAsgnTable[newrownum]["AB"] = AB
-                    
-                    ABNameSeq = AB + " " + linename
-                    if trySeq>0:
-                        tryABNameSeq = ABNameSeq + " " + str(trySeq)
-                    
-                        # This line seems to be a problem... A/B/NAME/SEQ are not unique
-                        if tryABNameSeq in ABNameSeqSet:
-                            WranglerLogger.warn("Non-Unique A/B/Name/Seq: " + tryABNameSeq + "; faking SEQ!")
-                        # Find one that works
-                        while tryABNameSeq in ABNameSeqSet:
-                            trySeq += 1
-                            tryABNameSeq = ABNameSeq + " " + str(trySeq)
-                        ABNameSeq = tryABNameSeq
-                    self.trnAsgnTable[newrownum]["ABNAMESEQ"] = ABNameSeq
-                    ABNameSeqSet.add(ABNameSeq)
-                    # WranglerLogger.debug("AABNAMESEQ={} type={}".format(ABNameSeq, type(ABNameSeq)))
-                    
-                    ABNameSeq_List.append((int(row[self.colnameToCsvIndex["A"]]),
-                                           int(row[self.colnameToCsvIndex["B"]]),
-                                           row[self.colnameToCsvIndex["NAME"]],
-                                           trySeq))
-                                        
-                    # ------------ straight lookup FULLNAME, VEHTYPE, VEHCAP; easy calc for PERIODCAP
-                    self.trnAsgnTable[newrownum]["SYSTEM"]  = system
-                    self.trnAsgnTable[newrownum]["VEHTYPE"] = vehicletype
-
-                    self.trnAsgnTable[newrownum]["FULLNAME"] = self.capacity.getFullname(linename, self.timeperiod)
-                        
-                    try:
-                       (vtype, vehcap) = self.capacity.getVehicleTypeAndCapacity(linename, self.timeperiod)
-
-                       self.trnAsgnTable[newrownum]["VEHCAP"] = vehcap
-                       self.trnAsgnTable[newrownum]["PERIODCAP"] = TransitLine.HOURS_PER_TIMEPERIOD[self.modelType][self.timeperiod] * 60.0 * vehcap/self.trnAsgnTable[newrownum]["FREQ"]
-                    except:
-                       self.trnAsgnTable[newrownum]["VEHCAP"] = 0
-                       self.trnAsgnTable[newrownum]["PERIODCAP"] = 0
-
-                    # if we still don't have a system, warn
-                    if self.trnAsgnTable[newrownum]["SYSTEM"] == "" and linename not in warnline:
-                        WranglerLogger.warning("No default system: " + linename)
-                        warnline[linename] =1
-                    
-                    #---------add in any grouping that may want to use
-                    if linename in self.lineToGroup:
-                        self.trnAsgnTable[newrownum]["GROUP"] = self.lineToGroup[linename]
+                fields = self.trnAsgnTable.getNumpyArray()
+
+                # ------------ these fields just get used directly
+                for field in self.trnAsgnCopyFields:
+                    if field in ['TIME','DIST']:
+                        # backwards compatibility - dbfs were 100ths of a mile/min
+                        fields[field] = kept_df[field].to_numpy() * 100.0
+                    elif self.trnAsgnFields[field][0] in ['u','b','f']:
+                        fields[field] = kept_df[field].to_numpy()
                     else:
-                        self.trnAsgnTable[newrownum]["GROUP"] = ""
-                    
-                    # initialize additive fields
-                    for field in self.trnAsgnAdditiveFields:
-                        if row[self.colnameToCsvIndex[field]]=="":
-                            self.trnAsgnTable[newrownum][field] = 0.0
-                        else:
-                            self.trnAsgnTable[newrownum][field] = float(row[self.colnameToCsvIndex[field]])
-
-                    # end initial table fill
-                
-                # Add in the subsequent assignment files
-                else:
-                    
-                    # print oldrownum, newrownum, ABNameSeq_List[newrownum]
-                    # print row[self.colnameToCsvIndex["NAME"]], ABNameSeq_List[oldrownum][2]
-                    if ((int(row[self.colnameToCsvIndex["A"]]) != ABNameSeq_List[newrownum][0]) or
-                        (int(row[self.colnameToCsvIndex["B"]]) != ABNameSeq_List[newrownum][1])):
-                        WranglerLogger.debug(row)
-                        WranglerLogger.debug(ABNameSeq_List[newrownum])
-                    assert(int(row[self.colnameToCsvIndex["A"]]) == ABNameSeq_List[newrownum][0])
-                    assert(int(row[self.colnameToCsvIndex["B"]]) == ABNameSeq_List[newrownum][1])
-                    # these don't nec match, can be *32 in ferry skim rather than the bart vehicle name, for example
-                    # assert(  row[self.colnameToCsvIndex["NAME"]] == ABNameSeq_List[newrownum][2])
-                    
-                    ABNameSeq = row[self.colnameToCsvIndex["A"]] + " " + \
-                                row[self.colnameToCsvIndex["B"]] + " " + \
-                                row[self.colnameToCsvIndex["NAME"]].rstrip()
-                    if ABNameSeq_List[newrownum][3]>0:
-                        ABNameSeq += " " + str(ABNameSeq_List[newrownum][3])
-                    # convert to bytes - the index in the dataTable is a byte string
-                    ABNameSeq = ABNameSeq.encode('utf-8')
-                    for field in self.trnAsgnAdditiveFields:
-                        if row[self.colnameToCsvIndex[field]] !="":
-                            self.trnAsgnTable[ABNameSeq][field] += float(row[self.colnameToCsvIndex[field]])
-                        
-                newrownum += 1   
-                oldrownum += 1
-
-            # we're done with this; free it up
-            del filereader
-            if indbf: 
-                del indbf
-            
-            # Table is created and filled -- set the index
-            if mode == self.MODES[0]: 
+                        fields[field] = kept_df[field].str.encode('utf-8').to_numpy()
+                fields["FREQ"]      = freq
+                fields["SEQ"]       = seq
+                fields["AB"]        = AB.str.encode('utf-8').to_numpy()
+                fields["ABNAMESEQ"] = [key.encode('utf-8') for key in ABNameSeq]
+                tableKeys           = ABNameSeq
+
+                # ------------ straight lookup FULLNAME, VEHTYPE, VEHCAP, GROUP; easy calc for PERIODCAP
+                kept_attrs = lineAttrs.loc[kept_df["LINENAME"]]
+                for field in ["SYSTEM","VEHTYPE","FULLNAME","GROUP"]:
+                    fields[field] = kept_attrs[field].str.encode('utf-8').to_numpy()
+                vehcap = kept_attrs["VEHCAP"].to_numpy(dtype=numpy.float64)
+                fields["VEHCAP"] = vehcap
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    fields["PERIODCAP"] = numpy.where(vehcap > 0, hours * 60.0 * vehcap / freq, 0.0)
+
+                # if we still don't have a system, warn
+                for linename in lineAttrs.index[(lineAttrs["SYSTEM"] == "").to_numpy() & lineAttrs.index.isin(kept_df["LINENAME"])]:
+                    WranglerLogger.warning("No default system: " + linename)
+
+                # initialize additive fields
+                for field in self.trnAsgnAdditiveFields:
+                    fields[field] = kept_df[field].to_numpy()
+
+                # Table is created and filled -- set the index
                 try:
                     self.trnAsgnTable.setIndex(fieldName="ABNAMESEQ")
                 except:
                     # failure - try to figure out why
-                    ABNameSeqList = []
-                    for row in self.trnAsgnTable:
-                        ABNameSeqList.append(row["ABNAMESEQ"])
-                    ABNameSeqList.sort()
+                    ABNameSeqList = sorted(fields["ABNAMESEQ"])
                     for idx in range(len(ABNameSeqList)-1):
                         if ABNameSeqList[idx]==ABNameSeqList[idx+1]:
                             WranglerLogger.fatal("Duplicate ABNAMESEQ at idx %d : [%s]" % (idx,ABNameSeqList[idx]))
                     exit(1)
+                self.buildLinkIndex(fields["A"], fields["B"], kept_df["LINENAME"].to_numpy(), trySeqs)
+                continue
+
+            # Add in the subsequent assignment files: these have the same rows as the first
+            if len(kept_df) != len(fields) or \
+               (kept_df["A"].to_numpy() != fields["A"]).any() or (kept_df["B"].to_numpy() != fields["B"]).any():
+                raise NetworkException("Links in %s don't match those of the first transit assignment file" % filename)
+            # the names don't nec match, can be *32 in ferry skim rather than the bart vehicle name, for example
+            ABNameSeq = (AB + " " + kept_df["NAME"].str.rstrip()).to_numpy(dtype=object)
+            ABNameSeq = numpy.where(trySeqs > 0, ABNameSeq + " " + trySeqs.astype(str).astype(object), ABNameSeq)
+            sameRow   = ABNameSeq == tableKeys
+            for field in self.trnAsgnAdditiveFields:
+                fields[field][sameRow] += kept_df[field].to_numpy()[sameRow]
+            # the others are added to the row with their key
+            for idx in numpy.flatnonzero(~sameRow):
+                row = self.trnAsgnTable[ABNameSeq[idx].encode('utf-8')]
+                for field in self.trnAsgnAdditiveFields:
+                    row[field] += kept_df[field].iat[idx]
 
         # ok the table is all filled in -- fill in the LOAD
-        for row in self.trnAsgnTable:
-            if row["VEHCAP"] == 0: continue
-            tpfactor = self.TIMEPERIOD_FACTOR[self.timeperiod]
-            
+        tpfactor = numpy.full(len(fields), self.TIMEPERIOD_FACTOR[self.timeperiod])
+        for (key, factors) in self.TIMEPERIOD_FACTOR.items():
             # mode-specific peaking factor will over-ride
-            if row["MODE"] in self.TIMEPERIOD_FACTOR:
-                tpfactor = self.TIMEPERIOD_FACTOR[row["MODE"]][self.timeperiod]
-                
-            row["LOAD"] = row["AB_VOL"] * tpfactor * row["FREQ"] / (60.0 * row["VEHCAP"])
+            if key in ["AM", "MD", "PM", "EV", "EA"]: continue
+            tpfactor[fields["MODE"] == key] = factors[self.timeperiod]
+        hasCap = fields["VEHCAP"] != 0
+        fields["LOAD"][hasCap] = (fields["AB_VOL"] * tpfactor * fields["FREQ"])[hasCap] / (60.0 * fields["VEHCAP"][hasCap])
 
         # build the aggregate table for key="A B"
         if self.aggregateAll:
             self.buildAggregateTable()
-        
+
+    def buildLinkIndex(self, a, b, linenames, seqs):
+        """
+        Builds the integer index of *trnAsgnTable* used by :py:meth:`getRecord`, given its A, B, line name and SEQ
+        (as used in ABNAMESEQ, so faked if need be) by row.  Line names are interned as line ids in *lineIds*,
+        so lookups hash tuples of ints rather than formatting and hashing a string key.
+
+        NOTE: this imports pandas
+        """
+        import pandas
+        (codes, uniques) = pandas.factorize(numpy.asarray(linenames, dtype=object))
+        self.lineNames = list(uniques)
+        self.lineIds   = dict((linename, lineId) for (lineId, linename) in enumerate(self.lineNames))
+        self.linkIndex = dict(zip(zip(numpy.asarray(a).tolist(), numpy.asarray(b).tolist(), codes.tolist(),
+                                      numpy.asarray(seqs).tolist()), range(len(codes))))
+        if len(self.linkIndex) != len(codes):
+            raise TransitAssignmentDataException("A/B/NAME/SEQ are not unique in transit assignment data")
+
+    def buildLinkIndexFromKeys(self):
+        """
+        Builds the integer index of *trnAsgnTable* (see :py:meth:`buildLinkIndex`) from its ABNAMESEQ field,
+        for tables read from dbfs.
+
+        NOTE: this imports pandas
+        """
+        import pandas
+        keys = pandas.Series(self.trnAsgnTable.getNumpyArray()["ABNAMESEQ"]).str.decode('utf-8')
+        parts = keys.str.strip().str.extract(r"^(\d+) (\d+) (.*?)(?: (\d+))?$")
+        if parts[0].isna().any():
+            raise TransitAssignmentDataException("Couldn't parse ABNAMESEQ [%s]" % keys[parts[0].isna()].iloc[0])
+        self.buildLinkIndex(parts[0].astype("int64"), parts[1].astype("int64"), parts[2],
+                            parts[3].fillna("0").astype("int64"))
+
+    def getLineId(self, linename):
+        """
+        Returns the line id for *linename* (e.g. MUN30I) to pass to :py:meth:`getRecord` and the
+        lookups that use it, or None if the line isn't in the assignment.
+        """
+        return self.lineIds.get(linename.upper())
+
+    def getRecord(self, line, a, b, seq):
+        """
+        Returns the *trnAsgnTable* record for the link (*a*, *b*) with the given *seq* on *line*, which is either
+        a line name or, to skip the name lookup, a line id from :py:meth:`getLineId`.
+        Throws an exception if there's no such record.
+        """
+        if isinstance(line, (int, numpy.integer)):
+            lineId = line
+        else:
+            lineId = self.lineIds.get(line.upper())
+        row = self.linkIndex.get((a, b, lineId, seq))
+        if row is None:
+            linename = self.lineNames[lineId] if isinstance(line, (int, numpy.integer)) and 0 <= lineId < len(self.lineNames) else line
+            raise TransitAssignmentDataException("key [%d %d %s %d] not found in transit assignment data" % (a, b, linename, seq))
+        return self.trnAsgnTable.getNumpyArray()[row]
+
     def buildAggregateTable(self):
-        # first find how big it is
-        ABSet = set()       
-        for row in self.trnAsgnTable:
-            ABSet.add(row["AB"])
-        
-        self.aggregateTable = DataTable(numRecords=len(ABSet),
+        """
+        Builds *aggregateTable* from *trnAsgnTable*: one row per link (key="A B"), in the order the links
+        first appear, with the line-level fields summed (or for FREQ, combined) over the lines using the link.
+
+        NOTE: this imports pandas
+        """
+        import pandas
+        fields = self.trnAsgnTable.getNumpyArray()
+        line_df = pandas.DataFrame(dict((field, fields[field]) for field in
+                                        ["AB","A","B","DIST","PERIODCAP","LOAD","FREQ"] + self.trnAsgnAdditiveFields))
+        with numpy.errstate(divide='ignore'):
+            line_df["FREQ"] = 1/line_df["FREQ"]  # combining -- will take reciprocal later
+        grouped = line_df.groupby("AB", sort=False)
+        agg_df  = grouped[["A","B","DIST"]].first()
+        sums_df = grouped[self.trnAsgnAdditiveFields + ["PERIODCAP","FREQ"]].sum()
+        # AB_VOL and BA_VOL have always been counted twice here; kept so aggregate dbfs compare across runs
+        sums_df["AB_VOL"] *= 2
+        sums_df["BA_VOL"] *= 2
+
+        self.aggregateTable = DataTable(numRecords=len(agg_df),
                                         fieldNames=list(self.aggregateFields.keys()),
                                         numpyFieldTypes=list(self.aggregateFields.values()))
-        ABtoRowIndex = {}
-        rowsUsed = 0
-        for row in self.trnAsgnTable:
-            if row["AB"] not in ABtoRowIndex:
-                rowIndex = rowsUsed
-                self.aggregateTable[rowIndex]["AB"]     = row["AB"]
-                self.aggregateTable[rowIndex]["A"]      = row["A"]
-                self.aggregateTable[rowIndex]["B"]      = row["B"]
-                self.aggregateTable[rowIndex]["DIST"]   = row["DIST"]
-                self.aggregateTable[rowIndex]["FREQ"]       = 0.0
-                self.aggregateTable[rowIndex]["PERIODCAP"]  = 0.0
-                self.aggregateTable[rowIndex]["LOAD"]       = 0.0
-                self.aggregateTable[rowIndex]["MAXLOAD"]    = 0.0
-                for field in self.trnAsgnAdditiveFields:    # sum
-                    self.aggregateTable[rowIndex][field] = 0.0
-                ABtoRowIndex[row["AB"]] = rowsUsed
-                rowsUsed += 1
-            else:
-                rowIndex = ABtoRowIndex[row["AB"]]
-            
-            for field in self.trnAsgnAdditiveFields:    # sum
-                self.aggregateTable[rowIndex][field] += row[field]
-            self.aggregateTable[rowIndex]["AB_VOL"] += row["AB_VOL"]
-            self.aggregateTable[rowIndex]["BA_VOL"] += row["BA_VOL"]
-            self.aggregateTable[rowIndex]["PERIODCAP"] += row["PERIODCAP"]
-            self.aggregateTable[rowIndex]["MAXLOAD"] = max(row["LOAD"], self.aggregateTable[rowIndex]["MAXLOAD"])
-            self.aggregateTable[rowIndex]["FREQ"] += 1/row["FREQ"]  # combining -- will take reciprocal later
-        
+        aggregate = self.aggregateTable.getNumpyArray()
+        aggregate["AB"] = agg_df.index.to_numpy()
+        for field in ["A","B","DIST"]:
+            aggregate[field] = agg_df[field].to_numpy()
+        for field in self.trnAsgnAdditiveFields + ["PERIODCAP","FREQ"]:
+            aggregate[field] = sums_df[field].to_numpy()
+        aggregate["MAXLOAD"] = grouped["LOAD"].max().clip(lower=0.0).to_numpy()
+
         self.aggregateTable.setIndex(fieldName="AB")
 
-        count=0
-        for row in self.aggregateTable:
-            count += 1
-            if row["FREQ"]>0: 
-                row["FREQ"] = 1/row["FREQ"]
-            if row["PERIODCAP"]>0:
-                row["LOAD"] = float(row["AB_VOL"]) / row["PERIODCAP"]
-                # print row["LOAD"]
-        WranglerLogger.debug("count "+str(count)+" lines in aggregate table")
+        with numpy.errstate(divide='ignore'):
+            hasFreq = aggregate["FREQ"] > 0
+            aggregate["FREQ"][hasFreq] = 1/aggregate["FREQ"][hasFreq]
+            hasCap  = aggregate["PERIODCAP"] > 0
+            aggregate["LOAD"][hasCap] = aggregate["AB_VOL"][hasCap].astype(numpy.float64) / aggregate["PERIODCAP"][hasCap]
+        WranglerLogger.debug("count "+str(len(aggregate))+" lines in aggregate table")
 
     def calculateFleetCharacteristics(self):
         """ Calculates the fleet characteristics - vehicle hours and vehicle miles - by vehicle type
@@ -594,6 +592,7 @@ class TransitAssignmentData:
 
         # this is the index!
         self.trnAsgnTable.setIndex(fieldName="ABNAMESEQ")
+        self.buildLinkIndexFromKeys()
 
         # the link-level aggregate table
         if not aggregateFileName:
@@ -707,25 +706,19 @@ class TransitAssignmentData:
         WranglerLogger.info("Wrote aggregate table as {}".format(aggregateFileName))
     
     def numBoards(self, linename, nodenum, nodenum_next, seq):
-        """ linename is something like MUN30I; it includes the direction.
+        """ linename is something like MUN30I; it includes the direction.  It can also be a line id (see getLineId).
             nodenum is the node in question, nodenum_next is the next node in the line file
             seq is for the sequence of (nodenum,nodenum_next). e.g. seq starts at 1 for the first link and increments
             TODO: what if the line is two-way?
             Returns an int representing number of boards in the whole time period.
             Throws an exception if linename isnt recognized or if nodenum is not part of the line.
         """
-        key = "%d %d %s %d" % (nodenum, nodenum_next, linename.upper(), seq)
-        if key in self.trnAsgnTable:
-            return self.trnAsgnTable[key]["AB_BRDA"]
-        raise TransitAssignmentDataException("key [%s] not found in transit assignment data" % key)
+        return self.getRecord(linename, nodenum, nodenum_next, seq)["AB_BRDA"]
     
     def numExits(self, linename, nodenum_prev, nodenum, seq):
         """ See numBoards
         """
-        key = "%d %d %s %d" % (nodenum_prev, nodenum, linename.upper(), seq)
-        if key in self.trnAsgnTable:
-            return self.trnAsgnTable[key]["AB_XITB"]
-        raise TransitAssignmentDataException("key [%s] not found in transit assignment data" % key)
+        return self.getRecord(linename, nodenum_prev, nodenum, seq)["AB_XITB"]
     
     def loadFactor(self, linename, a,b, seq):
         """ Returns a fraction: peak hour pax per vehicle / vehicle capacity
@@ -735,32 +728,20 @@ class TransitAssignmentData:
             the simple peak hour factors that quickboards uses but this could be refined
             in the future.
         """
-        key = "%d %d %s %d" % (a, b, linename.upper(), seq)
-        if key not in self.trnAsgnTable:
-            raise TransitAssignmentDataException("Key [%s] not found in transit assignment data" % key)
-        return self.trnAsgnTable[key]["LOAD"]
+        return self.getRecord(linename, a, b, seq)["LOAD"]
     
     def linkVolume(self,linename,a,b,seq):
         """Return number of people on a given link a b"""
-        key = "%d %d %s %d" % (a, b, linename.upper(), seq)
-        if key not in self.trnAsgnTable:
-            raise TransitAssignmentDataException("Key [%s] not found in transit assignment data" % key)
-        return self.trnAsgnTable[key]["AB_VOL"]
+        return self.getRecord(linename, a, b, seq)["AB_VOL"]
     
     def linkTime(self,linename,a,b,seq): 
         """Return time in minutes on a given link a b"""
-        key = "%d %d %s %d" % (a, b, linename.upper(), seq)
-        if key not in self.trnAsgnTable:
-            raise TransitAssignmentDataException("Key [%s] not found in transit assignment data" % key)
-        return self.trnAsgnTable[key]["TIME"]
+        return self.getRecord(linename, a, b, seq)["TIME"]
 
     
     def linkDistance(self,linename,a,b,seq):
         """Return distance in miles on a given link a b"""
-        key = "%d %d %s %d" % (a, b, linename.upper(), seq)
-        if key not in self.trnAsgnTable:
-            raise TransitAssignmentDataException("Key [%s] not found in transit assignment data" % key)
-        return self.trnAsgnTable[key]["DIST"]
+        return self.getRecord(linename, a, b, seq)["DIST"]
         
 
 # Not complete.... TODO if it makes sense....
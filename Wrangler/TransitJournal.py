@@ -0,0 +1,141 @@
+from .Logger import WranglerLogger
+from .NetworkException import NetworkException
+
+__all__ = ['TransitJournal', 'JournalEntry']
+
+# marker for "this key didn't exist before the change"
+_MISSING = "__wrangler_journal_missing__"
+
+class JournalEntry(object):
+    """
+    A single mutation recorded in a :py:class:`TransitJournal`.
+
+    * *op* is the name of the mutating method, e.g. ``deleteLine`` or ``splitLink``
+    * *target* is what was touched: a line name, or a collection name like ``links`` or ``BART.far``
+    * *details* is a dictionary of the arguments that describe the change
+    * *undo* is a tuple of (undo kind, undo args...) used by :py:meth:`TransitJournal.rollback`
+
+    """
+    def __init__(self, op, target, details, undo):
+        self.op      = op
+        self.target  = target
+        self.details = details
+        self.undo    = undo
+
+    def __repr__(self):
+        return "JournalEntry(op=%s, target=%s, details=%s)" % (self.op, self.target, self.details)
+
+class TransitJournal(object):
+    """
+    Change journal and undo log for a :py:class:`TransitNetwork` and its :py:class:`TransitLine` instances.
+
+    Mutating methods append a :py:class:`JournalEntry` when a journal is attached, so callers can::
+
+        mark = net.markJournal()
+        # ... apply a project ...
+        for entry in net.getChangesSince(mark): print(entry)
+        net.rollbackToMark(mark)
+
+    Undo information is kept per entry so rolling back is O(changes) rather than requiring a rebuild or
+    a deep copy of the network.  Changes made by manipulating lists directly (e.g. ``net.lines.append()``)
+    are not seen by the journal.
+    """
+
+    def __init__(self):
+        self.entries  = []
+        # project name -> (start mark, end mark)
+        self.projects = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record(self, op, target, details, undo):
+        """
+        Appends a :py:class:`JournalEntry` for the given mutation.  *undo* is a tuple of (kind, args...);
+        see the ``_undo_*`` methods for the supported kinds.
+        """
+        self.entries.append(JournalEntry(op, target, details, undo))
+
+    def mark(self):
+        """
+        Returns a mark (an int) representing the current position in the journal.
+        """
+        return len(self.entries)
+
+    def changesSince(self, mark):
+        """
+        Returns the list of :py:class:`JournalEntry` instances recorded since *mark*, in the order they were applied.
+        """
+        self._checkMark(mark)
+        return self.entries[mark:]
+
+    def setProjectSpan(self, projectname, start_mark, end_mark):
+        """
+        Remembers that the changes between *start_mark* and *end_mark* were made by *projectname*.
+        """
+        self.projects[projectname] = (start_mark, end_mark)
+
+    def projectChanges(self, projectname):
+        """
+        Returns the list of :py:class:`JournalEntry` instances recorded for the given project.
+        """
+        if projectname not in self.projects:
+            raise NetworkException("No journal entries recorded for project %s" % projectname)
+        (start_mark, end_mark) = self.projects[projectname]
+        return self.entries[start_mark:end_mark]
+
+    def rollback(self, mark):
+        """
+        Undoes every change recorded since *mark*, most recent first, and drops those entries.
+        Returns the number of changes undone.
+        """
+        self._checkMark(mark)
+        num_undone = 0
+        while len(self.entries) > mark:
+            entry = self.entries.pop()
+            undo_method = getattr(self, "_undo_%s" % entry.undo[0])
+            undo_method(*entry.undo[1:])
+            num_undone += 1
+
+        # forget projects that were (partially) rolled back
+        for projectname in list(self.projects.keys()):
+            if self.projects[projectname][1] > mark:
+                del self.projects[projectname]
+
+        WranglerLogger.debug("TransitJournal: rolled back %d changes to mark %d" % (num_undone, mark))
+        return num_undone
+
+    def _checkMark(self, mark):
+        if mark < 0 or mark > len(self.entries):
+            raise NetworkException("Invalid journal mark %s; journal has %d entries" % (str(mark), len(self.entries)))
+
+    # Undo implementations, keyed by the first element of JournalEntry.undo
+    def _undo_lineState(self, line, name, nodes):
+        """ Restores a line's name and node list """
+        line.name = name
+        line.n    = nodes
+
+    def _undo_setitems(self, container, old_values):
+        """ Restores the given keys of a dict (or indices of a list); deletes keys that didn't exist """
+        for key, old_value in old_values.items():
+            if isinstance(old_value, str) and old_value == _MISSING:
+                if key in container: del container[key]
+            else:
+                container[key] = old_value
+
+    def _undo_reinsert(self, list_obj, idx_objs):
+        """ Re-inserts deleted items; *idx_objs* is a list of (original index, item) in ascending index order """
+        for (idx, obj) in idx_objs:
+            list_obj.insert(idx, obj)
+
+    def _undo_truncate(self, list_obj, old_len):
+        """ Undoes an extend """
+        del list_obj[old_len:]
+
+    def _undo_restore(self, list_obj, old_contents):
+        """ Restores the full contents of a list (e.g. after a clear) """
+        list_obj[:] = old_contents
+
+    def _undo_call(self, obj, method_name, args):
+        """ Calls a method of *obj* that reverts the change, e.g. a fare table's undo method """
+        getattr(obj, method_name)(*args)
@@ -3,6 +3,7 @@ from .Network import Network
 from .NetworkException import NetworkException
 from .Node import Node
 from .Logger import WranglerLogger
+from .TransitJournal import _MISSING
 
 __all__ = ['TransitLine']
 
@@ -101,6 +102,9 @@ class TransitLine(object):
             137:True  # High speed rail
         }
     }
+
+    # Optional :py:class:`TransitJournal`; set by :py:meth:`TransitNetwork.startJournal`
+    journal = None
     
     def __init__(self, name=None, template=None):
 
@@ -159,6 +163,29 @@ class TransitLine(object):
     # python 2 backwards compat
     next = __next__
 
+    def __getstate__(self):
+        """
+        Pickle (and deepcopy) support.  Drops the iterator state and the journal, and encodes the node list
+        compactly: plain nodes are just their signed node number; others are Node state tuples.
+        """
+        state = self.__dict__.copy()
+        state.pop("currentStopIdx", None)
+        state.pop("journal", None)
+        state["n"] = [int(node.num) if node.isPlain() else node.__getstate__() for node in self.n]
+        return state
+
+    def __setstate__(self, state):
+        nodes = state.pop("n")
+        self.__dict__.update(state)
+        self.n = []
+        for node_state in nodes:
+            if isinstance(node_state, int):
+                self.n.append(Node(node_state))
+            else:
+                node = Node.__new__(Node)
+                node.__setstate__(node_state)
+                self.n.append(node)
+
     def setFreqs(self, freqs, timepers=None, allowDowngrades=True, modeltype=Network.MODEL_TYPE_TM1):
         '''Set some or all five headways (AM,MD,PM,EV,EA)
            - freqs is a list of numbers (or can be one number if only setting one headway)
@@ -192,6 +219,7 @@ class TransitLine(object):
                 num_timepers = 1
                 timepers = [timepers]
             if num_freqs != num_timepers: raise NetworkException('Specified ' + num_freqs + ' frequencies for ' + num_timepers + ' time periods')
+        self._journalAttrs("setFreqs", ["FREQ[%d]" % tp for tp in range(1,6)], freqs=list(freqs), timepers=list(timepers))
         for i in range(num_timepers):
             timeper = timepers[i]
             try:
@@ -286,6 +314,7 @@ class TransitLine(object):
         """
         Sets the owner for the transit line
         """
+        self._journalAttrs("setOwner", ["OWNER"], owner=newOwner)
         self.attr["OWNER"] = str(newOwner)
 
     def getModeType(self, modeltype):
@@ -317,6 +346,7 @@ class TransitLine(object):
         """
         Sets the oneway flag based on the given arg.
         """
+        self._journalAttrs("setOneWay", ["ONEWAY"], oneway=oneway)
         if oneway:
             self.attr["ONEWAY"] = "T"
         else:
@@ -427,6 +457,7 @@ class TransitLine(object):
         """
         for i in range(len(newnodelist)):
             if isinstance(newnodelist[i],int): newnodelist[i] = Node(newnodelist[i])
+        self._journalNodes(self._snapshotNodes(), "setNodes", nodes=[node.num for node in newnodelist])
         self.n = newnodelist
     
     def insertNode(self,refNodeNum,newNodeNum,stop=False,after=True):
@@ -440,10 +471,14 @@ class TransitLine(object):
         newNode = Node(newNodeNum)
         newNode.setStop(stop)
 
+        snapshot = self._snapshotNodes()
         nodeIdx = 0
         while True:
             # out of nodes -- done
-            if nodeIdx >= len(self.n): return
+            if nodeIdx >= len(self.n):
+                if snapshot and len(snapshot[1]) != len(self.n):
+                    self._journalNodes(snapshot, "insertNode", refNode=refNodeNum, newNode=newNodeNum, stop=stop, after=after)
+                return
             
             currentNodeNum = abs(int(self.n[nodeIdx].num))
             if currentNodeNum == abs(refNodeNum):
@@ -470,6 +505,7 @@ class TransitLine(object):
             raise NetworkException( "Line %s Doesn't have that link - so can't split it" % (self.name))
         newNode = Node(newNodeNum)
         if stop==True: newNode.setStop(True)
+        self._journalNodes(self._snapshotNodes(), "splitLink", nodeA=nodeA, nodeB=nodeB, newNode=newNodeNum, stop=stop)
         
         nodeNumPrev = -1
         for nodeIdx in range(len(self.n)):
@@ -479,6 +515,40 @@ class TransitLine(object):
                 if verboseLog: WranglerLogger.debug("In line %s: inserted node %s between node %s and node %s" % (self.name,newNode.num,str(nodeA),str(nodeB)))
             nodeNumPrev = currentNodeNum
     
+    def replaceLinks(self, mapping):
+        """
+        Replaces links in this line in a single pass over its nodes.
+
+        *mapping* is a dictionary of (nodeA, nodeB) -> node path, where the node ids in the key
+        are positive ints and the path is a list of ints starting with nodeA and ending with nodeB.
+        Each occurrence of the link nodeA-nodeB has the interior nodes of the path inserted between them.
+        This is stop-insensitive to *nodeA* and *nodeB*, whose Node objects are kept as is; the interior nodes
+        are stops if positive and non-stops if negative.
+
+        Only links in the original node list are matched, so links created by a replacement are not
+        themselves replaced.  Returns the number of links replaced.
+        """
+        new_nodes    = None
+        num_replaced = 0
+        nodeNumPrev  = None
+        for nodeIdx in range(len(self.n)):
+            node    = self.n[nodeIdx]
+            nodeNum = abs(int(node.num))
+            if nodeNumPrev is not None:
+                path = mapping.get((nodeNumPrev, nodeNum))
+                if path:
+                    if new_nodes is None: new_nodes = self.n[:nodeIdx]
+                    for pathNodeNum in path[1:-1]:
+                        new_nodes.append(Node(pathNodeNum))
+                    num_replaced += 1
+            if new_nodes is not None: new_nodes.append(node)
+            nodeNumPrev = nodeNum
+
+        if num_replaced > 0:
+            self._journalNodes(self._snapshotNodes(), "replaceLinks", num_replaced=num_replaced)
+            self.n = new_nodes
+        return num_replaced
+
     def extendLine(self, oldnode, newsection, beginning=True):
         """
         Replace nodes up through **and including** *oldnode* with *newsection*.
@@ -499,6 +569,8 @@ class TransitLine(object):
         # make the new nodes
         for i in range(len(newsection)):
             if isinstance(newsection[i],int): newsection[i] = Node(newsection[i])
+        self._journalNodes(self._snapshotNodes(), "extendLine", oldnode=oldnode,
+                           newsection=[node.num for node in newsection], beginning=beginning)
         
         if beginning:
             # print self.n[:ind+1]
@@ -534,6 +606,7 @@ class TransitLine(object):
         
         attr1 = self.n[ind1].attr
         attr2 = self.n[ind2].attr
+        self._journalNodes(self._snapshotNodes(), "replaceSegment", node1=node1, node2=node2, newsection=new_section_ints)
         
         # make the new nodes
         for i in range(len(newsection)):
@@ -571,6 +644,8 @@ class TransitLine(object):
 
         attr1 = self.n[replaceNodesStartingAt].attr
         attr2 = self.n[replaceNodesStartingAt+len(node_ids_to_replace)].attr
+        self._journalNodes(self._snapshotNodes(), "replaceSequence", oldsequence=list(node_ids_to_replace),
+                           newsequence=list(replacement_node_ids))
         
         # make the new nodes
         replacement_nodes = list(replacement_node_ids) # copy this, we'll make them nodes
@@ -590,12 +665,14 @@ class TransitLine(object):
         Throws an exception if the nodenum isn't found
         """
         found = False
+        snapshot = self._snapshotNodes()
         for node in self.n:
             if abs(int(node.num)) == abs(nodenum):
                 node.setStop(isStop)
                 found = True
         if not found:
             raise NetworkException("TransitLine %s setStop called but stop %d not found" % (self.name, nodenum))
+        self._journalNodes(snapshot, "setStop", node=nodenum, isStop=isStop)
 
     def addStopsToSet(self, set):
         for nodeIdx in range(len(self.n)):
@@ -606,17 +683,51 @@ class TransitLine(object):
         """
         Reverses the current line -- adds a "-" to the name, and reverses the node order
         """
+        self._journalNodes(self._snapshotNodes(), "reverse")
         # if name is 12 chars, have to drop one -- cube has a MAX of 12
         if len(self.name)>=11: self.name = self.name[:11]
         self.name = self.name + "R"
         self.n.reverse()
         
+    def _snapshotNodes(self):
+        """
+        If journaling, returns a copy of (name, node list) to be passed to :py:meth:`_journalNodes`.
+        Otherwise returns None.
+        """
+        if self.journal is None: return None
+        return (self.name, copy.deepcopy(self.n))
+
+    def _journalNodes(self, snapshot, op, **details):
+        """
+        Records that *op* changed the node list (or name) of this line, given the *snapshot* from
+        before the change.  No-op if not journaling.
+        """
+        if snapshot is None or self.journal is None: return
+        self.journal.record(op, snapshot[0], details, ("lineState", self, snapshot[0], snapshot[1]))
+
+    def _journalAttrs(self, op, keys, **details):
+        """
+        Records that *op* is about to set the given attribute *keys*.  No-op if not journaling.
+        """
+        if self.journal is None: return
+        old_values = dict((key, self.attr.get(key, _MISSING)) for key in keys)
+        self.journal.record(op, self.name, details, ("setitems", self.attr, old_values))
+
     def _applyTemplate(self, template):
         '''Copy all attributes (including nodes) from an existing transit line to this line'''
         self.attr = copy.deepcopy(template.attr)
         self.n = copy.deepcopy(template.n)
         self.comment = template.comment
 
+    def getSignature(self):
+        """
+        Returns a hash of this line's name, attributes and nodes (including which are stops), for
+        telling whether the line changed since it was last validated.
+        """
+        return hash((self.name,
+                     tuple([(key, str(value)) for (key, value) in self.attr.items()]),
+                     tuple([node.num for node in self.n])))
+
     def hasDuplicateStops(self):
         """
         Check if a stop occurs more than once and return True if so.
@@ -656,6 +767,7 @@ class TransitLine(object):
         Returns True if any nodes were removed, False otherwise.
         """
         removed_nodes = False
+        snapshot = self._snapshotNodes()
         # iterate backwards so we can freely delete from the list
         for node_idx in range(len(self.n)-3, -1, -1):
 
@@ -668,11 +780,14 @@ class TransitLine(object):
                 del[self.n[node_idx+1]]
                 removed_nodes = True
 
+        if removed_nodes: self._journalNodes(snapshot, "removeDummyJag")
         return removed_nodes
 
     # Dictionary methods
     def __getitem__(self,key): return self.attr[key.upper()]
-    def __setitem__(self,key,value): self.attr[key.upper()]=value
+    def __setitem__(self,key,value):
+        self._journalAttrs("setitem", [key.upper()], key=key.upper(), value=value)
+        self.attr[key.upper()]=value
     def __cmp__(self,other): return cmp(self.name,other)
 
     # String representation: for outputting to line-file
@@ -696,28 +811,21 @@ class TransitLine(object):
         s = 'Line name \"%s\" freqs=%s' % (self.name, str(self.getFreqs()))
         return s
 
-    def createGeoDataFrames(self, nodes_dict: dict, modeltype=Network.MODEL_TYPE_TM1, line_name_suffix="", include_reverse_for_two_way=False):
+    def getGeoRecords(self, modeltype=Network.MODEL_TYPE_TM1, line_name_suffix="", include_reverse_for_two_way=False):
         """
-        Create and return shapefile rows similar in format to those exported by 
-        https://github.com/BayAreaMetro/travel-model-one/blob/master/utilities/cube-to-shapefile/cube_to_shapefile.py
-
-        Args:
-            nodes_dict (dict): nodenum -> [X,Y]
-            include_reverse_for_two_way (bool): set to True to also include reverse of the line for non-oneway lines
-              (with Cube's convention of linename-)
-        
-        Returns:
-          (nodes_gdf, links_gdf,lines_gdf), a tuple of three geopandas GeoDataFrames
-          nodes_gdf 
+        Returns the rows for :py:meth:`createGeoDataFrames` without geometry, so that rows for many lines
+        can be collected and given geometry at once (see :py:func:`Wrangler.Geometry.pathsFromXY`).
 
-        NOTE: this imports pandas, geopandas and shapely
+        Returns (nodes, links, lines), where
+          nodes is a list of [LINE_NAME, N, SEQ, IS_STOP, ACCESS]
+          links is a list of [LINE_NAME, A, B, SEQ, MODE]
+          lines is a list of dictionaries with NAME, LONG_NAME, MODE, FREQ_[EA,AM,MD,PM,EV], ONEWAY and
+            NODES, the node numbers of the line's path
         """
-        import pandas
-        import geopandas
-        import shapely
-        nodes = [] # LINE_NAME, N, SEQ, IS_STOP, ACCESS, geometry
-        links = [] # LINE_NAME, A, B, SEQ, MODE, geometry
-        line_points = []  # list of shapely.Point instances for the line
+        nodes = [] # LINE_NAME, N, SEQ, IS_STOP, ACCESS
+        links = [] # LINE_NAME, A, B, SEQ, MODE
+        line_name = "{}{}".format(self.name, line_name_suffix)
+        mode      = int(self.attr['MODE'])
 
         prev_node_num = None
         access = 0 # 0:no restriction;  1:board only  2:exit only
@@ -738,59 +846,84 @@ class TransitLine(object):
                     WranglerLogger.warn('TransitLine.createGeoDataframes(): node attribute {}={} not handled'.format(node_attr, node_attr_value))
 
             # store node
-            nodes.append([
-                "{}{}".format(self.name, line_name_suffix),   # LINE_NAME
-                node_num,                                     # N
-                nodeIdx+1,                                    # SEQ
-                node.isStop(),                                # IS_STOP
-                access,                                       # ACCESS
-                shapely.Point(nodes_dict[node_num][0], nodes_dict[node_num][1]) # geometry
-            ])  
-            line_points.append(shapely.Point(nodes_dict[node_num][0], nodes_dict[node_num][1]))
+            nodes.append([line_name, node_num, nodeIdx+1, node.isStop(), access])
             # store link
             if prev_node_num:
-                links.append([
-                    "{}{}".format(self.name, line_name_suffix),   # LINE_NAME
-                    prev_node_num,                                # A
-                    node_num,                                     # B
-                    nodeIdx,                                      # SEQ
-                    int(self.attr['MODE']),                       # MODE
-                    shapely.LineString([
-                        shapely.Point(nodes_dict[prev_node_num][0], nodes_dict[prev_node_num][1]),
-                        shapely.Point(nodes_dict[node_num][0],      nodes_dict[node_num][1])
-                    ])
-                ])
+                links.append([line_name, prev_node_num, node_num, nodeIdx, mode])
 
             prev_node_num = node_num
-    
+
+        node_nums = [node[1] for node in nodes]
         lines = [{
-            'NAME':      "{}{}".format(self.name, line_name_suffix),
+            'NAME':      line_name,
             'LONG_NAME': self.attr['LONGNAME'] if 'LONGNAME' in self.attr.keys() else '',
-            'MODE':      int(self.attr['MODE']),
+            'MODE':      mode,
             'FREQ_EA':   self.getFreq('EA', modeltype),
             'FREQ_AM':   self.getFreq('AM', modeltype),
             'FREQ_MD':   self.getFreq('MD', modeltype),
             'FREQ_PM':   self.getFreq('PM', modeltype),
             'FREQ_EV':   self.getFreq('EV', modeltype),
             'ONEWAY':    self.isOneWay(),
-            'geometry':  shapely.LineString(line_points)
+            'NODES':     node_nums
             }]
 
         # if not oneway, then add reverse line
         if self.isOneWay() == False and include_reverse_for_two_way:
-            lines.append({
-                'NAME':      "{}{}".format(self.name + "-",line_name_suffix),
-                'LONG_NAME': self.attr['LONGNAME'] if 'LONGNAME' in self.attr.keys() else '',
-                'MODE':      int(self.attr['MODE']),
-                'FREQ_EA':   self.getFreq('EA', modeltype),
-                'FREQ_AM':   self.getFreq('AM', modeltype),
-                'FREQ_MD':   self.getFreq('MD', modeltype),
-                'FREQ_PM':   self.getFreq('PM', modeltype),
-                'FREQ_EV':   self.getFreq('EV', modeltype),
-                'ONEWAY':    self.isOneWay(),
-                'geometry':  shapely.LineString(line_points[::-1])
-            })
-        nodes_gdf = geopandas.GeoDataFrame(data=nodes, columns=['LINE_NAME','N','SEQ','IS_STOP','ACCESS','geometry'], crs='EPSG:26910')
-        links_gdf = geopandas.GeoDataFrame(data=links, columns=['LINE_NAME','A','B','SEQ','MODE','geometry'], crs='EPSG:26910')
-        line_gdf  = geopandas.GeoDataFrame(data=lines, crs='EPSG:26910')
-        return(nodes_gdf, links_gdf, line_gdf)
\ No newline at end of file
+            lines.append(dict(lines[0]))
+            lines[-1]['NAME']  = "{}{}".format(self.name + "-",line_name_suffix)
+            lines[-1]['NODES'] = node_nums[::-1]
+        return (nodes, links, lines)
+
+    @staticmethod
+    def geoDataFramesFromRecords(nodes, links, lines, node_coords, extra_columns=[]):
+        """
+        Creates (nodes_gdf, links_gdf, lines_gdf) from rows as returned by :py:meth:`getGeoRecords`,
+        possibly for many lines, building all the geometries at once.  Node and link rows may have
+        extra trailing values, named by *extra_columns*.
+
+        *node_coords* is a :py:class:`Wrangler.Geometry.NodeCoordinates` or a dictionary of nodenum -> [X,Y]
+
+        NOTE: this imports pandas, geopandas and shapely
+        """
+        import pandas
+        import geopandas
+        from .Geometry import NodeCoordinates, pointsFromXY, linesFromXY, pathsFromXY
+        if not isinstance(node_coords, NodeCoordinates): node_coords = NodeCoordinates(node_coords)
+
+        nodes_df = pandas.DataFrame(data=nodes, columns=['LINE_NAME','N','SEQ','IS_STOP','ACCESS'] + extra_columns)
+        links_df = pandas.DataFrame(data=links, columns=['LINE_NAME','A','B','SEQ','MODE'] + extra_columns)
+        lines_df = pandas.DataFrame(data=lines)
+
+        node_geometry = pointsFromXY(node_coords.lookup(nodes_df['N'].to_numpy()))
+        link_geometry = linesFromXY(node_coords.lookup(links_df['A'].to_numpy()), node_coords.lookup(links_df['B'].to_numpy()))
+        path_nodes    = [node_num for line in lines for node_num in line['NODES']]
+        path_ids      = [line_idx for line_idx in range(len(lines)) for node_num in lines[line_idx]['NODES']]
+        line_geometry = pathsFromXY(node_coords.lookup(path_nodes), path_ids)
+        if len(lines_df) > 0: lines_df = lines_df.drop(columns=['NODES'])
+
+        nodes_gdf = geopandas.GeoDataFrame(nodes_df, geometry=node_geometry, crs='EPSG:26910')
+        links_gdf = geopandas.GeoDataFrame(links_df, geometry=link_geometry, crs='EPSG:26910')
+        lines_gdf = geopandas.GeoDataFrame(lines_df, geometry=line_geometry, crs='EPSG:26910')
+        return (nodes_gdf, links_gdf, lines_gdf)
+
+    def createGeoDataFrames(self, nodes_dict: dict, modeltype=Network.MODEL_TYPE_TM1, line_name_suffix="", include_reverse_for_two_way=False):
+        """
+        Create and return shapefile rows similar in format to those exported by 
+        https://github.com/BayAreaMetro/travel-model-one/blob/master/utilities/cube-to-shapefile/cube_to_shapefile.py
+
+        Args:
+            nodes_dict (dict): nodenum -> [X,Y], or a :py:class:`Wrangler.Geometry.NodeCoordinates`
+            include_reverse_for_two_way (bool): set to True to also include reverse of the line for non-oneway lines
+              (with Cube's convention of linename-)
+        
+        Returns:
+          (nodes_gdf, links_gdf,lines_gdf), a tuple of three geopandas GeoDataFrames
+          nodes_gdf 
+
+        To create these for many lines, it's faster to collect :py:meth:`getGeoRecords` for all of
+        them and call :py:meth:`geoDataFramesFromRecords` once.
+
+        NOTE: this imports pandas, geopandas and shapely
+        """
+        (nodes, links, lines) = self.getGeoRecords(modeltype, line_name_suffix, include_reverse_for_two_way)
+        return TransitLine.geoDataFramesFromRecords(nodes, links, lines, nodes_dict)
\ No newline at end of file
@@ -1,19 +1,24 @@
-import copy, glob, inspect, math, os, pathlib, re, shutil, sys, traceback, xlrd
+import copy, glob, inspect, math, os, pathlib, re, shutil, sys, traceback
 from collections import defaultdict
 from .Factor import Factor
 from .Faresystem import Faresystem
+from .FareTables import StopToStopFareTable, TransferFareMatrix
 from .Linki import Linki
 from .Logger import WranglerLogger
 from .Network import Network
+from .NodeNames import readNodeNames
 from .NetworkException import NetworkException
 from .PNRLink import PNRLink
+from .ProjectSpec import TransitProjectSpec
 from .PTSystem import PTSystem
 from .Regexes import nodepair_pattern
 from .TransitAssignmentData import TransitAssignmentData, TransitAssignmentDataException
 from .TransitCapacity import TransitCapacity
+from .TransitJournal import TransitJournal, _MISSING
 from .TransitLine import TransitLine
 from .TransitLink import TransitLink
 from .TransitParser import TransitParser, transit_file_def
+from .TransitValidation import RoadwayLinkSet, ValidationState, findBadLinksInLines, findBadLinksInParallel
 from .ZACLink import ZACLink
 
 __all__ = ['TransitNetwork']
@@ -35,11 +40,24 @@ class TransitNetwork(Network):
         Network.MODEL_TYPE_TM2:
            ["fares.far",     "fareMatrix.txt"],
     }
+    # CHAMP and TM1 fare files that are not stop-to-stop fare matrices
+    NON_STOP_TO_STOP_FARE_FILES = ["xfer.fare", "farelinks.fare",
+                                   "xfare.far", "farelinks.far", "transit_faremat.block"]
+    # TM1 fare files with XFARE[from_mode]=to_mode1,to_mode2,... transfer fares
+    TRANSFER_FARE_FILES = ["xfare.far"]
 
 
     # Static reference to a TransitCapacity instance
     capacity = None
 
+    # Optional :py:class:`TransitJournal`; see :py:meth:`startJournal`
+    journal = None
+
+    # If True, declarative projects (see :py:class:`TransitProjectSpec`) passed to :py:meth:`applyProject`
+    # are queued and applied together by :py:meth:`flushProjectSpecs`, which happens automatically
+    # before a Python project is applied and before the network is written.
+    batchProjectSpecs = False
+
     def __init__(self, modelType, modelVersion, tempdir=None, basenetworkpath=None, networkBaseDir=None, networkProjectSubdir=None,
                  networkSeedSubdir=None, networkPlanSubdir=None, isTiered=False, networkName=None):
         """
@@ -59,13 +77,20 @@ class TransitNetwork(Network):
         self.supps        = [] # Supplinks
         self.faresystems  = {} # key is Id number
         self.ptsystem     = PTSystem()  # single instance
-        self.farefiles    = {} # farefile name -> [ lines in farefile ]
+        self.farefiles    = {} # farefile name -> StopToStopFareTable, TransferFareMatrix or [ lines in farefile ]
 
         for farefile in TransitNetwork.FARE_FILES[self.modelType]:
-            self.farefiles[farefile] = []
+            if self.isStopToStopFareFile(farefile):
+                self.farefiles[farefile] = StopToStopFareTable(farefile)
+            elif farefile in TransitNetwork.TRANSFER_FARE_FILES:
+                self.farefiles[farefile] = TransferFareMatrix(farefile)
+            else:
+                self.farefiles[farefile] = []
 
         self.DELAY_VALUES = None
         self.currentLineIdx = 0
+        self.validationState = ValidationState() # see validate()
+        self.pendingProjectSpecs = [] # (TransitProjectSpec, fare file extensions, logProject args) queued when batchProjectSpecs
 
         if basenetworkpath and isTiered:
             if not networkName:
@@ -158,7 +183,7 @@ class TransitNetwork(Network):
                     if os.path.exists(fullfarefile):
                         infile = open(fullfarefile, 'r')
                         lines = infile.readlines()
-                        self.farefiles[farefile].extend(lines)
+                        self.extendFareFile(farefile, lines, fullfarefile)
                         linecount = len(lines)
                         infile.close()
                     WranglerLogger.debug("Read %5d lines from fare file %s" % (linecount, fullfarefile))
@@ -196,6 +221,22 @@ class TransitNetwork(Network):
     # python 2 backwards compat
     next = __next__
 
+    def __getstate__(self):
+        """
+        Pickle (and deepcopy) support.  Drops the parser (which holds the compiled grammar and the
+        last parse), the iterator state and the journal so networks can be shipped cheaply
+        to worker processes.  The journal isn't carried over since its undo information refers
+        to the original objects.
+        """
+        state = self.__dict__.copy()
+        state.pop("parser", None)
+        state.pop("journal", None)
+        state["currentLineIdx"] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
     def __repr__(self):
         return "TransitNetwork: %s lines, %s links, %s PNRs, %s ZACs" % (len(self.lines),len(self.links),len(self.pnrs),len(self.zacs))
 
@@ -238,7 +279,13 @@ class TransitNetwork(Network):
         WranglerLogger.debug("response=[%s]" % response)
         if response != "Y" and response != "y":
             exit(0)
-            
+
+        if self.journal is not None:
+            for (collection_name, collection) in [("lines",self.lines), ("links",self.links), ("zacs",self.zacs),
+                                                  ("accessli",self.accessli), ("xferli",self.xferli)]:
+                self._journal("clear", collection_name, {"project":projectstr}, ("restore", collection, list(collection)))
+            self._journal("clear", "pnrs", {"project":projectstr}, ("setitems", self.pnrs, dict(self.pnrs)))
+
         del self.lines[:]
         del self.links[:]
         self.pnrs.clear()
@@ -252,16 +299,86 @@ class TransitNetwork(Network):
         Clears out all network **line** data to prep for a project apply, e.g. the MuniTEP project is a complete
         Muni network so clearing the existing contents beforehand makes sense.
         """
+        self._journal("clearLines", "lines", {}, ("restore", self.lines, list(self.lines)))
         del self.lines[:]
 
-    def validateFrequencies(self):
+    def startJournal(self):
+        """
+        Starts recording mutations of this network and its lines in a :py:class:`TransitJournal`
+        (if one isn't already attached) and returns the journal.
+        """
+        if self.journal is None:
+            self.journal = TransitJournal()
+        for line in self.lines:
+            if isinstance(line, TransitLine): line.journal = self.journal
+        return self.journal
+
+    def stopJournal(self):
+        """
+        Stops journaling, detaching and returning the journal.
+        """
+        journal = self.journal
+        self.journal = None
+        for line in self.lines:
+            if isinstance(line, TransitLine): line.journal = None
+        return journal
+
+    def markJournal(self):
+        """
+        Returns a mark for the current journal position, to be passed to :py:meth:`getChangesSince`
+        or :py:meth:`rollbackToMark`.  Starts the journal if it isn't started.
+        """
+        return self.startJournal().mark()
+
+    def getChangesSince(self, mark):
+        """
+        Returns the list of :py:class:`JournalEntry` instances applied since *mark*.
+        """
+        if self.journal is None:
+            raise NetworkException("getChangesSince() called but journal isn't started")
+        return self.journal.changesSince(mark)
+
+    def getProjectChanges(self, projectname):
+        """
+        Returns the list of :py:class:`JournalEntry` instances applied by the given project
+        (as named by :py:meth:`applyProject`).
+        """
+        if self.journal is None:
+            raise NetworkException("getProjectChanges() called but journal isn't started")
+        return self.journal.projectChanges(projectname)
+
+    def rollbackToMark(self, mark):
+        """
+        Undoes all journaled changes since *mark*.  Returns the number of changes undone.
+        """
+        if self.journal is None:
+            raise NetworkException("rollbackToMark() called but journal isn't started")
+        return self.journal.rollback(mark)
+
+    def _journal(self, op, target, details, undo):
+        """
+        Records a mutation in the journal, if there is one.
+        """
+        if self.journal is None: return
+        self.journal.record(op, target, details, undo)
+
+    def _journalDeletes(self, op, target, list_obj, del_idxs, details):
+        """
+        Records that the items at *del_idxs* are about to be deleted from *list_obj*.
+        """
+        if self.journal is None or len(del_idxs) == 0: return
+        idx_objs = [(idx, list_obj[idx]) for idx in sorted(del_idxs)]
+        self.journal.record(op, target, details, ("reinsert", list_obj, idx_objs))
+
+    def validateFrequencies(self, lines=None):
         """
         Makes sure none of the transit lines have 0 frequencies for all time periods.
+        If *lines* (a list of TransitLine instances) is passed, only those are checked.
         """
         WranglerLogger.debug("Validating frequencies")
 
         # For each line
-        for line in self:
+        for line in (self if lines is None else lines):
             if not isinstance(line,TransitLine): continue
 
             freqs = line.getFreqs()
@@ -274,139 +391,218 @@ class TransitNetwork(Network):
             if nonzero_found==False:
                 raise NetworkException('Lines {} has only zero frequencies'.format(line.name))
 
-    def validateWnrsAndPnrs(self):
+    def validateWnrsAndPnrs(self, linesets=None, raiseOnError=True):
         """
         Goes through the transit lines in this network and for those that are offstreet (e.g.
         modes 4 or 9), this method will validate that the xfer/pnr/wnr relationships look ship-shape.
         Pretty verbose in the debug log.
+
+        Linesets are the first three characters of the line names.  If *linesets* (a collection of
+        linesets) is passed, only lines in those linesets are checked.
+
+        The stops are joined against the endpoints of the xfer, zac, pnr and access links as tables,
+        so this is linear in the number of stops and support links.  Returns a pandas.DataFrame of the
+        problems found with columns lineset, modetype, stop, severity (``critical`` or ``warning``),
+        problem, A and B.  Raises a NetworkException if there are critical problems and *raiseOnError*.
+
+        NOTE: this imports pandas
         """
+        import pandas
         WranglerLogger.debug("Validating Off Street Transit Node Connections")
-        
-        nodeInfo        = {} # lineset => { station node => { xfer node => [ walk node, pnr node ] }}
+
         setToModeType   = {} # lineset => list of ModeTypes ("Local", etc)
         setToOffstreet  = {} # lineset => True if has offstreet nodes
-        doneNodes       = set()
-        
-        critical_found  = False
-
-        # For each line
-        for line in self:
+        stop_rows       = [] # (lineset, stop node string, ModeType of the line)
+        for line in self.lines:
             if not isinstance(line,TransitLine): continue
-            # print "validating", line
-            
+
             lineset = line.name[0:3]
-            if lineset not in nodeInfo:
-                nodeInfo[lineset]       = {}
+            if linesets is not None and lineset not in linesets: continue
+            if lineset not in setToModeType:
                 setToModeType[lineset]  = []
                 setToOffstreet[lineset] = False
-            if line.getModeType(self.modelType) not in setToModeType[lineset]:
-                setToModeType[lineset].append(line.getModeType(self.modelType))
+            mode_type = line.getModeType(self.modelType)
+            if mode_type not in setToModeType[lineset]:
+                setToModeType[lineset].append(mode_type)
                 setToOffstreet[lineset] = (setToOffstreet[lineset] or line.hasOffstreetNodes(self.modelType))
-            
-            # for each stop
-            for stopIdx in range(len(line.n)):
-                if not line.n[stopIdx].isStop(): continue
-                
-                stopNodeStr = line.n[stopIdx].num
 
-                wnrNodes = set()
-                pnrNodes = set()
-                
-                if stopNodeStr in nodeInfo[lineset]: continue
-                nodeInfo[lineset][stopNodeStr] = {}
-                   
-                #print " check if we have access to an on-street node"
-                for link in self.xferli:
-                    if not isinstance(link,Linki): continue
-                    # This xfer links the node to the on-street network
-                    if link.A == stopNodeStr:
-                        nodeInfo[lineset][stopNodeStr][link.B] = ["-","-"]
-                    elif link.B == stopNodeStr:
-                        nodeInfo[lineset][stopNodeStr][link.A] = ["-","-"]
-                    
-                #print " Check for WNR"
-                for zac in self.zacs:
-                    if not isinstance(zac,ZACLink): continue
-                    
-                    m = re.match(nodepair_pattern, zac.id)
-                    if m.group(1)==stopNodeStr: 
-                        # this one is invalid for TM1
-                        if self.modelType in [Network.MODEL_TYPE_TM1]:
-                            errorstr = "ZONEACCESS link should be funnel-stop but stop-funnel found: {}".format(zac)
-                            WranglerLogger.critical(errorstr)
-                            critical_found = True
-                        else:
-                            wnrNodes.add(int(m.group(2)))
-
-                    if m.group(2)==stopNodeStr:
-                        wnrNodes.add(int(m.group(1)))
-
-                #print "Check for PNR"
-                for pnr_filename in self.pnrs.keys():
-                    for pnr in self.pnrs[pnr_filename]:
-                        if not isinstance(pnr, PNRLink): continue
-                        pnr.parseID()
-                        if pnr.station==stopNodeStr and pnr.pnr!=PNRLink.UNNUMBERED:
-                            pnrNodes.add(int(pnr.pnr))
-
-                #print "Check that our access links go from an onstreet xfer to a pnr or to a wnr"
-                for link in self.accessli:
-                    if not isinstance(link,Linki): continue
-                    try:
-                        if int(link.A) in wnrNodes:
-                            nodeInfo[lineset][stopNodeStr][link.B][0] = link.A
-                        elif int(link.B) in wnrNodes:
-                            nodeInfo[lineset][stopNodeStr][link.A][0] = link.B
-                        elif int(link.A) in pnrNodes:
-                            nodeInfo[lineset][stopNodeStr][link.B][1] = link.A
-                        elif int(link.B) in pnrNodes:
-                            nodeInfo[lineset][stopNodeStr][link.A][1] = link.B
-                    except KeyError:
-                        # if it's not offstreet then that's ok
-                        if not setToOffstreet[lineset]: continue
-                        
-                        errorstr = "Invalid access link found in %s lineset %s (incl offstreet) stopNode %s -- Missing xfer?  A=%s B=%s, xfernodes=%s wnrNodes=%s pnrNodes=%s" % \
-                            (line.getModeType(self.modelType), lineset, stopNodeStr, link.A, link.B, str(nodeInfo[lineset][stopNodeStr].keys()), str(wnrNodes), str(pnrNodes))
-                        WranglerLogger.warning(errorstr)
-                        # raise NetworkException(errorstr)
-        
+            for node in line.n:
+                if node.isStop(): stop_rows.append((lineset, node.num, mode_type))
+
+        # each stop is reported once per lineset, with the ModeType of the first line stopping there
+        stops = pandas.DataFrame(stop_rows, columns=["lineset","stop","modetype"], dtype=object)
+        stops.drop_duplicates(subset=["lineset","stop"], keep="first", inplace=True)
+        stops["offstreet"] = stops["lineset"].map(setToOffstreet).astype(bool)
+
+        # xfer links connect a stop to the on-street xfer node at the other end
+        xfers = pandas.DataFrame([(link.A, link.B) for link in self.xferli if isinstance(link,Linki)],
+                                 columns=["A","B"], dtype=object)
+        stop_xfers = pandas.concat([xfers.rename(columns={"A":"stop", "B":"xfer"}),
+                                    xfers.loc[xfers["A"] != xfers["B"]].rename(columns={"B":"stop", "A":"xfer"})],
+                                   ignore_index=True).drop_duplicates()
+
+        # zone access links should be funnel-stop; the funnel is a wnr node
+        zac_strs  = [str(zac) for zac in self.zacs if isinstance(zac,ZACLink)]
+        zac_ids   = pandas.Series([zac.id for zac in self.zacs if isinstance(zac,ZACLink)], dtype=object)
+        zac_nodes = zac_ids.str.extract("^" + nodepair_pattern.pattern).astype(object)
+        zac_nodes.columns = ["node1","node2"]
+        zac_nodes["zac"] = pandas.Series(zac_strs, dtype=object)
+        zac_nodes = zac_nodes.dropna(subset=["node1","node2"])
+        stop_wnrs = [zac_nodes[["node2","node1"]].set_axis(["stop","node"], axis=1)]
+        if self.modelType in [Network.MODEL_TYPE_TM1]:
+            stop_funnels = zac_nodes.rename(columns={"node1":"stop"})
+        else:
+            stop_funnels = zac_nodes.iloc[0:0].rename(columns={"node1":"stop"})
+            stop_wnrs.append(zac_nodes[["node1","node2"]].set_axis(["stop","node"], axis=1))
+        stop_wnrs = pandas.concat(stop_wnrs, ignore_index=True)
+
+        # numbered pnrs are (pnr node)-(station)
+        pnr_ids   = pandas.Series([pnr.id for pnr_file in self.pnrs.keys() for pnr in self.pnrs[pnr_file]
+                                   if isinstance(pnr, PNRLink)], dtype=object)
+        stop_pnrs = pnr_ids.str.extract("^" + nodepair_pattern.pattern).astype(object).dropna()
+        stop_pnrs.columns = ["node","stop"]
+
+        # an access link from a wnr (or pnr) node sets the wnr (or pnr) for the xfer node at its other end;
+        # wnr nodes are checked first, A before B, and later access links win
+        access = pandas.DataFrame([(link.A, link.B) for link in self.accessli if isinstance(link,Linki)],
+                                  columns=["A","B"], dtype=object)
+        access["order"] = range(len(access))
+        candidates = []
+        for (branch, (node_col, xfer_col, kind, stop_nodes)) in enumerate([("A", "B", "wnr", stop_wnrs),
+                                                                           ("B", "A", "wnr", stop_wnrs),
+                                                                           ("A", "B", "pnr", stop_pnrs),
+                                                                           ("B", "A", "pnr", stop_pnrs)]):
+            stop_nodes = stop_nodes.assign(node_int=pandas.to_numeric(stop_nodes["node"], errors="coerce"))
+            matched    = access.assign(node_int=pandas.to_numeric(access[node_col], errors="coerce")).merge(
+                            stop_nodes[["stop","node_int"]], on="node_int")
+            candidates.append(pandas.DataFrame({"stop":matched["stop"], "order":matched["order"],
+                                                "branch":branch, "kind":kind,
+                                                "xfer":matched[xfer_col], "value":matched[node_col],
+                                                "A":matched["A"], "B":matched["B"]}))
+        candidates = pandas.concat(candidates, ignore_index=True).astype({"stop":object, "xfer":object, "value":object})
+        candidates = candidates.sort_values(["stop","order","branch"]).drop_duplicates(subset=["stop","order"], keep="first")
+        candidates = candidates.merge(stop_xfers.assign(has_xfer=True), on=["stop","xfer"], how="left")
+
+        assigned = candidates.loc[candidates["has_xfer"].notna()].sort_values("order")
+        assigned = assigned.drop_duplicates(subset=["stop","xfer","kind"], keep="last")
+        assigned = assigned.pivot(index=["stop","xfer"], columns="kind", values="value")
+        assigned = assigned.reindex(columns=["wnr","pnr"]).reset_index()
+
+        report = stops.merge(stop_xfers, on="stop").merge(assigned, on=["stop","xfer"], how="left")
+        report[["wnr","pnr"]] = report[["wnr","pnr"]].fillna("-")
+
+        problems = []
+        # stop-funnel zone access links
+        for row in stops.merge(stop_funnels, on="stop").itertuples():
+            errorstr = "ZONEACCESS link should be funnel-stop but stop-funnel found: {}".format(row.zac)
+            WranglerLogger.critical(errorstr)
+            problems.append((row.lineset, row.modetype, row.stop, "critical", errorstr, row.stop, row.node2))
+
+        # access links to a node that isn't an xfer node for the stop; ok if it's not offstreet
+        for row in stops.loc[stops["offstreet"]].merge(candidates.loc[candidates["has_xfer"].isna()], on="stop").itertuples():
+            errorstr = "Invalid access link found in %s lineset %s (incl offstreet) stopNode %s -- Missing xfer?  A=%s B=%s" % \
+                (row.modetype, row.lineset, row.stop, row.A, row.B)
+            WranglerLogger.warning(errorstr)
+            problems.append((row.lineset, row.modetype, row.stop, "warning", errorstr, row.A, row.B))
+
+        # offstreet stops need a wnr
+        num_wnrs = report.loc[report["wnr"] != "-"].groupby(["lineset","stop"]).size().rename("num_wnrs").reset_index()
+        no_wnrs  = stops.loc[stops["offstreet"]].merge(num_wnrs, on=["lineset","stop"], how="left")
+        for row in no_wnrs.loc[no_wnrs["num_wnrs"].isna()].itertuples():
+            errorstr = "Zero wnrNodes or onstreetxfers for stop %s!" % row.stop
+            WranglerLogger.critical(errorstr)
+            problems.append((row.lineset, row.modetype, row.stop, "critical", errorstr, "", ""))
+
         nodeNames = {}
         if "CHAMP_node_names" in os.environ:
-            book = xlrd.open_workbook(os.environ["CHAMP_node_names"])
-            sh = book.sheet_by_index(0)
-            for rx in range(0,sh.nrows): # skip header
-                therow = sh.row(rx)
-                nodeNames[int(therow[0].value)] = therow[1].value
-            # WranglerLogger.info(str(nodeNames))
-        
-        # print it all out
-        for lineset in nodeInfo.keys():
+            nodeNames = readNodeNames(os.environ["CHAMP_node_names"], sheet=0)
 
-            stops = list(nodeInfo[lineset].keys())
-            stops.sort()
-              
-            WranglerLogger.debug("--------------- Line set %s %s -- hasOffstreet? %s------------------" % 
+        # print it all out
+        for lineset in setToModeType.keys():
+            WranglerLogger.debug("--------------- Line set %s %s -- hasOffstreet? %s------------------" %
                                  (lineset, str(setToModeType[lineset]), str(setToOffstreet[lineset])))
             WranglerLogger.debug("%-40s %10s %10s %10s %10s" % ("stopname", "stop", "xfer", "wnr", "pnr"))
-            for stopNodeStr in stops:
-                numWnrs = 0
-                stopname = "Unknown stop name"
-                if int(stopNodeStr) in nodeNames: stopname = nodeNames[int(stopNodeStr)]
-                for xfernode in nodeInfo[lineset][stopNodeStr].keys():
-                    WranglerLogger.debug("%-40s %10s %10s %10s %10s" % 
-                                 (stopname, stopNodeStr, xfernode, 
-                                  nodeInfo[lineset][stopNodeStr][xfernode][0],
-                                  nodeInfo[lineset][stopNodeStr][xfernode][1]))
-                    if nodeInfo[lineset][stopNodeStr][xfernode][0] != "-": numWnrs += 1
-                
-                if numWnrs == 0 and setToOffstreet[lineset]:
-                    errorstr = "Zero wnrNodes or onstreetxfers for stop %s!" % stopNodeStr
-                    WranglerLogger.critical(errorstr)
-                    critical_found = True
+            for row in report.loc[report["lineset"] == lineset].sort_values("stop", kind="stable").itertuples():
+                stopname = nodeNames.get(int(row.stop), "Unknown stop name")
+                WranglerLogger.debug("%-40s %10s %10s %10s %10s" % (stopname, row.stop, row.xfer, row.wnr, row.pnr))
 
-        if critical_found:
+        problems = pandas.DataFrame(problems, columns=["lineset","modetype","stop","severity","problem","A","B"])
+        if raiseOnError and (problems["severity"] == "critical").any():
             raise NetworkException("Critical errors found")
-                           
+        return problems
+
+    def validateLines(self, lines=None):
+        """
+        Makes sure line names are unique (case-insensitive) and at most 12 characters, as required by Cube,
+        and that no line has a stop that occurs more than once.  Uniqueness is checked across all lines;
+        if *lines* (a list of TransitLine instances) is passed, only those are checked for the rest.
+        """
+        line_names = set()
+        for line in self:
+            if line.name.upper() in line_names:
+                raise NetworkException("Line name {} not unique".format(line.name))
+            line_names.add(line.name.upper())
+
+        for line in (self if lines is None else lines):
+            if len(line.name) > 12:
+                raise NetworkException("Line name {} too long".format(line.name))
+            if line.hasDuplicateStops():
+                raise NetworkException("Line {} has a stop that occurs more than once".format(line.name))
+
+    def validate(self, cubeNetFile=None, full=False, numProcesses=1):
+        """
+        Runs the validations done before writing: :py:meth:`validateLines`, :py:meth:`validateFrequencies`,
+        :py:meth:`validateWnrsAndPnrs` and, if *cubeNetFile* is passed, :py:meth:`checkValidityOfLinks`.
+        Throws a NetworkException for the first validation that fails.
+
+        Only what changed since the last successful validation is checked (unless *full* is True):
+
+        * lines that were added or changed (see :py:meth:`TransitLine.getSignature`)
+        * for the wnr/pnr check, linesets with added, changed or deleted lines, or every lineset
+          if the xfer, zac, pnr or access records changed
+        * for the link check, every line if the roadway network file or the off-road links changed
+
+        so this is cheap enough to call after each project.
+        """
+        if full or getattr(self, "validationState", None) is None:
+            self.validationState = ValidationState()
+        state = self.validationState
+
+        all_lines       = [line for line in self.lines if isinstance(line, TransitLine)]
+        line_signatures = dict([(line.name, line.getSignature()) for line in all_lines])
+        dirty_lines     = [line for line in all_lines if state.lineSignatures.get(line.name) != line_signatures[line.name]]
+        deleted_names   = set(state.lineSignatures.keys()) - set(line_signatures.keys())
+
+        WranglerLogger.debug("Validating {} of {} lines ({} deleted since last validation)".format(
+                             len(dirty_lines), len(all_lines), len(deleted_names)))
+        self.validateLines(lines=dirty_lines)
+        self.validateFrequencies(lines=dirty_lines)
+
+        support_signature = ValidationState.signatureOf(self.xferli + self.zacs + self.accessli +
+                                [pnr for pnr_file in sorted(self.pnrs.keys()) for pnr in self.pnrs[pnr_file]])
+        if support_signature != state.supportSignature:
+            self.validateWnrsAndPnrs()
+        else:
+            dirty_linesets = set([line.name[0:3] for line in dirty_lines] + [name[0:3] for name in deleted_names])
+            if len(dirty_linesets) > 0:
+                self.validateWnrsAndPnrs(linesets=dirty_linesets)
+
+        roadway_state           = None
+        transit_links_signature = None
+        if cubeNetFile:
+            roadway_state           = (os.path.abspath(cubeNetFile), self.modelType, RoadwayLinkSet.fileState(cubeNetFile))
+            transit_links_signature = hash(frozenset(self.getTransitLinkSet()))
+            if roadway_state != state.roadwayState or transit_links_signature != state.transitLinksSignature:
+                self.checkValidityOfLinks(cubeNetFile, numProcesses=numProcesses)
+            elif len(dirty_lines) > 0:
+                self.checkValidityOfLinks(cubeNetFile, numProcesses=numProcesses, lines=dirty_lines)
+
+        # everything passed
+        state.lineSignatures        = line_signatures
+        state.supportSignature      = support_signature
+        state.roadwayState          = roadway_state
+        state.transitLinksSignature = transit_links_signature
+
     def line(self, name):
         """
         If a string is passed in, return the line for that name exactly (a :py:class:`TransitLine` object).
@@ -447,7 +643,9 @@ class TransitNetwork(Network):
         If a regex, delete all the lines that match, debug-logging the deleted line names.
         """
         if isinstance(name,str):
-            del self.lines[self.lines.index(name)]
+            del_idx = self.lines.index(name)
+            self._journalDeletes("deleteLine", name, self.lines, [del_idx], {"name":name})
+            del self.lines[del_idx]
             return
 
         if str(type(name))==str(type(re.compile("."))):
@@ -455,6 +653,7 @@ class TransitNetwork(Network):
                 if isinstance(self.lines[idx],str): continue
                 if name.match(self.lines[idx].name):
                     WranglerLogger.debug("Deleting line {}".format(self.lines[idx].name))
+                    self._journalDeletes("deleteLine", self.lines[idx].name, self.lines, [idx], {"name":name.pattern})
                     del self.lines[idx]
             return
 
@@ -476,6 +675,8 @@ class TransitNetwork(Network):
             elif include_reverse and self.links[idx].Anode == nodeB and self.links[idx].Bnode == nodeA:
                 del_idxs.append(idx)
 
+        self._journalDeletes("deleteLinkForNodes", "links", self.links, del_idxs,
+                             {"nodeA":nodeA, "nodeB":nodeB, "include_reverse":include_reverse})
         for del_idx in del_idxs:
             WranglerLogger.debug("Removing link %s" % str(self.links[del_idx]))
             del self.links[del_idx]
@@ -507,6 +708,7 @@ class TransitNetwork(Network):
                     del_idxs.append(idx)
 
             # delete them
+            self._journalDeletes("deletePNRLinkForId", pnr_file, self.pnrs[pnr_file], del_idxs, {"pnr_id":pnr_id})
             for del_idx in del_idxs:
                 WranglerLogger.debug("Removing PNR link {} from {}".format(self.pnrs[pnr_file][del_idx], pnr_file))
                 del self.pnrs[pnr_file][del_idx]
@@ -526,6 +728,7 @@ class TransitNetwork(Network):
                 if int(self.accessli[idx].A) == nodenum or int(self.accessli[idx].B) == nodenum:
                     del_acc_idxs.append(idx)
             
+            self._journalDeletes("deleteAccessXferLinkForNode", "accessli", self.accessli, del_acc_idxs, {"nodenum":nodenum})
             for del_idx in del_acc_idxs:
                 WranglerLogger.debug("Removing access link %s" % str(self.accessli[del_idx]))
                 del self.accessli[del_idx]
@@ -537,6 +740,7 @@ class TransitNetwork(Network):
                 if int(self.xferli[idx].A) == nodenum or int(self.xferli[idx].B) == nodenum:
                     del_xfer_idxs.append(idx)
             
+            self._journalDeletes("deleteAccessXferLinkForNode", "xferli", self.xferli, del_xfer_idxs, {"nodenum":nodenum})
             for del_idx in del_xfer_idxs:
                 WranglerLogger.debug("Removing xfere link %s" % str(self.xferli[del_idx]))
                 del self.xferli[del_idx]
@@ -561,6 +765,34 @@ class TransitNetwork(Network):
         if verboseLog: WranglerLogger.debug("Total Lines with Link %s-%s split:%d" % (str(nodeA),str(nodeB),totReplacements))
         return lines_split
     
+    def applyLinkReplacements(self, mapping, verboseLog=True):
+        """
+        Replaces links in all transit lines in a single pass.  *mapping* is a dictionary of
+        (nodeA, nodeB) -> replacement node path, e.g. ``{ (1,2):[1,-101,-102,2] }``.
+        The path must start with nodeA and end with nodeB; the interior nodes are inserted as stops
+        if positive and non-stops if negative.  See :py:meth:`TransitLine.replaceLinks`.
+
+        Returns sorted list of names of the lines affected.
+        """
+        cleaned_mapping = {}
+        for ((nodeA, nodeB), path) in mapping.items():
+            path = [int(node_num) for node_num in path]
+            if len(path) < 2 or abs(path[0]) != abs(nodeA) or abs(path[-1]) != abs(nodeB):
+                raise NetworkException("applyLinkReplacements(): path {} for link {}-{} must start with {} and end with {}".format(
+                                       path, nodeA, nodeB, nodeA, nodeB))
+            cleaned_mapping[(abs(int(nodeA)), abs(int(nodeB)))] = path
+
+        lines_affected = []
+        totReplacements = 0
+        for line in self:
+            num_replaced = line.replaceLinks(cleaned_mapping)
+            if num_replaced > 0:
+                totReplacements += num_replaced
+                lines_affected.append(line.name)
+
+        if verboseLog: WranglerLogger.debug("applyLinkReplacements(): replaced {} links in {} lines".format(totReplacements, len(lines_affected)))
+        return sorted(lines_affected)
+
     def replaceSegmentInTransitLines(self,nodeA,nodeB,newNodes):
         """
         *newNodes* should include nodeA and nodeB if they are not going away
@@ -629,31 +861,23 @@ class TransitNetwork(Network):
             if denom[t] > 0: combined[t] = round(1/denom[t],2)
         return combined
 
+    def _getTransferFareMatrix(self, fare_filename):
+        """
+        Returns the TransferFareMatrix for the given fare filename or throws a NetworkException.
+        """
+        if fare_filename not in self.farefiles.keys():
+            raise NetworkException("Fare file {} not found".format(fare_filename))
+        if not isinstance(self.farefiles[fare_filename], TransferFareMatrix):
+            raise NetworkException("Fare file {} is not a transfer fare file".format(fare_filename))
+        return self.farefiles[fare_filename]
+
     def getValueFromXfare(self, fare_filename, from_mode, to_mode):
         """
         Assuming that fare_filename contains XFARE information (e.g. XFAR[from_mode]=to_mode1,to_mode2,...)
         Returns the value set for from_mode to to_mode
         If none found, throws a NetworkException
         """
-        xfare_re = re.compile("xfare\[(\d+)\]=((-?\d+)(,\s*-?\d+)*)", re.IGNORECASE)
-        if fare_filename not in self.farefiles.keys():
-            raise NetworkException("Fare file {} not found".format(fare_filename))
-
-        for line in self.farefiles[fare_filename]:
-            # WranglerLogger.debug("getValueFromXfare() line = {}".format(line))
-            result = xfare_re.match(line)
-            if result == None: continue
-            my_from_mode = int(result.group(1))
-            if my_from_mode != from_mode: continue
-
-            my_to_mode_strings = result.group(2).split(",")
-            my_to_modes = [int(x) for x in my_to_mode_strings]
-            # WranglerLogger.debug("getValueFromXfare my_to_modes={}".format(my_to_modes))
-            if len(my_to_modes) < to_mode:
-                raise NetworkException("to_mode {} not found: {}".format(to_mode, my_to_modes))
-            return my_to_modes[to_mode-1] # index starts at zero
-
-        raise NetworkException("from_mode {} not found".format(from_mode))
+        return self._getTransferFareMatrix(fare_filename).getFare(from_mode, to_mode)
 
     def setValueToXfare(self, fare_filename, from_mode, to_mode, value):
         """
@@ -661,35 +885,60 @@ class TransitNetwork(Network):
         Sets the value for from_mode to to_mode to value.
         Throws NetworkException if the appropriate spot isn't found
         """
-        xfare_re = re.compile("(xfare\[(\d+)\]=)((-?\d+)(,\s*-?\d+)*)", re.IGNORECASE)
-        if fare_filename not in self.farefiles.keys():
-            raise NetworkException("Fare file {} not found".format(fare_filename))
+        xfare_matrix = self._getTransferFareMatrix(fare_filename)
+        row_states   = xfare_matrix.setFare(from_mode, to_mode, value)
+        self._journal("setValueToXfare", fare_filename, {"from_mode":from_mode, "to_mode":to_mode, "value":value},
+                      ("call", xfare_matrix, "restoreRows", (row_states,)))
 
-        for line_idx in range(len(self.farefiles[fare_filename])):
-            line = self.farefiles[fare_filename][line_idx]
+    def setValuesToXfare(self, fare_filename, value, from_modes=None, to_modes=None):
+        """
+        Assuming that fare_filename contains XFARE information (e.g. XFAR[from_mode]=to_mode1,to_mode2,...)
+        Sets the value for every combination of *from_modes* and *to_modes* (lists of ints; None means all modes)
+        to *value* in one update.  For example, to make all transfers into mode 120 free::
 
-            # WranglerLogger.debug("getValueFromXfare() line = {}".format(line))
-            result = xfare_re.match(line)
-            if result == None: continue
-            my_from_mode = int(result.group(2))
-            if my_from_mode != from_mode: continue
+            net.setValuesToXfare("xfare.far", 0, to_modes=[120])
 
-            my_to_mode_strings = result.group(3).split(",")
-            my_to_modes = [int(x) for x in my_to_mode_strings]
-            # WranglerLogger.debug("getValueFromXfare my_to_modes={}".format(my_to_modes))
-            if len(my_to_modes) < to_mode:
-                raise NetworkException("to_mode {} not found: {}".format(to_mode, my_to_modes))
-            
-            my_to_modes[to_mode-1] = value # index starts at zero
-            # put the line back together
-            my_to_mode_strings = [str(x) for x in my_to_modes]
-            comma_str = ','
-            line = "{}{}\n".format(result.group(1),comma_str.join(my_to_mode_strings))
-            self.farefiles[fare_filename][line_idx] = line
-            return
+        Modes past the end of an XFARE line are skipped.  Throws NetworkException for unknown from modes.
+        Returns the number of values changed.
+        """
+        xfare_matrix = self._getTransferFareMatrix(fare_filename)
+        (num_changed, row_states) = xfare_matrix.setBlock(from_modes, to_modes, value)
+        self._journal("setValuesToXfare", fare_filename, {"from_modes":from_modes, "to_modes":to_modes, "value":value},
+                      ("call", xfare_matrix, "restoreRows", (row_states,)))
+        WranglerLogger.debug("setValuesToXfare: set %d values in %s" % (num_changed, fare_filename))
+        return num_changed
+
+    def isStopToStopFareFile(self, fare_filename):
+        """
+        Returns True if the given fare file (one of FARE_FILES) holds stop-to-stop fares.
+        """
+        if self.modelType not in [Network.MODEL_TYPE_CHAMP, Network.MODEL_TYPE_TM1]: return False
+        return fare_filename not in TransitNetwork.NON_STOP_TO_STOP_FARE_FILES
+
+    def extendFareFile(self, fare_filename, lines, path):
+        """
+        Appends the given lines read from *path* to the given fare file.  For stop-to-stop fare files,
+        fares for a stop pair that's already present replace the existing fare; likewise XFARE lines
+        for a mode that's already present replace the existing row in transfer fare files.
+        """
+        farefile = self.farefiles[fare_filename]
+        if isinstance(farefile, (StopToStopFareTable, TransferFareMatrix)):
+            undo_args = farefile.extend(lines)
+            self._journal("addFares", fare_filename, {"path":path}, ("call", farefile, "undoExtend", undo_args))
+        else:
+            self._journal("addFares", fare_filename, {"path":path}, ("truncate", farefile, len(farefile)))
+            farefile.extend(lines)
+
+    def _getStopToStopFareTable(self, fare_filename):
+        """
+        Returns the StopToStopFareTable for the given fare filename or throws a NetworkException.
+        """
+        if fare_filename not in self.farefiles.keys():
+            raise NetworkException("Fare file {} not found".format(fare_filename))
+        if not isinstance(self.farefiles[fare_filename], StopToStopFareTable):
+            raise NetworkException("Fare file {} is not a stop-to-stop fare file".format(fare_filename))
+        return self.farefiles[fare_filename]
 
-        raise NetworkException("from_mode {} not found".format(from_mode))
-    
     def getValueFromStopToStopFare(self, fare_filename, stopA, stopB):
         """
         Assuming that fare_filename contains stop-to-stop fare information (e.g. Ferry.far)
@@ -705,32 +954,7 @@ class TransitNetwork(Network):
             If fare_filename not found, or stop-to-stop nodes aren't found in that farefile,
             throws NetworkException.
         """
-        # sort: stop1 < stop2
-        stop1 = stopA if stopA < stopB else stopB
-        stop2 = stopA if stopA > stopB else stopB
-        # WranglerLogger.debug("stop1: {}  stop2: {}".format(stop1, stop2))
-
-        fare_stops_re = re.compile(r"^\s*(\d+)\s+(\d+)\s+(\d+)\s([;].*)$", re.IGNORECASE)
-        if fare_filename not in self.farefiles.keys():
-            raise NetworkException("Fare file {} not found".format(fare_filename))
-
-        for line in self.farefiles[fare_filename]:
-            # WranglerLogger.debug("getValueFromStopToStopFare() line = {}".format(line.strip()))
-            result = fare_stops_re.match(line)
-            # WranglerLogger.debug("  result: {}".format("None" if result == None else result.groups()))
-            if result == None: continue
-
-            my_stop1 = int(result.group(1)) if int(result.group(1)) < int(result.group(2)) else int(result.group(2))
-            my_stop2 = int(result.group(1)) if int(result.group(1)) > int(result.group(2)) else int(result.group(2))
-
-            # WranglerLogger.debug("my_stop1: {}  my_stop2: {}".format(my_stop1,my_stop2))
-
-            if my_stop1 != stop1: continue
-            if my_stop2 != stop2: continue
-
-            return int(result.group(3))
-
-        raise NetworkException("stopA/stopB {}/{} not found".format(stopA, stopB))
+        return self._getStopToStopFareTable(fare_filename).getFare(stopA, stopB)
 
     def setValueToStopToStopFare(self, fare_filename, stopA, stopB, value):
         """
@@ -747,42 +971,10 @@ class TransitNetwork(Network):
         If fare_filename not found, or stop-to-stop nodes aren't found in that farefile,
         throws NetworkException.
         """
-        # sort: stop1 < stop2
-        stop1 = stopA if stopA < stopB else stopB
-        stop2 = stopA if stopA > stopB else stopB
-
-        # WranglerLogger.debug("stop1: {}  stop2: {}".format(stop1, stop2))
-        # keep spaces this time
-        #                               1    2    3    4    5    6    7   8     
-        fare_stops_re = re.compile(r"(^\s*)(\d+)(\s+)(\d+)(\s+)(\d+)(\s*)([;].*)$", re.IGNORECASE | re.DOTALL)
-        if fare_filename not in self.farefiles.keys():
-            raise NetworkException("Fare file {} not found".format(fare_filename))
-
-        for line_idx in range(len(self.farefiles[fare_filename])):
-            line = self.farefiles[fare_filename][line_idx]
-            # WranglerLogger.debug("getValueFromStopToStopFare() line = {}".format(line.strip()))
-            result = fare_stops_re.match(line)
-            # WranglerLogger.debug("  result: {}".format("None" if result == None else result.groups()))
-            if result == None: continue
-
-            my_stop1 = int(result.group(2)) if int(result.group(2)) < int(result.group(4)) else int(result.group(4))
-            my_stop2 = int(result.group(2)) if int(result.group(2)) > int(result.group(4)) else int(result.group(4))
-
-            # WranglerLogger.debug("my_stop1: {}  my_stop2: {}".format(my_stop1,my_stop2))
-
-            if my_stop1 != stop1: continue
-            if my_stop2 != stop2: continue
-
-            # found it!  replace
-            line_bak = line
-            line = "{}{}{}{}{}{}{}{}".format(
-                result.group(1), result.group(2), result.group(3), result.group(4),
-                result.group(5), value, result.group(7), result.group(8))
-            self.farefiles[fare_filename][line_idx] = line
-            # WranglerLogger.debug("Replaced [{}] with [{}]".format(line_bak, line))
-            return
-
-        raise NetworkException("stopA/stopB {}/{} not found".format(stopA, stopB))
+        fare_table = self._getStopToStopFareTable(fare_filename)
+        undo_args  = fare_table.setFare(stopA, stopB, value)
+        self._journal("setValueToStopToStopFare", fare_filename, {"stopA":stopA, "stopB":stopB, "value":value},
+                      ("call", fare_table, "restoreEntry", undo_args))
 
     def verifyTransitLineFrequencies(self, frequencies, coverage=None):
         """
@@ -842,57 +1034,42 @@ class TransitNetwork(Network):
         WranglerLogger.debug(f"removeIrrelevantFareMatrixLines(): all_nodes_set={all_nodes_set}")
 
 
-        blank_comment_re = re.compile("^(\s*)([;](.*))?$")
-        from_to_fare_re  = re.compile("^\s*(\d+)\s+(\d+)\s+(\d+)\s*([;](.*))?$")
         for fare_file in self.farefiles.keys():
             # these aren't faremat files
-            if fare_file in ['farelinks.far','xfare.far','transit_faremat.block']: continue
+            if not isinstance(self.farefiles[fare_file], StopToStopFareTable): continue
 
             WranglerLogger.debug(f"Going through fare_file {fare_file}")
-            # we only understand:
-            # blank lines / comment lines
-            # fromNode toNode fare [comment]
-            for line_idx in range(len(self.farefiles[fare_file])):
-                line = self.farefiles[fare_file][line_idx]
-                # WranglerLogger.debug(f"  line: {line.strip()}")
-
-                match = re.match(blank_comment_re, line.strip())
-                if match:
-                    # Leave it alone
-                    continue
-
-                match = re.match(from_to_fare_re, line.strip())
-                if match:
-                    # comment out if from_node or to_node are not used (e.g. present in all_nodes_set)
-                    from_node = int(match.group(1))
-                    to_node = int(match.group(2))
-                    if (from_node not in all_nodes_set) or (to_node not in all_nodes_set):
-                        WranglerLogger.debug(f"Commenting out line {line.strip()}")
-                        self.farefiles[fare_file][line_idx] = "; node not in use: " + self.farefiles[fare_file][line_idx]
-                    continue
-
-                # if we don't understand it, leave it alone
+            fare_table = self.farefiles[fare_file]
+            # comment out if from_node or to_node are not used (e.g. present in all_nodes_set)
+            for ((from_node, to_node), fare) in fare_table.records():
+                if (from_node not in all_nodes_set) or (to_node not in all_nodes_set):
+                    undo_args = fare_table.commentOut((from_node, to_node), prefix="; node not in use: ")
+                    WranglerLogger.debug(f"Commented out fare {from_node} {to_node} {fare}")
+                    self._journal("removeIrrelevantFareMatrixLines", fare_file, {"from_node":from_node, "to_node":to_node},
+                                  ("call", fare_table, "restoreEntry", undo_args))
+
+            # if we don't understand it, leave it alone
+            for line in fare_table.unparsedLines():
                 WranglerLogger.warn(f"  => Didn't understand this line: {line.strip()}")
         return
 
-
-
-
     def write(self, path='.', name='transit', writeEmptyFiles=True, suppressQuery=False, suppressValidation=False,
               cubeNetFileForValidation=None, line_only=False):
         """
-        Write out this full transit network to disk in path specified.
+        Write out this full transit network to disk in path specified.  The lines are checked with
+        :py:meth:`validateLines` even if *suppressValidation*, since Cube requires it.
         """
-        if not suppressValidation:
+        self.flushProjectSpecs()
+        if suppressValidation:
+            self.validateLines()
+        else:
 
-            self.validateFrequencies()
-            self.validateWnrsAndPnrs()
-            
             if not cubeNetFileForValidation:
                 WranglerLogger.fatal("Trying to validate TransitNetwork but cubeNetFileForValidation not passed")
                 exit(2)
-            
-            self.checkValidityOfLinks(cubeNetFile=cubeNetFileForValidation)
+
+            # only checks what changed since the last validation
+            self.validate(cubeNetFile=cubeNetFileForValidation)
 
         
         if not os.path.exists(path):
@@ -918,9 +1095,6 @@ class TransitNetwork(Network):
         WranglerLogger.info("Writing into %s\\%s" % (path, name))
         logstr = ""
         if len(self.lines)>0 or writeEmptyFiles:
-            # for verifying uniqueness of line names
-            line_names = set()
-
             logstr += " lines"
             f = open(os.path.join(path,name+".lin"), 'w');
             if self.program == TransitParser.PROGRAM_TRNBUILD:
@@ -931,18 +1105,7 @@ class TransitNetwork(Network):
                 if isinstance(line,str):
                     f.write(line)
                 else:
-                    # write it first
                     f.write(repr(line)+"\n")
-
-                    # Cube TRNBUILD documentation for LINE NAME
-                    # It may be up to 12 characters in length, and must be unique.
-                    if line.name.upper() in line_names:
-                        raise NetworkException("Line name {} not unique".format(line.name))
-                    if len(line.name) > 12:
-                        raise NetworkException("Line name {} too long".format(line.name))
-                    if line.hasDuplicateStops():
-                        raise NetworkException("Line {} has a stop that occurs more than once".format(line.name))
-                    line_names.add(line.name.upper())
             f.close()
 
         if line_only:
@@ -1029,8 +1192,7 @@ class TransitNetwork(Network):
                 else:
                     logstr += " " + farefile
                     f = open(os.path.join(path,farefile), 'w')
-                    for line in self.farefiles[farefile]:
-                        f.write(line)
+                    f.writelines(self.farefiles[farefile])
                     f.close()
         else:
             if len(self.faresystems) > 0 or writeEmptyFiles:
@@ -1126,19 +1288,29 @@ class TransitNetwork(Network):
             for line in lines:
                 if isinstance(line,TransitLine) and (line in self.lines):
                     # logstr += " *%s" % (line.name)
+                    line_idx = self.lines.index(line)
                     if insert_replace:
-                        self.lines[self.lines.index(line)]=line
+                        line.journal = self.journal
+                        self._journal("replaceLine", line.name, {"path":path},
+                                      ("setitems", self.lines, {line_idx:self.lines[line_idx]}))
+                        self.lines[line_idx]=line
                         extendlines.remove(line)
                     else:
-                        self.lines.remove(line)
+                        self._journalDeletes("deleteLine", line.name, self.lines, [line_idx], {"path":path})
+                        del self.lines[line_idx]
 
             if len(extendlines)>0:
                 # for line in extendlines: print line
+                for line in extendlines:
+                    if isinstance(line,TransitLine): line.journal = self.journal
+                self._journal("addLines", "lines", {"path":path, "names":[line.name for line in extendlines if isinstance(line,TransitLine)]},
+                              ("truncate", self.lines, len(self.lines)))
                 self.lines.extend(["\n;######################### From: "+path+"\n"])
                 self.lines.extend(extendlines)
 
         if len(links)>0:
             logstr += " %d links" % len(links)
+            self._journal("addLinks", "links", {"path":path}, ("truncate", self.links, len(self.links)))
             self.links.extend(["\n;######################### From: "+path+"\n"])
             self.links.extend(links)
 
@@ -1149,32 +1321,40 @@ class TransitNetwork(Network):
 
             logstr += " {} {}_PNRs".format(len(pnrs), pnr_root)
             if pnr_root not in self.pnrs:
+                self._journal("addPNRs", pnr_root, {"path":path}, ("setitems", self.pnrs, {pnr_root:_MISSING}))
                 self.pnrs[pnr_root] = []
+            else:
+                self._journal("addPNRs", pnr_root, {"path":path}, ("truncate", self.pnrs[pnr_root], len(self.pnrs[pnr_root])))
             self.pnrs[pnr_root].extend( ["\n;######################### From: "+path+"\n"])
             self.pnrs[pnr_root].extend(pnrs)
 
         if len(zacs)>0:
             logstr += " %d ZACs" % len(zacs)
+            self._journal("addZACs", "zacs", {"path":path}, ("truncate", self.zacs, len(self.zacs)))
             self.zacs.extend( ["\n;######################### From: "+path+"\n"])
             self.zacs.extend(zacs)
 
         if len(accessli)>0:
             logstr += " %d accesslinks" % len(accessli)
+            self._journal("addAccessLinks", "accessli", {"path":path}, ("truncate", self.accessli, len(self.accessli)))
             self.accessli.extend( ["\n;######################### From: "+path+"\n"])
             self.accessli.extend(accessli)
 
         if len(xferli)>0:
             logstr += " %d xferlinks" % len(xferli)
+            self._journal("addXferLinks", "xferli", {"path":path}, ("truncate", self.xferli, len(self.xferli)))
             self.xferli.extend( ["\n;######################### From: "+path+"\n"])
             self.xferli.extend(xferli)
 
         if len(nodes)>0:
             logstr += " %d nodes" % len(nodes)
+            self._journal("addNodes", "nodes", {"path":path}, ("truncate", self.nodes, len(self.nodes)))
             self.nodes.extend( ["\n;######################### From: "+path+"\n"])
             self.nodes.extend(nodes)
 
         if len(supps)>0:
             logstr += " %d supps" % len(supps)
+            self._journal("addSupps", "supps", {"path":path}, ("truncate", self.supps, len(self.supps)))
             self.supps.extend( ["\n;######################### From: "+path+"\n"])
             self.supps.extend(supps)
 
@@ -1189,6 +1369,7 @@ class TransitNetwork(Network):
                     WranglerLogger.fatal("       new: " + str(fs))
                     raise NetworkException("FARESYSTEM definition collision")
                 else:
+                    self._journal("addFaresystem", fs_id, {"path":path}, ("setitems", self.faresystems, {fs_id:_MISSING}))
                     self.faresystems[fs_id] = fs
 
         if pts:
@@ -1367,6 +1548,12 @@ class TransitNetwork(Network):
                 
             simpleDwellDelay = self.findSimpleDwellDelay(line)
 
+            # look the line up once; the assignment lookups below take its integer id
+            lineKey = line.name
+            if transitAssignmentData:
+                lineId = transitAssignmentData.getLineId(line.name)
+                if lineId is not None: lineKey = lineId
+
             for nodeIdx in range(len(line.n)):
 
                 # linkSet nodes exempt - don't add delay 'cos that's inherent to the link
@@ -1382,7 +1569,7 @@ class TransitNetwork(Network):
                     (nodeIdx>0) and 
                     (int(line.attr["MODE"]) in complexAccessModes)):
                     try:                  
-                        loadFactor  = transitAssignmentData.loadFactor(line.name,
+                        loadFactor  = transitAssignmentData.loadFactor(lineKey,
                                                                        abs(int(line.n[nodeIdx-1].num)),
                                                                        abs(int(line.n[nodeIdx].num)),
                                                                        nodeIdx)
@@ -1412,7 +1599,7 @@ class TransitNetwork(Network):
                 # =======================================================================================
                 vehiclesPerPeriod = line.vehiclesPerPeriod(timeperiod, self.modelType)
                 try:
-                    boards = transitAssignmentData.numBoards(line.name,
+                    boards = transitAssignmentData.numBoards(lineKey,
                                                              abs(int(line.n[nodeIdx].num)),
                                                              abs(int(line.n[nodeIdx+1].num)),
                                                              nodeIdx+1)
@@ -1426,7 +1613,7 @@ class TransitNetwork(Network):
                     exits       = 0
                 else:
                     try:
-                        exits       = transitAssignmentData.numExits(line.name,
+                        exits       = transitAssignmentData.numExits(lineKey,
                                                                      abs(int(line.n[nodeIdx-1].num)),
                                                                      abs(int(line.n[nodeIdx].num)),
                                                                      nodeIdx)
@@ -1587,22 +1774,23 @@ class TransitNetwork(Network):
 
         # replace all instances of a_GP, b_GP with a_GP,a,hov,b_hov,b_gp
         # keep hov_nodes and gp_nodes
-        lines_moved = []
         hov_nodes = {}
         gp_nodes  = {}
+        link_replacements = {}
         hov_dict_list = hov_group1_df.to_dict(orient='records')
         for hov_record in hov_dict_list:
-            # split twice
-            lines_split1 = self.splitLinkInTransitLines(int(hov_record["a_GP"]), int(hov_record["b_GP"]), newNode=-1*int(hov_record["a"]), stop=False, verboseLog=False)
-            lines_split2 = self.splitLinkInTransitLines(int(hov_record["a"   ]), int(hov_record["b_GP"]), newNode=-1*int(hov_record["b"]), stop=False, verboseLog=False)
-            lines_moved.extend(lines_split1)
-            lines_moved.extend(lines_split2)
-            lines_moved = sorted(set(lines_moved))
+            # a_GP,b_GP => a_GP,-a,-b,b_GP
+            gp_link = (int(hov_record["a_GP"]), int(hov_record["b_GP"]))
+            if gp_link in link_replacements:
+                WranglerLogger.warn("General purpose link {} matches multiple hov links; using the first".format(gp_link))
+            else:
+                link_replacements[gp_link] = [gp_link[0], -1*int(hov_record["a"]), -1*int(hov_record["b"]), gp_link[1]]
             # keep these for fixing up lines
             hov_nodes[int(hov_record["a"])] = int(hov_record["a_GP"])
             hov_nodes[int(hov_record["b"])] = int(hov_record["b_GP"])
             gp_nodes[-1*int(hov_record["a_GP"])] = int(hov_record["a"])
             gp_nodes[-1*int(hov_record["b_GP"])] = int(hov_record["b"])
+        lines_moved = self.applyLinkReplacements(link_replacements, verboseLog=False)
 
         # when two links in a row are moved, there can be an artifact where the dummy link is used twice -- remove these
         for line in self.line(re.compile(".")):
@@ -1635,22 +1823,23 @@ class TransitNetwork(Network):
         
         # replace all instances of a_GP, b_GP with a_GP,a,el,b_el,b_gp
         # keep el_nodes and gp_nodes
-        lines_moved = []
         el_nodes  = {}
         gp_nodes  = {}
+        link_replacements = {}
         el_dict_list = el_group1_df.to_dict(orient='records')
         for el_record in el_dict_list:
-            # split twice            
-            lines_split1 = self.splitLinkInTransitLines(int(el_record["a_GP"]), int(el_record["b_GP"]), newNode=-1*int(el_record["a"]), stop=False, verboseLog=False)
-            lines_split2 = self.splitLinkInTransitLines(int(el_record["a"   ]), int(el_record["b_GP"]), newNode=-1*int(el_record["b"]), stop=False, verboseLog=False)
-            lines_moved.extend(lines_split1)
-            lines_moved.extend(lines_split2)
-            lines_moved = sorted(set(lines_moved))
+            # a_GP,b_GP => a_GP,-a,-b,b_GP
+            gp_link = (int(el_record["a_GP"]), int(el_record["b_GP"]))
+            if gp_link in link_replacements:
+                WranglerLogger.warn("General purpose link {} matches multiple express lane links; using the first".format(gp_link))
+            else:
+                link_replacements[gp_link] = [gp_link[0], -1*int(el_record["a"]), -1*int(el_record["b"]), gp_link[1]]
             # keep these for fixing up lines
             el_nodes[int(el_record["a"])] = int(el_record["a_GP"])
             el_nodes[int(el_record["b"])] = int(el_record["b_GP"])
             gp_nodes[-1*int(el_record["a_GP"])] = int(el_record["a"])
             gp_nodes[-1*int(el_record["b_GP"])] = int(el_record["b"])
+        lines_moved = self.applyLinkReplacements(link_replacements, verboseLog=False)
 
         # when two links in a row are moved, there can be an artifact where the dummy link is used twice -- remove these
         for line in self.line(re.compile(".")):
@@ -1661,86 +1850,55 @@ class TransitNetwork(Network):
         # remove the temp dir
         shutil.rmtree(tempdir)
 
-    def checkValidityOfLinks(self, cubeNetFile):
+    def getTransitLinkSet(self):
         """
-        Checks the validity of each of the transit links against the given cubeNetFile.
-        That is, each link in a .lin should either be in the roadway network, or in a .link file.
+        Returns the set of (a, b) for the off-road :py:class:`TransitLink` instances in *links*,
+        including (b, a) for two-way links.
         """
-        import Cube
-    
-        extra_link_vars = []
-        link_var_names  = {}
-
-        if self.modelType == Network.MODEL_TYPE_CHAMP:
-            extra_link_vars=['STREETNAME',
-                             'LANE_AM', 'LANE_OP','LANE_PM',
-                             'BUSLANE_AM', 'BUSLANE_OP', 'BUSLANE_PM']
-        elif self.modelType == Network.MODEL_TYPE_TM1:
-            extra_link_vars=['LANES','BRT']
-            link_var_names={ 'DISTANCE':0, 'LANES':1, 'BRT':2 }
-
-        (nodes_dict, links_dict) = Cube.import_cube_nodes_links_from_csvs(cubeNetFile,
-                                        extra_link_vars=extra_link_vars,
-                                        extra_node_vars=[],
-                                        links_csv=os.path.join(os.getcwd(),"cubenet_validate_links.csv"),
-                                        nodes_csv=os.path.join(os.getcwd(),"cubenet_validate_nodes.csv"),
-                                        exportIfExists=True)
+        transit_links = set()
+        for link in self.links:
+            if not isinstance(link,TransitLink): continue
+            transit_links.add((link.Anode, link.Bnode))
+            if not link.isOneway(): transit_links.add((link.Bnode, link.Anode))
+        return transit_links
 
-        WranglerLogger.debug("checkValidityOfLinks(): using links from {} to check lines".format(cubeNetFile))
-        errors_found = False
-        for line in self:
-            
-            # todo fix this
-            line_is_oneway = True
-            
-            last_node = None
-            for node in line:
+    def findBadTransitLinks(self, cubeNetFile, numProcesses=1, chunkSize=200, lines=None):
+        """
+        Checks each of the transit links against the given cubeNetFile and returns a list of
+        :py:class:`BadTransitLink` (line, seq, a, b, reason) for every problem found, in line order.
 
-                # this is the first node - nothing to do                
-                if not last_node:
-                    last_node = node
-                    continue
-                
-                # we need to check this link but possibly also the reverse
-                link_list = [(abs(last_node), abs(node))]
-                if not line_is_oneway:
-                    link_list.append((abs(node), abs(last_node)))
-                
-                # check the link(s)
-                for (a,b) in link_list:
-                    
-                    # it's a road link
-                    if (a,b) in links_dict:
-
-                        if self.modelType == Network.MODEL_TYPE_TM1:
-                            # if LANES = 0 and BRT != 1 then transit will be suuuuuuuper slow
-                            if ((int(links_dict[(a,b)][link_var_names['LANES']]) == 0) and \
-                                (int(links_dict[(a,b)][link_var_names['BRT'  ]]) != 1)):
-                                msg = "line {} is running on link {}-{} which has LANES=0 and BRT!=1".format(line.name, a, b)
-                                WranglerLogger.fatal(msg)
-                                raise NetworkException(msg)
-                        continue
-                    
-                    found_link = False
-                    for link in self.links:
-                        if not isinstance(link,TransitLink): continue
-                        
-                        if link.Anode == a and link.Bnode == b:
-                            found_link = True
-                            break
-                        
-                        if not link.isOneway() and link.Anode == b and link.Bnode == a:
-                            found_link = True
-                            break
-                    
-                    if found_link: continue
+        Each link in a .lin should either be in the roadway network, or in a .link file; for TM1,
+        lines shouldn't run on roadway links with LANES=0 and BRT!=1.
+
+        The roadway links are read once per roadway network state (see :py:class:`RoadwayLinkSet`).
+        If *numProcesses* > 1, lines are checked in chunks of *chunkSize* lines in that many processes.
+        If *lines* (a list of TransitLine instances) is passed, only those are checked.
+        """
+        roadway_link_set = RoadwayLinkSet.forCubeNet(cubeNetFile, self.modelType)
+        transit_links    = self.getTransitLinkSet()
+        line_nodes       = [(line.name, line.listNodeIds()) for line in (self.lines if lines is None else lines)
+                            if isinstance(line, TransitLine)]
 
-                    error_message = f"TransitNetwork.checkValidityOfLinks: ({a}, {b}) not in the roadway network nor in the off-road links (line {line.name})"
-                    WranglerLogger.fatal(error_message)
-                    errors_found = True
-                last_node = node
+        WranglerLogger.debug("findBadTransitLinks(): using links from {} to check {} lines".format(cubeNetFile, len(line_nodes)))
+        if numProcesses > 1 and len(line_nodes) > chunkSize:
+            return findBadLinksInParallel(line_nodes, roadway_link_set.links, roadway_link_set.noLaneLinks,
+                                          transit_links, numProcesses, chunkSize)
+        return findBadLinksInLines(line_nodes, roadway_link_set.links, roadway_link_set.noLaneLinks, transit_links)
 
-            if errors_found: raise NetworkException("Bad links found")
+    def checkValidityOfLinks(self, cubeNetFile, numProcesses=1, lines=None):
+        """
+        Checks the validity of each of the transit links against the given cubeNetFile.
+        That is, each link in a .lin should either be in the roadway network, or in a .link file.
+
+        Logs every bad link found (see :py:meth:`findBadTransitLinks`) and then raises a NetworkException if there were any.
+        """
+        bad_links = self.findBadTransitLinks(cubeNetFile, numProcesses=numProcesses, lines=lines)
+        for bad_link in bad_links:
+            WranglerLogger.fatal("TransitNetwork.checkValidityOfLinks: line {} link {} ({}, {}) {}".format(
+                                 bad_link.line, bad_link.seq, bad_link.a, bad_link.b, bad_link.reason))
+        if len(bad_links) > 0:
+            raise NetworkException("Bad links found: {} bad links in {} lines".format(
+                                   len(bad_links), len(set([bad_link.line for bad_link in bad_links]))))
 
     def applyProject(self, parentdir, networkdir, gitdir, projectsubdir=None, **kwargs):
         """
@@ -1755,11 +1913,17 @@ class TransitNetwork(Network):
             projectname = projectsubdir
         else:
             projectname = networkdir
-            
+
+        spec_file = TransitProjectSpec.findSpecFile(gitdir)
+        if spec_file:
+            return self.applyProjectSpecFile(spec_file, parentdir, networkdir, gitdir, projectsubdir)
+
+        self.flushProjectSpecs()
         evalstr = f"import {projectname}; {projectname}.apply(self"
         for key in kwargs.keys():
             evalstr += f", {key}={str(kwargs[key])}" 
         evalstr += ")"
+        journal_mark = self.journal.mark() if self.journal is not None else None
         try:
             # WranglerLogger.debug(f"cwd: {pathlib.Path.cwd()}")
             # WranglerLogger.debug(f"sys.path: {sys.path}")
@@ -1767,6 +1931,9 @@ class TransitNetwork(Network):
             exec(evalstr)
         except:
             WranglerLogger.fatal(f"Failed to exec [{evalstr}]")
+            if journal_mark is not None:
+                WranglerLogger.fatal(f"Rolling back {len(self.journal)-journal_mark} changes made by {projectname}")
+                self.journal.rollback(journal_mark)
             raise
                
         evalstr = f"dir({projectname})"
@@ -1788,18 +1955,97 @@ class TransitNetwork(Network):
             if os.path.exists(fullfarefile):
                 infile = open(fullfarefile, 'r')
                 lines = infile.readlines()
-                self.farefiles[farefile].extend(lines)
+                self.extendFareFile(farefile, lines, fullfarefile)
                 linecount = len(lines)
                 infile.close()
                 WranglerLogger.debug("Read %5d lines from fare file %s" % (linecount, fullfarefile))
+
+        if journal_mark is not None:
+            self.journal.setProjectSpan(projectname, journal_mark, self.journal.mark())
         
         return self.logProject(gitdir=gitdir,
                                projectname=(networkdir + "\\" + projectsubdir if projectsubdir else networkdir),
                                year=pyear, projectdesc=pdesc)
 
-    def reportDiff(self, netmode:str, other_network:pathlib.Path, directory:pathlib.Path, network_year:int, report_description:str, project_gitdir:str, additional_roadway_attrs:dict):
+    def applyProjectSpecs(self, specs):
+        """
+        Applies the given list of :py:class:`TransitProjectSpec` instances together; consecutive operations
+        of the same kind are executed in a single pass.  Returns the number of operations applied.
+        """
+        for spec in specs: spec.checkModelType(self.modelType)
+        journal_mark = self.journal.mark() if self.journal is not None else None
+        try:
+            num_ops = TransitProjectSpec.applySpecs(self, specs)
+        except:
+            if journal_mark is not None:
+                WranglerLogger.fatal("Rolling back {} changes made by {}".format(len(self.journal)-journal_mark, specs))
+                self.journal.rollback(journal_mark)
+            raise
+
+        if journal_mark is not None:
+            for spec in specs:
+                self.journal.setProjectSpan(spec.name, journal_mark, self.journal.mark())
+        return num_ops
+
+    def flushProjectSpecs(self):
+        """
+        Applies any declarative projects queued by :py:meth:`applyProject` when *batchProjectSpecs* is set,
+        along with their fare files, and logs them.
+        """
+        if len(self.pendingProjectSpecs) == 0: return
+        WranglerLogger.debug("Applying {} queued transit project specs".format(len(self.pendingProjectSpecs)))
+        pending = self.pendingProjectSpecs
+        self.pendingProjectSpecs = []
+        self.applyProjectSpecs([spec for (spec, fares, log_args) in pending])
+        for (spec, fares, log_args) in pending:
+            for (farefile, lines, fullfarefile) in fares:
+                self.extendFareFile(farefile, lines, fullfarefile)
+            self.logProject(**log_args)
+
+    def applyProjectSpecFile(self, spec_file, parentdir, networkdir, gitdir, projectsubdir=None):
+        """
+        Applies (or queues, if *batchProjectSpecs*) the declarative project in *spec_file*, including
+        its fare files, and logs the project.  Queued fare files are applied and the project is logged with
+        the spec (see :py:meth:`flushProjectSpecs`), so fares and lines stay in step.  The year and description
+        come from the spec if specified and from the project module otherwise.
+
+        Returns the SHA1 hash ID of the git commit of the project.
+        """
+        projectname = networkdir + "\\" + projectsubdir if projectsubdir else networkdir
+        spec = TransitProjectSpec.read(spec_file, name=projectsubdir if projectsubdir else networkdir)
+        spec.checkModelType(self.modelType)
+        WranglerLogger.debug("Applying {} from {}".format(spec, spec_file))
+
+        fares = []
+        for farefile in TransitNetwork.FARE_FILES[self.modelType]:
+            fullfarefile = os.path.join(gitdir, farefile)
+            if os.path.exists(fullfarefile):
+                with open(fullfarefile, 'r') as infile:
+                    lines = infile.readlines()
+                fares.append((farefile, lines, fullfarefile))
+                WranglerLogger.debug("Read %5d lines from fare file %s" % (len(lines), fullfarefile))
+
+        (pyear, pdesc) = (spec.year, spec.desc)
+        try:
+            if pyear is None: pyear = self.getAttr('year', parentdir, networkdir, gitdir, projectsubdir)
+            if pdesc is None: pdesc = self.getAttr('desc', parentdir, networkdir, gitdir, projectsubdir)
+        except AttributeError:
+            pass
+        log_args = {"gitdir":gitdir, "projectname":projectname, "year":pyear, "projectdesc":pdesc}
+
+        if self.batchProjectSpecs:
+            self.pendingProjectSpecs.append((spec, fares, log_args))
+            return self.getCommit(gitdir)
+
+        self.applyProjectSpecs([spec])
+        for (farefile, lines, fullfarefile) in fares:
+            self.extendFareFile(farefile, lines, fullfarefile)
+        return self.logProject(**log_args)
+
+    def reportDiff(self, netmode:str, other_network:pathlib.Path, directory:pathlib.Path, network_year:int, report_description:str, project_gitdir:str, additional_roadway_attrs:dict, fmt:str='shp'):
         """
         Reports the difference ebetween this network and the other_network into the given directory.
+        *fmt* is the vector format to write: ``shp``, ``parquet`` or ``fgb``; see :py:func:`Wrangler.Geometry.writeGeoDataFrame`.
 
         NOTE: this imports pandas, geopandas and shapely
 
@@ -1835,35 +2081,27 @@ class TransitNetwork(Network):
         # call parent version to create dir and copy in tableau
         Network.reportDiff(self, netmode, other_network, directory, network_year, report_description, report_description)
 
-        import pandas
-        import geopandas
+        from .Geometry import NodeCoordinates, writeGeoDataFrame
 
-        nodes_dict = Network.allNetworks["hwy"].writeShapefile(path=directory, additional_roadway_attrs=additional_roadway_attrs)
+        nodes_dict  = Network.allNetworks["hwy"].writeShapefile(path=directory, additional_roadway_attrs=additional_roadway_attrs, fmt=fmt)
+        node_coords = NodeCoordinates(nodes_dict)
 
-        nodes_gdf = geopandas.GeoDataFrame()
-        links_gdf = geopandas.GeoDataFrame()
-        lines_gdf = geopandas.GeoDataFrame()
+        # collect the rows for every line with their change, and create the geometries at once
+        nodes = []
+        links = []
+        lines = []
+        def addLine(line, change, line_name_suffix=""):
+            (line_nodes, line_links, line_lines) = line.getGeoRecords(line_name_suffix=line_name_suffix)
+            nodes.extend([node + [change] for node in line_nodes])
+            links.extend([link + [change] for link in line_links])
+            for line_dict in line_lines: line_dict["change"] = change
+            lines.extend(line_lines)
 
-        # create geodataframe rows
         for line_name in added_lines:
-            (added_nodes_gdf, added_links_gdf, added_lines_gdf) = self.line(line_name).createGeoDataFrames(nodes_dict)
-            added_nodes_gdf["change"] = "added line"
-            added_links_gdf["change"] = "added line"
-            added_lines_gdf["change"] = "added line"
-
-            nodes_gdf = pandas.concat([nodes_gdf, added_nodes_gdf])
-            links_gdf = pandas.concat([links_gdf, added_links_gdf])
-            lines_gdf = pandas.concat([lines_gdf, added_lines_gdf])
+            addLine(self.line(line_name), "added line")
 
         for line_name in deleted_lines:
-            (deleted_nodes_gdf, deleted_links_gdf, deleted_lines_gdf) = other_network.line(line_name).createGeoDataFrames(nodes_dict)
-            deleted_nodes_gdf["change"] = "deleted line"
-            deleted_links_gdf["change"] = "deleted line"
-            deleted_lines_gdf["change"] = "deleted line"
-
-            nodes_gdf = pandas.concat([nodes_gdf, deleted_nodes_gdf])
-            links_gdf = pandas.concat([links_gdf, deleted_links_gdf])
-            lines_gdf = pandas.concat([lines_gdf, deleted_lines_gdf])
+            addLine(other_network.line(line_name), "deleted line")
 
         for line_name in sorted(list(lines_in_both)):
             my_line = self.line(line_name)
@@ -1874,30 +2112,16 @@ class TransitNetwork(Network):
             my_node_ids = my_line.listNodeIds(ignoreStops=False)
             other_node_ids = other_line.listNodeIds(ignoreStops=False)
             # create modified route shapes
-            (new_nodes_gdf, new_links_gdf, new_lines_gdf) = self.line(line_name).createGeoDataFrames(nodes_dict)
-            new_nodes_gdf["change"] = "modified line"
-            new_links_gdf["change"] = "modified line"
-            new_lines_gdf["change"] = "modified line"
-
-            nodes_gdf = pandas.concat([nodes_gdf, new_nodes_gdf])
-            links_gdf = pandas.concat([links_gdf, new_links_gdf])
-            lines_gdf = pandas.concat([lines_gdf, new_lines_gdf])
+            addLine(my_line, "modified line")
         
             # if rerouted, create previous route shapes
             if my_node_ids != other_node_ids:
-               
-                (prev_nodes_gdf, prev_links_gdf, prev_lines_gdf) = other_network.line(line_name).createGeoDataFrames(nodes_dict, line_name_suffix="_prev")
-                prev_nodes_gdf["change"] = "previous line"
-                prev_links_gdf["change"] = "previous line"
-                prev_lines_gdf["change"] = "previous line"   
-
-                nodes_gdf = pandas.concat([nodes_gdf, prev_nodes_gdf])
-                links_gdf = pandas.concat([links_gdf, prev_links_gdf])
-                lines_gdf = pandas.concat([lines_gdf, prev_lines_gdf])
-
+                addLine(other_line, "previous line", line_name_suffix="_prev")
                 rerouted_lines.append(line_name)
-        if len(nodes_gdf)>0: nodes_gdf.to_file(filename=os.path.join(directory, "trn_nodes.shp"))
-        if len(links_gdf)>0: links_gdf.to_file(filename=os.path.join(directory, "trn_links.shp"))
-        if len(lines_gdf)>0: lines_gdf.to_file(filename=os.path.join(directory, "trn_lines.shp"))
+
+        (nodes_gdf, links_gdf, lines_gdf) = TransitLine.geoDataFramesFromRecords(nodes, links, lines, node_coords, extra_columns=["change"])
+        if len(nodes_gdf)>0: writeGeoDataFrame(nodes_gdf, directory, "trn_nodes", fmt)
+        if len(links_gdf)>0: writeGeoDataFrame(links_gdf, directory, "trn_links", fmt)
+        if len(lines_gdf)>0: writeGeoDataFrame(lines_gdf, directory, "trn_lines", fmt)
 
         return True
\ No newline at end of file
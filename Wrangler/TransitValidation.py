@@ -0,0 +1,158 @@
+import collections, os
+from .Logger import WranglerLogger
+from .Network import Network
+
+__all__ = ['BadTransitLink', 'RoadwayLinkSet', 'ValidationState', 'findBadLinksInLines', 'findBadLinksInParallel']
+
+BadTransitLink = collections.namedtuple('BadTransitLink', ['line', 'seq', 'a', 'b', 'reason'])
+BadTransitLink.__doc__ = """
+A transit link that failed validation: link (*a*, *b*) of the line named *line*, where *seq* is the
+(zero-based) index of node *a* in the line, and *reason* describes the problem.
+"""
+
+REASON_NOT_FOUND = "not in the roadway network nor in the off-road links"
+REASON_NO_LANES  = "roadway link has LANES=0 and BRT!=1"
+
+class RoadwayLinkSet(object):
+    """
+    The set of roadway links in a Cube network file, for validating transit lines against.
+
+    * *links* is a set of (a, b) for every roadway link
+    * *noLaneLinks* is a set of (a, b) for (TM1) links that transit shouldn't run on: LANES=0 and BRT!=1
+    * *nodes* is the set of roadway nodes, including those without links, or None if it's not known
+
+    Use :py:meth:`forCubeNet` to read one; it's cached per network file and model type, keyed
+    by the file's modification time and size, so validating unchanged roadway networks (e.g. several
+    transit writes within a year) doesn't re-export the network.
+    """
+
+    # (absolute cubeNetFile path, model type) -> ((mtime, size), RoadwayLinkSet)
+    _cache = {}
+
+    def __init__(self, links, noLaneLinks, nodes=None):
+        self.links       = links
+        self.noLaneLinks = noLaneLinks
+        self.nodes       = nodes
+
+    def __len__(self):
+        return len(self.links)
+
+    @staticmethod
+    def fileState(cubeNetFile):
+        """
+        Returns (modification time, size) of the given file, which identifies the roadway state.
+        """
+        stat = os.stat(cubeNetFile)
+        return (stat.st_mtime, stat.st_size)
+
+    @classmethod
+    def forCubeNet(cls, cubeNetFile, modelType):
+        """
+        Returns the RoadwayLinkSet for the given Cube network file, exporting and reading it if it's
+        not cached or has changed since it was cached.
+
+        NOTE: this exports the network with Cube via :py:func:`Cube.import_cube_nodes_links_from_csvs`
+        """
+        key        = (os.path.abspath(cubeNetFile), modelType)
+        file_state = RoadwayLinkSet.fileState(cubeNetFile)
+        if key in cls._cache and cls._cache[key][0] == file_state:
+            WranglerLogger.debug("RoadwayLinkSet: using cached links for {}".format(cubeNetFile))
+            return cls._cache[key][1]
+
+        import Cube
+
+        extra_link_vars = []
+        if modelType == Network.MODEL_TYPE_CHAMP:
+            extra_link_vars=['STREETNAME',
+                             'LANE_AM', 'LANE_OP','LANE_PM',
+                             'BUSLANE_AM', 'BUSLANE_OP', 'BUSLANE_PM']
+        elif modelType == Network.MODEL_TYPE_TM1:
+            extra_link_vars=['LANES','BRT']
+
+        (nodes_dict, links_dict) = Cube.import_cube_nodes_links_from_csvs(cubeNetFile,
+                                        extra_link_vars=extra_link_vars,
+                                        extra_node_vars=[],
+                                        links_csv=os.path.join(os.getcwd(),"cubenet_validate_links.csv"),
+                                        nodes_csv=os.path.join(os.getcwd(),"cubenet_validate_nodes.csv"),
+                                        exportIfExists=True)
+
+        no_lane_links = set()
+        if modelType == Network.MODEL_TYPE_TM1:
+            # links_dict values are [DISTANCE, LANES, BRT]
+            no_lane_links = set([ab for (ab, link_vars) in links_dict.items()
+                                 if int(link_vars[1]) == 0 and int(link_vars[2]) != 1])
+
+        roadway_link_set = cls(set(links_dict.keys()), no_lane_links, set(nodes_dict.keys()))
+        cls._cache[key] = (file_state, roadway_link_set)
+        WranglerLogger.debug("RoadwayLinkSet: read {} links from {}".format(len(roadway_link_set), cubeNetFile))
+        return roadway_link_set
+
+class ValidationState(object):
+    """
+    What a :py:class:`TransitNetwork` looked like at its last successful :py:meth:`TransitNetwork.validate`,
+    so the next validation only needs to check what changed.
+
+    * *lineSignatures* maps line name to :py:meth:`TransitLine.getSignature`
+    * *supportSignature* is a signature of the support records used by :py:meth:`TransitNetwork.validateWnrsAndPnrs`
+    * *roadwayState* identifies the roadway network used for link validation (see :py:meth:`RoadwayLinkSet.fileState`)
+    * *transitLinksSignature* is a signature of the off-road transit links used for link validation
+    """
+
+    def __init__(self):
+        self.lineSignatures        = {}
+        self.supportSignature      = None
+        self.roadwayState          = None
+        self.transitLinksSignature = None
+
+    def __repr__(self):
+        return "ValidationState(%d lines)" % len(self.lineSignatures)
+
+    @staticmethod
+    def signatureOf(records):
+        """
+        Returns a signature of the given list of records, based on their string representations.
+        """
+        return hash(tuple([str(record) for record in records]))
+
+def findBadLinksInLines(line_nodes, roadway_links, no_lane_links, transit_links):
+    """
+    Checks the given lines, a list of (line name, [node ids]), against the given sets of (a, b) links.
+    Returns a list of :py:class:`BadTransitLink` for every link that's on a no-lane roadway link or
+    that isn't in either the roadway links or the transit (off-road) links.
+
+    This is a module-level function so it can be run in worker processes.
+    """
+    bad_links = []
+    for (line_name, node_ids) in line_nodes:
+        for seq in range(len(node_ids)-1):
+            ab = (abs(node_ids[seq]), abs(node_ids[seq+1]))
+            if ab in roadway_links:
+                if ab in no_lane_links:
+                    bad_links.append(BadTransitLink(line_name, seq, ab[0], ab[1], REASON_NO_LANES))
+            elif ab not in transit_links:
+                bad_links.append(BadTransitLink(line_name, seq, ab[0], ab[1], REASON_NOT_FOUND))
+    return bad_links
+
+# link sets for worker processes; see :py:func:`findBadLinksInParallel`
+_worker_link_sets = None
+
+def _initWorker(roadway_links, no_lane_links, transit_links):
+    global _worker_link_sets
+    _worker_link_sets = (roadway_links, no_lane_links, transit_links)
+
+def _findBadLinksInChunk(line_nodes):
+    return findBadLinksInLines(line_nodes, *_worker_link_sets)
+
+def findBadLinksInParallel(line_nodes, roadway_links, no_lane_links, transit_links, numProcesses, chunkSize=200):
+    """
+    Like :py:func:`findBadLinksInLines` but checks chunks of *chunkSize* lines in *numProcesses* worker processes.
+    The link sets are sent to each worker once.  Results are returned in line order.
+    """
+    import concurrent.futures
+    chunks = [line_nodes[idx:idx+chunkSize] for idx in range(0, len(line_nodes), chunkSize)]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=numProcesses, initializer=_initWorker,
+                                                initargs=(roadway_links, no_lane_links, transit_links)) as executor:
+        bad_links = []
+        for chunk_bad_links in executor.map(_findBadLinksInChunk, chunks):
+            bad_links.extend(chunk_bad_links)
+    return bad_links
@@ -0,0 +1,154 @@
+import collections, re
+from .Logger import WranglerLogger
+
+__all__ = ['TurnPenalties', 'LinkAdjacency', 'InvalidTurn']
+
+InvalidTurn = collections.namedtuple('InvalidTurn', ['a', 'b', 'c', 'penset', 'missingLinks', 'suggestion'])
+InvalidTurn.__doc__ = """
+A turn penalty that refers to roadway links that don't exist; see :py:meth:`TurnPenalties.findInvalidTurns`.
+
+* *a*, *b*, *c* and *penset* identify the turn
+* *missingLinks* is a list of the missing (a, b) and/or (b, c) links
+* *suggestion* is a (new a, b, new c) turn built from existing links, with -1 for a node that
+  couldn't be fixed, or None if no suggestion was asked for
+"""
+
+class LinkAdjacency(object):
+    """
+    Out-link and in-link indexes for a set of (a, b) roadway links, so finding the links at
+    a node is O(degree) rather than a scan of every link.
+    """
+    def __init__(self, links):
+        self.links    = set(links)
+        self.outNodes = collections.defaultdict(set)
+        self.inNodes  = collections.defaultdict(set)
+        for (a, b) in self.links:
+            self.outNodes[a].add(b)
+            self.inNodes[b].add(a)
+
+    def __contains__(self, link):
+        return link in self.links
+
+    def nodesBetween(self, a, b):
+        """
+        Returns a sorted list of the nodes *n* for which links (*a*, *n*) and (*n*, *b*) both exist.
+        """
+        return sorted(self.outNodes.get(a, set()) & self.inNodes.get(b, set()))
+
+class TurnPenalties(object):
+    """
+    The turn penalties of a Cube turn penalty file (e.g. ``turnsam.pen``), keyed by
+    (from node, through node, to node, penalty set).
+
+    Merging another file (e.g. a project's ``turns.pen``) with :py:meth:`merge` replaces the penalties
+    for turns that are already present, in place, and appends new ones, so applying a series of projects
+    leaves one entry per turn, as specified by the last project to touch it.  Comment lines, and lines that
+    can't be parsed (with a warning), are kept verbatim in order.
+    """
+    # A B C penalty_set penalty, separated by whitespace or commas, optionally followed by a comment
+    PENALTY_RE = re.compile(r"^\s*(\d+)[\s,]+(\d+)[\s,]+(\d+)[\s,]+(\d+)[\s,]+(-?\d*\.?\d+)\s*(;.*)?$")
+
+    def __init__(self, filename=None):
+        # (a, b, c, penset) -> line text, or ('comment', n) -> line text for comments and unparsed lines
+        self.lines       = collections.OrderedDict()
+        self.numComments = 0
+        if filename: self.merge(filename)
+
+    def __len__(self):
+        return len(self.lines) - self.numComments
+
+    def __contains__(self, turn):
+        """
+        *turn* is (a, b, c) for penalty set 1, or (a, b, c, penset)
+        """
+        return self._key(turn) in self.lines
+
+    def __iter__(self):
+        """
+        Iterates over the (a, b, c, penset) turns, in file order.
+        """
+        for key in self.lines.keys():
+            if key[0] != 'comment': yield key
+
+    def _key(self, turn):
+        return tuple(turn) if len(turn) == 4 else tuple(turn) + (1,)
+
+    def getPenalty(self, a, b, c, penset=1):
+        """
+        Returns the penalty (a float) for the given turn, or None if it doesn't have one.
+        """
+        key = (a, b, c, penset)
+        if key not in self.lines: return None
+        return float(TurnPenalties.PENALTY_RE.match(self.lines[key]).group(5))
+
+    def mergeLines(self, lines, source="turn penalties"):
+        """
+        Merges the given lines of a turn penalty file into these penalties.  Returns (number of new turns,
+        number of turns whose penalties were replaced).
+        """
+        num_new      = 0
+        num_replaced = 0
+        for line in lines:
+            line = line.rstrip("\r\n")
+            match = TurnPenalties.PENALTY_RE.match(line)
+            if match:
+                key = tuple([int(match.group(idx)) for idx in range(1,5)])
+                if key in self.lines: num_replaced += 1
+                else:                 num_new      += 1
+                self.lines[key] = line
+            else:
+                if line.strip() != "" and not line.lstrip().startswith(";"):
+                    WranglerLogger.warning("Couldn't parse turn penalty line in {}; keeping it as is: [{}]".format(source, line))
+                self.lines[('comment', self.numComments)] = line
+                self.numComments += 1
+
+        WranglerLogger.debug("TurnPenalties: merged {} new and {} replaced turn penalties from {}".format(
+                             num_new, num_replaced, source))
+        return (num_new, num_replaced)
+
+    def merge(self, filename):
+        """
+        Merges the turn penalty file *filename* into these penalties; see :py:meth:`mergeLines`.
+        """
+        with open(filename, 'r') as f:
+            return self.mergeLines(f, source=filename)
+
+    def write(self, filename):
+        """
+        Writes these turn penalties to *filename*.
+        """
+        with open(filename, 'w') as f:
+            for line in self.lines.values():
+                f.write(line + "\n")
+
+    def findInvalidTurns(self, links, suggestCorrectLink=True, prohibitedOnly=False):
+        """
+        Returns a list of :py:class:`InvalidTurn` for the turns whose (a, b) or (b, c) link isn't in *links*,
+        a :py:class:`LinkAdjacency` or a set of (a, b) links.  This is linear in the number of links and turns.
+        If *prohibitedOnly*, only prohibited turns (those with negative penalties) are checked.
+
+        If *suggestCorrectLink*, a missing link is assumed to have been split by a new node, and the
+        suggestion uses the node between the two ends (or -1 if there isn't one).
+        """
+        if not isinstance(links, LinkAdjacency):
+            links = LinkAdjacency(links)
+
+        invalid_turns = []
+        for (a, b, c, penset) in self:
+            if prohibitedOnly and self.getPenalty(a, b, c, penset) >= 0: continue
+            missing = [link for link in [(a, b), (b, c)] if link not in links]
+            if not missing: continue
+
+            suggestion = None
+            if suggestCorrectLink:
+                new_a = a
+                new_c = c
+                if (a, b) in missing:
+                    nodes = links.nodesBetween(a, b)
+                    new_a = nodes[0] if nodes else -1
+                if (b, c) in missing:
+                    nodes = links.nodesBetween(b, c)
+                    new_c = nodes[0] if nodes else -1
+                suggestion = (new_a, b, new_c)
+            invalid_turns.append(InvalidTurn(a, b, c, penset, missing, suggestion))
+        return invalid_turns
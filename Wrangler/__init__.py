@@ -1,10 +1,14 @@
 import os, sys
+from .Connectivity import ConnectivityReport, UnionFind
 from .Faresystem import Faresystem
+from .Geometry import NodeCoordinates, writeGeoDataFrame
+from .FareTables import StopToStopFareTable, TransferFareMatrix
 from .Linki import Linki
 from .Network import Network
 from .NetworkException import NetworkException
 from .PTSystem import PTSystem
 from .PNRLink import PNRLink
+from .ProjectSpec import TransitProjectSpec, readProjectSpecFile
 from .Supplink import Supplink
 
 # add ..\_static for dataTable import
@@ -12,20 +16,33 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__
 
 from .TransitAssignmentData import TransitAssignmentData ##
 from .TransitCapacity import TransitCapacity
+from .TransitJournal import TransitJournal, JournalEntry
 from .TransitLine import TransitLine
 from .TransitLink import TransitLink
 from .TransitNetwork import TransitNetwork
 from .TransitParser import TransitParser
+from .TransitValidation import BadTransitLink, RoadwayLinkSet
+from .TollTable import TollTable
+from .TurnPenalties import TurnPenalties, LinkAdjacency, InvalidTurn
 from .HighwayNetwork import HighwayNetwork
+from .RoadwayChangeSet import RoadwayChangeSet
+from .RoadwayEdits import RoadwayEdits
+from .RoadwaySnapshot import RoadwaySnapshot, RoadwayDiff
 from .Logger import setupLogging, WranglerLogger
 from .Node import Node
+from .NodeNames import readNodeNames
 from .HwySpecsRTP import HwySpecsRTP
 
 
 __all__ = ['NetworkException', 'setupLogging', 'WranglerLogger',
            'Network', 'TransitAssignmentData', 'TransitNetwork', 'TransitLine', 'TransitParser',
            'Node', 'TransitLink', 'Linki', 'PNRLink', 'Supplink', 'HighwayNetwork', 'HwySpecsRTP',
-           'TransitCapacity', 'Faresystem', 'PTSystem'
+           'TransitCapacity', 'Faresystem', 'PTSystem', 'TransitJournal', 'JournalEntry',
+           'TransitProjectSpec', 'readProjectSpecFile', 'StopToStopFareTable', 'TransferFareMatrix',
+           'BadTransitLink', 'RoadwayLinkSet', 'ConnectivityReport', 'UnionFind',
+           'readNodeNames', 'TurnPenalties', 'LinkAdjacency', 'InvalidTurn',
+           'NodeCoordinates', 'writeGeoDataFrame', 'RoadwaySnapshot', 'RoadwayDiff',
+           'RoadwayEdits', 'RoadwayChangeSet', 'TollTable'
 ]
 
 
@@ -7,11 +7,50 @@
   -Lisa 2012.03.12
 
 """
-import copy, os, re, time
+import collections, copy, hashlib, io, os, shlex, sys
 from socket import gethostname, getfqdn
 
+from .CubeRunner import run_cube_job
+
 CUBE_COMPUTER = "vanness"
-CUBE_SUCCESS = re.compile("\s*(VOYAGER)\s+(ReturnCode)\s*=\s*([01])\s+")
+
+# Command used to run Cube scripts, as a list.  Set the WRANGLER_RUNTPP environment variable
+# (e.g. to "python fake_runtpp.py") to use a stand-in.
+RUNTPP_COMMAND = ["runtpp.exe"]
+
+# Exported networks, keyed by the SHA1 of the network file, most recently used last:
+# sha1 -> CubeExport with every variable exported so far
+EXPORT_CACHE      = collections.OrderedDict()
+EXPORT_CACHE_SIZE = 4
+
+# dtypes for the typed loader (see import_cube_nodes_links_as_dataframes) for variables we know about;
+# str variables have their quotes stripped.  Other variables are left for pandas to infer.
+CUBE_VAR_DTYPES = {
+    'N':'int32', 'A':'int32', 'B':'int32', 'X':'float64', 'Y':'float64', 'DISTANCE':'float64',
+    'LANES':'int8', 'USE':'int8', 'FT':'int8', 'TOLLCLASS':'int32', 'ROUTENUM':'int32', 'CITYID':'int32',
+    'SIGCOR':'int8', 'TOS':'int8', 'AUX':'int8', 'HOT':'int8', 'BRT':'int8', 'REGFREIGHT':'int8',
+    'LANE_AM':'int8', 'LANE_OP':'int8', 'LANE_PM':'int8', 'BUSLANE_AM':'int8', 'BUSLANE_OP':'int8', 'BUSLANE_PM':'int8',
+    'FFS':'float64',
+    'ROUTEDIR':'str', 'CITYNAME':'str', 'PROJ':'str', 'STREETNAME':'str',
+}
+
+def get_runtpp_command():
+    """
+    Returns the command (a list) used to run Cube scripts: WRANGLER_RUNTPP if set, otherwise RUNTPP_COMMAND.
+    """
+    if os.environ.get("WRANGLER_RUNTPP"):
+        return shlex.split(os.environ["WRANGLER_RUNTPP"], posix=(os.name != "nt"))
+    return list(RUNTPP_COMMAND)
+
+def file_sha1(file):
+    """
+    Returns the SHA1 hex digest of the contents of the given file.
+    """
+    sha1 = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024*1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
 
 def getCubeHostnames():
     """
@@ -40,8 +79,7 @@ def export_cubenet_to_csvs(file, extra_link_vars=[], extra_node_vars=[],
     options:
         extra_link_vars, extra_node_vars: list extra variables to export
     """
-    import subprocess
-    script   = os.path.join(os.path.dirname(os.path.abspath(__file__)),"exportHwyfromPy.s")
+    script   = os.path.join(os.path.dirname(os.path.abspath(__file__)),"exportHwyFromPy.s")
     
     #set environment variables
     env = copy.copy(os.environ)
@@ -76,112 +114,43 @@ def export_cubenet_to_csvs(file, extra_link_vars=[], extra_node_vars=[],
     filedir = os.path.dirname(os.path.abspath(file))
     hostname = gethostname().lower()
 
-    # retry in case of a license error
-    NUM_RETRIES = 5
-    for attempt in range(1,NUM_RETRIES+1):
-
-        cube_stdout = []
-        license_error = False
-        if hostname not in getCubeHostnames():
-            if links_csv == None or nodes_csv == None:
-                print("export_cubenet_to_csvs requires a links_csv and nodes_csv output file if dispatching to {} (temp won't work)".format(CUBE_COMPUTER))
-                sys.exit(2)
-             
-            env["MACHINES"] = CUBE_COMPUTER
-        
-            cmd = r'y:\champ\util\bin\dispatch-one.bat "runtpp ' + script + '"'
-            print(cmd)
-            proc = subprocess.Popen( cmd, cwd = filedir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-            for line in proc.stdout:
-                if type(line)==bytes: line = line.decode()  # convert to string, not byetes
-                line = line.strip('\r\n')
-                print("stdout: {}".format(line))
-                cube_stdout.append(line)
-                if line=="RUNTPP: Licensing error": license_error = True
-        else:
-            cmd = 'runtpp.exe ' + script 
-            print(cmd)
-            print(filedir)
-        
-            proc = subprocess.Popen( cmd, cwd = filedir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-            for line in proc.stdout:
-                if type(line)==bytes: line = line.decode()  # convert to string, not byetes
-                line = line.strip('\r\n')
-                print("stdout: {}".format(line))
-                cube_stdout.append(line)
-                if line=="RUNTPP: Licensing error": license_error = True
-
-        print("EXPORTING CUBE NETWORK: {}".format(env['CUBENET']))
-        print("...adding variables {}, {}:".format(env['XTRALINKVAR'], env['XTRANODEVAR']))
-        print("...running script: \n      {}".format(script))
-
-        # retry on license error
-        if license_error:
-            print("Received license error")
-            if attempt == NUM_RETRIES:
-                print("Out of retry attempts")
-                sys.exit(2)
-
-            # retry
-            print("Retrying {} ...".format(attempt))
-            time.sleep(1)
-            continue
-     
-        retStderr = []
-        for line in proc.stderr:
-            if type(line)==bytes: line = line.decode()  # convert to string, not byetes
-            line = line.strip('\r\n')
-            print("stderr: {}".format(line))
-        retcode  = proc.wait()
-
-        if (retcode != 0) and len(cube_stdout)>0:
-            # retcode may be wrong -- check last stdout
-            print("checking cube_stdout[-1]: {}".format(cube_stdout[-1]))
-            # print("match: {}".format(re.match(retcode,cube_stdout[-1])))
-            if re.match(CUBE_SUCCESS,cube_stdout[-1]):
-                print("Overriding cuberet {} with 0 due to last cubeStdout line".format(retcode))
-                retcode = 0
-
-        # success -- stop looping
-        if retcode == 0: break
-
-        # not license error -- break
-        if retcode != 0: raise
+    if hostname not in getCubeHostnames():
+        if links_csv == None or nodes_csv == None:
+            print("export_cubenet_to_csvs requires a links_csv and nodes_csv output file if dispatching to {} (temp won't work)".format(CUBE_COMPUTER))
+            sys.exit(2)
 
+        env["MACHINES"] = CUBE_COMPUTER
+        cmd = r'y:\champ\util\bin\dispatch-one.bat "runtpp ' + script + '"'
+    else:
+        cmd = get_runtpp_command() + [script]
+    print(cmd if isinstance(cmd, str) else " ".join(cmd))
+    print(filedir)
+    print("EXPORTING CUBE NETWORK: {}".format(env['CUBENET']))
+    print("...adding variables {}, {}:".format(env['XTRALINKVAR'], env['XTRANODEVAR']))
+    print("...running script: \n      {}".format(script))
+
+    # license errors are retried by the runner
+    result = run_cube_job(cmd, cwd=filedir, env=env, on_line=lambda line: print("stdout: {}".format(line)))
+    if result.licenseError:
+        print("Out of retry attempts")
+        sys.exit(2)
+    if result.timedOut:
+        raise RuntimeError("Exporting {} timed out".format(file))
+    retcode = result.returncode
+    if retcode != 0:
+        raise RuntimeError("Exporting {} failed with return code {}".format(file, retcode))
 
     print("Received {} from [{}]".format(retcode, cmd))
     print("Exported network to: {}, {}".format(env["CUBELINK_CSV"], env["CUBENODE_CSV"]))
 
     
-def import_cube_nodes_links_from_csvs(cubeNetFile,
-                                          extra_link_vars=[], extra_node_vars=[],
-                                          links_csv=None, nodes_csv=None,
-                                          exportIfExists=True):
+def _read_cube_csv_dicts(nodes_file, links_file):
     """
-    Imports cube network from network file and returns (nodes_dict, links_dict).
-    
-    Nodes_dict maps node numbers to [X, Y, vars given by *extra_node_vars*]
-    
-    Links_dict maps (a,b) to [DISTANCE, *extra_link_vars*]
+    Reads the given open node and link csv files into (nodes_dict, links_dict); see :py:func:`read_cube_csvs`.
     """
-
-    if not links_csv:
-        links_csv=os.path.join(os.environ['TEMP'],"node.csv")
-    if not nodes_csv:
-        nodes_csv=os.path.join(os.environ['TEMP'],"link.csv")
-
-    # don't export if
-    if (not exportIfExists and links_csv and nodes_csv and 
-        os.path.exists(links_csv) and os.path.exists(nodes_csv)):
-        pass # don't need to do anything
-    else:
-        export_cubenet_to_csvs(cubeNetFile,extra_link_vars, extra_node_vars, links_csv=links_csv, nodes_csv=nodes_csv)
-
-    
     # Open node file and read nodes
     nodes_dict = {}    
-    F=open(nodes_csv,mode='r')
-    for rec in F:
+    for rec in nodes_file:
         r=rec.strip().split(',')
         n=int(r[0])
         x=float(r[1])
@@ -190,12 +159,10 @@ def import_cube_nodes_links_from_csvs(cubeNetFile,
         node_array.extend(r[3:])
         
         nodes_dict[n] = node_array
-    F.close()
     
     # Open link file and read links
     links_dict = {}
-    F=open(links_csv,mode='r')
-    for rec in F:
+    for rec in links_file:
         r=rec.strip().split(',')
         
         #add standard fields
@@ -208,8 +175,181 @@ def import_cube_nodes_links_from_csvs(cubeNetFile,
         link_array.extend(r[3:])
         
         links_dict[(a,b)] = link_array
-    F.close()
 
     return (nodes_dict, links_dict)
 
+def read_cube_csvs(nodes_csv, links_csv):
+    """
+    Reads the node and link csvs written by :py:func:`export_cubenet_to_csvs` and returns (nodes_dict, links_dict).
+
+    Nodes_dict maps node numbers to [X, Y, extra node vars]
+
+    Links_dict maps (a,b) to [DISTANCE, extra link vars]
+    """
+    with open(nodes_csv, mode='r') as nodes_file, open(links_csv, mode='r') as links_file:
+        return _read_cube_csv_dicts(nodes_file, links_file)
+
+def _read_cube_csv_dataframe(csv_file, columns, index_columns, dtypes):
+    """
+    Reads the given open csv file (with no header) into a DataFrame with the given columns, indexed by *index_columns*.
+
+    NOTE: this imports pandas
+    """
+    import pandas
+    col_dtypes = {}
+    for column in columns:
+        dtype = dtypes.get(column, dtypes.get(column.upper(), CUBE_VAR_DTYPES.get(column.upper())))
+        if dtype: col_dtypes[column] = dtype
+    str_columns = [column for (column, dtype) in col_dtypes.items() if dtype in ['str', str, 'object', object]]
+
+    df = pandas.read_csv(csv_file, header=None, names=columns,
+                         dtype=dict([(column, dtype) for (column, dtype) in col_dtypes.items() if column not in str_columns] +
+                                    [(column, str) for column in str_columns]),
+                         keep_default_na=False, na_values=[])
+    for column in str_columns:
+        df[column] = df[column].str.strip(" '")
+    return df.set_index(index_columns)
+
+class CubeExport(object):
+    """
+    The csv export of a Cube network with the given link and node variables, kept as text so that it
+    can be served as dictionaries (:py:meth:`dicts`) or typed DataFrames (:py:meth:`dataframes`), each
+    parsed at most once.
+    """
+    def __init__(self, link_vars, node_vars, nodes_text, links_text):
+        self.link_vars   = list(link_vars)
+        self.node_vars   = list(node_vars)
+        self.nodes_text  = nodes_text
+        self.links_text  = links_text
+        self._dicts      = None
+        self._dataframes = {}
 
+    @classmethod
+    def fromCsvs(cls, link_vars, node_vars, nodes_csv, links_csv):
+        with open(nodes_csv, mode='r') as nodes_file, open(links_csv, mode='r') as links_file:
+            return cls(link_vars, node_vars, nodes_file.read(), links_file.read())
+
+    def hasVars(self, link_vars, node_vars):
+        """
+        Returns True if this export includes all of the given variables.
+        """
+        my_link_vars = [var.upper() for var in self.link_vars]
+        my_node_vars = [var.upper() for var in self.node_vars]
+        return (all([var.upper() in my_link_vars for var in link_vars]) and
+                all([var.upper() in my_node_vars for var in node_vars]))
+
+    def dicts(self, link_vars, node_vars):
+        """
+        Returns (nodes_dict, links_dict) with the given variables; see :py:func:`import_cube_nodes_links_from_csvs`.
+        """
+        if self._dicts is None:
+            self._dicts = _read_cube_csv_dicts(io.StringIO(self.nodes_text), io.StringIO(self.links_text))
+        return (_project_columns(self._dicts[0], self.node_vars, node_vars, 2),
+                _project_columns(self._dicts[1], self.link_vars, link_vars, 1))
+
+    def dataframes(self, link_vars, node_vars, dtypes=None):
+        """
+        Returns (nodes_df, links_df) with the given variables; see :py:func:`import_cube_nodes_links_as_dataframes`.
+
+        NOTE: this imports pandas
+        """
+        dtypes = dtypes if dtypes else {}
+        key    = tuple(sorted([(column, str(dtype)) for (column, dtype) in dtypes.items()]))
+        if key not in self._dataframes:
+            self._dataframes[key] = (
+                _read_cube_csv_dataframe(io.StringIO(self.nodes_text), ["N","X","Y"] + self.node_vars, "N", dtypes),
+                _read_cube_csv_dataframe(io.StringIO(self.links_text), ["A","B","DISTANCE"] + self.link_vars, ["A","B"], dtypes))
+        (nodes_df, links_df) = self._dataframes[key]
+        return (nodes_df[["X","Y"] + _matching_vars(self.node_vars, node_vars)].copy(),
+                links_df[["DISTANCE"] + _matching_vars(self.link_vars, link_vars)].copy())
+
+def _matching_vars(all_vars, wanted_vars):
+    """
+    Returns the names in *all_vars* for *wanted_vars*, which may differ in case.
+    """
+    upper_vars = [var.upper() for var in all_vars]
+    return [all_vars[upper_vars.index(var.upper())] for var in wanted_vars]
+
+def _project_columns(table, all_vars, wanted_vars, num_fixed):
+    """
+    Returns a copy of *table* (key -> [fixed values, all_vars values]) with only *wanted_vars* after the fixed values.
+    """
+    upper_vars = [var.upper() for var in all_vars]
+    idxs       = list(range(num_fixed)) + [num_fixed + upper_vars.index(var.upper()) for var in wanted_vars]
+    return dict([(key, [values[idx] for idx in idxs]) for (key, values) in table.items()])
+
+def _get_cube_export(cubeNetFile, extra_link_vars, extra_node_vars, links_csv, nodes_csv, exportIfExists, useCache):
+    """
+    Returns a :py:class:`CubeExport` of the given network with at least the given variables,
+    exporting it with Cube if needed.  See :py:func:`import_cube_nodes_links_from_csvs`.
+    """
+    if not links_csv:
+        links_csv=os.path.join(os.environ['TEMP'],"node.csv")
+    if not nodes_csv:
+        nodes_csv=os.path.join(os.environ['TEMP'],"link.csv")
+
+    # don't export if
+    if (not exportIfExists and links_csv and nodes_csv and 
+        os.path.exists(links_csv) and os.path.exists(nodes_csv)):
+        return CubeExport.fromCsvs(extra_link_vars, extra_node_vars, nodes_csv, links_csv)
+
+    if not useCache:
+        export_cubenet_to_csvs(cubeNetFile,extra_link_vars, extra_node_vars, links_csv=links_csv, nodes_csv=nodes_csv)
+        return CubeExport.fromCsvs(extra_link_vars, extra_node_vars, nodes_csv, links_csv)
+
+    sha1   = file_sha1(cubeNetFile)
+    export = EXPORT_CACHE.get(sha1)
+    if export and export.hasVars(extra_link_vars, extra_node_vars):
+        print("Using cached export of {} ({})".format(cubeNetFile, sha1))
+    else:
+        # export the superset of what's been asked for
+        link_vars = list(export.link_vars) if export else []
+        node_vars = list(export.node_vars) if export else []
+        link_vars += [var for var in extra_link_vars if var.upper() not in [v.upper() for v in link_vars]]
+        node_vars += [var for var in extra_node_vars if var.upper() not in [v.upper() for v in node_vars]]
+        export_cubenet_to_csvs(cubeNetFile, link_vars, node_vars, links_csv=links_csv, nodes_csv=nodes_csv)
+        export = CubeExport.fromCsvs(link_vars, node_vars, nodes_csv, links_csv)
+        EXPORT_CACHE[sha1] = export
+
+    EXPORT_CACHE.move_to_end(sha1)
+    while len(EXPORT_CACHE) > EXPORT_CACHE_SIZE:
+        EXPORT_CACHE.popitem(last=False)
+    return export
+
+def import_cube_nodes_links_from_csvs(cubeNetFile,
+                                          extra_link_vars=[], extra_node_vars=[],
+                                          links_csv=None, nodes_csv=None,
+                                          exportIfExists=True, useCache=True):
+    """
+    Imports cube network from network file and returns (nodes_dict, links_dict).
+    
+    Nodes_dict maps node numbers to [X, Y, vars given by *extra_node_vars*]
+    
+    Links_dict maps (a,b) to [DISTANCE, *extra_link_vars*]
+
+    If *useCache*, exports are cached in memory keyed by the SHA1 of *cubeNetFile*'s contents, so
+    asking again for the same network (even a copy at a different path) doesn't re-run Cube.
+    Each export includes every variable requested so far for that network, and the requested
+    variables are picked from that.  Note that the csvs are only (re)written when Cube runs.
+    """
+    export = _get_cube_export(cubeNetFile, extra_link_vars, extra_node_vars, links_csv, nodes_csv, exportIfExists, useCache)
+    return export.dicts(extra_link_vars, extra_node_vars)
+
+def import_cube_nodes_links_as_dataframes(cubeNetFile,
+                                          extra_link_vars=[], extra_node_vars=[],
+                                          links_csv=None, nodes_csv=None,
+                                          exportIfExists=True, useCache=True, dtypes=None):
+    """
+    Like :py:func:`import_cube_nodes_links_from_csvs` but returns typed pandas DataFrames (nodes_df, links_df):
+
+    * nodes_df is indexed by N and has columns X, Y and *extra_node_vars*
+    * links_df is indexed by (A, B) and has columns DISTANCE and *extra_link_vars*
+
+    Column dtypes come from *dtypes* (variable name -> dtype) if given, then :py:data:`CUBE_VAR_DTYPES`,
+    otherwise they're inferred.  String variables have their quotes stripped.  The exports are parsed
+    by pandas' C parser and shared with :py:func:`import_cube_nodes_links_from_csvs` through the cache.
+
+    NOTE: this imports pandas
+    """
+    export = _get_cube_export(cubeNetFile, extra_link_vars, extra_node_vars, links_csv, nodes_csv, exportIfExists, useCache)
+    return export.dataframes(extra_link_vars, extra_node_vars, dtypes)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+ Runs Cube (runtpp) jobs and other commands: output is streamed line by line as it's produced,
+ jobs can time out, license errors are retried with exponential backoff and jitter, and Cube jobs
+ take a seat from a license pool so concurrent callers (threads, or processes sharing a seat directory)
+ queue for the available Cube licenses rather than colliding.
+
+ The pool is configured with environment variables:
+   WRANGLER_CUBE_SEATS     the number of Cube jobs that may run at once (default 1)
+   WRANGLER_CUBE_SEAT_DIR  a directory for seat lock files, shared by processes on the same machine
+   WRANGLER_CUBE_TIMEOUT   the default timeout for Cube jobs, in seconds (default none)
+"""
+import collections, contextlib, io, os, random, re, signal, subprocess, threading, time
+
+LICENSE_ERROR = "RUNTPP: Licensing error"
+CUBE_SUCCESS  = re.compile(r"\s*(VOYAGER)\s+(ReturnCode)\s*=\s*([01])\s+")
+
+CommandResult = collections.namedtuple('CommandResult', ['returncode', 'stdout', 'stderr', 'timedOut', 'licenseError', 'attempts'])
+CommandResult.__doc__ = """
+The result of :py:func:`run_command` or :py:func:`run_cube_job`.  *returncode* is None if the command timed out
+(*timedOut*); *stdout* and *stderr* are lists of lines.  *licenseError* is True if
+the last attempt failed with a license error.
+"""
+
+def _kill_process_tree(proc):
+    """
+    Kills the given process and its children (runtpp starts Voyager, which may start more).
+    """
+    try:
+        if os.name == "nt":
+            subprocess.run(["taskkill", "/F", "/T", "/PID", str(proc.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (OSError, subprocess.SubprocessError):
+        proc.kill()
+
+def _stream_lines(pipe, lines, callback):
+    # universal newlines, since Cube writes its progress lines ending with a bare \r
+    with io.TextIOWrapper(pipe, encoding='utf-8', errors='replace', newline=None) as text:
+        for line in text:
+            line = line.rstrip('\n')
+            if len(line) == 0: continue
+            lines.append(line)
+            if callback: callback(line)
+
+def run_command(cmd, cwd=".", env=None, timeout=None, on_stdout=None, on_stderr=None):
+    """
+    Runs *cmd* (a list, or a string for the shell) in *cwd* with environment *env* (the current one if None),
+    calling *on_stdout* and *on_stderr* with each non-empty line of output as it's produced (lines may end
+    with \n, \r\n or \r).  If it runs for longer than *timeout* seconds, it's killed (with its child processes).
+    Returns a :py:class:`CommandResult`; if the command can't be started, the OSError from
+    :py:class:`subprocess.Popen` is raised.
+    """
+    stdout = []
+    stderr = []
+    popen_args = {}
+    if os.name != "nt": popen_args["start_new_session"] = True   # so a timeout can kill the process group
+    proc = subprocess.Popen(cmd, cwd=cwd, env=env, shell=isinstance(cmd, str),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, **popen_args)
+    readers = [threading.Thread(target=_stream_lines, args=(proc.stdout, stdout, on_stdout), daemon=True),
+               threading.Thread(target=_stream_lines, args=(proc.stderr, stderr, on_stderr), daemon=True)]
+    for reader in readers: reader.start()
+
+    timed_out = False
+    try:
+        returncode = proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        timed_out  = True
+        returncode = None
+        _kill_process_tree(proc)
+        proc.wait()
+    for reader in readers: reader.join(timeout=10)
+    return CommandResult(returncode, stdout, stderr, timed_out, False, 1)
+
+class CubeLicensePool(object):
+    """
+    A pool of *seats* Cube licenses.  :py:meth:`seat` blocks until one is free.
+
+    Seats are shared by the threads of a process, and, if *seat_dir* is passed, by the processes using that
+    directory: a seat is held by creating ``seat<n>.lock`` there.  Lock files older than *stale_after*
+    seconds are assumed to have been left by a process that died, and are taken over.
+    """
+    def __init__(self, seats=1, seat_dir=None, stale_after=12*60*60, poll_interval=0.5):
+        self.seats         = max(1, int(seats))
+        self.seatDir       = seat_dir
+        self.staleAfter    = stale_after
+        self.pollInterval  = poll_interval
+        self._semaphore    = threading.BoundedSemaphore(self.seats)
+        if seat_dir: os.makedirs(seat_dir, exist_ok=True)
+
+    def __repr__(self):
+        return "CubeLicensePool(%d seats%s)" % (self.seats, " in " + self.seatDir if self.seatDir else "")
+
+    def _acquire_seat_file(self):
+        """
+        Returns the lock file of a free seat in *seatDir*, waiting for one.
+        """
+        while True:
+            for seat_num in range(self.seats):
+                lock_file = os.path.join(self.seatDir, "seat{}.lock".format(seat_num))
+                try:
+                    if time.time() - os.path.getmtime(lock_file) > self.staleAfter: os.remove(lock_file)
+                except OSError:
+                    pass
+                try:
+                    fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                except FileExistsError:
+                    continue
+                os.write(fd, "{} {}\n".format(os.getpid(), threading.get_ident()).encode())
+                os.close(fd)
+                return lock_file
+            time.sleep(self.pollInterval)
+
+    @contextlib.contextmanager
+    def seat(self):
+        """
+        Context manager that holds a seat while its block runs.
+        """
+        self._semaphore.acquire()
+        lock_file = None
+        try:
+            if self.seatDir: lock_file = self._acquire_seat_file()
+            yield
+        finally:
+            if lock_file:
+                try:
+                    os.remove(lock_file)
+                except OSError:
+                    pass
+            self._semaphore.release()
+
+_license_pool      = None
+_license_pool_lock = threading.Lock()
+
+def get_license_pool():
+    """
+    Returns the process's :py:class:`CubeLicensePool`, configured by WRANGLER_CUBE_SEATS and WRANGLER_CUBE_SEAT_DIR.
+    """
+    global _license_pool
+    with _license_pool_lock:
+        if _license_pool is None:
+            _license_pool = CubeLicensePool(seats=int(os.environ.get("WRANGLER_CUBE_SEATS", "1")),
+                                            seat_dir=os.environ.get("WRANGLER_CUBE_SEAT_DIR"))
+        return _license_pool
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=60.0):
+    """
+    Returns the delay before retry number *attempt* (1-based): exponential in *attempt*, capped at *max_delay*,
+    with jitter so callers that failed together don't retry together.
+    """
+    return min(max_delay, base_delay * (2 ** (attempt-1))) * random.uniform(0.5, 1.0)
+
+def run_cube_job(cmd, cwd=".", env=None, timeout=None, on_line=None, on_retry=None, log=print,
+                 num_retries=5, base_delay=1.0, max_delay=60.0, pool=None):
+    """
+    Runs the Cube job *cmd* (see :py:func:`run_command`) holding a seat of the license pool (by default,
+    :py:func:`get_license_pool`), with output streamed to *on_line* (stdout) and *log* (stderr) as it's produced.
+
+    On a license error, the job is retried up to *num_retries* attempts in all, after a :py:func:`backoff_delay`
+    during which the seat is given up; *on_retry* is called with the attempt number before each retry (e.g. to
+    restore the job's input).  *timeout* defaults to WRANGLER_CUBE_TIMEOUT.
+
+    Voyager sometimes returns an error code after a successful run, so if the last line of output is a
+    ``VOYAGER ReturnCode`` of 0 or 1, that's returned instead.  Returns a :py:class:`CommandResult`.
+    """
+    if pool is None: pool = get_license_pool()
+    if timeout is None and os.environ.get("WRANGLER_CUBE_TIMEOUT"): timeout = float(os.environ["WRANGLER_CUBE_TIMEOUT"])
+
+    for attempt in range(1, num_retries+1):
+        license_error = [False]
+        def stdout_line(line):
+            if line == LICENSE_ERROR: license_error[0] = True
+            if on_line: on_line(line)
+        def stderr_line(line):
+            if log: log("stderr: " + line)
+
+        with pool.seat():
+            result = run_command(cmd, cwd=cwd, env=env, timeout=timeout, on_stdout=stdout_line, on_stderr=stderr_line)
+        returncode = result.returncode
+
+        if license_error[0] and attempt < num_retries:
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            if log: log("Received license error; retrying in {:.1f} seconds (attempt {} of {})".format(delay, attempt+1, num_retries))
+            time.sleep(delay)
+            if on_retry: on_retry(attempt)
+            continue
+
+        if returncode not in [None, 0, 1] and len(result.stdout) > 0 and re.match(CUBE_SUCCESS, result.stdout[-1]):
+            if log: log("Overriding return code {} with 0 due to last stdout line".format(returncode))
+            returncode = 0
+        return CommandResult(returncode, result.stdout, result.stderr, result.timedOut, license_error[0], attempt)
@@ -5,6 +5,10 @@ Created on Mon Nov 22 12:05:51 2010
 @author: Elizabeth
 """
 
-from .CubeNet import export_cubenet_to_csvs, import_cube_nodes_links_from_csvs
+from .CubeNet import export_cubenet_to_csvs, import_cube_nodes_links_from_csvs, import_cube_nodes_links_as_dataframes, \
+                     read_cube_csvs, get_runtpp_command, CubeExport
+from .CubeRunner import run_command, run_cube_job, get_license_pool, CubeLicensePool, CommandResult
 
-__all__ = ['export_cubenet_to_csvs', 'import_cube_nodes_links_from_csvs']
\ No newline at end of file
+__all__ = ['export_cubenet_to_csvs', 'import_cube_nodes_links_from_csvs', 'import_cube_nodes_links_as_dataframes',
+           'read_cube_csvs', 'get_runtpp_command', 'CubeExport',
+           'run_command', 'run_cube_job', 'get_license_pool', 'CubeLicensePool', 'CommandResult']
\ No newline at end of file
@@ -445,6 +445,47 @@ def dbfTableReader(fileName):
         raise
     return dt
 
+def dbfColumnReader(fileName, fieldNames=None):
+    """Read the given fields (all of them by default) of a dbf table in bulk and
+    return a dictionary of field name -> numpy array, with a row for every record
+    (deleted or not, so rows can be joined to other files by record number).
+    Numeric fields become int64 (or float64 if they have decimals), with blank
+    and overflowed (all *) values read as 0; character fields are right-stripped bytes."""
+    binaryStream = open(fileName, "rb")
+    try:
+        numrec, lenheader, lenrecord = unpack('<xxxxLHH20x', binaryStream.read(32))
+        numfields = (lenheader - 33) // 32
+        header = [list(unpack('<11sc4xBB14x', binaryStream.read(32))) for i in xrange(numfields)]
+        for fieldInfo in header:
+            fieldInfo[0] = fieldInfo[0].replace(b'\0', b'').decode()
+        binaryStream.seek(lenheader)
+        data = binaryStream.read(numrec * lenrecord)
+    finally:
+        binaryStream.close()
+
+    names   = ["DeletionFlag"] + [fieldInfo[0] for fieldInfo in header]
+    formats = ["S1"] + ["S%d" % fieldInfo[2] for fieldInfo in header]
+    records = np.frombuffer(data, dtype=np.dtype({"names":names, "formats":formats}), count=numrec)
+
+    columns = {}
+    for name, typ, size, deci in header:
+        if fieldNames and name not in fieldNames: continue
+        values = records[name]
+        if typ == b"N" or typ == b"F":
+            values  = np.char.strip(np.char.replace(values, b'\0', b''))
+            unknown = (values == b'') | (values == b'*'*size)
+            values  = np.where(unknown, b'0', values)
+            columns[name] = values.astype(np.float64) if deci else values.astype(np.float64).astype(np.int64)
+        elif typ == b"C":
+            columns[name] = np.char.rstrip(values)
+        else:
+            columns[name] = values
+    if fieldNames:
+        missing = [name for name in fieldNames if name not in columns]
+        if missing:
+            raise DataTableKeyError("Fields %s do not exist in %s" % (str(missing), fileName))
+    return columns
+
 class DbfDictWriter(object):
     """Writes a datatable to the disk
     Not individual records"""
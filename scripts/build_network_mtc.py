@@ -1,4 +1,4 @@
-import argparse,collections,copy,datetime,os,pathlib,socket,shutil,sys,tempfile,time
+import argparse,collections,copy,datetime,os,pathlib,socket,shutil,sys,time
 import Wrangler
 
 # Based on NetworkWrangler\scripts\build_network.py
@@ -469,6 +469,10 @@ if __name__ == '__main__':
     parser.add_argument("--skip_precheck_requirements", help="Don't precheck network requirements, stale projects, non-HEAD projects, etc", action="store_true", default=True)
     parser.add_argument("--create_all_project_diffs", help="Pass this to create project diffs information for EVERY project. NOTE: THIS WILL BE SLOW", action="store_true")
     parser.add_argument("--create_project_diffs",     help="Pass project name(s) to create project diffs information for that project", type=str, nargs='+')
+    parser.add_argument("--check_connectivity", help="After each roadway project, check for new roadway islands and transit lines running across gaps", action="store_true")
+    parser.add_argument("--batch_hwy_projects", help="Run consecutive roadway apply.s projects as a single Cube job", action="store_true")
+    parser.add_argument("--hwy_network_in_place", help="Run roadway apply.s projects on the network where it is rather than moving it into each project directory", action="store_true")
+    parser.add_argument("--tolls_in_memory", help="Only write tolls.csv with the network, rather than before each roadway apply.s project", action="store_true")
     parser.add_argument("project_name", help="required project name, for example NGF")
     parser.add_argument("--scenario", help="optional SCENARIO name")
     parser.add_argument("net_spec", metavar="network_specification.py", help="Script which defines required variables indicating how to build the network")
@@ -590,6 +594,9 @@ if __name__ == '__main__':
                                        isTiered=True if PIVOT_DIR else False,
                                        networkName=TRN_NET_NAME)
     }
+    if args.batch_hwy_projects: networks['hwy'].batchApplyScripts = True
+    if args.hwy_network_in_place: networks['hwy'].networkInPlace = True
+    if args.tolls_in_memory: networks['hwy'].syncTollsFile = False
 
     # For projects applied in a pivot network (because they won't show up in the current project list)
     if APPLIED_PROJECTS != None:
@@ -655,16 +662,21 @@ if __name__ == '__main__':
                     if netmode == "trn":
                         network_without_project = copy.deepcopy(networks[netmode])
                     elif netmode == 'hwy':
-                        # the network state is not in the object, but in the files in scratch. write these to tempdir
-                        network_without_project = pathlib.Path(tempfile.mkdtemp())
-                        Wrangler.WranglerLogger.debug(f"Saving previous network into tempdir {network_without_project}")
-                        networks[netmode].writeShapefile(network_without_project, suffix="_prev",
-                                                         additional_roadway_attrs=ADDITONAL_ROADWAY_ATTRS)
+                        # the network state is not in the object, but in the files in scratch.  snapshot it; if it hasn't
+                        # changed since the last project's diff, that snapshot is reused
+                        network_without_project = networks[netmode].getSnapshot(additional_roadway_attrs=ADDITONAL_ROADWAY_ATTRS)
+                        Wrangler.WranglerLogger.debug(f"Saved previous network as {network_without_project}")
 
                 # apply project
                 applied_SHA1 = networks[netmode].applyProject(parentdir, networkdir, gitdir, projectsubdir, **kwargs)
                 appliedcount += 1
 
+                if args.check_connectivity and netmode == 'hwy':
+                    connectivity = networks['hwy'].checkConnectivity(transitNetwork=networks['trn'])
+                    if len(connectivity.newIslands) > 0 or len(connectivity.badTransitLinks) > 0:
+                        Wrangler.WranglerLogger.warning("Project {} left {} new roadway islands and {} transit links off the network".format(
+                            project_name, len(connectivity.newIslands), len(connectivity.badTransitLinks)))
+
                 # Create difference report for this project_name
                 if (args.create_all_project_diffs and (project not in SKIP_PROJ_DIFFS)) or (project_name in args.create_project_diffs):
                     # difference information to be store in network_dir netmode_projectname
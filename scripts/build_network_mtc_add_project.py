@@ -1,4 +1,4 @@
-import argparse,collections,copy,datetime,os,pathlib,re,shutil,sys,tempfile,time
+import argparse,collections,copy,datetime,os,pathlib,re,shutil,sys,time
 import Wrangler
 
 import build_network_mtc
@@ -241,11 +241,10 @@ if __name__ == '__main__':
                       if netmode == "trn":
                         network_without_project = copy.deepcopy(networks[netmode])
                       elif netmode == 'hwy':
-                        # the network state is not in the object, but in the files in scratch. write these to tempdir
-                        network_without_project = pathlib.Path(tempfile.mkdtemp())
-                        Wrangler.WranglerLogger.debug(f"Saving previous network into tempdir {network_without_project}")
-                        networks[netmode].writeShapefile(network_without_project, suffix="_prev",
-                                                         additional_roadway_attrs=ADDITONAL_ROADWAY_ATTRS)
+                        # the network state is not in the object, but in the files in scratch.  snapshot it; if it hasn't
+                        # changed since the last project's diff, that snapshot is reused
+                        network_without_project = networks[netmode].getSnapshot(additional_roadway_attrs=ADDITONAL_ROADWAY_ATTRS)
+                        Wrangler.WranglerLogger.debug(f"Saved previous network as {network_without_project}")
                         
                     cloned_SHA1 = networks[netmode].cloneProject(networkdir=my_project, tag=args.tag,
                                                                  projtype="project", tempdir=TEMP_SUBDIR, **kwargs)
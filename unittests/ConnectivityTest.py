@@ -0,0 +1,30 @@
+import os, sys, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import Wrangler
+from Wrangler.Connectivity import findComponents
+
+class TestConnectivity(unittest.TestCase):
+
+    def test_union_find(self):
+        union_find = Wrangler.UnionFind()
+        union_find.union(1, 2)
+        union_find.union(3, 4)
+        self.assertNotEqual(union_find.find(1), union_find.find(3))
+        union_find.union(2, 4)
+        self.assertEqual(union_find.find(1), union_find.find(3))
+        union_find.add(5)
+        self.assertEqual(len(union_find), 5)
+        self.assertEqual(union_find.components(), [[1,2,3,4],[5]])
+
+    def test_findComponents(self):
+        # a one-way link still connects its nodes
+        links = [(1,2),(2,3),(3,1),(10,11),(4,3)]
+        self.assertEqual(findComponents(links), [[1,2,3,4],[10,11]])
+        self.assertEqual(findComponents(links, nodes=[20]), [[1,2,3,4],[10,11],[20]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import json, os, shutil, sys, tempfile, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import Wrangler
+import Cube
+from Cube import CubeNet
+
+# Stand-in for runtpp running exportHwyFromPy.s: the "network" is a json file of
+# {"nodes": {N: {"X":x, "Y":y, var:value}}, "links": {"A-B": {"DISTANCE":d, var:value}}}
+# and each call is recorded in the file named by FAKE_RUNTPP_LOG
+FAKE_RUNTPP = r'''
+import json, os
+net = json.load(open(os.environ["CUBENET"]))
+link_vars = [var for var in os.environ["XTRALINKVAR"].split(",") if var.strip()]
+node_vars = [var for var in os.environ["XTRANODEVAR"].split(",") if var.strip()]
+with open(os.environ["CUBELINK_CSV"], "w") as f:
+    for (ab, attrs) in net["links"].items():
+        f.write(",".join(ab.split("-") + [str(attrs["DISTANCE"])] + [str(attrs[var]) for var in link_vars]) + "\n")
+with open(os.environ["CUBENODE_CSV"], "w") as f:
+    for (n, attrs) in net["nodes"].items():
+        f.write(",".join([n, str(attrs["X"]), str(attrs["Y"])] + [str(attrs[var]) for var in node_vars]) + "\n")
+with open(os.environ["FAKE_RUNTPP_LOG"], "a") as f:
+    f.write(os.environ["XTRALINKVAR"] + "\n")
+print(" VOYAGER  ReturnCode = 0  ")
+'''
+
+class TestCubeNetExportCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        fake_runtpp  = os.path.join(self.tempdir, "fake_runtpp.py")
+        with open(fake_runtpp, "w") as f:
+            f.write(FAKE_RUNTPP)
+        self.log     = os.path.join(self.tempdir, "runtpp.log")
+        self.old_env = dict(os.environ)
+        os.environ["WRANGLER_RUNTPP"] = '"{}" "{}"'.format(sys.executable, fake_runtpp)
+        os.environ["FAKE_RUNTPP_LOG"] = self.log
+
+        self.net = os.path.join(self.tempdir, "FREEFLOW.BLD")
+        with open(self.net, "w") as f:
+            json.dump({"nodes":{"1":{"X":0,"Y":0}, "2":{"X":1,"Y":0}},
+                       "links":{"1-2":{"DISTANCE":1.5, "LANES":2, "FT":3, "BRT":0}}}, f)
+        CubeNet.EXPORT_CACHE.clear()
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.old_env)
+        CubeNet.EXPORT_CACHE.clear()
+        shutil.rmtree(self.tempdir)
+
+    def importNet(self, net, link_vars):
+        return Cube.import_cube_nodes_links_from_csvs(net, extra_link_vars=link_vars,
+                                                      links_csv=os.path.join(self.tempdir, "links.csv"),
+                                                      nodes_csv=os.path.join(self.tempdir, "nodes.csv"))
+
+    def numExports(self):
+        return len(open(self.log).readlines())
+
+    def test_export_cache(self):
+        (nodes_dict, links_dict) = self.importNet(self.net, ["LANES","BRT"])
+        self.assertEqual(links_dict, {(1,2):[1.5, "2", "0"]})
+        self.assertEqual(nodes_dict[2], [1.0, 0.0])
+        self.assertEqual(self.numExports(), 1)
+
+        # a subset of the variables, from a copy of the network: no export
+        net_copy = os.path.join(self.tempdir, "freeflow.net")
+        shutil.copyfile(self.net, net_copy)
+        (nodes_dict, links_dict) = self.importNet(net_copy, ["brt"])
+        self.assertEqual(links_dict, {(1,2):[1.5, "0"]})
+        self.assertEqual(self.numExports(), 1)
+
+        # a new variable exports the superset
+        (nodes_dict, links_dict) = self.importNet(self.net, ["FT","LANES"])
+        self.assertEqual(links_dict, {(1,2):[1.5, "3", "2"]})
+        self.assertEqual(open(self.log).readlines()[-1].strip(), ",LANES,BRT,FT")
+        (nodes_dict, links_dict) = self.importNet(self.net, ["BRT","FT"])
+        self.assertEqual(self.numExports(), 2)
+
+        # a changed network is exported again
+        with open(self.net, "w") as f:
+            json.dump({"nodes":{"1":{"X":0,"Y":0}}, "links":{}}, f)
+        (nodes_dict, links_dict) = self.importNet(self.net, ["LANES"])
+        self.assertEqual(links_dict, {})
+        self.assertEqual(self.numExports(), 3)
+
+    def test_typed_loader(self):
+        with open(self.net, "w") as f:
+            json.dump({"nodes":{"1":{"X":0,"Y":0}, "2":{"X":1.5,"Y":2}},
+                       "links":{"1-2":{"DISTANCE":1.5, "LANES":2, "STREETNAME":"'Main St'"},
+                                "2-1":{"DISTANCE":1.5, "LANES":3, "STREETNAME":"'Main St'"}}}, f)
+        (nodes_df, links_df) = Cube.import_cube_nodes_links_as_dataframes(self.net,
+                                    extra_link_vars=["LANES","STREETNAME"],
+                                    links_csv=os.path.join(self.tempdir, "links.csv"),
+                                    nodes_csv=os.path.join(self.tempdir, "nodes.csv"))
+        self.assertEqual(list(links_df.index.names), ["A","B"])
+        self.assertEqual(str(links_df.index.get_level_values("A").dtype), "int32")
+        self.assertEqual(str(links_df["LANES"].dtype), "int8")
+        self.assertEqual(str(links_df["DISTANCE"].dtype), "float64")
+        self.assertEqual(links_df.loc[(2,1), "LANES"], 3)
+        self.assertEqual(links_df.loc[(1,2), "STREETNAME"], "Main St")
+        self.assertEqual(nodes_df.loc[2, "Y"], 2.0)
+
+        # the dict loader shares the export
+        (nodes_dict, links_dict) = self.importNet(self.net, ["LANES"])
+        self.assertEqual(links_dict[(1,2)], [1.5, "2"])
+        self.assertEqual(self.numExports(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
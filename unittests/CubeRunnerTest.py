@@ -0,0 +1,108 @@
+import os, shutil, sys, tempfile, threading, time, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import Wrangler
+import Cube
+from Cube import CubeLicensePool, CubeRunner
+
+# Stand-in for a Cube job: prints a licensing error for the first FAIL_LICENSE runs (counted in COUNT_FILE),
+# otherwise prints its lines, sleeping SLEEP seconds, and exits with EXIT_CODE
+FAKE_JOB = r'''
+import os, sys, time
+count_file = os.environ["COUNT_FILE"]
+count = int(open(count_file).read()) if os.path.exists(count_file) else 0
+open(count_file, "w").write(str(count+1))
+if count < int(os.environ.get("FAIL_LICENSE", "0")):
+    print("RUNTPP: Licensing error")
+    sys.exit(2)
+print("first", flush=True)
+time.sleep(float(os.environ.get("SLEEP", "0")))
+sys.stdout.write("progress 50%\rprogress 100%\r")
+print("second", flush=True)
+sys.stderr.write("warning\n")
+print(" VOYAGER  ReturnCode = 0  ")
+sys.exit(int(os.environ.get("EXIT_CODE", "0")))
+'''
+
+class TestCubeRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir  = tempfile.mkdtemp()
+        self.fake_job = os.path.join(self.tempdir, "fake_job.py")
+        with open(self.fake_job, "w") as f:
+            f.write(FAKE_JOB)
+        self.pool     = CubeLicensePool(seats=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def env(self, **values):
+        env = dict(os.environ)
+        env["COUNT_FILE"] = os.path.join(self.tempdir, "count{}".format(threading.get_ident()))
+        env.update(values)
+        return env
+
+    def test_streaming(self):
+        lines  = []
+        result = Cube.run_command([sys.executable, self.fake_job], cwd=self.tempdir, env=self.env(),
+                                  on_stdout=lines.append)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(lines, ["first", "progress 50%", "progress 100%", "second", " VOYAGER  ReturnCode = 0  "])
+        self.assertEqual(result.stderr, ["warning"])
+
+    def test_timeout(self):
+        lines  = []
+        start  = time.time()
+        result = Cube.run_command([sys.executable, self.fake_job], cwd=self.tempdir, env=self.env(SLEEP="30"),
+                                  timeout=1, on_stdout=lines.append)
+        self.assertTrue(result.timedOut)
+        self.assertEqual(result.returncode, None)
+        self.assertEqual(lines, ["first"])
+        self.assertTrue(time.time() - start < 20)
+
+    def test_license_retry(self):
+        retries = []
+        result  = Cube.run_cube_job([sys.executable, self.fake_job], cwd=self.tempdir, env=self.env(FAIL_LICENSE="2"),
+                                    on_retry=retries.append, log=None, base_delay=0.01, pool=self.pool)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.attempts, 3)
+        self.assertEqual(retries, [1, 2])
+        self.assertFalse(result.licenseError)
+
+        result  = Cube.run_cube_job([sys.executable, self.fake_job], cwd=self.tempdir, env=self.env(FAIL_LICENSE="9"),
+                                    log=None, num_retries=2, base_delay=0.01, pool=self.pool)
+        self.assertTrue(result.licenseError)
+
+        # Voyager's success line overrides a bad return code
+        result  = Cube.run_cube_job([sys.executable, self.fake_job], cwd=self.tempdir, env=self.env(EXIT_CODE="3"),
+                                    log=None, pool=self.pool)
+        self.assertEqual(result.returncode, 0)
+
+    def test_backoff(self):
+        for attempt in range(1, 10):
+            delay = CubeRunner.backoff_delay(attempt, base_delay=1.0, max_delay=20.0)
+            self.assertTrue(0.5 * min(20.0, 2 ** (attempt-1)) <= delay <= min(20.0, 2 ** (attempt-1)))
+
+    def test_pool(self):
+        for pool in [CubeLicensePool(seats=2), CubeLicensePool(seats=2, seat_dir=os.path.join(self.tempdir, "seats"), poll_interval=0.01)]:
+            running = [0]
+            most    = [0]
+            lock    = threading.Lock()
+            def job():
+                with pool.seat():
+                    with lock:
+                        running[0] += 1
+                        most[0] = max(most[0], running[0])
+                    time.sleep(0.05)
+                    with lock: running[0] -= 1
+            threads = [threading.Thread(target=job) for _ in range(6)]
+            for thread in threads: thread.start()
+            for thread in threads: thread.join()
+            self.assertEqual(most[0], 2)
+            if pool.seatDir: self.assertEqual(os.listdir(pool.seatDir), [])
+
+if __name__ == '__main__':
+    unittest.main()
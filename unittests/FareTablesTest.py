@@ -0,0 +1,127 @@
+import io, os, sys, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import Wrangler
+from Wrangler.FareTables import StopToStopFareTable, TransferFareMatrix
+
+FERRY_LINES = [
+    "; Ferry fares\n",
+    "\n",
+    "  12001  12002   450 ; Oakland to SF\n",
+    "12003 12001 300\n",
+    "  12004  12005   700 ; Vallejo\n",
+]
+
+XFARE_LINES = [
+    "; transfer fares\n",
+    "XFARE[1]=0,50, 100,-1 ; local bus\n",
+    "XFARE[2]=25,0,25\n",
+    "XFARE[3]=10,10,10,10\n",
+]
+
+class TestStopToStopFareTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = StopToStopFareTable("Ferry.far", FERRY_LINES)
+
+    def test_roundtrip(self):
+        self.assertEqual(len(self.table), 5)
+        self.assertEqual(list(self.table), FERRY_LINES)
+        outfile = io.StringIO()
+        self.table.write(outfile)
+        self.assertEqual(outfile.getvalue(), "".join(FERRY_LINES))
+
+    def test_get_set(self):
+        self.assertEqual(self.table.getFare(12001, 12002), 450)
+        self.assertEqual(self.table.getFare(12002, 12001), 450)
+        self.assertEqual(self.table.getFare(12001, 12003), 300)
+        self.assertRaises(Wrangler.NetworkException, self.table.getFare, 12001, 12005)
+
+        undo_args = self.table.setFare(12002, 12001, 500)
+        self.assertEqual(self.table[2], "  12001  12002   500 ; Oakland to SF\n")
+        self.table.restoreEntry(*undo_args)
+        self.assertEqual(self.table[2], FERRY_LINES[2])
+
+    def test_later_entries_override(self):
+        undo_args = self.table.extend(["; project\n", "12001 12002 475\n"])
+        self.assertEqual(len(self.table), 6)
+        self.assertEqual(self.table.getFare(12001, 12002), 475)
+        self.assertEqual(list(self.table), FERRY_LINES[:2] + FERRY_LINES[3:] + ["; project\n", "12001 12002 475\n"])
+
+        self.assertEqual(self.table[2], FERRY_LINES[3])
+        self.assertEqual(self.table[-1], "12001 12002 475\n")
+        self.assertEqual(self.table[1:3], FERRY_LINES[1:2] + FERRY_LINES[3:4])
+
+        self.table.undoExtend(*undo_args)
+        self.assertEqual(list(self.table), FERRY_LINES)
+        self.assertEqual(self.table[2], FERRY_LINES[2])
+        self.assertEqual(self.table.getFare(12001, 12002), 450)
+
+    def test_both_directions(self):
+        # a later record overrides an earlier one in the other direction
+        self.table.extend(["12001 12003 350\n", "12005 12004 750\n"])
+        self.assertEqual(self.table.findKey(12003, 12001), (12001, 12003))
+        self.assertEqual(self.table.getFare(12003, 12001), 350)
+        self.assertEqual(self.table.getFare(12004, 12005), 750)
+        self.assertEqual(list(self.table), FERRY_LINES[:3] + ["12001 12003 350\n", "12005 12004 750\n"])
+        self.assertEqual(self.table.records(), [((12001, 12002), 450), ((12001, 12003), 350), ((12005, 12004), 750)])
+
+    def test_commentOut(self):
+        self.table.commentOut((12004, 12005), prefix="; node not in use: ")
+        self.assertEqual(self.table[4], "; node not in use:   12004  12005   700 ; Vallejo\n")
+        self.assertRaises(Wrangler.NetworkException, self.table.getFare, 12004, 12005)
+        self.assertEqual(self.table.unparsedLines(), [])
+
+class TestTransferFareMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.xfare = TransferFareMatrix("xfare.far", XFARE_LINES)
+
+    def test_roundtrip(self):
+        self.assertEqual(len(self.xfare), 4)
+        self.assertEqual(self.xfare.modes(), [1,2,3])
+        outfile = io.StringIO()
+        self.xfare.write(outfile)
+        self.assertEqual(outfile.getvalue(), "".join(XFARE_LINES))
+
+    def test_get_set(self):
+        self.assertEqual(self.xfare.getFare(1, 3), 100)
+        self.assertEqual(self.xfare.getFare(1, 4), -1)
+        self.assertRaises(Wrangler.NetworkException, self.xfare.getFare, 2, 4)
+        self.assertRaises(Wrangler.NetworkException, self.xfare.getFare, 4, 1)
+
+        row_states = self.xfare.setFare(1, 2, 75)
+        self.assertEqual(self.xfare[1], "XFARE[1]=0,75,100,-1 ; local bus\n")
+        self.xfare.restoreRows(row_states)
+        self.assertEqual(list(self.xfare), XFARE_LINES)
+
+    def test_column_and_block(self):
+        # mode 4 only exists in rows 1 and 3
+        (num_changed, row_states) = self.xfare.setColumn(4, 0)
+        self.assertEqual(num_changed, 2)
+        self.assertEqual(self.xfare[2], XFARE_LINES[2])
+        self.assertEqual(self.xfare[3], "XFARE[3]=10,10,10,0\n")
+
+        (num_changed, block_states) = self.xfare.setBlock([2,3], [1,2], 5)
+        self.assertEqual(num_changed, 4)
+        self.assertEqual(self.xfare[2], "XFARE[2]=5,5,25\n")
+        self.assertRaises(Wrangler.NetworkException, self.xfare.setRow, 7, 0)
+
+        self.xfare.restoreRows(block_states)
+        self.xfare.restoreRows(row_states)
+        self.assertEqual(list(self.xfare), XFARE_LINES)
+
+    def test_later_rows_override(self):
+        undo_args = self.xfare.extend(["XFARE[2]=1,2,3,4,5\n", "XFARE[5]=9\n"])
+        self.assertEqual(len(self.xfare), 5)
+        self.assertEqual(self.xfare.getFare(2, 5), 5)
+        self.assertEqual(self.xfare.getFare(5, 1), 9)
+        self.xfare.undoExtend(*undo_args)
+        self.assertEqual(list(self.xfare), XFARE_LINES)
+        self.assertRaises(Wrangler.NetworkException, self.xfare.getFare, 5, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os, sys, tempfile, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import Wrangler
+
+class TestFaresystem(unittest.TestCase):
+
+    def makeFaresystem(self, number, farematrix):
+        fs = Wrangler.Faresystem()
+        fs["NUMBER"]     = str(number)
+        fs["FAREMATRIX"] = farematrix
+        return fs
+
+    def test_read_write_fare_zone_matrix(self):
+        faresystems = {1:self.makeFaresystem(1, "FMI.1.101"),
+                       2:self.makeFaresystem(2, "FMI.1.102"),
+                       3:self.makeFaresystem(3, "FMI.1.101")}
+        (fd, matfile) = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(fd, "w") as f:
+            f.write("101 1 1 1.5 2.0 2.5\n")
+            f.write("102 2 1 3.25\n")
+            f.write("101 2 2 1.75,4\n")
+            f.write("101 1 2 2.25\n")  # overrides the earlier 1->2 fare
+        try:
+            Wrangler.Faresystem.readFareZoneMatrixFile(matfile, faresystems)
+        finally:
+            os.remove(matfile)
+
+        self.assertEqual(faresystems[1].getFarezoneODPair(1, 3), 2.5)
+        self.assertEqual(faresystems[1].getFarezoneODPair(1, 2), 2.25)
+        self.assertEqual(faresystems[1].getFarezoneODPair(2, 3), 4.0)
+        self.assertIsNone(faresystems[1].getFarezoneODPair(2, 1))
+        self.assertEqual(faresystems[2].getFarezoneODPair(2, 1), 3.25)
+
+        # faresystems sharing a matrix don't share the array
+        faresystems[3].setFarezoneODPair(1, 1, 9.0)
+        self.assertEqual(faresystems[1].getFarezoneODPair(1, 1), 1.5)
+
+        self.assertEqual(faresystems[1].getFareZoneMatrixLines(),
+                         "1 1 1 1.5000\n1 1 2 2.2500\n1 1 3 2.5000\n1 2 2 1.7500\n1 2 3 4.0000\n")
+        self.assertEqual(Wrangler.Faresystem().getFareZoneMatrixLines(), "")
+
+    def test_set_fare_zone_pairs(self):
+        fs = self.makeFaresystem(1, "FMI.1.101")
+        # duplicate pairs: the last one wins
+        fs.setFarezoneODPairs([1, 2] + [1]*20 + [3], [2, 2] + [2]*20 + [1], [1.0, 2.0] + list(range(20)) + [3.0])
+        self.assertEqual(fs.getFarezoneODPair(1, 2), 19.0)
+        self.assertEqual(fs.getFarezoneODPair(2, 2), 2.0)
+        self.assertEqual(fs.getFarezoneODPair(3, 1), 3.0)
+        fs.setFarezoneODPairs([2, 2], [2, 2], 5.0)
+        self.assertEqual(fs.getFarezoneODPair(2, 2), 5.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os, sys, unittest
+import numpy
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import Wrangler
+from Wrangler import NodeCoordinates, NetworkException
+from Wrangler.Geometry import pathsFromXY, vectorFilenames
+
+try:
+    import shapely
+except ImportError:
+    shapely = None
+
+class TestGeometry(unittest.TestCase):
+
+    def setUp(self):
+        self.nodes_dict = {3:[30.0, 3.0], 1:[10.0, 1.0], 2:[20.0, 2.0]}
+
+    def test_node_coordinates(self):
+        node_coords = NodeCoordinates(self.nodes_dict)
+        self.assertEqual(len(node_coords), 3)
+        self.assertEqual(node_coords.lookup([2, -3, 1]).tolist(), [[20.0, 2.0], [30.0, 3.0], [10.0, 1.0]])
+        self.assertRaises(NetworkException, node_coords.lookup, [1, 4])
+
+    def test_vector_filenames(self):
+        self.assertEqual(vectorFilenames("out", "trn_lines", "fgb"), [os.path.join("out", "trn_lines.fgb")])
+        self.assertEqual(len(vectorFilenames("out", "trn_lines")), 5)
+        self.assertRaises(NetworkException, vectorFilenames, "out", "trn_lines", "gpkg")
+
+    def test_line_geo_records(self):
+        tn = Wrangler.TransitNetwork(Wrangler.Network.MODEL_TYPE_TM1, 1.0)
+        tn.mergeDir(os.path.dirname(os.path.realpath(__file__)))
+        line = tn.line("TEST_A")
+        (nodes, links, lines) = line.getGeoRecords(line_name_suffix="_prev")
+        self.assertEqual(len(nodes), len(line.n))
+        self.assertEqual(len(links), len(line.n)-1)
+        self.assertEqual(links[0][1:3], [nodes[0][1], nodes[1][1]])
+        self.assertEqual(lines[0]['NAME'], line.name + "_prev")
+        self.assertEqual(lines[0]['NODES'], [node[1] for node in nodes])
+
+    @unittest.skipIf(shapely is None, "requires shapely")
+    def test_paths(self):
+        xy    = NodeCoordinates(self.nodes_dict).lookup([1, 2, 3, 3, 1])
+        paths = pathsFromXY(xy, [7, 7, 7, 5, 5])
+        self.assertEqual([list(path.coords) for path in paths],
+                         [[(10.0, 1.0), (20.0, 2.0), (30.0, 3.0)], [(30.0, 3.0), (10.0, 1.0)]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import os, shutil, subprocess, sys, tempfile, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import Wrangler
+from Wrangler import HighwayNetwork, NetworkException
+
+# Stand-in for runtpp: the "network" is a text file, and the script language is
+#   *echo text / *copy /y src dst
+#   RUN PGM=... ENDRUN blocks with FILEI NETI=file, FILEO NETO=file, FILEI LINKI[n]=file (appended to the
+#   network), %VAR% environment tokens, APPEND text (appended to the network) and ABORT
+# Each call is recorded in the file named by FAKE_RUNTPP_LOG
+FAKE_RUNTPP = r'''
+import os, re, shutil, sys
+with open(os.environ["FAKE_RUNTPP_LOG"], "a") as f: f.write(sys.argv[1] + "\n")
+def filename(value): return value.strip().strip('"')
+neti = neto = None
+net  = []
+for line in open(sys.argv[1]):
+    line = line.split(";")[0].strip()
+    line = re.sub(r"%(\w+)%", lambda match: os.environ.get(match.group(1), match.group(0)), line)
+    if line.startswith("*echo "):
+        print(line[6:])
+    elif line.startswith("*copy /y "):
+        (src, dst) = line[9:].split()
+        shutil.copyfile(filename(src), filename(dst))
+    elif line.startswith("RUN PGM="):
+        net = []
+    elif re.match(r"FILEI NETI=", line):
+        net = open(filename(line.split("=",1)[1])).read().splitlines()
+    elif re.match(r"FILEI LINKI\[\d+\]=", line):
+        net.extend(open(filename(line.split("=",1)[1].split(",")[0])).read().splitlines())
+    elif re.match(r"FILEO NETO=", line):
+        neto = filename(line.split("=",1)[1])
+    elif line.startswith("APPEND "):
+        net.append(line[7:])
+    elif line == "ABORT":
+        print(" VOYAGER  ReturnCode = 2  ")
+        sys.exit(2)
+    elif line == "ENDRUN":
+        open(neto, "w").write("\n".join(net) + "\n")
+print(" VOYAGER  ReturnCode = 0  ")
+'''
+
+APPLY_S = """RUN PGM=NETWORK
+  FILEI NETI=FREEFLOW.BLD
+  FILEO NETO=FREEFLOW.BLDOUT
+  {}
+ENDRUN
+*copy /y FREEFLOW.BLDOUT FREEFLOW.BLD
+"""
+
+class TestHighwayNetworkBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.old_cwd = os.getcwd()
+        self.old_env = dict(os.environ)
+        fake_runtpp  = os.path.join(self.tempdir, "fake_runtpp.py")
+        with open(fake_runtpp, "w") as f:
+            f.write(FAKE_RUNTPP)
+        self.log     = os.path.join(self.tempdir, "runtpp.log")
+        os.environ["WRANGLER_RUNTPP"] = '"{}" "{}"'.format(sys.executable, fake_runtpp)
+        os.environ["FAKE_RUNTPP_LOG"] = self.log
+        for (var, value) in [("NAME","test"), ("EMAIL","test@example.com")]:
+            os.environ["GIT_AUTHOR_" + var] = os.environ["GIT_COMMITTER_" + var] = value
+
+        base = os.path.join(self.tempdir, "base")
+        os.makedirs(base)
+        with open(os.path.join(base, "FREEFLOW.net"), "w") as f: f.write("base\n")
+
+        self.projects = os.path.join(self.tempdir, "projects")
+        os.makedirs(os.path.join(self.tempdir, "work"))
+        os.chdir(os.path.join(self.tempdir, "work"))
+        self.hwy = HighwayNetwork(Wrangler.Network.MODEL_TYPE_TM1, 1.0, basenetworkpath=base, isTiered=True)
+        self.hwy.batchApplyScripts = True
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        os.environ.clear()
+        os.environ.update(self.old_env)
+        shutil.rmtree(self.tempdir)
+
+    def makeProject(self, name, statements, files={}, shell_commands=[], **kwargs):
+        project_dir = os.path.join(self.projects, name)
+        os.makedirs(project_dir)
+        with open(os.path.join(project_dir, "apply.s"), "w") as f:
+            f.write(APPLY_S.format("\n  ".join(statements)) + "".join([command + "\n" for command in shell_commands]))
+        for (filename, contents) in files.items():
+            with open(os.path.join(project_dir, filename), "w") as f: f.write(contents)
+        subprocess.check_call("git init -q && git add -A && git commit -q -m init", cwd=project_dir, shell=True)
+        self.hwy.applyProject(self.projects, name, project_dir, **kwargs)
+
+    def numRuns(self):
+        return len(open(self.log).readlines()) if os.path.exists(self.log) else 0
+
+    def network(self):
+        return open("FREEFLOW.BLD").read().splitlines()
+
+    def test_batch_order(self):
+        self.makeProject("ProjA", ["APPEND A"])
+        self.makeProject("ProjB", ["FILEI LINKI[2]=extra.csv", "APPEND %MODELYEAR%"], files={"extra.csv":"B extra\n"},
+                         MODELYEAR="2035")
+        self.makeProject("ProjC", ["APPEND C"])
+        self.assertEqual(self.numRuns(), 0)
+        self.assertEqual(self.network(), ["base"])
+
+        self.hwy.flushNetwork()
+        self.assertEqual(self.numRuns(), 1)
+        self.assertEqual(self.network(), ["base", "A", "B extra", "2035", "C"])
+
+        # a project with other shell commands runs on its own, after the queue
+        self.makeProject("ProjD", ["APPEND D"])
+        self.makeProject("ProjE", ["APPEND E"], shell_commands=["*echo not batchable"])
+        self.assertEqual(self.numRuns(), 3)
+        self.assertEqual(self.network(), ["base", "A", "B extra", "2035", "C", "D", "E"])
+
+    def test_batch_failure(self):
+        self.makeProject("ProjA", ["APPEND A"])
+        self.makeProject("ProjB", ["ABORT"])
+        self.makeProject("ProjC", ["APPEND C"])
+        with self.assertRaises(NetworkException) as context:
+            self.hwy.flushNetwork()
+        self.assertTrue("ProjB" in str(context.exception))
+        self.assertEqual(self.numRuns(), 1)
+
+    def test_in_place(self):
+        self.hwy.batchApplyScripts = False
+        self.hwy.networkInPlace    = True
+        self.makeProject("ProjA", ["APPEND A"])
+        self.makeProject("ProjB", ["FILEI LINKI[2]=extra.csv"], files={"extra.csv":"B extra\n"})
+        self.assertEqual(self.numRuns(), 2)
+        self.assertEqual(self.network(), ["base", "A", "B extra"])
+        for name in ["ProjA", "ProjB"]:
+            self.assertEqual([f for f in os.listdir(os.path.join(self.projects, name)) if f.upper().startswith("FREEFLOW")], [])
+        self.assertFalse(os.path.exists("FREEFLOW.BLDOUT"))
+
+        # scripts using other network files are run the usual way
+        self.makeProject("ProjC", ["APPEND C"], shell_commands=["*copy /y FREEFLOW.BLD FREEFLOW_prev.BLD"])
+        self.assertEqual(self.network(), ["base", "A", "B extra", "C"])
+        self.assertTrue(os.path.exists(os.path.join(self.projects, "ProjC", "FREEFLOW_prev.BLD")))
+
+    def test_in_place_failure(self):
+        self.hwy.batchApplyScripts = False
+        self.hwy.networkInPlace    = True
+        self.makeProject("ProjA", ["APPEND A"])
+        with self.assertRaises(NetworkException):
+            self.makeProject("ProjB", ["APPEND B", "ABORT"])
+        self.assertEqual(self.network(), ["base", "A"])
+        # the rewritten script isn't left in the project
+        self.assertEqual(sorted(os.listdir(os.path.join(self.projects, "ProjB"))), [".git", "apply.s"])
+
+    def test_roadway_table(self):
+        import pandas
+        from Wrangler import RoadwaySnapshot
+        self.hwy.batchApplyScripts = False
+        with open("FREEFLOW.BLD", "w") as f: f.write("1\n2\n3\n1-2\n2-3\n")
+        self.hwy.roadwayTable = RoadwaySnapshot("base",
+            pandas.DataFrame({"N":[1,2,3], "X":[0.0,1.0,2.0], "Y":[0.0,0.0,0.0]}).set_index("N"),
+            pandas.DataFrame({"A":[1,2], "B":[2,3], "LANES":[2,2]}).set_index(["A","B"]), "")
+        self.assertEqual(self.hwy.getRoadwayLinks(), set([(1,2), (2,3)]))
+
+        # Python project edits are applied to the table
+        self.hwy.edits().setProject("EditProj")
+        self.hwy.edits().setLinkAttributes(1, 2, LANES=3)
+        self.hwy.edits().addNode(4, 3.0, 0.0)
+        self.hwy.edits().addLink(3, 4, LANES=1)
+        self.hwy.flushNetwork()
+        self.assertEqual(self.hwy.roadwayTable.links_df.loc[(1,2), "LANES"], 3)
+        self.assertEqual(self.hwy.getRoadwayLinks(), set([(1,2), (2,3), (3,4)]))
+
+        # deleting a dead-end link leaves its end node an island
+        self.assertEqual(self.hwy.checkConnectivity().islands, [])
+        self.hwy.edits().setProject("DeleteProj")
+        self.hwy.edits().deleteLink(3, 4)
+        connectivity = self.hwy.checkConnectivity()
+        self.assertEqual(connectivity.numNodes, 4)
+        self.assertEqual(connectivity.newIslands, [[4]])
+
+        # apply.s projects may change anything, so the table isn't known until the next export
+        self.makeProject("ProjA", ["APPEND 5", "APPEND 4-5"])
+        self.assertEqual(self.hwy.roadwayTable, None)
+        self.assertEqual(self.hwy.getRoadwayLinks(), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os, shutil, subprocess, sys, tempfile, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import Wrangler
+from Wrangler import NodeNames
+from Wrangler.NodeNames import readNodeNames
+
+# reads the names in another process; the workbook isn't a real one, so this only works from the cache
+READ_NAMES = r'''
+import sys
+sys.path.insert(1, sys.argv[1])
+from Wrangler.NodeNames import readNodeNames
+print(readNodeNames(sys.argv[2])[16511])
+'''
+
+class TestNodeNames(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir  = tempfile.mkdtemp()
+        self.workbook = os.path.join(self.tempdir, "Node Description.xls")
+        with open(self.workbook, "wb") as f:
+            f.write(b"not really a workbook")
+        self.cache_dir = os.environ.get("WRANGLER_CACHE_DIR")
+        os.environ["WRANGLER_CACHE_DIR"] = os.path.join(self.tempdir, "cache")
+
+        # count the workbook reads
+        self.reads          = []
+        self._readWorkbook  = NodeNames._readWorkbook
+        NodeNames._readWorkbook = lambda filename, sheet: self.reads.append((filename, sheet)) or {16511:"Embarcadero BART"}
+
+    def tearDown(self):
+        NodeNames._readWorkbook = self._readWorkbook
+        NodeNames._node_names_cache.clear()
+        if self.cache_dir is None:
+            del os.environ["WRANGLER_CACHE_DIR"]
+        else:
+            os.environ["WRANGLER_CACHE_DIR"] = self.cache_dir
+        shutil.rmtree(self.tempdir)
+
+    def test_cached(self):
+        self.assertEqual(readNodeNames(self.workbook), {16511:"Embarcadero BART"})
+        self.assertEqual(readNodeNames(self.workbook)[16511], "Embarcadero BART")
+        self.assertEqual(len(self.reads), 1)
+
+        # nothing is written next to the workbook
+        self.assertEqual(sorted(os.listdir(self.tempdir)), ["Node Description.xls", "cache"])
+
+        # another process reads the cache
+        output = subprocess.check_output([sys.executable, "-c", READ_NAMES,
+                                          os.path.normpath(os.path.join(curdir, "..", "..")), self.workbook])
+        self.assertEqual(output.decode().splitlines()[-1], "Embarcadero BART")
+
+        # so does this one without its in-process cache, even if the mtime changed
+        NodeNames._node_names_cache.clear()
+        os.utime(self.workbook, (0, 0))
+        self.assertEqual(readNodeNames(self.workbook), {16511:"Embarcadero BART"})
+        self.assertEqual(len(self.reads), 1)
+
+        # sheets are cached separately
+        readNodeNames(self.workbook, sheet="equiv")
+        self.assertEqual(len(self.reads), 2)
+
+    def test_changed_workbook_is_reread(self):
+        readNodeNames(self.workbook)
+        with open(self.workbook, "ab") as f:
+            f.write(b" but longer")
+        NodeNames._node_names_cache.clear()
+        readNodeNames(self.workbook)
+        self.assertEqual(len(self.reads), 2)
+
+    def test_bad_cache_is_ignored(self):
+        os.makedirs(os.environ["WRANGLER_CACHE_DIR"])
+        with open(NodeNames._cacheFilename(self.workbook, 0), "w") as f:
+            f.write("not json")
+        self.assertEqual(readNodeNames(self.workbook)[16511], "Embarcadero BART")
+        self.assertEqual(len(self.reads), 1)
+
+if __name__ == '__main__':
+    unittest.main()
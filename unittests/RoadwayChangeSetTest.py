@@ -0,0 +1,42 @@
+import os, sys, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import pandas
+import Wrangler
+from Wrangler import RoadwayChangeSet, RoadwayEdits, RoadwaySnapshot
+
+class TestRoadwayChangeSet(unittest.TestCase):
+
+    def setUp(self):
+        nodes_df = pandas.DataFrame([(1,0.0,0.0), (2,1.0,0.0), (3,2.0,0.0)], columns=["N","X","Y"]).set_index("N")
+        links_df = pandas.DataFrame([(1,2,2,"Oakland"), (2,3,2,"Oakland")],
+                                    columns=["A","B","LANES","CITYNAME"]).set_index(["A","B"])
+        self.snapshot = RoadwaySnapshot("before", nodes_df, links_df, "")
+
+    def test_edits(self):
+        edits = RoadwayEdits()
+        edits.setProject("proj")
+        edits.setLinkAttributes(1, 2, LANES=3)
+        edits.addNode(4, 3.0, 0.0)
+        edits.addLink(3, 4, LANES=1, CITYNAME="Berkeley")
+        edits.deleteLink(2, 3)
+
+        change_set = RoadwayChangeSet.fromEdits(edits)
+        self.assertEqual(len(change_set), 4)
+
+        after = self.snapshot.applyChangeSet(change_set, key="after")
+        self.assertEqual(after.links_df.index.tolist(), [(1,2), (3,4)])
+        self.assertEqual(after.links_df.loc[(1,2), "LANES"], 3)
+        self.assertEqual(after.links_df.loc[(3,4), "CITYNAME"], "Berkeley")
+        self.assertEqual(after.nodes_df.loc[4, "X"], 3.0)
+
+        # the same as applying the edits to the tables
+        (nodes_df, links_df) = edits.applyToTables(self.snapshot.nodes_df, self.snapshot.links_df)
+        self.assertTrue(links_df.equals(after.links_df))
+        self.assertTrue(nodes_df.equals(after.nodes_df))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import os, shutil, sys, tempfile, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import pandas
+import Wrangler
+from Wrangler import RoadwayEdits, NetworkException
+
+class TestRoadwayEdits(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.edits   = RoadwayEdits()
+        self.edits.setProject("ProjA")
+        self.edits.setLinkAttributes(1, 2, LANES=3)
+        self.edits.addNode(10, 5.0, 5.0)
+        self.edits.addLink(2, 10, DISTANCE=0.5, LANES=1)
+        self.edits.deleteLink(3, 4)
+        self.edits.setProject("ProjB")
+        self.edits.setLinkAttributes(1, 2, CITYNAME="Oakland")
+        self.edits.setLinkAttributes(2, 10, LANES=2)
+        self.edits.addLink(10, 2, DISTANCE=0.5, LANES=1)
+        self.edits.deleteLink(10, 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_accumulate(self):
+        self.assertEqual(len(self.edits), 4)
+        self.assertEqual(self.edits.projects, ["ProjA", "ProjB"])
+        self.assertEqual(dict(self.edits.linkAttrs[(1,2)]), {"LANES":3, "CITYNAME":"Oakland"})
+        self.assertEqual(dict(self.edits.linkAdds[(2,10)]), {"DISTANCE":0.5, "LANES":2})
+        self.assertRaises(NetworkException, self.edits.setLinkAttributes, 3, 4, LANES=1)
+        self.assertRaises(NetworkException, self.edits.setLinkAttributes, 1, 2, CITYNAME="O'Neill")
+
+        # re-adding a deleted link keeps it with the new attributes
+        self.edits.addLink(3, 4, LANES=4)
+        self.assertFalse((3,4) in self.edits.linkDeletes)
+        self.assertEqual(dict(self.edits.linkAttrs[(3,4)]), {"LANES":4})
+
+    def test_writeScript(self):
+        script = open(self.edits.writeScript(self.tempdir)).read()
+        self.assertTrue("FILEI NODEI[2]=edits_nodes.csv, VAR=N,X,Y" in script)
+        self.assertTrue("FILEI LINKI[2]=edits_links.csv, VAR=A,B,DISTANCE,LANES" in script)
+        self.assertTrue("    IF (A=3 & B=4) DELETE" in script)
+        self.assertTrue("    IF (A=1 & B=2)\n      LANES=3\n      CITYNAME='Oakland'\n    ENDIF" in script)
+        self.assertTrue(script.rstrip().endswith("*copy /y FREEFLOW_edits.BLDOUT FREEFLOW.BLD"))
+        self.assertEqual(open(os.path.join(self.tempdir, "edits_links.csv")).read(), "2,10,0.5,2\n")
+
+    def test_applyToTables(self):
+        nodes_df = pandas.DataFrame([(1,0.0,0.0),(2,1.0,0.0),(3,2.0,0.0),(4,3.0,0.0)], columns=["N","X","Y"]).set_index("N")
+        links_df = pandas.DataFrame([(1,2,1.0,2,"Emeryville"),(3,4,1.0,2,"Oakland")],
+                                    columns=["A","B","DISTANCE","LANES","CITYNAME"]).set_index(["A","B"])
+        (new_nodes_df, new_links_df) = self.edits.applyToTables(nodes_df, links_df)
+        self.assertEqual(sorted(new_links_df.index.tolist()), [(1,2),(2,10)])
+        self.assertEqual(new_links_df.loc[(1,2),"LANES"], 3)
+        self.assertEqual(new_links_df.loc[(1,2),"CITYNAME"], "Oakland")
+        self.assertEqual(new_links_df.loc[(2,10),"LANES"], 2)
+        self.assertEqual(new_nodes_df.loc[10,"X"], 5.0)
+        # the originals are untouched
+        self.assertEqual(len(links_df), 2)
+        self.assertEqual(links_df.loc[(1,2),"LANES"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import os, sys, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import pandas
+import Wrangler
+from Wrangler import RoadwaySnapshot
+
+def makeSnapshot(key, nodes, links):
+    """ nodes is a list of (N, X, Y), links is a list of (A, B, DISTANCE, LANES, CITYNAME) """
+    nodes_df = pandas.DataFrame(nodes, columns=["N","X","Y"]).set_index("N")
+    links_df = pandas.DataFrame(links, columns=["A","B","DISTANCE","LANES","CITYNAME"]).set_index(["A","B"])
+    return RoadwaySnapshot(key, nodes_df, links_df, "fac_index\n")
+
+class TestRoadwaySnapshot(unittest.TestCase):
+
+    def test_diff(self):
+        before = makeSnapshot("before",
+                              [(1,0.0,0.0), (2,1.0,0.0), (3,2.0,0.0), (4,3.0,0.0), (5,0.0,5.0)],
+                              [(1,2,1.0,2,"Oakland"), (2,3,1.0,2,None), (3,4,1.0,2,"Oakland"), (1,5,5.0,1,"Oakland")])
+        # lanes changed on 1-2, 3-4 deleted, 4-3 added, node 5 moved (so 1-5 moves) and node 6 added
+        after  = makeSnapshot("after",
+                              [(1,0.0,0.0), (2,1.0,0.0), (3,2.0,0.0), (4,3.0,0.0), (5,0.0,6.0), (6,9.0,9.0)],
+                              [(1,2,1.0,3,"Oakland"), (2,3,1.0,2,None), (4,3,1.0,2,"Oakland"), (1,5,5.0,1,"Oakland")])
+
+        self.assertTrue(before.hasVars(["LANES"]))
+        self.assertFalse(before.hasVars(["LANES","FT"]))
+
+        diff = before.diff(after)
+        self.assertEqual(list(diff.addedLinks),    [(4,3)])
+        self.assertEqual(list(diff.deletedLinks),  [(3,4)])
+        self.assertEqual(list(diff.modifiedLinks), [(1,2),(1,5)])
+        self.assertEqual(list(diff.addedNodes),    [6])
+        self.assertEqual(list(diff.deletedNodes),  [])
+        self.assertEqual(list(diff.modifiedNodes), [5])
+
+        # no differences from itself
+        diff = after.diff(after)
+        self.assertEqual(sum([len(changes) for changes in diff]), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os, shutil, sys, tempfile, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import Wrangler
+from Wrangler import NetworkException, TollTable
+
+TOLLS_CSV = """facility_name,fac_index,tollclass,tollseg,tolltype,use,toll_flat,tollea_da,tollam_da,tollmd_da,tollpm_da,tollev_da,tollea_s2,tollam_s2,tollmd_s2,tollpm_s2,tollev_s2
+Bay Bridge,1001,1,1,bridge,1,0,6.0,7.5,6.0,7.5,6.0,3.0,3.5,3.0,3.5,3.0
+I-880 Express,2001,25,1,expr_lane,2,,0.10,0.25,0.10,0.25,0.10,0,0,0,0,0
+"""
+
+# replaces 2001 and adds 3001, without the s2 columns
+NEW_TOLLS_CSV = """facility_name,fac_index,tollclass,tollseg,tolltype,use,toll_flat,tollea_da,tollam_da,tollmd_da,tollpm_da,tollev_da
+I-880 Express,2001,25,1,expr_lane,2,,0.2,0.5,0.2,0.5,0.2
+SR-84,3001,26,1,expr_lane,2,1.5,0.3,0.3,0.3,0.3,0.3
+"""
+
+class TestTollTable(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        for (filename, contents) in [("tolls.csv", TOLLS_CSV), ("new_tolls.csv", NEW_TOLLS_CSV),
+                                     ("tolls_del.csv", "facility_name,fac_index\nBay Bridge,1001\n"),
+                                     ("bad_tolls.csv", "fac_index,facility_name\n1,x\n")]:
+            with open(os.path.join(self.tempdir, filename), "w") as f: f.write(contents)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_merge(self):
+        tolls = TollTable.read(os.path.join(self.tempdir, "tolls.csv"))
+        self.assertEqual(len(tolls), 2)
+        self.assertEqual(tolls.toText(), TOLLS_CSV)
+        before = tolls.copy()
+
+        self.assertEqual(tolls.merge(os.path.join(self.tempdir, "new_tolls.csv")), (1, 1, 0))
+        self.assertEqual(tolls.tolls_df.index.tolist(), [1001, 2001, 3001])
+        self.assertEqual(tolls.tolls_df.loc[2001, "tollam_da"], "0.5")
+        self.assertEqual(tolls.tolls_df.loc[1001, "tollclass"], "1")
+        # the values are written as they were read, even with a decimal toll_flat in the new file
+        lines = tolls.toText().splitlines()
+        self.assertEqual(lines[:2], TOLLS_CSV.splitlines()[:2])
+        self.assertEqual(lines[2], "I-880 Express,2001,25,1,expr_lane,2,,0.2,0.5,0.2,0.5,0.2,,,,,")
+        self.assertEqual(lines[3], "SR-84,3001,26,1,expr_lane,2,1.5,0.3,0.3,0.3,0.3,0.3,,,,,")
+
+        # the copy isn't affected
+        self.assertEqual(before.toText(), TOLLS_CSV)
+
+        self.assertEqual(tolls.merge(os.path.join(self.tempdir, "new_tolls.csv"), os.path.join(self.tempdir, "tolls_del.csv")), (0, 2, 1))
+        self.assertEqual(tolls.tolls_df.index.tolist(), [2001, 3001])
+
+        with self.assertRaises(NetworkException):
+            tolls.merge(os.path.join(self.tempdir, "bad_tolls.csv"))
+
+    def test_empty(self):
+        empty_file = os.path.join(self.tempdir, "empty.csv")
+        open(empty_file, "w").close()
+        tolls = TollTable.read(empty_file)
+        self.assertEqual(len(tolls), 0)
+        self.assertEqual(tolls.toText(), "")
+        tolls.merge(os.path.join(self.tempdir, "new_tolls.csv"))
+        self.assertEqual(tolls.toText(), NEW_TOLLS_CSV)
+
+    def test_long(self):
+        tolls = TollTable.read(os.path.join(self.tempdir, "tolls.csv"))
+        tolls_long = tolls.longView()
+        # 2 facilities x 2 vehicle classes x 5 time periods
+        self.assertEqual(len(tolls_long), 20)
+        self.assertTrue(tolls.longView() is tolls_long)
+        row = tolls_long[(tolls_long.fac_index == 1001) & (tolls_long.vehicle_class == "s2") & (tolls_long.timeperiod == "am")]
+        self.assertEqual(row["toll"].tolist(), [3.5])
+        row = tolls_long[(tolls_long.fac_index == 2001) & (tolls_long.vehicle_class == "da") & (tolls_long.timeperiod == "ea")]
+        self.assertEqual(row["toll"].tolist(), [0.1])
+
+if __name__ == '__main__':
+    unittest.main()
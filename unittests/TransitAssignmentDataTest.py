@@ -0,0 +1,113 @@
+import os, shutil, sys, tempfile, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import Wrangler
+from Wrangler import TransitAssignmentData, TransitCapacity, TransitLine
+from Wrangler.TransitAssignmentData import TransitAssignmentDataException
+from Wrangler.Network import Network
+from dataTable import DbfDictWriter, FieldType, dbfColumnReader
+
+MODES = ["wlk_loc_wlk", "drv_loc_wlk"]
+
+# A,B,TIME,MODE,PLOT,STOP_A,STOP_B,DIST,NAME,OWNER, then AB_VOL,AB_BRDA,AB_XITA,AB_BRDB,AB_XITB and the same for BA
+# the third link repeats the first's A/B/NAME/SEQ, so it gets a fake SEQ; the fourth is an ignored mode
+TRNLINK_CSV = """1,2,1.5,110,1,1,0,0.50,MUN5I,OP,{vol},{vol},,0,0,0,0,0,0,0
+2,3,2.0,110,1,0,1,0.70,MUN5I,OP,95,0,0,0,5,0,0,0,0,0
+1,2,1.5,110,1,1,0,0.50,MUN5I,OP,20,20,0,0,0,0,0,0,0,0
+3,4,1.0,7,1,0,0,0.10,,OP,3,0,0,0,0,0,0,0,0,0
+"""
+DBF_ROWS = [(1, 2, 10.0, 1), (2, 3, 10.0, 2), (1, 2, 20.0, 1), (3, 4, 15.0, 1)]
+
+class TestTransitAssignmentData(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        for (filename, contents) in [("transitLineToVehicle.csv", "MUN5I,SF MUNI,5I,5,5 Fulton,LRV2,LRV2,LRV2\n"),
+                                     ("transitVehicleToCapacity.csv", "VehicleType,100%Capacity\nLRV2,238\n"),
+                                     ("transitPrefixToVehicle.csv", "")]:
+            with open(os.path.join(self.tempdir, filename), "w") as f: f.write(contents)
+        for (mode, vol) in zip(MODES, [100, 10]):
+            with open(os.path.join(self.tempdir, "trnlinkam_{}.csv".format(mode)), "w") as f:
+                f.write(TRNLINK_CSV.format(vol=vol))
+
+        header = (FieldType("A", "N", 7, 0), FieldType("B", "N", 7, 0), FieldType("FREQ", "F", 6, 2), FieldType("SEQ", "N", 3, 0))
+        writer = DbfDictWriter(os.path.join(self.tempdir, "trnlinkam_{}.dbf".format(MODES[0])), header, len(DBF_ROWS))
+        for (a, b, freq, seq) in DBF_ROWS:
+            writer.writeRecord({"A":a, "B":b, "FREQ":freq, "SEQ":seq})
+
+        self.alltripmodes = os.environ.get("ALLTRIPMODES")
+        os.environ["ALLTRIPMODES"] = " ".join(MODES)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        if self.alltripmodes is None:
+            del os.environ["ALLTRIPMODES"]
+        else:
+            os.environ["ALLTRIPMODES"] = self.alltripmodes
+
+    def test_dbf_columns(self):
+        columns = dbfColumnReader(os.path.join(self.tempdir, "trnlinkam_{}.dbf".format(MODES[0])), ["A","FREQ"])
+        self.assertEqual(sorted(columns.keys()), ["A","FREQ"])
+        self.assertEqual(columns["A"].tolist(), [1, 2, 1, 3])
+        self.assertEqual(columns["FREQ"].tolist(), [10.0, 10.0, 20.0, 15.0])
+
+    def test_read_csvs(self):
+        tad = TransitAssignmentData(directory=self.tempdir, timeperiod="AM", modelType=Network.MODEL_TYPE_TM1,
+                                    ignoreModes=[7], transitCapacity=TransitCapacity(directory=self.tempdir))
+        table = tad.trnAsgnTable
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table.getNumpyArray()["ABNAMESEQ"].tolist(), [b"1 2 MUN5I 1", b"2 3 MUN5I 2", b"1 2 MUN5I 2"])
+
+        row = table[b"1 2 MUN5I 1"]
+        self.assertEqual(row["TIME"], 150)
+        self.assertEqual(row["DIST"], 50)
+        self.assertEqual(row["NAME"], b"MUN5I")
+        self.assertEqual(row["SYSTEM"], b"SF MUNI")
+        self.assertEqual(row["VEHCAP"], 238)
+        self.assertEqual(row["AB_VOL"], 110)   # summed over the modes
+        self.assertEqual(row["AB_XITA"], 0)    # blank
+        hours = TransitLine.HOURS_PER_TIMEPERIOD[Network.MODEL_TYPE_TM1]["AM"]
+        self.assertAlmostEqual(row["PERIODCAP"], hours*60.0*238/10.0, places=3)
+        self.assertAlmostEqual(row["LOAD"], 110*0.44*10.0/(60.0*238), places=6)
+
+        # the fake SEQ is only in the key
+        self.assertEqual(table[b"1 2 MUN5I 2"]["SEQ"], 1)
+        self.assertEqual(table[b"1 2 MUN5I 2"]["FREQ"], 20.0)
+        self.assertEqual(table[b"1 2 MUN5I 2"]["AB_VOL"], 40)
+
+        link = tad.aggregateTable[b"1 2"]
+        self.assertAlmostEqual(link["FREQ"], 1/(1/10.0 + 1/20.0), places=4)
+        self.assertAlmostEqual(link["PERIODCAP"], hours*60.0*238*(1/10.0 + 1/20.0), places=2)
+        self.assertAlmostEqual(link["MAXLOAD"], row["LOAD"], places=6)
+
+    def test_lookups(self):
+        tad = TransitAssignmentData(directory=self.tempdir, timeperiod="AM", modelType=Network.MODEL_TYPE_TM1,
+                                    ignoreModes=[7], transitCapacity=TransitCapacity(directory=self.tempdir))
+        lineId = tad.getLineId("mun5i")
+        self.assertTrue(isinstance(lineId, int))
+        self.assertEqual(tad.getLineId("MUN30I"), None)
+        for line in ["MUN5I", lineId]:
+            self.assertEqual(tad.linkVolume(line, 1, 2, 1), 110)
+            self.assertEqual(tad.linkVolume(line, 1, 2, 2), 40)   # the fake SEQ
+            self.assertEqual(tad.numBoards(line, 1, 2, 1), 110)
+            self.assertEqual(tad.numExits(line, 2, 3, 2), 10)  # 5 in each mode
+            self.assertEqual(tad.linkTime(line, 2, 3, 2), 200)
+            with self.assertRaises(TransitAssignmentDataException):
+                tad.linkVolume(line, 2, 3, 1)
+        with self.assertRaises(TransitAssignmentDataException):
+            tad.numBoards("MUN30I", 1, 2, 1)
+
+        # the index is rebuilt from the keys of the written dbfs
+        asgnFile = os.path.join(self.tempdir, "asgn.dbf")
+        tad.writeDbfs(asgnFileName=asgnFile)
+        tad2 = TransitAssignmentData(directory=self.tempdir, timeperiod="AM", modelType=Network.MODEL_TYPE_TM1,
+                                     transitCapacity=TransitCapacity(directory=self.tempdir),
+                                     lineLevelAggregateFilename=asgnFile)
+        self.assertEqual(tad2.linkIndex, tad.linkIndex)
+        self.assertEqual(tad2.linkVolume("MUN5I", 1, 2, 2), 40)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,4 @@
-import os, sys, unittest
+import copy, json, os, pickle, shutil, subprocess, sys, tempfile, unittest
 
 # test this version of Wrangler
 curdir = os.path.dirname(__file__)
@@ -11,7 +11,7 @@ class TestTransitNetwork(unittest.TestCase):
     def setUp(self):
         """ Initialize the TransitNetwork and read in the unittests dir
         """
-        self.tn = Wrangler.TransitNetwork()
+        self.tn = Wrangler.TransitNetwork(Wrangler.Network.MODEL_TYPE_TM1, 1.0)
         thisdir = os.path.dirname(os.path.realpath(__file__))
 
         self.tn.mergeDir(thisdir)
@@ -62,5 +62,200 @@ class TestTransitNetwork(unittest.TestCase):
     def test_transit_line_index(self):
         self.assertEqual(self.tn.line("TEST_A").n.index(4), 3)
 
+    def test_journal_rollback(self):
+        orig_nodes = self.tn.line("TEST_A").listNodeIds(ignoreStops=False)
+        orig_freqs = self.tn.line("TEST_B").getFreqs()
+        mark = self.tn.markJournal()
+
+        self.tn.line("TEST_A").splitLink(2, 3, 100)
+        self.tn.line("TEST_A").setStop(6)
+        self.tn.line("TEST_B").setFreqs([1,2,3,4,5])
+        self.tn.deleteLine("TEST_B")
+
+        changes = self.tn.getChangesSince(mark)
+        self.assertEqual([entry.op for entry in changes], ["splitLink", "setStop", "setFreqs", "deleteLine"])
+        self.assertEqual(changes[0].target, "TEST_A")
+        self.assertRaises(Wrangler.NetworkException, self.tn.line, "TEST_B")
+
+        self.assertEqual(self.tn.rollbackToMark(mark), 4)
+        self.assertEqual(self.tn.getChangesSince(mark), [])
+        self.assertEqual(self.tn.line("TEST_A").listNodeIds(ignoreStops=False), orig_nodes)
+        self.assertEqual(self.tn.line("TEST_B").getFreqs(), orig_freqs)
+        self.assertEqual(self.tn.lineNames(), ["TEST_A", "TEST_B"])
+
+    def test_journal_merge_rollback(self):
+        mark = self.tn.markJournal()
+        thisdir = os.path.dirname(os.path.realpath(__file__))
+        num_lines = len(self.tn.lines)
+        self.tn.parseFile(os.path.join(thisdir, "test.lin"), insert_replace=False)
+        self.tn.line("TEST_A").setStop(3)
+
+        self.tn.rollbackToMark(mark)
+        self.assertEqual(len(self.tn.lines), num_lines)
+        self.assertFalse(self.tn.line("TEST_A").n[2].isStop())
+
+    def test_applyLinkReplacements(self):
+        # equivalent to splitting twice
+        tn2 = copy.deepcopy(self.tn)
+        tn2.splitLinkInTransitLines(2, 3, -101)
+        tn2.splitLinkInTransitLines(101, 3, -102)
+        tn2.splitLinkInTransitLines(12, 13, 103)
+
+        lines = self.tn.applyLinkReplacements({(2,3):[2,-101,-102,3], (12,13):[12,103,13]})
+        self.assertEqual(lines, ["TEST_A", "TEST_B"])
+        for line in self.tn:
+            self.assertEqual(line.listNodeIds(ignoreStops=False), tn2.line(line.name).listNodeIds(ignoreStops=False))
+        self.assertTrue(self.tn.line("TEST_B").n[2].isStop())
+        self.assertEqual(self.tn.line("TEST_A").n[2].num, "-101")
+
+        self.assertRaises(Wrangler.NetworkException, self.tn.applyLinkReplacements, {(2,3):[2,-101,4]})
+
+    def test_findBadLinksInLines(self):
+        from Wrangler.TransitValidation import findBadLinksInLines, findBadLinksInParallel
+        line_nodes    = [(line.name, line.listNodeIds()) for line in self.tn]
+        roadway_links = set()
+        for (line_name, node_ids) in line_nodes:
+            roadway_links.update(zip(node_ids[:-1], node_ids[1:]))
+        roadway_links.discard((2,3))
+        roadway_links.discard((12,13))
+
+        bad_links = findBadLinksInLines(line_nodes, roadway_links, set([(4,5)]), set([(12,13)]))
+        self.assertEqual([tuple(bad_link[:4]) for bad_link in bad_links], [("TEST_A", 1, 2, 3), ("TEST_A", 3, 4, 5)])
+        self.assertEqual(findBadLinksInParallel(line_nodes, roadway_links, set([(4,5)]), set([(12,13)]),
+                                                numProcesses=2, chunkSize=1), bad_links)
+
+    def test_validate_incremental(self):
+        self.tn.validate()
+        self.assertEqual(len(self.tn.validationState.lineSignatures), 2)
+
+        # nothing changed so nothing is checked
+        checked = []
+        validateFrequencies = self.tn.validateFrequencies
+        def recordingValidateFrequencies(lines=None):
+            checked.append([line.name for line in lines])
+            validateFrequencies(lines=lines)
+        self.tn.validateFrequencies = recordingValidateFrequencies
+        self.tn.validate()
+        self.assertEqual(checked, [[]])
+
+        # only the changed line is checked, and failures aren't remembered as validated
+        self.tn.line("TEST_B").setFreqs([0,0,0,0,0])
+        self.assertRaises(Wrangler.NetworkException, self.tn.validate)
+        self.assertRaises(Wrangler.NetworkException, self.tn.validate)
+        self.assertEqual(checked[1:], [["TEST_B"], ["TEST_B"]])
+
+        self.tn.line("TEST_B").setFreqs([5,10,15,20,25])
+        self.tn.validate()
+        self.assertEqual(checked[3:], [["TEST_B"]])
+
+    def test_validateWnrsAndPnrs(self):
+        from Wrangler.ZACLink import ZACLink
+        def makeLink(cls, **kwargs):
+            link = cls()
+            for (key, value) in kwargs.items(): setattr(link, key, value)
+            return link
+
+        # TEST_A becomes BART, which has offstreet stops
+        self.tn.line("TEST_A").attr["MODE"] = "120"
+        self.tn.xferli   = [makeLink(Wrangler.Linki, A="1", B="501"), makeLink(Wrangler.Linki, A="502", B="2")]
+        self.tn.zacs     = [makeLink(ZACLink, id="901-1"), makeLink(ZACLink, id="2-902")]
+        self.tn.accessli = [makeLink(Wrangler.Linki, A="901", B="501"), makeLink(Wrangler.Linki, A="901", B="999")]
+        self.assertRaises(Wrangler.NetworkException, self.tn.validateWnrsAndPnrs)
+
+        problems = self.tn.validateWnrsAndPnrs(linesets=["TES"], raiseOnError=False)
+        self.assertEqual(list(problems.loc[problems["severity"] == "warning", ["stop","A","B"]].itertuples(index=False, name=None)),
+                         [("1", "901", "999")])
+        critical = problems.loc[problems["severity"] == "critical"]
+        # stop 1 has a wnr; stop 2 has a stop-funnel zone access link and no wnr
+        self.assertNotIn("1", list(critical["stop"]))
+        self.assertEqual(len(critical.loc[critical["stop"] == "2"]), 2)
+
+    def test_applyProjectSpecs(self):
+        spec_dir = tempfile.mkdtemp()
+        try:
+            spec_file = os.path.join(spec_dir, "transit_project.json")
+            with open(spec_file, "w") as outfile:
+                json.dump({"year":2030, "desc":"test", "operations":[
+                    {"op":"set_frequencies", "lines":["TEST_A"], "freqs":[1,2,3,4,5]},
+                    {"op":"set_frequencies", "pattern":"TEST_", "freqs":[7], "timepers":["AM"]},
+                    {"op":"insert_stop", "nodeA":2, "nodeB":3, "node":100},
+                    {"op":"insert_stop", "node":12, "lines":["TEST_B"]},
+                    {"op":"replace_segment", "nodeA":13, "nodeB":15, "nodes":[13,-200,15]},
+                    {"op":"delete_lines", "names":["TEST_B"]}]}, outfile)
+            spec = Wrangler.TransitProjectSpec.read(spec_file)
+            self.assertEqual(spec.year, 2030)
+            self.assertEqual(Wrangler.TransitProjectSpec.findSpecFile(spec_dir), spec_file)
+
+            tn2 = copy.deepcopy(self.tn)
+            self.assertEqual(self.tn.applyProjectSpecs([spec]), 6)
+            self.assertEqual(self.tn.line("TEST_A").getFreqs(), ["1.0","7.0","3.0","4.0","5.0"])
+            self.assertEqual(self.tn.line("TEST_A").listNodeIds(ignoreStops=False)[:4], [1,2,100,-3])
+            self.assertEqual(self.tn.lineNames(), ["TEST_A"])
+
+            # without the delete
+            spec.operations = spec.operations[:-1]
+            tn2.applyProjectSpecs([spec])
+            self.assertEqual(tn2.line("TEST_B").listNodeIds(ignoreStops=False), [11,12,13,-200,15])
+        finally:
+            shutil.rmtree(spec_dir)
+
+        # two ops splitting the same link chain their nodes, in op order
+        spec = Wrangler.TransitProjectSpec([{"op":"insert_stop", "nodeA":1, "nodeB":2, "node":101},
+                                            {"op":"insert_stop", "nodeA":1, "nodeB":2, "node":102, "stop":False},
+                                            {"op":"insert_stop", "nodeA":1, "nodeB":2, "node":103, "lines":["NOT_A_LINE"]}])
+        tn2.applyProjectSpecs([spec])
+        self.assertEqual(tn2.line("TEST_A").listNodeIds(ignoreStops=False)[:4], [1,101,-102,2])
+
+        self.assertRaises(Wrangler.NetworkException, Wrangler.TransitProjectSpec, [{"op":"bogus"}])
+        self.assertRaises(Wrangler.NetworkException, Wrangler.TransitProjectSpec, [{"op":"set_frequencies"}])
+
+    def test_applyProjectSpecs_tm2(self):
+        # setFreqs doesn't know the TM2 time periods
+        tn = Wrangler.TransitNetwork(Wrangler.Network.MODEL_TYPE_TM2, 1.0)
+        spec = Wrangler.TransitProjectSpec([{"op":"set_frequencies", "freqs":[1,2,3,4,5]}])
+        self.assertRaises(Wrangler.NetworkException, tn.applyProjectSpecs, [spec])
+        tn.applyProjectSpecs([Wrangler.TransitProjectSpec([{"op":"delete_lines", "names":[]}])])
+
+    def test_applyProjectSpecFile_batched_fares(self):
+        project_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(project_dir, "transit_project.json"), "w") as outfile:
+                json.dump({"year":2030, "desc":"test", "operations":[{"op":"delete_lines", "names":["TEST_B"]}]}, outfile)
+            with open(os.path.join(project_dir, "farelinks.far"), "w") as outfile:
+                outfile.write("FARELINKS L=1-2 FARE=100 MODE=3\n")
+            subprocess.check_call("git init -q && git add -A && git -c user.name=test -c user.email=test@example.com commit -q -m init",
+                                  cwd=project_dir, shell=True)
+            farelinks = len(self.tn.farefiles["farelinks.far"])
+
+            self.tn.batchProjectSpecs = True
+            commit = self.tn.applyProjectSpecFile(os.path.join(project_dir, "transit_project.json"), project_dir, "proj", project_dir)
+            # fares and the log wait for the spec
+            self.assertEqual(len(self.tn.farefiles["farelinks.far"]), farelinks)
+            self.assertIn("TEST_B", self.tn.lineNames())
+            self.assertNotIn("proj", self.tn.appliedProjects)
+
+            self.tn.flushProjectSpecs()
+            self.assertEqual(len(self.tn.farefiles["farelinks.far"]), farelinks+1)
+            self.assertEqual(self.tn.appliedProjects["proj"], commit)
+            self.assertNotIn("TEST_B", self.tn.lineNames())
+        finally:
+            shutil.rmtree(project_dir)
+
+    def test_pickle_roundtrip(self):
+        self.tn.startJournal()
+        self.assertTrue(hasattr(self.tn, "parser"))
+        tn2 = pickle.loads(pickle.dumps(self.tn))
+        self.assertFalse(hasattr(tn2, "parser"))
+        self.assertIsNone(tn2.journal)
+        self.assertEqual(tn2.lineNames(), self.tn.lineNames())
+        for line in self.tn:
+            line2 = tn2.line(line.name)
+            self.assertIsNone(line2.journal)
+            self.assertEqual(line2, line)
+            self.assertEqual(repr(line2), repr(line))
+
+        tn3 = copy.deepcopy(self.tn)
+        self.assertEqual(repr(tn3.line("TEST_A")), repr(self.tn.line("TEST_A")))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,65 @@
+import os, shutil, sys, tempfile, unittest
+
+# test this version of Wrangler
+curdir = os.path.dirname(__file__)
+sys.path.insert(1, os.path.normpath(os.path.join(curdir, "..", "..")))
+
+import Wrangler
+from Wrangler import TurnPenalties, LinkAdjacency
+
+class TestTurnPenalties(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_merge_overrides(self):
+        turn_penalties = TurnPenalties()
+        turn_penalties.mergeLines(["; base turns", "1 2 3 1 -1", "4 5 6 1 -1"], source="base")
+        self.assertEqual(turn_penalties.mergeLines(["; project", "1 2 3 1 2.5 ; now allowed", "7 8 9 1 -1"], source="project"),
+                         (1, 1))
+        # applying the same project again doesn't duplicate anything
+        self.assertEqual(turn_penalties.mergeLines(["7 8 9 1 -1"], source="project"), (0, 1))
+
+        self.assertEqual(len(turn_penalties), 3)
+        self.assertEqual(turn_penalties.getPenalty(1,2,3), 2.5)
+        self.assertTrue((7,8,9) in turn_penalties)
+        self.assertEqual(turn_penalties.getPenalty(7,8,9,penset=2), None)
+
+        # overridden entries stay in place
+        filename = os.path.join(self.tempdir, "turnsam.pen")
+        turn_penalties.write(filename)
+        self.assertEqual(open(filename).read().splitlines(),
+                         ["; base turns", "1 2 3 1 2.5 ; now allowed", "4 5 6 1 -1", "; project", "7 8 9 1 -1"])
+        self.assertEqual(list(TurnPenalties(filename)), [(1,2,3,1), (4,5,6,1), (7,8,9,1)])
+
+        # lines that can't be parsed are kept as is
+        self.assertEqual(turn_penalties.mergeLines(["1 2 three 1 -1"]), (0, 0))
+        self.assertEqual(len(turn_penalties), 3)
+        turn_penalties.write(filename)
+        self.assertEqual(open(filename).read().splitlines()[-1], "1 2 three 1 -1")
+
+    def test_findInvalidTurns(self):
+        # link (1,2) was split by node 10
+        links = LinkAdjacency([(1,10), (10,2), (2,3), (5,6)])
+        self.assertEqual(links.nodesBetween(1,2), [10])
+
+        turn_penalties = TurnPenalties()
+        turn_penalties.mergeLines(["1 2 3 1 -1", "10 2 3 1 -1", "4 5 6 1 -1"])
+        invalid_turns = turn_penalties.findInvalidTurns(links)
+        self.assertEqual([(turn.a, turn.b, turn.c) for turn in invalid_turns], [(1,2,3), (4,5,6)])
+        self.assertEqual(invalid_turns[0].missingLinks, [(1,2)])
+        self.assertEqual(invalid_turns[0].suggestion, (10,2,3))
+        self.assertEqual(invalid_turns[1].suggestion, (-1,5,6))
+
+        self.assertEqual(turn_penalties.findInvalidTurns(set([(1,2),(10,2),(2,3),(4,5),(5,6)])), [])
+
+        # only prohibited turns, as validateTurnPens checks
+        turn_penalties.mergeLines(["4 5 6 1 2.5"])
+        self.assertEqual([(turn.a, turn.b, turn.c) for turn in turn_penalties.findInvalidTurns(links, prohibitedOnly=True)],
+                         [(1,2,3)])
+
+if __name__ == '__main__':
+    unittest.main()